@@ -14,6 +14,23 @@ BACKFILL_LOG="$HOME/.zen/strfry/constellation-backfill.log"
 BACKFILL_ERROR_LOG="$HOME/.zen/strfry/constellation-backfill.error.log"
 BACKFILL_PID="$HOME/.zen/strfry/constellation-backfill.pid"
 LOCK_FILE="$HOME/.zen/strfry/constellation-backfill.lock"
+# Event-id dedup before strfry import (run seen-set + persisted known ids)
+BACKFILL_DEDUP="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/nostr_backfill_dedup.py"
+# Write policy package: local relay queries (policy.relayquery, pooled websocket
+# connections, fallback strfry scan) and event counters (policy.eventcounts)
+NIP101_PLUGIN_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/relay.writePolicy.plugin"
+
+# Usage: policy_module MODULE ARGS... → python3 -m policy.MODULE ARGS...
+policy_module() {
+    local module="$1"
+    shift
+    PYTHONPATH="$NIP101_PLUGIN_DIR${PYTHONPATH:+:$PYTHONPATH}" python3 -m "policy.$module" "$@"
+}
+
+# Backfill engine (nostr_websocket_backfill.py --plan): REQs in flight on one
+# peer connection (below strfry maxSubsPerConnection) and over all peers
+BACKFILL_PEER_CONCURRENCY="${BACKFILL_PEER_CONCURRENCY:-2}"
+BACKFILL_CONCURRENCY="${BACKFILL_CONCURRENCY:-8}"
 
 # Public fallback relays for profile recovery (kind 0) when constellation peers are unreachable
 PUBLIC_FALLBACK_RELAYS=(
@@ -111,8 +128,7 @@ while [[ $# -gt 0 ]]; do
             # Get current event count directly
             db_path="$HOME/.zen/strfry/strfry-db/data.mdb"
             if [[ -f "$db_path" ]]; then
-                cd "$HOME/.zen/strfry"
-                current_count=$(./strfry scan --count '{}' 2>/dev/null | tail -1 | tr -d '[:space:]')
+                current_count=$(policy_module eventcounts stored 2>/dev/null)
                 echo "Current events in database: $current_count"
                 
                 # Show database size
@@ -434,170 +450,91 @@ get_timestamp_days_ago() {
     echo "$timestamp"
 }
 
-# Function to split HEX pubkeys into batches
-split_hex_pubkeys_into_batches() {
-    local hex_pubkeys="$1"
-    local batch_size="${2:-100}"  # Default batch size of 100
-    
-    # Convert to array for proper counting with strict validation
-    local authors_array=()
-    while IFS= read -r pubkey; do
-        # Clean and validate each pubkey
-        pubkey=$(echo "$pubkey" | tr -d '[:space:]')
-        # Strict validation: exactly 64 hex characters AND not a log line
-        if [[ -n "$pubkey" && ${#pubkey} -eq 64 && "$pubkey" =~ ^[0-9a-fA-F]{64}$ ]]; then
-            # Additional check: reject if it looks like a timestamp or log pattern
-            if [[ ! "$pubkey" =~ ^[0-9]{8}[0-9a-fA-F]{56}$ ]] && [[ ! "$pubkey" =~ 202[0-9] ]]; then
-                authors_array+=("$pubkey")
-            else
-                log "DEBUG" "Rejecting timestamp-like hex (length=${#pubkey}): ${pubkey:0:16}..."
-            fi
-        elif [[ -n "$pubkey" && ${#pubkey} -gt 20 ]]; then
-            log "DEBUG" "Rejecting invalid hex in batch split (length=${#pubkey}): ${pubkey:0:16}..."
-        fi
-    done <<< "$hex_pubkeys"
-    
-    local total_authors=${#authors_array[@]}
-    
-    if [[ $total_authors -eq 0 ]]; then
-        log "ERROR" "No valid hex pubkeys to split into batches"
-        return 1
+# Kinds requested from constellation peers (JSON array)
+backfill_kinds_json() {
+    if [[ "$INCLUDE_DMS" == "true" ]]; then
+        echo '[0, 1, 3, 4, 5, 6, 7, 8, 21, 22, 40, 41, 42, 44, 1063, 1111, 1222, 1244, 1506, 1984, 1985, 1986, 9735, 22242, 30001, 30005, 30008, 30009, 10001, 30023, 30024, 30078, 30303, 30312, 30313, 30315, 30500, 30501, 30502, 30503, 30504, 30505, 30506, 30508, 30800, 30850, 30851, 30904, 31900, 31901, 31902, 31910, 31922, 31923, 31924, 31925, 10000]'  # Include DMs + WoTx² (30503-30506) + Justice (1506,1984) + Zap (9735) + Crowdfunding (30904)
+    else
+        echo '[0, 1, 3, 5, 6, 7, 8, 21, 22, 40, 41, 42, 44, 1063, 1111, 1222, 1244, 1506, 1984, 1985, 1986, 9735, 22242, 30001, 30005, 30008, 30009, 10001, 30023, 30024, 30078, 30303, 30312, 30313, 30315, 30500, 30501, 30502, 30503, 30504, 30505, 30506, 30508, 30800, 30850, 30851, 30904, 31900, 31901, 31902, 31910, 31922, 31923, 31924, 31925, 10000]'  # Exclude DMs + WoTx² (30503-30506) + Justice (1506,1984) + Zap (9735) + Crowdfunding (30904)
     fi
-    
-    local batches=()
-    
-    log "INFO" "Splitting $total_authors valid HEX pubkeys into batches of $batch_size"
-    
-    for ((i=0; i<total_authors; i+=batch_size)); do
-        local batch=()
-        for ((j=i; j<i+batch_size && j<total_authors; j++)); do
-            batch+=("${authors_array[$j]}")
-        done
-        
-        # Convert batch array to newline-separated string (better than space-separated)
-        local batch_string=$(printf '%s\n' "${batch[@]}")
-        batches+=("$batch_string")
-        
-        log "DEBUG" "Created batch $((i/batch_size + 1)) with ${#batch[@]} pubkeys"
-    done
-    
-    # Return batches as array (newline-separated)
-    printf '%s\n---BATCH_SEPARATOR---\n' "${batches[@]}"
 }
 
-# Function to execute backfill using WebSocket connection with batching
-execute_backfill_websocket() {
-    local peer="$1"
-    local since_timestamp="$2"
-    local hex_pubkeys="$3"
-    
-    log "INFO" "Executing WebSocket backfill from peer: $peer"
+# Sync several peers in one engine run (nostr_websocket_backfill.py --plan):
+# all peers concurrently, one websocket per peer reused by every author batch,
+# REQs in flight bounded per peer (BACKFILL_PEER_CONCURRENCY) and overall
+# (BACKFILL_CONCURRENCY), events already received from another peer dropped.
+# Logs SYNC_PEER (events/sec) per peer, imports each peer's events and fills
+# PLAN_OK_PEERS / PLAN_FAILED_PEERS. Returns 0 if at least one peer synced.
+# Usage: run_backfill_plan SINCE_TIMESTAMP HEX_PUBKEYS PEER_URL...
+run_backfill_plan() {
+    local since_timestamp="$1"
+    local hex_pubkeys="$2"
+    shift 2
+    PLAN_OK_PEERS=()
+    PLAN_FAILED_PEERS=()
+    [[ $# -eq 0 ]] && return 1
     
-    # If no hex_pubkeys, do a general backfill
-    if [[ -z "$hex_pubkeys" ]]; then
-        log "INFO" "No HEX pubkeys provided, performing general backfill"
-        execute_backfill_websocket_batch "$peer" "$since_timestamp" ""
-        return $?
-    fi
+    local SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+    local python_script="$SCRIPT_DIR/nostr_websocket_backfill.py"
+    local plan_dir
+    plan_dir=$(mktemp -d "$HOME/.zen/strfry/backfill-plan.XXXXXX") || return 1
+    printf '%s\n' "$hex_pubkeys" | tr -d '[:blank:]\r' | grep -E '^[0-9a-fA-F]{64}$' > "$plan_dir/authors.txt"
     
     # OPT #6: Batch size adaptatif selon le nombre de HEX
-    local total_hex=$(echo "$hex_pubkeys" | wc -l)
+    local total_hex=$(wc -l < "$plan_dir/authors.txt")
     local batch_size=50  # Default
-    
     if [[ $total_hex -lt 50 ]]; then
-        batch_size=$total_hex  # 1 seul batch
-        log "INFO" "Small constellation: using single batch of $batch_size HEX pubkeys"
+        batch_size=$(( total_hex > 0 ? total_hex : 1 ))  # 1 seul batch
     elif [[ $total_hex -gt 200 ]]; then
         batch_size=100  # Batches plus gros si beaucoup de HEX
-        log "INFO" "Large constellation: using batch size of $batch_size HEX pubkeys"
     fi
-    
-    # Split hex_pubkeys into batches
-    local batches
-    batches=$(split_hex_pubkeys_into_batches "$hex_pubkeys" "$batch_size")
-    
-    if [[ -z "$batches" ]]; then
-        log "WARN" "No batches created, skipping backfill"
-        return 1
+    if [[ $total_hex -eq 0 ]]; then
+        log "INFO" "No HEX pubkeys provided, performing general backfill"
     fi
     
-    # Convert to array (split on ---BATCH_SEPARATOR---)
-    local batches_array=()
-    local current_batch=""
-    while IFS= read -r line; do
-        if [[ "$line" == "---BATCH_SEPARATOR---" ]]; then
-            if [[ -n "$current_batch" ]]; then
-                batches_array+=("$current_batch")
-                current_batch=""
+    # Station events (kind 30850, 30851, 30800) are published by the STATION key,
+    # NOT by user MULTIPASS keys → extra filter WITHOUT authors
+    jq -n --argjson since "$since_timestamp" --argjson kinds "$(backfill_kinds_json)" \
+        --arg authors_file "$plan_dir/authors.txt" --argjson batch_size "$batch_size" \
+        --argjson per_peer "$BACKFILL_PEER_CONCURRENCY" --argjson concurrency "$BACKFILL_CONCURRENCY" \
+        '{peers: $ARGS.positional, authors_file: $authors_file, batch_size: $batch_size,
+          kinds: $kinds, since: $since, limit: 10000,
+          extra_filters: [{kinds: [30800, 30850, 30851], since: $since, limit: 1000}],
+          timeout: 30, retries: 2, per_peer: $per_peer, concurrency: $concurrency}' \
+        --args "$@" > "$plan_dir/plan.json"
+    
+    log "INFO" "Backfill plan: $# peer(s), $total_hex HEX pubkeys in batches of $batch_size"
+    local start_time=$(date +%s%3N)
+    local reports
+    reports=$(python3 "$python_script" --plan "$plan_dir/plan.json" --output-dir "$plan_dir" 2>>"$BACKFILL_ERROR_LOG")
+    log "PERF" "Backfill plan fetched in $(( $(date +%s%3N) - start_time ))ms"
+    
+    local peer file batches failed events new seconds eps status
+    while IFS=$'\t' read -r peer file batches failed events new seconds eps status; do
+        [[ -z "$peer" ]] && continue
+        log "INFO" "SYNC_PEER: peer=$peer batches=$batches failed=$failed events=$events new=$new seconds=$seconds events_per_sec=$eps status=$status"
+        if [[ "$status" == "ok" ]]; then
+            PLAN_OK_PEERS+=("$peer")
+            if [[ $new -gt 0 ]]; then
+                process_and_import_events "$file" || log "ERROR" "Failed to process and import events from $peer"
             fi
         else
-            if [[ -n "$current_batch" ]]; then
-                current_batch+=$'\n'
-            fi
-            current_batch+="$line"
+            PLAN_FAILED_PEERS+=("$peer")
         fi
-    done <<< "$batches"
-    
-    # Add the last batch if it exists
-    if [[ -n "$current_batch" ]]; then
-        batches_array+=("$current_batch")
-    fi
-    
-    log "INFO" "Executing backfill in ${#batches_array[@]} batches"
-    
-    # Process each batch with retry logic
-    local total_events=0
-    local batch_number=1
-    local MAX_RETRIES=3  # Maximum retry attempts per batch
+    done < <(jq -r 'select(type == "object") | [.peer, .file, .batches, .failed_batches, .events, .new, .seconds, .events_per_sec, .status] | @tsv' <<< "$reports" 2>/dev/null)
     
-    for batch in "${batches_array[@]}"; do
-        log "INFO" "Processing batch $batch_number/${#batches_array[@]}"
-        
-        local batch_success=false
-        local retry_count=0
-        
-        # Retry logic for failed batches
-        while [[ $retry_count -lt $MAX_RETRIES && "$batch_success" == "false" ]]; do
-            if [[ $retry_count -gt 0 ]]; then
-                log "INFO" "Retry attempt $retry_count/$MAX_RETRIES for batch $batch_number"
-                sleep $((retry_count * 2))  # Exponential backoff: 2s, 4s, 6s
-            fi
-            
-            # Store result in a variable to check exit code properly
-            if execute_backfill_websocket_batch "$peer" "$since_timestamp" "$batch"; then
-                local batch_exit_code=$?
-                batch_success=true
-                # Exit code 0 means success, even if no events collected
-                if [[ $retry_count -gt 0 ]]; then
-                    log "INFO" "✅ Batch $batch_number succeeded on retry $retry_count"
-                else
-                    log "INFO" "✅ Batch $batch_number completed successfully"
-                fi
-            else
-                ((retry_count++))
-                if [[ $retry_count -lt $MAX_RETRIES ]]; then
-                    log "WARN" "❌ Batch $batch_number failed (attempt $retry_count/$MAX_RETRIES), retrying..."
-                else
-                    log "ERROR" "❌ Batch $batch_number failed after $MAX_RETRIES attempts, giving up"
-                fi
-            fi
-        done
-        
-        ((batch_number++))
-        
-        # OPT #7: Sleep conditionnel - ne sleep que s'il reste des batches
-        if [[ $batch_number -le ${#batches_array[@]} ]]; then
-            sleep 1
-        fi
-    done
-    
-    log "INFO" "Completed processing ${#batches_array[@]} batches"
+    rm -rf "$plan_dir"
+    [[ ${#PLAN_OK_PEERS[@]} -gt 0 ]]
+}
 
-    # Station events (kind 30850, 30851, 30800) are published by the STATION key,
-    # NOT by user MULTIPASS keys → do a separate pass WITHOUT authors filter
-    log "INFO" "Fetching station-published events (kind 30850/30851/30800) — no authors filter"
-    execute_backfill_websocket_station_events "$peer" "$since_timestamp"
-    return 0
+# Function to execute backfill from one peer using WebSocket connection
+execute_backfill_websocket() {
+    local peer="$1"
+    local since_timestamp="$2"
+    local hex_pubkeys="$3"
+    
+    log "INFO" "Executing WebSocket backfill from peer: $peer"
+    run_backfill_plan "$since_timestamp" "$hex_pubkeys" "$peer"
 }
 
 # Function to execute backfill for a single HEX pubkey (all messages, no time limit)
@@ -662,35 +599,6 @@ execute_backfill_websocket_single_hex() {
     fi
 }
 
-# Fetch station-level events (kind 30850 economic health, 30851, 30800 coop-config)
-# These are published by the STATION key, not user MULTIPASS keys → no authors filter
-execute_backfill_websocket_station_events() {
-    local peer="$1"
-    local since_timestamp="$2"
-
-    local req_message='["REQ", "station_events", {"kinds": [30800, 30850, 30851], "since": '"$since_timestamp"', "limit": 1000}]'
-    log "INFO" "Fetching station events (30800/30850/30851) from $peer (no authors filter)"
-
-    local SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-    local python_script="$SCRIPT_DIR/nostr_websocket_backfill.py"
-    local response_file="$HOME/.zen/strfry/backfill-station-${RANDOM}.json"
-
-    local python_output
-    python_output=$(python3 "$python_script" "$peer" "$req_message" "$response_file" 30 2>/dev/null)
-    local exit_code=$?
-
-    if [[ $exit_code -eq 0 ]]; then
-        local count=$(echo "$python_output" | grep -o "Collected [0-9]* events" | grep -o "[0-9]*" || echo "0")
-        log "INFO" "Station events collected: $count"
-        process_and_import_events "$response_file"
-        rm -f "$response_file"
-    else
-        log "WARN" "Station events fetch failed or empty from $peer"
-        rm -f "$response_file"
-    fi
-    return 0
-}
-
 # Targeted kind-0 fetch for a single pubkey — 10s timeout, used for public relay fallback
 fetch_profile_kind0() {
     local peer="$1"
@@ -718,127 +626,6 @@ fetch_profile_kind0() {
     return 1
 }
 
-# Function to execute a single batch backfill using WebSocket connection
-execute_backfill_websocket_batch() {
-    local peer="$1"
-    local since_timestamp="$2"
-    local hex_pubkeys_batch="$3"
-    
-    # Create the Nostr REQ message
-    local req_message='["REQ", "backfill", {'
-    
-    # Build kinds array based on INCLUDE_DMS setting
-    if [[ "$INCLUDE_DMS" == "true" ]]; then
-        req_message+='"kinds": [0, 1, 3, 4, 5, 6, 7, 8, 21, 22, 40, 41, 42, 44, 1063, 1111, 1222, 1244, 1506, 1984, 1985, 1986, 9735, 22242, 30001, 30005, 30008, 30009, 10001, 30023, 30024, 30078, 30303, 30312, 30313, 30315, 30500, 30501, 30502, 30503, 30504, 30505, 30506, 30508, 30800, 30850, 30851, 30904, 31900, 31901, 31902, 31910, 31922, 31923, 31924, 31925, 10000], '  # Include DMs + WoTx² (30503-30506) + Justice (1506,1984) + Zap (9735) + Crowdfunding (30904)
-    else
-        req_message+='"kinds": [0, 1, 3, 5, 6, 7, 8, 21, 22, 40, 41, 42, 44, 1063, 1111, 1222, 1244, 1506, 1984, 1985, 1986, 9735, 22242, 30001, 30005, 30008, 30009, 10001, 30023, 30024, 30078, 30303, 30312, 30313, 30315, 30500, 30501, 30502, 30503, 30504, 30505, 30506, 30508, 30800, 30850, 30851, 30904, 31900, 31901, 31902, 31910, 31922, 31923, 31924, 31925, 10000], '  # Exclude DMs + WoTx² (30503-30506) + Justice (1506,1984) + Zap (9735) + Crowdfunding (30904)
-    fi
-
-    req_message+="\"since\": $since_timestamp, "
-    req_message+='"limit": 10000'
-    
-    # Add authors filter if hex_pubkeys are provided
-    if [[ -n "$hex_pubkeys_batch" ]]; then
-        # Parse authors array from newline-separated batch string with strict validation
-        local authors_array=()
-        while IFS= read -r author; do
-            # Clean whitespace and validate
-            author=$(echo "$author" | tr -d '[:space:]')
-            # Only add if exactly 64 hex characters (strict validation)
-            if [[ -n "$author" && ${#author} -eq 64 && "$author" =~ ^[0-9a-fA-F]{64}$ ]]; then
-                authors_array+=("$author")
-            elif [[ -n "$author" ]]; then
-                log "WARN" "Invalid hex pubkey in batch (length=${#author}): ${author:0:16}... - SKIPPING"
-            fi
-        done <<< "$hex_pubkeys_batch"
-        
-        if [[ ${#authors_array[@]} -eq 0 ]]; then
-            log "ERROR" "No valid authors in batch after validation"
-            return 1
-        fi
-        
-        local authors_json="["
-        for i in "${!authors_array[@]}"; do
-            if [[ $i -gt 0 ]]; then
-                authors_json+=", "
-            fi
-            authors_json+="\"${authors_array[$i]}\""
-        done
-        authors_json+="]"
-        req_message+=", \"authors\": $authors_json"
-        
-        log "DEBUG" "Batch contains ${#authors_array[@]} valid authors (filtered from input)"
-    fi
-    
-    req_message+='}]'
-    
-    log "INFO" "Connecting to WebSocket: $peer"
-    log "DEBUG" "Request size: ${#req_message} characters"
-    
-    # Log a sample of the request for debugging (first 200 chars + last 100 chars)
-    if [[ "$VERBOSE" == "true" ]]; then
-        log "DEBUG" "Request preview: ${req_message:0:200}...${req_message: -100}"
-    fi
-    
-    # OPT #2: Use permanent Python script instead of creating/destroying temp scripts
-    local SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-    local python_script="$SCRIPT_DIR/nostr_websocket_backfill.py"
-    local response_file="$HOME/.zen/strfry/backfill-response-${RANDOM}.json"
-    
-    # Execute the Python WebSocket script with retry logic
-    local python_output
-    local python_exit_code=1
-    local websocket_retry_count=0
-    local MAX_WEBSOCKET_RETRIES=2  # Maximum retry attempts for WebSocket connection
-    
-    while [[ $websocket_retry_count -le $MAX_WEBSOCKET_RETRIES && $python_exit_code -ne 0 ]]; do
-        if [[ $websocket_retry_count -gt 0 ]]; then
-            log "INFO" "WebSocket retry attempt $websocket_retry_count/$MAX_WEBSOCKET_RETRIES for $peer"
-            sleep $((websocket_retry_count * 3))  # Exponential backoff: 3s, 6s
-        fi
-        
-        python_output=$(python3 "$python_script" "$peer" "$req_message" "$response_file" 30 2>/dev/null)
-        python_exit_code=$?
-        
-        if [[ $python_exit_code -eq 0 ]]; then
-            # Extract the number of events from the output
-            local events_count=$(echo "$python_output" | grep -o "Collected [0-9]* events" | grep -o "[0-9]*" || echo "0")
-            
-            if [[ $websocket_retry_count -gt 0 ]]; then
-                log "INFO" "✅ WebSocket backfill succeeded on retry $websocket_retry_count"
-            else
-                log "INFO" "WebSocket backfill completed successfully"
-            fi
-            log "INFO" "Response saved to: $response_file"
-            log "INFO" "Collected $events_count events in this batch"
-            
-            # Process the response and import events to local strfry
-            if process_and_import_events "$response_file"; then
-                # Clean up response file only (keep script)
-                rm -f "$response_file"
-                
-                # Return 0 for success (not event count)
-                return 0
-            else
-                log "ERROR" "Failed to process and import events"
-                rm -f "$response_file"
-                return 1
-            fi
-        else
-            ((websocket_retry_count++))
-            if [[ $websocket_retry_count -le $MAX_WEBSOCKET_RETRIES ]]; then
-                log "WARN" "❌ WebSocket connection failed (attempt $websocket_retry_count/$MAX_WEBSOCKET_RETRIES), retrying..."
-            else
-                log "ERROR" "❌ WebSocket backfill failed after $MAX_WEBSOCKET_RETRIES attempts"
-            fi
-        fi
-    done
-    
-    # If we reach here, all retries failed
-    rm -f "$response_file"
-    return 1
-}
-
 # Function to process video events and extract video metadata
 process_video_events() {
     local response_file="$1"
@@ -902,6 +689,18 @@ process_deletion_events() {
     echo "${deleted_message_ids[@]}"
 }
 
+# Start a dedup run: empty the run seen-set, then add the ids of local events
+# created since the previous seed to the persisted known-id filter (paginated
+# REQ on the local relay, strfry scan only if the relay does not answer)
+dedup_start_run() {
+    local since seeded
+    python3 "$BACKFILL_DEDUP" reset 2>/dev/null || return 1
+    since=$(python3 "$BACKFILL_DEDUP" since "$(get_timestamp_days_ago "$DAYS_BACK")" 2>/dev/null)
+    seeded=$(policy_module relayquery query "{\"since\":${since:-0}}" 2>/dev/null \
+        | python3 "$BACKFILL_DEDUP" seed 2>/dev/null)
+    log "INFO" "Dedup: ${seeded:-0 known ids added} (local events since $(date -d "@${since:-0}" '+%Y-%m-%d %H:%M:%S'))"
+}
+
 # Function to process and import events from WebSocket response
 process_and_import_events() {
     local response_file="$1"
@@ -979,6 +778,21 @@ process_and_import_events() {
     log "INFO" "Events after filtering: $filtered_events"
     log "INFO" "Removed events: $removed_events (including 'Hello NOSTR visitor.' messages and deleted messages)"
     
+    # Drop events already imported during this run (other peers / batches)
+    # or already in the local store, before strfry has to reject them
+    local dedup_file="${response_file%.json}_dedup.ndjson"
+    local kept_events run_duplicates known_duplicates
+    if read -r kept_events run_duplicates known_duplicates \
+        < <(python3 "$BACKFILL_DEDUP" filter "$filtered_file" "$dedup_file" 2>/dev/null) \
+        && [[ -n "$known_duplicates" ]]; then
+        mv "$dedup_file" "$filtered_file"
+        filtered_events=$kept_events
+        log "INFO" "SYNC_DEDUP: skipped=$((run_duplicates + known_duplicates)) run_duplicates=$run_duplicates known=$known_duplicates kept=$kept_events"
+    else
+        rm -f "$dedup_file"
+        log "WARN" "Dedup filter unavailable - importing all filtered events"
+    fi
+    
     # Check if we have events to import
     if [[ ! -s "$filtered_file" ]]; then
         log "WARN" "No events remaining after filtering"
@@ -1004,6 +818,13 @@ process_and_import_events() {
     
     cd ~/.zen/strfry
     if $import_cmd < "$import_file" 2>/dev/null; then
+        python3 "$BACKFILL_DEDUP" commit "$import_file" >/dev/null 2>&1
+        # strfry import bypasses the write policy: count the batch here
+        policy_module eventcounts import "$import_file" >/dev/null 2>&1
+        # ... and index the ATOM4LOVE certificates 30078.sh would have recorded
+        if grep -q atom4love "$import_file"; then
+            policy_module certs index "$import_file" >/dev/null 2>&1
+        fi
         if [[ "$NO_VERIFY" == "true" ]]; then
             log "INFO" "SYNC_IMPORT: events=$filtered_events mode=no-verify"
         else
@@ -1158,9 +979,9 @@ execute_p2p_websocket_backfill() {
 get_event_count() {
     local db_path="$HOME/.zen/strfry/strfry-db/data.mdb"
     if [[ -f "$db_path" ]]; then
-        # Use strfry scan with count option to get event count
-        cd "$HOME/.zen/strfry"
-        local count=$(./strfry scan --count '{}' 2>/dev/null | tail -1 | tr -d '[:space:]')
+        # O(1): counters kept by the write policy + imported batches
+        # (recalibrated by a NIP-45 COUNT when the last real count is a day old)
+        local count=$(policy_module eventcounts stored 2>/dev/null)
         if [[ -n "$count" && "$count" =~ ^[0-9]+$ ]]; then
             echo "$count"
         else
@@ -1281,12 +1102,37 @@ main() {
         exit 0
     fi
     
+    dedup_start_run || log "WARN" "Dedup state unavailable - duplicates left to strfry import"
+    
     # Process each peer
     local success_count=0
     local total_peers=${#peers[@]}
     local DEAD_PEERS=()  # peers injoignables ce run — évite de les réessayer
 
+    # Routable relays: one engine run for all of them (concurrent peers,
+    # connections reused across batches); P2P peers below share the tunnel port
+    local routable_urls=()
+    for peer in "${peers[@]}"; do
+        [[ "$peer" =~ ^localhost: ]] || routable_urls+=("${peer#routable:}")
+    done
+    if [[ ${#routable_urls[@]} -gt 0 ]]; then
+        log "INFO" "Processing ${#routable_urls[@]} routable relay(s) concurrently"
+        run_backfill_plan "$since_timestamp" "$CONSTELLATION_HEX_CACHE" "${routable_urls[@]}"
+        success_count=${#PLAN_OK_PEERS[@]}
+        local relay_url
+        for relay_url in "${PLAN_OK_PEERS[@]}"; do
+            log "INFO" "✅ WebSocket backfill successful for $relay_url"
+        done
+        for relay_url in "${PLAN_FAILED_PEERS[@]}"; do
+            log "ERROR" "❌ WebSocket backfill failed for $relay_url"
+            DEAD_PEERS+=("$relay_url")
+        done
+    fi
+
     for peer in "${peers[@]}"; do
+        # Routable relays were synced by run_backfill_plan above
+        [[ "$peer" =~ ^localhost: ]] || continue
+        
         log "INFO" "Processing peer: $peer"
 
         local is_p2p=false
@@ -1346,27 +1192,6 @@ main() {
                 log "ERROR" "❌ All P2P tunnel attempts failed for $ipfsnodeid, skipping this peer"
                 continue
             fi
-        else
-            # Regular routable relay - extract URL from routable: prefix
-            local relay_url=$(echo "$peer" | sed 's/^routable://')
-            log "INFO" "Processing routable relay: $relay_url"
-            
-            # Skip peers already known down this run
-            local is_dead=false
-            for _dead in "${DEAD_PEERS[@]}"; do [[ "$relay_url" == "$_dead" ]] && is_dead=true && break; done
-            if [[ "$is_dead" == "true" ]]; then
-                log "WARN" "Skipping known dead peer: $relay_url"
-                continue
-            fi
-
-            # Execute WebSocket backfill for routable relay
-            if execute_backfill_websocket "$relay_url" "$since_timestamp" "$hex_pubkeys"; then
-                log "INFO" "✅ WebSocket backfill successful for $relay_url"
-                backfill_success=true
-            else
-                log "ERROR" "❌ WebSocket backfill failed for $relay_url"
-                DEAD_PEERS+=("$relay_url")
-            fi
         fi
         
         if [[ "$backfill_success" == "true" ]]; then
@@ -1438,8 +1263,8 @@ main() {
                             log "INFO" "$hex_line"
                         done
                         
-                        # OPT #3: Batch strfry scan - 1 seul scan pour tous les HEX au lieu de N scans
-                        log "INFO" "🔍 Checking for HEX pubkeys with events in strfry (batch scan)..."
+                        # OPT #3: Batch query - 1 seule requête au relais local pour tous les HEX au lieu de N scans
+                        log "INFO" "🔍 Checking for HEX pubkeys with events in strfry (batch query)..."
                         local recent_hex_count=0
                         local missing_profiles=()
                         
@@ -1448,14 +1273,14 @@ main() {
                         # Build authors array for single scan
                         local authors_json=$(cat "$hex_file" | jq -R . | jq -s .)
                         
-                        # 1 SEUL scan pour tous les HEX (énorme gain de performance)
-                        local all_profiles=$(cd "$HOME/.zen/strfry" && ./strfry scan "{
+                        # 1 SEULE requête pour tous les HEX (connexion websocket au relais local, repli strfry scan)
+                        local all_profiles=$(policy_module relayquery query "{
                             \"kinds\": [0],
                             \"authors\": $authors_json
                         }" 2>/dev/null)
                         
                         local end_batch_scan=$(date +%s%3N)
-                        log "PERF" "Batch strfry scan for all HEX: $((end_batch_scan - start_batch_scan))ms"
+                        log "PERF" "Batch profile query for all HEX: $((end_batch_scan - start_batch_scan))ms"
                         
                         # Parse results in memory (much faster than N separate scans)
                         while IFS= read -r hex_pubkey; do
@@ -1606,6 +1431,15 @@ main() {
         fi
     fi
     
+    log "INFO" "SYNC_DEDUP_TOTAL: $(python3 "$BACKFILL_DEDUP" stats 2>/dev/null)"
+    
+    # Relay size and verdict totals from the write policy counters (no database scan)
+    local stored_events total_accepted total_rejected total_imported
+    stored_events=$(get_event_count)
+    read -r _ total_accepted total_rejected total_imported \
+        < "$HOME/.zen/strfry/event_counts.total" 2>/dev/null
+    log "INFO" "SYNC_RELAY: stored=$stored_events accepted=${total_accepted:-0} rejected=${total_rejected:-0} imported=${total_imported:-0}"
+    
     # Send synchronization report to CAPTAINEMAIL
     if [[ -n "$CAPTAINEMAIL" ]]; then
         log "INFO" "📧 Sending synchronization report to $CAPTAINEMAIL..."
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Nostr Backfill Dedup
+Event-id filter used by backfill_constellation.sh before `strfry import`.
+
+Each peer returns the same DAYS_BACK window for all constellation authors and
+parallel_full_sync_hex asks several peers for the same history: most events
+reaching process_and_import_events are already imported (earlier in the run)
+or already in the local store. Two Bloom filters (false positive rate
+BACKFILL_DEDUP_ERROR, 1e-6 by default), memory-mapped in
+~/.zen/strfry/backfill_dedup/, drop them before import:
+
+    seen.bloom                      ids imported during the current run
+                                    (reset at the start of each run)
+    known.bloom / known.prev.bloom  ids known to be in the local store, kept
+                                    across runs; when known.bloom holds
+                                    BACKFILL_DEDUP_CAPACITY ids it becomes
+                                    known.prev.bloom and a new generation starts
+
+`seed` adds the ids of local events created since the previous seed
+(`python3 -m policy.relayquery query` output on stdin), so events written by
+clients are known too.
+Ids of events deleted locally stay known: they are not re-imported.
+
+Usage:
+    python3 nostr_backfill_dedup.py reset
+    python3 nostr_backfill_dedup.py since DEFAULT_TIMESTAMP      (lower bound of the next seed scan)
+    python3 nostr_backfill_dedup.py seed < events.ndjson
+    python3 nostr_backfill_dedup.py filter IN.ndjson OUT.ndjson   → "KEPT RUN_DUPLICATES KNOWN"
+    python3 nostr_backfill_dedup.py commit IMPORTED.ndjson
+    python3 nostr_backfill_dedup.py stats
+"""
+
+import fcntl
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from contextlib import contextmanager
+
+DEDUP_DIR = os.path.join(os.path.expanduser("~"), ".zen", "strfry", "backfill_dedup")
+RUN_CAPACITY = int(os.environ.get("BACKFILL_RUN_CAPACITY", "1000000"))
+KNOWN_CAPACITY = int(os.environ.get("BACKFILL_DEDUP_CAPACITY", "2000000"))
+ERROR_RATE = float(os.environ.get("BACKFILL_DEDUP_ERROR", "0.000001"))
+# Backdated events still reach the local store after a seed
+SEED_MARGIN = 600
+
+HEADER = struct.Struct("<4sQIQQ")  # magic, bits, hashes, capacity, count
+MAGIC = b"NBF1"
+EVENT_ID = re.compile(r"^[0-9a-f]{64}$")
+ID_FIELD = re.compile(r'"id"\s*:\s*"([0-9a-fA-F]{64})"')
+
+
+class BloomFile:
+    """Bloom filter stored in a memory-mapped file (bits updated in place)."""
+
+    def __init__(self, path, capacity=RUN_CAPACITY, error_rate=ERROR_RATE):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(path, capacity, error_rate)
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.bits, self.hashes, self.capacity, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a bloom filter")
+
+    @staticmethod
+    def _create(path, capacity, error_rate):
+        bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 8)) * 8
+        hashes = max(1, int(round(bits / capacity * math.log(2))))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, bits, hashes, capacity, 0))
+            f.truncate(HEADER.size + bits // 8)  # sparse: zero bits
+        os.replace(tmp, path)
+
+    def _positions(self, event_id):
+        digest = bytes.fromhex(event_id) if EVENT_ID.match(event_id) else hashlib.sha256(event_id.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, event_id):
+        m = self._map
+        return all(m[HEADER.size + p // 8] & (1 << (p % 8)) for p in self._positions(event_id))
+
+    def add(self, event_id):
+        """Set the bits of `event_id`; True if it was not already present."""
+        m, new = self._map, False
+        for p in self._positions(event_id):
+            offset, mask = HEADER.size + p // 8, 1 << (p % 8)
+            if not m[offset] & mask:
+                m[offset] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def close(self):
+        HEADER.pack_into(self._map, 0, MAGIC, self.bits, self.hashes, self.capacity, self.count)
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+class DedupState:
+    """Run seen-set + known-id generations under an exclusive lock."""
+
+    def __init__(self, directory=DEDUP_DIR):
+        self.dir = directory
+        self.seen_path = os.path.join(directory, "seen.bloom")
+        self.known_path = os.path.join(directory, "known.bloom")
+        self.prev_path = os.path.join(directory, "known.prev.bloom")
+        self.since_path = os.path.join(directory, "known.since")
+        self.stats_path = os.path.join(directory, "run_stats.json")
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def locked(self):
+        with open(os.path.join(self.dir, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def filters(self):
+        seen = BloomFile(self.seen_path, RUN_CAPACITY)
+        known = BloomFile(self.known_path, KNOWN_CAPACITY)
+        prev = BloomFile(self.prev_path, KNOWN_CAPACITY) if os.path.exists(self.prev_path) else None
+        try:
+            yield seen, known, prev
+        finally:
+            for f in (seen, known, prev):
+                if f is not None:
+                    f.close()
+
+    def _rotate_if_full(self):
+        known = BloomFile(self.known_path, KNOWN_CAPACITY)
+        full = known.full
+        known.close()
+        if full:
+            os.replace(self.known_path, self.prev_path)
+
+    def _add_known(self, ids):
+        with self.filters() as (seen, known, prev):
+            added = sum(1 for i in ids if known.add(i))
+        self._rotate_if_full()
+        return added
+
+    def read_stats(self):
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"kept": 0, "run_duplicates": 0, "known": 0}
+
+    def _write_stats(self, stats):
+        tmp = self.stats_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp, self.stats_path)
+
+    # ------------------------------------------------------------- commands
+
+    def reset(self):
+        """Start a new run: empty seen-set and counters."""
+        with self.locked():
+            for path in (self.seen_path, self.stats_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def seed(self, lines):
+        """Add ids of local events read from `lines`; return how many were new."""
+        started = int(time.time())
+        ids = [m.group(1).lower() for m in map(ID_FIELD.search, lines) if m]
+        with self.locked():
+            added = self._add_known(ids)
+            with open(self.since_path, "w") as f:
+                f.write(f"{started - SEED_MARGIN}\n")
+        return added
+
+    def since(self, default):
+        try:
+            with open(self.since_path) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return default
+
+    def filter(self, src, dst):
+        """Copy to `dst` the events of `src` not imported yet; (kept, run_dup, known)."""
+        kept = run_dup = known_dup = 0
+        batch = set()
+        with self.locked(), self.filters() as (seen, known, prev), open(src) as fin, open(dst, "w") as fout:
+            for line in fin:
+                m = ID_FIELD.search(line)
+                event_id = m.group(1).lower() if m else None
+                if event_id is not None:
+                    if event_id in batch or event_id in seen:
+                        run_dup += 1
+                        continue
+                    if event_id in known or (prev is not None and event_id in prev):
+                        known_dup += 1
+                        continue
+                    batch.add(event_id)
+                fout.write(line)
+                kept += 1
+            stats = self.read_stats()
+            stats["kept"] += kept
+            stats["run_duplicates"] += run_dup
+            stats["known"] += known_dup
+            self._write_stats(stats)
+        return kept, run_dup, known_dup
+
+    def commit(self, path):
+        """Record the ids of an imported file (run seen-set and known ids)."""
+        with open(path) as f:
+            ids = [m.group(1).lower() for m in map(ID_FIELD.search, f) if m]
+        with self.locked():
+            with self.filters() as (seen, known, prev):
+                for event_id in ids:
+                    seen.add(event_id)
+                    known.add(event_id)
+            self._rotate_if_full()
+        return len(ids)
+
+    def stats(self):
+        with self.locked(), self.filters() as (seen, known, prev):
+            stats = self.read_stats()
+            stats.update(seen_ids=seen.count, known_ids=known.count + (prev.count if prev else 0),
+                         known_since=self.since(0))
+        stats["skipped"] = stats["run_duplicates"] + stats["known"]
+        return stats
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    state = DedupState()
+    if args == ["reset"]:
+        state.reset()
+    elif args == ["seed"]:
+        print(f"{state.seed(sys.stdin)} known ids added")
+    elif args[:1] == ["since"] and len(args) == 2:
+        print(state.since(int(args[1])))
+    elif args[:1] == ["filter"] and len(args) == 3:
+        print(*state.filter(args[1], args[2]))
+    elif args[:1] == ["commit"] and len(args) == 2:
+        print(f"{state.commit(args[1])} ids recorded")
+    elif args == ["stats"]:
+        print(" ".join(f"{k}={v}" for k, v in state.stats().items()))
+    else:
+        print(__doc__.split("Usage:")[1], file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,63 @@
 """
 Nostr WebSocket Backfill Script
 Permanent script used by backfill_constellation.sh for WebSocket connections
+
+Single request (one REQ, events saved as a JSON array):
+    python3 nostr_websocket_backfill.py <websocket_url> <req_message> <response_file> [timeout]
+
+Engine mode (a whole sync plan in one asyncio process):
+    python3 nostr_websocket_backfill.py --plan PLAN.json --output-dir DIR
+
+PLAN.json keys (defaults in PLAN_DEFAULTS):
+    peers           relay URLs, all synced concurrently
+    authors         hex pubkeys, and/or authors_file (one pubkey per line),
+                    requested in batches of batch_size
+    kinds, since, limit
+                    filter of every author batch
+    extra_filters   filters sent as is to every peer (station events)
+    timeout         seconds to wait for EOSE of one REQ
+    retries         extra attempts of a failed REQ (reconnecting if needed)
+    per_peer        REQs in flight on one peer connection
+    concurrency     REQs in flight over all peers
+
+Each peer gets one websocket connection, reused by all its REQs. Events
+already received from another peer are dropped; the new ones are streamed
+to DIR/peer-N.json (JSON array, peer N of the plan). One JSON report line
+per peer is printed on stdout when the peer is done:
+    {"peer", "file", "batches", "failed_batches", "events", "new",
+     "seconds", "events_per_sec", "status"}
 """
 
+import argparse
 import asyncio
+import itertools
 import websockets
+from websockets.exceptions import WebSocketException
 import json
+import os
+import re
 import sys
 import time
 
+PLAN_DEFAULTS = {
+    "peers": [],
+    "authors": [],
+    "authors_file": None,
+    "batch_size": 50,
+    "kinds": None,
+    "since": 0,
+    "limit": 10000,
+    "extra_filters": [],
+    "timeout": 30,
+    "retries": 2,
+    "per_peer": 2,
+    "concurrency": 8,
+}
+HEX_PUBKEY = re.compile(r"^[0-9a-fA-F]{64}$")
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# Failures that end one REQ attempt (retried on a new connection)
+REQ_ERRORS = (OSError, asyncio.TimeoutError, WebSocketException)
+
 
 async def backfill_websocket(websocket_url, req_message, response_file, timeout=30):
     """
@@ -77,10 +126,244 @@ async def backfill_websocket(websocket_url, req_message, response_file, timeout=
         return 0
 
 
+class PeerDown(ConnectionError):
+    """The peer refused every connection attempt: its remaining REQs are skipped."""
+
+
+class PeerSession:
+    """
+    One websocket connection to a peer, shared by concurrent subscriptions.
+
+    A reader task dispatches EVENT/EOSE/CLOSED messages to the queue of their
+    subscription. When the connection drops, pending subscriptions fail and
+    the next fetch() reconnects; after `max_failures` consecutive failed
+    connection attempts the peer is considered down.
+    """
+
+    def __init__(self, url, timeout=30, max_failures=3):
+        self.url = url
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.failures = 0
+        self._ws = None
+        self._reader = None
+        self._subs = {}
+        self._sub_ids = itertools.count(1)
+        self._connecting = asyncio.Lock()
+
+    async def _connection(self):
+        async with self._connecting:
+            if self._ws is None:
+                if self.failures >= self.max_failures:
+                    raise PeerDown(f"{self.url}: {self.failures} failed connection attempts")
+                try:
+                    self._ws = await asyncio.wait_for(
+                        websockets.connect(self.url, ping_interval=None, ping_timeout=None,
+                                           max_size=MAX_MESSAGE_SIZE),
+                        timeout=self.timeout)
+                except REQ_ERRORS:
+                    self.failures += 1
+                    raise
+                self.failures = 0
+                self._reader = asyncio.ensure_future(self._read(self._ws))
+            return self._ws
+
+    async def _read(self, ws):
+        try:
+            async for message in ws:
+                try:
+                    data = json.loads(message)
+                except ValueError:
+                    continue
+                if not isinstance(data, list) or len(data) < 2 or not isinstance(data[1], str):
+                    continue
+                if data[0] == "NOTICE":
+                    print(f"Notice from {self.url}: {data[1]}", file=sys.stderr)
+                    continue
+                queue = self._subs.get(data[1])
+                if queue is not None:
+                    queue.put_nowait(data)
+        except REQ_ERRORS:
+            pass
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            for queue in self._subs.values():
+                queue.put_nowait(None)
+
+    async def fetch(self, flt):
+        """
+        Send one REQ and collect its events.
+
+        Returns:
+            (events, complete) - complete is False when EOSE did not arrive
+            within `timeout` (events received so far are kept)
+        """
+        ws = await self._connection()
+        sub_id = f"backfill{next(self._sub_ids)}"
+        queue = asyncio.Queue()
+        self._subs[sub_id] = queue
+        events = []
+        complete = False
+        loop = asyncio.get_event_loop()
+        try:
+            await ws.send(json.dumps(["REQ", sub_id, flt]))
+            deadline = loop.time() + self.timeout
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if message is None:
+                    raise ConnectionError(f"{self.url}: connection lost")
+                if message[0] == "EVENT" and len(message) > 2 and isinstance(message[2], dict):
+                    events.append(message[2])
+                elif message[0] == "EOSE":
+                    complete = True
+                    break
+                elif message[0] == "CLOSED":
+                    raise ConnectionError(f"{self.url}: subscription closed: {message[2:]}")
+            if self._ws is ws:
+                try:
+                    await ws.send(json.dumps(["CLOSE", sub_id]))
+                except REQ_ERRORS:
+                    pass
+        finally:
+            del self._subs[sub_id]
+        return events, complete
+
+    async def close(self):
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            await ws.close()
+        if self._reader is not None:
+            await self._reader
+
+
+def load_plan(path):
+    """Read a sync plan, fill defaults and keep valid, unique author pubkeys."""
+    with open(path) as f:
+        plan = dict(PLAN_DEFAULTS, **json.load(f))
+    authors = list(plan["authors"])
+    if plan["authors_file"]:
+        with open(plan["authors_file"]) as f:
+            authors.extend(line.strip() for line in f)
+    unique = {}
+    for author in authors:
+        if HEX_PUBKEY.match(author):
+            unique.setdefault(author.lower(), None)
+    plan["authors"] = list(unique)
+    return plan
+
+
+def plan_filters(plan):
+    """REQ filters sent to every peer: author batches, then extra filters."""
+    base = {"since": plan["since"], "limit": plan["limit"]}
+    if plan["kinds"]:
+        base["kinds"] = plan["kinds"]
+    authors, size = plan["authors"], max(1, plan["batch_size"])
+    filters = [dict(base, authors=authors[i:i + size]) for i in range(0, len(authors), size)]
+    return (filters or [base]) + list(plan["extra_filters"])
+
+
+async def sync_peer(number, url, filters, plan, seen, slots, output_dir):
+    """Run every filter of the plan against one peer; return its report."""
+    session = PeerSession(url, plan["timeout"], plan["retries"] + 1)
+    peer_slots = asyncio.Semaphore(plan["per_peer"])
+    path = os.path.join(output_dir, f"peer-{number}.json")
+    report = {"peer": url, "file": path, "batches": len(filters), "failed_batches": 0,
+              "events": 0, "new": 0}
+    started = time.monotonic()
+
+    with open(path, "w") as out:
+        out.write("[")
+
+        def write_new(events):
+            report["events"] += len(events)
+            for event in events:
+                event_id = event.get("id")
+                if event_id in seen:
+                    continue
+                seen.add(event_id)
+                out.write(("\n" if not report["new"] else ",\n") + json.dumps(event))
+                report["new"] += 1
+
+        async def run(flt):
+            for attempt in range(plan["retries"] + 1):
+                if attempt:
+                    await asyncio.sleep(3 * attempt)  # Backoff: 3s, 6s
+                try:
+                    async with peer_slots, slots:
+                        events, complete = await session.fetch(flt)
+                except PeerDown:
+                    break
+                except REQ_ERRORS as e:
+                    print(f"REQ failed on {url} (attempt {attempt + 1}): {e}", file=sys.stderr)
+                    continue
+                if complete or events:
+                    write_new(events)
+                    return
+            report["failed_batches"] += 1
+
+        try:
+            await asyncio.gather(*(run(flt) for flt in filters))
+        finally:
+            out.write("\n]\n")
+            try:
+                await session.close()
+            except REQ_ERRORS:
+                pass
+
+    seconds = time.monotonic() - started
+    report["seconds"] = round(seconds, 3)
+    report["events_per_sec"] = round(report["events"] / seconds, 1) if seconds > 0 else 0.0
+    report["status"] = "ok" if report["failed_batches"] < report["batches"] else "failed"
+    return report
+
+
+async def run_plan(plan, output_dir):
+    """Sync all peers of the plan concurrently, printing each report when done."""
+    os.makedirs(output_dir, exist_ok=True)
+    filters = plan_filters(plan)
+    seen = set()
+    slots = asyncio.Semaphore(plan["concurrency"])
+    started = time.monotonic()
+    reports = []
+    tasks = [sync_peer(number, url, filters, plan, seen, slots, output_dir)
+             for number, url in enumerate(plan["peers"], 1)]
+    for task in asyncio.as_completed(tasks):
+        report = await task
+        reports.append(report)
+        print(json.dumps(report), flush=True)
+    seconds = time.monotonic() - started
+    events = sum(r["events"] for r in reports)
+    print(f"Plan: {len(reports)} peers x {len(filters)} REQs, {events} events "
+          f"({len(seen)} unique) in {seconds:.1f}s", file=sys.stderr)
+    return reports
+
+
+def main_plan(argv):
+    """Engine mode entry point (--plan)."""
+    parser = argparse.ArgumentParser(prog="nostr_websocket_backfill.py")
+    parser.add_argument("--plan", required=True, help="sync plan (JSON)")
+    parser.add_argument("--output-dir", required=True, help="directory of the peer-N.json files")
+    args = parser.parse_args(argv)
+    try:
+        plan = load_plan(args.plan)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Invalid plan {args.plan}: {e}", file=sys.stderr)
+        sys.exit(2)
+    reports = asyncio.run(run_plan(plan, args.output_dir))
+    sys.exit(0 if any(r["status"] == "ok" for r in reports) else 1)
+
+
 def main():
     """Main entry point"""
+    if "--plan" in sys.argv[1:]:
+        main_plan(sys.argv[1:])
     if len(sys.argv) not in [4, 5]:
         print("Usage: python3 nostr_websocket_backfill.py <websocket_url> <req_message> <response_file> [timeout]")
+        print("       python3 nostr_websocket_backfill.py --plan PLAN.json --output-dir DIR")
         sys.exit(1)
     
     websocket_url = sys.argv[1]
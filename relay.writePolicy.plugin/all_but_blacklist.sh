@@ -7,6 +7,10 @@
 #~ blacklisted_pubkey2
 #~
 #~ Elle est alimentée par le script ~/.zen/Astroport.ONE/IA/UPlanet_IA_Responder.sh
+#~ Lecture et écriture par `python3 -m policy.blacklist contains|add|remove` :
+#~ les retraits sont journalisés (blacklist.txt.journal) jusqu'à la compaction,
+#~ et un ajout direct doit tenir le verrou :
+#~   flock blacklist.txt.lock sh -c 'echo "$pubkey" >> blacklist.txt'
 #~ /filter/$kind.sh sont les scripts qui filtrent les événements.
 #~ /filter/1.sh est le script qui filtre les événements de type 1
 #~ etc...
@@ -14,6 +18,13 @@
 MY_PATH="`dirname \"$0\"`"              # relative
 MY_PATH="`( cd \"$MY_PATH\" && pwd )`"  # absolutized and normalized
 
+# Moteur persistant (policy_engine.py) : même protocole stdin/stdout, une seule
+# analyse JSON par événement et blacklist / classification en mémoire.
+# NIP101_POLICY_ENGINE=bash pour conserver la boucle shell ci-dessous.
+if [[ "${NIP101_POLICY_ENGINE:-python}" != "bash" ]] && command -v python3 >/dev/null 2>&1; then
+    exec python3 "$MY_PATH/policy_engine.py"
+fi
+
 # Source common functions
 source "$MY_PATH/filter/common.sh"
 
@@ -25,7 +36,7 @@ mkdir -p "$(dirname "$LOG_FILE")"
 
 # Fonction de logging qui écrit seulement dans le fichier de log, pas dans stdout
 log_message() {
-    echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" >> "$LOG_FILE"
+    printf '%(%Y-%m-%d %H:%M:%S)T - %s\n' -1 "$1" >> "$LOG_FILE"
 }
 
 # Définition du répertoire de stockage des clés publiques
@@ -37,23 +48,16 @@ BLACKLIST_FILE="$HOME/.zen/strfry/blacklist.txt"
 # Fichier contenant les amis des amis
 AMIS_OF_AMIS_FILE="$HOME/.zen/strfry/amisOfAmis.txt"
 
-# Fonction pour vérifier si une pubkey a un compte MULTIPASS et la retirer de la blacklist
+# Fonction pour vérifier si une pubkey blacklistée a un compte MULTIPASS et la retirer de la blacklist
 check_multipass_and_remove_from_blacklist() {
     local pubkey="$1"
     
-    # Vérifier d'abord si la pubkey est réellement dans la blacklist
-    if [[ ! -f "$BLACKLIST_FILE" ]] || ! grep -q "^$pubkey$" "$BLACKLIST_FILE"; then
-        return 1 # Pubkey not in blacklist, nothing to remove
-    fi
-    
     # Vérifier si la pubkey existe dans un fichier HEX sous ~/.zen/game/nostr/*/HEX
     if cat "$KEY_DIR"/*/HEX 2>/dev/null | grep -q "^$pubkey$"; then
         log_message "Found pubkey $pubkey in MULTIPASS account, removing from blacklist"
         
-        # Créer un fichier temporaire sans la pubkey
-        local temp_file=$(mktemp)
-        grep -v "^$pubkey$" "$BLACKLIST_FILE" > "$temp_file"
-        mv "$temp_file" "$BLACKLIST_FILE"
+        # Retrait journalisé (une ligne dans blacklist.txt.journal)
+        policy_module blacklist remove "$pubkey"
         log_message "Removed pubkey $pubkey from blacklist due to MULTIPASS account"
         
         return 0 # Pubkey removed from blacklist
@@ -62,23 +66,16 @@ check_multipass_and_remove_from_blacklist() {
     return 1 # Pubkey not found in MULTIPASS accounts
 }
 
-# Fonction pour vérifier si une pubkey est dans amisOfAmis et la retirer de la blacklist
+# Fonction pour vérifier si une pubkey blacklistée est dans amisOfAmis et la retirer de la blacklist
 check_amis_of_amis_and_remove_from_blacklist() {
     local pubkey="$1"
     
-    # Vérifier d'abord si la pubkey est réellement dans la blacklist
-    if [[ ! -f "$BLACKLIST_FILE" ]] || ! grep -q "^$pubkey$" "$BLACKLIST_FILE"; then
-        return 1 # Pubkey not in blacklist, nothing to remove
-    fi
-    
 # Vérifier si la pubkey existe dans le fichier amisOfAmis.txt (local ou swarm)
     if grep -q -h "^$pubkey$" "$AMIS_OF_AMIS_FILE" "$HOME/.zen/tmp/swarm/"*/amisOfAmis.txt 2>/dev/null; then
         log_message "Found pubkey $pubkey in amisOfAmis.txt, removing from blacklist"
         
-        # Créer un fichier temporaire sans la pubkey
-        local temp_file=$(mktemp)
-        grep -v "^$pubkey$" "$BLACKLIST_FILE" > "$temp_file"
-        mv "$temp_file" "$BLACKLIST_FILE"
+        # Retrait journalisé (une ligne dans blacklist.txt.journal)
+        policy_module blacklist remove "$pubkey"
         log_message "Removed pubkey $pubkey from blacklist due to amisOfAmis.txt"
         
         return 0 # Pubkey removed from blacklist
@@ -91,6 +88,13 @@ check_amis_of_amis_and_remove_from_blacklist() {
 # Cherche dans les fichiers HEX publiés via IPNS par chaque station
 check_swarm_node_hex() {
     local pubkey="$1"
+    # Index exporté par policy_engine.py si disponible
+    if _identity_index_lookup "$pubkey" "swarm_node" >/dev/null; then
+        return 0
+    elif [[ $? -eq 1 ]]; then
+        _identity_index_lookup "$pubkey" "captain" >/dev/null
+        return
+    fi
     # Nœud local
     [[ -n "$IPFSNODEID" && -f "$HOME/.zen/tmp/$IPFSNODEID/HEX" ]] && \
         grep -q "^$pubkey$" "$HOME/.zen/tmp/$IPFSNODEID/HEX" 2>/dev/null && return 0
@@ -104,23 +108,18 @@ check_swarm_node_hex() {
 is_key_blacklisted() {
     local pubkey="$1"
     
-    # Vérifier d'abord si la pubkey a un compte MULTIPASS
-    check_multipass_and_remove_from_blacklist "$pubkey"
-    
-    # Vérifier ensuite si la pubkey est dans amisOfAmis.txt
-    check_amis_of_amis_and_remove_from_blacklist "$pubkey"
-    
-    # Vérifier si le fichier blacklist existe
-    if [[ ! -f "$BLACKLIST_FILE" ]]; then
-        return 1 # Pas de blacklist, clé non blacklistée
+    # Store journalisé (policy/blacklist.py) : blacklist.txt et retraits en attente
+    if ! policy_module blacklist contains "$pubkey"; then
+        return 1 # Clé non blacklistée
     fi
     
-    # Vérification rapide avec grep
-    if grep -q "^$pubkey$" "$BLACKLIST_FILE"; then
-        return 0 # Clé blacklistée
+    # Compte MULTIPASS ou amisOfAmis.txt : la clé sort de la blacklist
+    if check_multipass_and_remove_from_blacklist "$pubkey" \
+        || check_amis_of_amis_and_remove_from_blacklist "$pubkey"; then
+        return 1
     fi
     
-    return 1 # Clé non blacklistée
+    return 0 # Clé blacklistée
 }
 
 # Function to classify user type: nobody, player, or uplanet
@@ -157,10 +156,10 @@ classify_user() {
 process_new_event() {
     local event_json="$1"
     
-    # Extraire les informations nécessaires de l'événement
-    local event_id=$(echo "$event_json" | jq -r '.event.id')
-    local pubkey=$(echo "$event_json" | jq -r '.event.pubkey')
-    local kind=$(echo "$event_json" | jq -r '.event.kind')
+    # Contexte déjà décodé par la boucle principale (event_context_load, exporté aux filtres)
+    local event_id="$_ev_id"
+    local pubkey="$_ev_pubkey"
+    local kind="$_ev_kind"
     local current_time=$(date +%s)
 
     log_message "Processing event ID: $event_id, pubkey: $pubkey, kind: $kind"
@@ -227,13 +226,10 @@ while IFS= read -r line; do
         continue
     fi
 
-    # Vérifier si la ligne contient un JSON valide
-    if echo "$line" | jq -e '.' > /dev/null 2>&1; then
-        # Extraire le type d'événement
-        parsed=$(echo "$line" | jq -e '{type:.type, id:.event.id, kind:.event.kind}' 2>/dev/null) || { echo '{"action":"reject"}'; continue; }
-        event_type=$(echo "$parsed" | jq -r '.type')
-        event_id=$(echo "$parsed"   | jq -r '.id')
-        event_kind=$(echo "$parsed" | jq -r '.kind')
+    # Décoder l'événement une seule fois (un seul jq, JSON invalide → reject)
+    if event_context_load "$line"; then
+        event_type="$_ev_type"
+        event_id="$_ev_id"
 
         if [[ "$event_type" == "new" ]]; then
             # Traiter les nouveaux événements
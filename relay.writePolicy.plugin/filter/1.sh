@@ -23,18 +23,15 @@ longitude="$longitude"
 ############################################################
 # Variables pour la gestion du message "Hello NOSTR visitor"
 BLACKLIST_FILE="$HOME/.zen/strfry/blacklist.txt"
-COUNT_DIR="$HOME/.zen/strfry/pubkey_counts"
-WARNING_MESSAGES_DIR="$HOME/.zen/strfry/warning_messages"
-MESSAGE_LIMIT=3
+COUNT_DIR="$HOME/.zen/strfry/pubkey_counts"  # lastevent (anti-doublon #BRO)
+MESSAGE_LIMIT=3  # messages par fenêtre glissante de 48 h (policy/visitors.py)
 VISITOR_MESSAGE_EXPIRY=86400  # 24 hours in seconds for visitor messages
 
-# Variables pour la gestion de la file d'attente des traitements #BRO or #BOT
-QUEUE_DIR="$HOME/.zen/tmp/uplanet_queue"
-mkdir -p "$QUEUE_DIR" "$WARNING_MESSAGES_DIR"
-MAX_QUEUE_SIZE=5
+# Variables pour la file d'attente des traitements #BRO or #BOT (policy/iaqueue.py)
+MAX_QUEUE_SIZE=20  # travaux en attente, les moins prioritaires sont abandonnés au-delà
 PROCESS_TIMEOUT=300  # 5 minutes timeout for processing
-QUEUE_CLEANUP_AGE=3600  # 1 hour for queue file cleanup
-WARNING_MESSAGE_TTL=172800  # 48 heures en secondes
+IA_WORKERS=2  # répondeurs exécutés en parallèle
+WARNING_MESSAGE_TTL=172800  # 48 heures : fenêtre des compteurs visiteurs et suppression des réponses (policy/expiry.py)
 
 # Logging functions using common utilities (must be defined before use)
 log_uplanet() {
@@ -129,75 +126,6 @@ if [[ "$content" == *"#plantnet"* ]]; then
     log_uplanet "PLANTNET message detected - will be processed by UPlanet_IA_Responder.sh"
 fi
 
-# Optimized cleanup function with better logging
-cleanup_warning_messages() {
-    local current_time=$(date +%s)
-    local cutoff_time=$((current_time - WARNING_MESSAGE_TTL))
-
-    # Use UMAP 0.00,0.00 pubkey for cleanup — derive from NPUB (not NSEC) for correct public key hex
-    local UMAP_PUBKEY=""
-    local UMAPNSEC=$($HOME/.zen/Astroport.ONE/tools/keygen -t nostr "${UPLANETNAME}0.00" "${UPLANETNAME}0.00" -s)
-    if [[ -n "$UMAPNSEC" ]]; then
-        local _UMAP_NPUB=$($HOME/.zen/Astroport.ONE/tools/keygen -t nostr "${UPLANETNAME}0.00" "${UPLANETNAME}0.00" 2>/dev/null)
-        UMAP_PUBKEY=$($HOME/.zen/Astroport.ONE/tools/nostr2hex.py "$_UMAP_NPUB" 2>/dev/null)
-        if [[ -z "$UMAP_PUBKEY" ]]; then
-            log_uplanet "Warning: Failed to convert UMAP NPUB to HEX for cleanup"
-            return 1
-        fi
-    else
-        log_uplanet "Warning: Failed to generate UMAP NSEC for cleanup"
-        return 1
-    fi
-
-    if [[ -n "$UMAP_PUBKEY" ]]; then
-        log_uplanet "Cleaning up old visitor messages sent by UMAP 0.00,0.00: $UMAP_PUBKEY (older than $(date -d "@$cutoff_time"))"
-
-        cd "$HOME/.zen/strfry"
-        # Search for both "Hello NOSTR visitor" and BRO response messages from UMAP 0.00,0.00
-        local messages_48h_json=$(./strfry scan \
-            '{"authors":["'"$UMAP_PUBKEY"'"], "until":'"$cutoff_time"', "kinds":[1]}' \
-            2>/dev/null)
-
-        local message_ids=()
-        if echo "$messages_48h_json" | jq -e '.id' >/dev/null 2>&1; then
-            # Find messages containing "Hello NOSTR visitor" or BRO responses
-            message_ids=($(echo "$messages_48h_json" | jq -r 'select(.content | contains("Hello NOSTR visitor") or (.tags[] | select(.[0] == "t" and .[1] == "BRO"))) | .id'))
-        fi
-        cd - >/dev/null
-
-        if [ ${#message_ids[@]} -gt 0 ]; then
-            local ids_string=""
-            for id in "${message_ids[@]}"; do
-                ids_string+="\"$id\","
-            done
-            ids_string=${ids_string%,} # Remove trailing comma
-
-            log_uplanet "Deleting old visitor messages by ID: $ids_string"
-
-            cd "$HOME/.zen/strfry"
-            ./strfry delete --filter "{\"ids\":[$ids_string]}" >> "$HOME/.zen/tmp/nostr_kind1_messages.log" 2>&1
-            cd - >/dev/null
-        else
-            log_uplanet "No old visitor messages from UMAP 0.00,0.00 found to delete."
-        fi
-    else
-        log_uplanet "Warning: UMAP 0.00,0.00 key not found/set. Skipping visitor message cleanup."
-    fi
-
-    # Cleanup of individual warning tracking files (if older than TTL)
-    for warning_file in "$WARNING_MESSAGES_DIR"/*; do
-        [[ ! -f "$warning_file" ]] && continue
-
-        local file_time=$(stat -c %Y "$warning_file" 2>/dev/null)
-        [[ -z "$file_time" ]] && continue
-
-        if [ $((current_time - file_time)) -gt $WARNING_MESSAGE_TTL ]; then
-            log_uplanet "Cleaning up 48h old warning tracking file for pubkey: $(basename "$warning_file")"
-            rm -f "$warning_file"
-        fi
-    done
-}
-
 # Optimized visitor message handling
 handle_visitor_message() {
     local pubkey="$1"
@@ -205,40 +133,35 @@ handle_visitor_message() {
     local visitor_content="$3"
 
     # Compute UMAP 0.00,0.00 public key to detect self-messages and prevent self-blacklisting
-    local UMAP_NPUB=$($HOME/.zen/Astroport.ONE/tools/keygen -t nostr "${UPLANETNAME}0.00" "${UPLANETNAME}0.00" 2>/dev/null)
-    local UMAP_HEX=""
-    [[ -n "$UMAP_NPUB" ]] && UMAP_HEX=$($HOME/.zen/Astroport.ONE/tools/nostr2hex.py "$UMAP_NPUB" 2>/dev/null)
+    local UMAP_LAT UMAP_LON UMAP_HEX UMAP_NPUB
+    umap_key "0.00" "0.00"
     if [[ -n "$UMAP_HEX" && "$pubkey" == "$UMAP_HEX" ]]; then
         log_uplanet "Skipping visitor handling for UMAP 0.00,0.00 key — adding to amisOfAmis"
         add_to_amis_of_amis "$UMAP_HEX" "UMAP 0.00,0.00 key (auto-whitelist)"
         return 0
     fi
 
-    # Nettoyer les anciens messages d'avertissement
-    cleanup_warning_messages &
+    # Supprimer les avertissements / réponses BRO échus (policy/expiry.py, un seul balayeur)
+    expiry_sweep_due
 
-    # Créer le répertoire de comptage si inexistant
-    mkdir -p "$COUNT_DIR" 2>/dev/null
+    # Compteur du visiteur (fenêtre glissante) : "warn|block|blacklisted COUNT REMAINING"
+    # Au-delà de MESSAGE_LIMIT, la clé est ajoutée à blacklist.txt par le store.
+    # --not-blacklisted : l'appelant (moteur, all_but_blacklist.sh) a déjà écarté les clés blacklistées
+    local visitor_action next_count remaining_messages
+    read -r visitor_action next_count remaining_messages \
+        < <(NIP101_VISITOR_MESSAGE_LIMIT="$MESSAGE_LIMIT" NIP101_VISITOR_WINDOW="$WARNING_MESSAGE_TTL" \
+            policy_module visitors hit "$pubkey" --not-blacklisted 2>>"$HOME/.zen/tmp/nostr_kind1_messages.log")
 
-    # Vérifier si la clé publique est déjà blacklistée
-    if grep -q "^$pubkey$" "$BLACKLIST_FILE" 2>/dev/null; then
+    if [[ "$visitor_action" == "blacklisted" ]]; then
         echo "Pubkey $pubkey is blacklisted, skipping visitor message."
         return 0
     fi
+    if [[ -z "$visitor_action" ]]; then
+        log_uplanet "Warning: visitor counter unavailable for $pubkey, skipping visitor message"
+        return 0
+    fi
 
-    local count_file="$COUNT_DIR/$pubkey"
-    local warning_file="$WARNING_MESSAGES_DIR/$pubkey"
-
-    # Initialiser le compteur à 0 si le fichier n'existe pas
-    local current_count=0
-    [[ -f "$count_file" ]] && current_count=$(cat "$count_file")
-
-    local next_count=$((current_count + 1))
-    local remaining_messages=$((MESSAGE_LIMIT - next_count))
-
-    echo "$next_count" > "$count_file"
-
-    if [[ "$next_count" -le "$MESSAGE_LIMIT" ]]; then
+    if [[ "$visitor_action" == "warn" ]]; then
         (
         # Use UMAP 0.00,0.00 key for visitor messages instead of captain key
         UMAPNSEC=$($HOME/.zen/Astroport.ONE/tools/keygen -t nostr "${UPLANETNAME}0.00" "${UPLANETNAME}0.00" -s)
@@ -275,7 +198,10 @@ Get a #MULTIPASS to access localized content
 "
 
             # Calculate expiration timestamp (current time + expiry duration)
-            EXPIRY_TIMESTAMP=$(($(date +%s) + VISITOR_MESSAGE_EXPIRY))
+            printf -v SENT_TIMESTAMP '%(%s)T' -1
+            EXPIRY_TIMESTAMP=$((SENT_TIMESTAMP + VISITOR_MESSAGE_EXPIRY))
+            # Suppression de la base strfry après WARNING_MESSAGE_TTL (policy/expiry.py)
+            DELETE_TIMESTAMP=$((SENT_TIMESTAMP + WARNING_MESSAGE_TTL))
             log_uplanet "⏰ Visitor message will expire at: $(date -d "@$EXPIRY_TIMESTAMP") (${VISITOR_MESSAGE_EXPIRY}s from now)"
             
             # Envoyer le message d'avertissement avec expiration
@@ -296,8 +222,7 @@ Get a #MULTIPASS to access localized content
             # Extraire l'ID du message d'avertissement
             WARNING_MSG_ID=$(echo "$WARNING_MSG_OUTPUT" | grep -oE '"event_id": "[a-f0-9]{64}"' | cut -d'"' -f4 | head -n 1)
 
-            # Update the warning file timestamp
-            touch "$warning_file"
+            [[ -n "$WARNING_MSG_ID" ]] && expiry_schedule "$WARNING_MSG_ID" "$DELETE_TIMESTAMP" visitor_warning
             log_uplanet "Warning message sent (ID: $WARNING_MSG_ID) and tracked for pubkey: $pubkey"
             log_uplanet "$WARNING_MSG_OUTPUT"
             
@@ -356,6 +281,7 @@ Get a #MULTIPASS to access localized content
                 rm "$TMP_KEYFILE"
                 
                 BRO_MSG_ID=$(echo "$BRO_MSG_OUTPUT" | grep -oE '"event_id": "[a-f0-9]{64}"' | cut -d'"' -f4 | head -n 1)
+                [[ -n "$BRO_MSG_ID" ]] && expiry_schedule "$BRO_MSG_ID" "$DELETE_TIMESTAMP" visitor_bro
                 log_uplanet "BRO response sent (ID: $BRO_MSG_ID) for visitor: $pubkey"
                 log_uplanet "$BRO_MSG_OUTPUT"
             fi
@@ -366,79 +292,28 @@ Get a #MULTIPASS to access localized content
         cd ~/.zen/strfry
         ./strfry delete --filter "{\"authors\":[\"$pubkey\"]}"
         cd -
-        echo "$pubkey" >> "$BLACKLIST_FILE"
-        rm -f "$warning_file"
-        rm -f "$count_file"
     fi
     return 0
 }
 
-# Optimized queue management functions
-cleanup_old_queue_files() {
-    find "$QUEUE_DIR" -type f -mmin +60 -delete 2>/dev/null
-}
-
-check_stuck_processes() {
-    local current_time=$(date +%s)
-    for pid in $(pgrep -f "UPlanet_IA_Responder.sh"); do
-        local process_start=$(ps -p $pid -o lstart= 2>/dev/null)
-        if [ -n "$process_start" ]; then
-            local start_time=$(date -d "$process_start" +%s 2>/dev/null)
-            if [ $? -eq 0 ] && [ $((current_time - start_time)) -gt $PROCESS_TIMEOUT ]; then
-                kill -9 $pid 2>/dev/null
-                log_uplanet "Killed stuck UPlanet_IA_Responder.sh process $pid"
-            fi
-        fi
-    done
-}
-
-# Optimized queue file creation
-create_queue_file() {
-    QUEUE_FILE="$QUEUE_DIR/${pubkey}.sh"
-    cat > "$QUEUE_FILE" << EOF
-pubkey="$pubkey"
-event_id="$event_id"
-latitude="$latitude"
-longitude="$longitude"
-full_content="$full_content"
-url="$url"
-KNAME="$KNAME"
-ORIGINAL_GEO_LAT="$ORIGINAL_GEO_LAT"
-ORIGINAL_GEO_LON="$ORIGINAL_GEO_LON"
-EOF
-}
-
-# Streamlined queue processing
-process_queue() {
-    cleanup_old_queue_files
-    check_stuck_processes
-
-    [[ -z "$(ls -A $QUEUE_DIR/ 2>/dev/null)" ]] && return 0
-
-    # Check if process is already running
-    if pgrep -f "UPlanet_IA_Responder.sh" > /dev/null; then
-        # Only queue if content contains #BRO or #BOT
-        if [[ "$full_content" == *"#BRO"* || "$full_content" == *"#BOT"* ]]; then
-            local queue_size=$(ls -1 $QUEUE_DIR/ 2>/dev/null | wc -l)
-            if [ "$queue_size" -lt "$MAX_QUEUE_SIZE" ]; then
-                create_queue_file
-            else
-                log_uplanet "Queue is full, message dropped: $event_id"
-            fi
-        fi
-        
-        exit 0
-    else
-        # Launch process directly
-        local secret_flag=""
-        [[ "$is_secret_message" == true ]] && secret_flag="--secret"
-        
-        timeout $PROCESS_TIMEOUT $HOME/.zen/Astroport.ONE/IA/UPlanet_IA_Responder.sh "$pubkey" "$event_id" "$latitude" "$longitude" "$full_content" "$url" "$KNAME" "$ORIGINAL_GEO_LAT" "$ORIGINAL_GEO_LON" $secret_flag &
+# Mise en file de UPlanet_IA_Responder.sh (dédoublonnage par event / pubkey, priorités,
+# pool de répondeurs avec délai maximal) : affiche queued|replaced|duplicate|full
+enqueue_ia_response() {
+    local ia_class="bro"
+    local secret_flag=()
+    [[ "$is_plantnet_message" == true ]] && ia_class="plantnet"
+    if [[ "$is_secret_message" == true ]]; then
+        ia_class="secret"
+        secret_flag=(--secret)
     fi
+    
+    NIP101_IA_QUEUE_MAX="$MAX_QUEUE_SIZE" NIP101_IA_TIMEOUT="$PROCESS_TIMEOUT" NIP101_IA_WORKERS="$IA_WORKERS" \
+        policy_module iaqueue enqueue --event "$event_id" --pubkey "$pubkey" --class "$ia_class" -- \
+        "$pubkey" "$event_id" "$latitude" "$longitude" "$full_content" "$url" "$KNAME" \
+        "$ORIGINAL_GEO_LAT" "$ORIGINAL_GEO_LON" "${secret_flag[@]}" 2>>"$HOME/.zen/tmp/nostr_kind1_messages.log"
 }
 
 ################# MAIN TREATMENT
-process_queue
 
 if [[ "$check" != "nobody" ]]; then
     # UPlanet APP NOSTR messages.
@@ -449,22 +324,9 @@ if [[ "$check" != "nobody" ]]; then
         log_uplanet "OK Authorized key : $KNAME"
         log_uplanet "UPlanet Message - Lat: $latitude, Lon: $longitude, Content: $full_content"
 
-        # Check if process is running
-        if pgrep -f "UPlanet_IA_Responder.sh" > /dev/null; then
-            queue_size=$(ls -1 $QUEUE_DIR/ 2>/dev/null | wc -l)
-            if [ "$queue_size" -lt "$MAX_QUEUE_SIZE" ]; then
-                create_queue_file
-                log_uplanet "QUEUE_FILE: $QUEUE_FILE"
-            else
-                log_uplanet "Queue is full, message dropped: $event_id"
-            fi
-        else
-            log_ia "PROCESSING UPlanet_IA_Responder.sh $pubkey $event_id $latitude $longitude $full_content $url $KNAME"
-            secret_flag=""
-            [[ "$is_secret_message" == true ]] && secret_flag="--secret"
-            
-            timeout $PROCESS_TIMEOUT $HOME/.zen/Astroport.ONE/IA/UPlanet_IA_Responder.sh "$pubkey" "$event_id" "$latitude" "$longitude" "$full_content" "$url" "$KNAME" "$ORIGINAL_GEO_LAT" "$ORIGINAL_GEO_LON" $secret_flag 2>&1 >> "$HOME/.zen/tmp/IA.log" &
-        fi
+        ia_result=$(enqueue_ia_response)
+        log_uplanet "IA_QUEUE: ${ia_result:-enqueue failed} ($event_id)"
+        log_ia "QUEUED UPlanet_IA_Responder.sh $pubkey $event_id $latitude $longitude $full_content $url $KNAME"
 
         echo "$event_id" > "$COUNT_DIR/lastevent"
         [[ "$is_secret_message" == true ]] && exit 1 || exit 0
@@ -18,22 +18,23 @@ log_report() { log_with_timestamp "$LOG_FILE" "$1"; }
 event_json="$1"
 extract_event_data "$event_json"
 
-# Extraire p, e, reason via extract_tags (noms sans tiret → variables bash valides)
+# Extraire p, e, reason via extract_tags (contexte déjà décodé, pas de jq)
 extract_tags "$event_json" "p" "e" "reason"
 reported_pubkey="$p"
 reported_event_id="$e"
 
-# report-type contient un tiret → extraction directe via jq (extract_tags ne peut pas créer
-# une variable bash avec tiret dans le nom)
-report_type=$(echo "$event_json" | jq -r '
-    .event.tags[] | select(.[0] == "report-type") | .[1]' 2>/dev/null | head -1)
+# report-type contient un tiret : première valeur depuis le multimap des tags
+report_type=$(event_tag "report-type")
+
+# Rapporteur et partie signalée résolus en une passe (tableaux AUTH_*)
+check_authorizations "$pubkey" "$reported_pubkey"
 
 # Vérifier l'autorisation du rapporteur
-if ! check_authorization "$pubkey" "log_report"; then
+if ! auth_log "log_report" "$pubkey"; then
     exit 1
 fi
-reporter_email="$EMAIL"
-reporter_source="$SOURCE"
+reporter_email="${AUTH_EMAIL[$pubkey]}"
+reporter_source="${AUTH_SOURCE[$pubkey]}"
 
 if [[ -z "$reported_pubkey" ]]; then
     log_report "REJECTED: 'p' tag manquant (pubkey de la personne signalée)"
@@ -46,18 +47,16 @@ if [[ -z "$report_type" ]]; then
 fi
 
 # Vérifier si la partie signalée est membre UPlanet
-if check_authorization "$reported_pubkey" "log_report" 2>/dev/null; then
+if auth_log "log_report" "$reported_pubkey"; then
     reported_in_uplanet=true
-    reported_email="$EMAIL"
-    reported_source="$SOURCE"
+    reported_email="${AUTH_EMAIL[$reported_pubkey]}"
+    reported_source="${AUTH_SOURCE[$reported_pubkey]}"
     log_report "REPORT: ${pubkey:0:8}... signale ${reported_pubkey:0:8}... (membre UPlanet: $reported_email depuis $reported_source)"
 else
     reported_in_uplanet=false
     reported_email=""
     log_report "REPORT: ${pubkey:0:8}... signale utilisateur externe ${reported_pubkey:0:8}..."
 fi
-EMAIL="$reporter_email"
-SOURCE="$reporter_source"
 
 log_report "REPORT: Type: $report_type"
 [[ -n "$reported_event_id" ]] && log_report "REPORT: Événement signalé: ${reported_event_id:0:8}..."
@@ -80,11 +79,9 @@ case "$report_type" in
         if [[ "$reported_in_uplanet" != "true" ]]; then
             log_report "FRICTION: Pas de dossier N1 — ${reported_pubkey:0:8}... n'est pas membre UPlanet MULTIPASS"
         else
-            # Tags spécifiques friction (noms sans tiret → jq direct)
-            friction_amount=$(echo "$event_json" | jq -r '
-                .event.tags[] | select(.[0] == "friction-amount") | .[1]' 2>/dev/null | head -1)
-            friction_object=$(echo "$event_json" | jq -r '
-                .event.tags[] | select(.[0] == "object") | .[1]' 2>/dev/null | head -1)
+            # Tags spécifiques friction (première valeur)
+            friction_amount="${_ev_first[friction-amount]-}"
+            friction_object="${_ev_first[object]-}"
             friction_amount="${friction_amount:-0}"
 
             # Seuil de niveau selon montant (barème mutualiste)
@@ -142,7 +139,7 @@ JSON
         ;;
 esac
 
-log_report "ACCEPTED: Rapport de ${pubkey:0:8}... (Email: $EMAIL, Source: $SOURCE)"
+log_report "ACCEPTED: Rapport de ${pubkey:0:8}... (Email: $reporter_email, Source: $reporter_source)"
 echo ">>> (1984) REPORT: ${pubkey:0:8}... → ${reported_pubkey:0:8}... ($report_type)"
 
 exit 0 
\ No newline at end of file
@@ -85,28 +85,13 @@ update_nostr_video_stats() {
     local mime_type="$5"
     local has_location="$6"
     
-    # Initialize stats file if it doesn't exist
-    if [[ ! -f "$VIDEO_STATS_FILE" ]]; then
-        echo '{"total_videos": 0, "total_duration": 0, "by_user": {}, "by_type": {}, "with_location": 0, "webcam_videos": 0}' > "$VIDEO_STATS_FILE"
-    fi
+    local flag=0
     
-    # Update statistics using jq
-    local temp_file=$(mktemp)
-    jq --arg pubkey "$pubkey" \
-       --arg title "$title" \
-       --argjson duration "${duration:-0}" \
-       --arg dimensions "$dimensions" \
-       --arg mime_type "$mime_type" \
-       --argjson has_location "$has_location" \
-       '.total_videos += 1 |
-        .total_duration += $duration |
-        .by_user[$pubkey] = (.by_user[$pubkey] // 0) + 1 |
-        .by_type[$mime_type] = (.by_type[$mime_type] // 0) + 1 |
-        .with_location += (if $has_location then 1 else 0 end) |
-        .webcam_videos += (if ($title | contains("webcam") or contains("Webcam")) then 1 else 0 end)' \
-       "$VIDEO_STATS_FILE" > "$temp_file"
+    # webcam_videos : titre contenant "webcam" ou "Webcam"
+    [[ "$title" == *"webcam"* || "$title" == *"Webcam"* ]] && flag=1
     
-    mv "$temp_file" "$VIDEO_STATS_FILE"
+    # Append-only delta, folded into $VIDEO_STATS_FILE by policy/videostats.py
+    video_stats_add 21 "$pubkey" "$duration" "$mime_type" "$has_location" "$flag"
 }
 
 # Detect video type and source
@@ -288,60 +273,55 @@ activate_umap_follow_for_video() {
         
         # Check if latitude is numeric and format it
         if [[ "$latitude" =~ ^-?[0-9]+\.?[0-9]*$ ]]; then
-            umap_lat=$(awk "BEGIN {printf \"%.2f\", $latitude}")
+            LC_ALL=C printf -v umap_lat '%.2f' "$latitude"
         else
             log_video "UMAP_FOLLOW: Invalid latitude value: $latitude"
         fi
         
         # Check if longitude is numeric and format it
         if [[ "$longitude" =~ ^-?[0-9]+\.?[0-9]*$ ]]; then
-            umap_lon=$(awk "BEGIN {printf \"%.2f\", $longitude}")
+            LC_ALL=C printf -v umap_lon '%.2f' "$longitude"
         else
             log_video "UMAP_FOLLOW: Invalid longitude value: $longitude"
         fi
         
-        # Generate UMAP NSEC for this location
-        local umap_nsec=$($HOME/.zen/Astroport.ONE/tools/keygen -t nostr "${UPLANETNAME}${umap_lat}" "${UPLANETNAME}${umap_lon}" -s)
+        # UMAP public key for this location (cached, see umap_key in common.sh)
+        local UMAP_LAT UMAP_LON UMAP_HEX UMAP_NPUB
+        umap_key "$umap_lat" "$umap_lon"
+        local umap_pubkey="$UMAP_HEX"
         
-        if [[ -n "$umap_nsec" ]]; then
-            # Get UMAP pubkey
-            local umap_pubkey=$($HOME/.zen/Astroport.ONE/tools/nostr2hex.py "$umap_nsec")
+        if [[ -n "$umap_pubkey" ]]; then
+            log_video "UMAP_FOLLOW: UMAP pubkey for $umap_lat,$umap_lon: $umap_pubkey"
             
-            if [[ -n "$umap_pubkey" ]]; then
-                log_video "UMAP_FOLLOW: UMAP pubkey for $umap_lat,$umap_lon: $umap_pubkey"
+            # Follow the UMAP from the video publisher
+            if [[ -n "$pubkey" && "$pubkey" != "$umap_pubkey" ]]; then
+                # Get publisher's NSEC (if available in MULTIPASS)
+                local publisher_nsec=""
+                local publisher_email=$(get_key_email "$pubkey")
+                
+                if [[ -n "$publisher_email" ]]; then
+                    publisher_nsec=$(cat "$KEY_DIR/$publisher_email/NSEC" 2>/dev/null)
+                fi
                 
-                # Follow the UMAP from the video publisher
-                if [[ -n "$pubkey" && "$pubkey" != "$umap_pubkey" ]]; then
-                    # Get publisher's NSEC (if available in MULTIPASS)
-                    local publisher_nsec=""
-                    local publisher_email=$(get_key_email "$pubkey")
+                if [[ -n "$publisher_nsec" ]]; then
+                    log_video "UMAP_FOLLOW: Following UMAP $umap_pubkey from publisher $pubkey"
                     
-                    if [[ -n "$publisher_email" ]]; then
-                        publisher_nsec=$(cat "$KEY_DIR/$publisher_email/NSEC" 2>/dev/null)
-                    fi
+                    # Use nostr_follow.sh to follow the UMAP
+                    $HOME/.zen/Astroport.ONE/tools/nostr_follow.sh "$publisher_nsec" "$umap_pubkey" "$myRELAY" 2>/dev/null
                     
-                    if [[ -n "$publisher_nsec" ]]; then
-                        log_video "UMAP_FOLLOW: Following UMAP $umap_pubkey from publisher $pubkey"
-                        
-                        # Use nostr_follow.sh to follow the UMAP
-                        $HOME/.zen/Astroport.ONE/tools/nostr_follow.sh "$publisher_nsec" "$umap_pubkey" "$myRELAY" 2>/dev/null
-                        
-                        if [[ $? -eq 0 ]]; then
-                            log_video "UMAP_FOLLOW: Successfully followed UMAP $umap_pubkey"
-                        else
-                            log_video "UMAP_FOLLOW: Failed to follow UMAP $umap_pubkey"
-                        fi
+                    if [[ $? -eq 0 ]]; then
+                        log_video "UMAP_FOLLOW: Successfully followed UMAP $umap_pubkey"
                     else
-                        log_video "UMAP_FOLLOW: No NSEC found for publisher $pubkey, cannot follow UMAP"
+                        log_video "UMAP_FOLLOW: Failed to follow UMAP $umap_pubkey"
                     fi
                 else
-                    log_video "UMAP_FOLLOW: Publisher is the same as UMAP, no follow needed"
+                    log_video "UMAP_FOLLOW: No NSEC found for publisher $pubkey, cannot follow UMAP"
                 fi
             else
-                log_video "UMAP_FOLLOW: Failed to get UMAP pubkey for $umap_lat,$umap_lon"
+                log_video "UMAP_FOLLOW: Publisher is the same as UMAP, no follow needed"
             fi
         else
-            log_video "UMAP_FOLLOW: Failed to generate UMAP NSEC for $umap_lat,$umap_lon"
+            log_video "UMAP_FOLLOW: Failed to get UMAP pubkey for $umap_lat,$umap_lon"
         fi
     else
         log_video "UMAP_FOLLOW: No location data, skipping UMAP follow"
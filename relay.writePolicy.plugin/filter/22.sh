@@ -85,28 +85,13 @@ update_nostr_long_video_stats() {
     local mime_type="$5"
     local has_location="$6"
     
-    # Initialize stats file if it doesn't exist
-    if [[ ! -f "$LONG_VIDEO_STATS_FILE" ]]; then
-        echo '{"total_long_videos": 0, "total_duration": 0, "by_user": {}, "by_type": {}, "with_location": 0, "extended_content": 0}' > "$LONG_VIDEO_STATS_FILE"
-    fi
+    local flag=0
     
-    # Update statistics using jq
-    local temp_file=$(mktemp)
-    jq --arg pubkey "$pubkey" \
-       --arg title "$title" \
-       --argjson duration "${duration:-0}" \
-       --arg dimensions "$dimensions" \
-       --arg mime_type "$mime_type" \
-       --argjson has_location "$has_location" \
-       '.total_long_videos += 1 |
-        .total_duration += $duration |
-        .by_user[$pubkey] = (.by_user[$pubkey] // 0) + 1 |
-        .by_type[$mime_type] = (.by_type[$mime_type] // 0) + 1 |
-        .with_location += (if $has_location then 1 else 0 end) |
-        .extended_content += (if ($title | length > 50) then 1 else 0 end)' \
-       "$LONG_VIDEO_STATS_FILE" > "$temp_file"
+    # extended_content : titre de plus de 50 caractères
+    (( ${#title} > 50 )) && flag=1
     
-    mv "$temp_file" "$LONG_VIDEO_STATS_FILE"
+    # Append-only delta, folded into $LONG_VIDEO_STATS_FILE by policy/videostats.py
+    video_stats_add 22 "$pubkey" "$duration" "$mime_type" "$has_location" "$flag"
 }
 
 # Detect long video type and source
@@ -325,52 +310,45 @@ activate_umap_follow_for_long_video() {
     if [[ -n "$latitude" && -n "$longitude" && "$latitude" != "0.00" && "$longitude" != "0.00" ]]; then
         log_long_video "UMAP_FOLLOW: Activating UMAP follow for long video at $latitude,$longitude"
         
-        # Get UMAP coordinates (rounded to 0.01° precision)
-        local umap_lat=$(printf "%.2f" "$latitude")
-        local umap_lon=$(printf "%.2f" "$longitude")
-        
-        # Generate UMAP NSEC for this location
-        local umap_nsec=$($HOME/.zen/Astroport.ONE/tools/keygen -t nostr "${UPLANETNAME}${umap_lat}" "${UPLANETNAME}${umap_lon}" -s)
+        # UMAP coordinates (rounded to 0.01° precision) and public key, cached (see umap_key in common.sh)
+        local UMAP_LAT UMAP_LON UMAP_HEX UMAP_NPUB
+        umap_key "$latitude" "$longitude"
+        local umap_lat="${UMAP_LAT:-$latitude}"
+        local umap_lon="${UMAP_LON:-$longitude}"
+        local umap_pubkey="$UMAP_HEX"
         
-        if [[ -n "$umap_nsec" ]]; then
-            # Get UMAP pubkey
-            local umap_pubkey=$($HOME/.zen/Astroport.ONE/tools/nostr2hex.py "$umap_nsec")
+        if [[ -n "$umap_pubkey" ]]; then
+            log_long_video "UMAP_FOLLOW: UMAP pubkey for $umap_lat,$umap_lon: $umap_pubkey"
             
-            if [[ -n "$umap_pubkey" ]]; then
-                log_long_video "UMAP_FOLLOW: UMAP pubkey for $umap_lat,$umap_lon: $umap_pubkey"
+            # Follow the UMAP from the video publisher
+            if [[ -n "$pubkey" && "$pubkey" != "$umap_pubkey" ]]; then
+                # Get publisher's NSEC (if available in MULTIPASS)
+                local publisher_nsec=""
+                local publisher_email=$(get_key_email "$pubkey")
                 
-                # Follow the UMAP from the video publisher
-                if [[ -n "$pubkey" && "$pubkey" != "$umap_pubkey" ]]; then
-                    # Get publisher's NSEC (if available in MULTIPASS)
-                    local publisher_nsec=""
-                    local publisher_email=$(get_key_email "$pubkey")
+                if [[ -n "$publisher_email" ]]; then
+                    publisher_nsec=$(cat "$KEY_DIR/$publisher_email/NSEC" 2>/dev/null)
+                fi
+                
+                if [[ -n "$publisher_nsec" ]]; then
+                    log_long_video "UMAP_FOLLOW: Following UMAP $umap_pubkey from publisher $pubkey"
                     
-                    if [[ -n "$publisher_email" ]]; then
-                        publisher_nsec=$(cat "$KEY_DIR/$publisher_email/NSEC" 2>/dev/null)
-                    fi
+                    # Use nostr_follow.sh to follow the UMAP
+                    $HOME/.zen/Astroport.ONE/tools/nostr_follow.sh "$publisher_nsec" "$umap_pubkey" "$myRELAY" 2>/dev/null
                     
-                    if [[ -n "$publisher_nsec" ]]; then
-                        log_long_video "UMAP_FOLLOW: Following UMAP $umap_pubkey from publisher $pubkey"
-                        
-                        # Use nostr_follow.sh to follow the UMAP
-                        $HOME/.zen/Astroport.ONE/tools/nostr_follow.sh "$publisher_nsec" "$umap_pubkey" "$myRELAY" 2>/dev/null
-                        
-                        if [[ $? -eq 0 ]]; then
-                            log_long_video "UMAP_FOLLOW: Successfully followed UMAP $umap_pubkey"
-                        else
-                            log_long_video "UMAP_FOLLOW: Failed to follow UMAP $umap_pubkey"
-                        fi
+                    if [[ $? -eq 0 ]]; then
+                        log_long_video "UMAP_FOLLOW: Successfully followed UMAP $umap_pubkey"
                     else
-                        log_long_video "UMAP_FOLLOW: No NSEC found for publisher $pubkey, cannot follow UMAP"
+                        log_long_video "UMAP_FOLLOW: Failed to follow UMAP $umap_pubkey"
                     fi
                 else
-                    log_long_video "UMAP_FOLLOW: Publisher is the same as UMAP, no follow needed"
+                    log_long_video "UMAP_FOLLOW: No NSEC found for publisher $pubkey, cannot follow UMAP"
                 fi
             else
-                log_long_video "UMAP_FOLLOW: Failed to get UMAP pubkey for $umap_lat,$umap_lon"
+                log_long_video "UMAP_FOLLOW: Publisher is the same as UMAP, no follow needed"
             fi
         else
-            log_long_video "UMAP_FOLLOW: Failed to generate UMAP NSEC for $umap_lat,$umap_lon"
+            log_long_video "UMAP_FOLLOW: Failed to get UMAP pubkey for $umap_lat,$umap_lon"
         fi
     else
         log_long_video "UMAP_FOLLOW: No location data, skipping UMAP follow"
@@ -24,6 +24,12 @@
 # The UPassport API (54321.py → services/nostr.py → check_nip42_auth_local_marker)
 # uses the marker as proof of a recent NIP-42 authentication without needing to
 # query the relay database.
+#
+# Sessions are kept in ~/.zen/strfry/nip42_sessions.sqlite (policy/authsessions.py,
+# TTL NIP101_NIP42_TTL, read-only lookup for the API). Marker files are now a
+# compatibility export: NIP101_NIP42_MARKERS=all (default) | known | none.
+# Local MULTIPASS and amisOfAmis keys are handled in-process by the policy engine
+# (policy/filters/kind22242.py); this script runs for roaming keys and CAPTAIN.
 
 MY_PATH="`dirname \"$0\"`"
 MY_PATH="`( cd \"$MY_PATH\" && pwd )`"
@@ -40,22 +46,41 @@ log_event() {
     log_with_timestamp "$LOG_FILE" "$1"
 }
 
-# Extract event data in one optimized call
-# Sets: pubkey, kind, id, created_at, tags, content (all from the event JSON)
+NIP42_MARKERS="${NIP101_NIP42_MARKERS:-all}"
+
+# Usage: record_auth_session MARKER_DIR
+# Upsert the session (pubkey, event_id, EMAIL, SOURCE) and export the marker
+# into MARKER_DIR when NIP42_MARKERS allows it. Prints the marker path or "stored".
+record_auth_session() {
+    policy_module authsessions upsert "$pubkey" "$event_id" \
+        --email "$EMAIL" --source "$SOURCE" --marker-dir "$1" 2>/dev/null
+}
+
+# Usage: pubkey_marker_dir SOURCE_LABEL [roaming]
+# Minimal .pubkey_<hex> directory for keys without MULTIPASS (full export only).
+pubkey_marker_dir() {
+    [[ "$NIP42_MARKERS" == "all" ]] || return 0
+    local dir="${HOME}/.zen/game/nostr/.pubkey_${pubkey}"
+    mkdir -p "$dir"
+    printf '%s\n' "$pubkey" > "$dir/HEX"
+    [[ "$2" == "roaming" ]] && touch "$dir/.roaming"
+    printf '%s\n' "$1" > "$dir/SOURCE"
+    echo "$dir"
+}
+
+# Extract event data (decoded event context, no jq when provided by the engine)
+# Sets: event_id (sha256 of the serialised event), pubkey, created_at, content
 event_json="$1"
 extract_event_data "$event_json"
 
 if [[ "${DEBUG:-0}" == "1" ]]; then
-    RELAY_TAG=$(echo "$event_json" | jq -r '(.event.tags // [])[] | select(.[0]=="relay") | .[1]' 2>/dev/null || true)
-    CHALLENGE_TAG=$(echo "$event_json" | jq -r '(.event.tags // [])[] | select(.[0]=="challenge") | .[1]' 2>/dev/null || true)
+    RELAY_TAG=$(event_tags "relay")
+    CHALLENGE_TAG=$(event_tags "challenge")
     log_event "DEBUG: Challenge=${CHALLENGE_TAG:-<vide>}"
     log_event "DEBUG: RelayTag=${RELAY_TAG:-<vide>}"
     log_event "DEBUG: Pubkey=${pubkey:-<vide>}"
 fi
 
-# Extract event_id (= the 'id' field of the event – sha256 of the serialised event)
-event_id="${id:-}"
-
 # Check authorization using common function
 # Sets global: AUTHORIZED, EMAIL, SOURCE
 if ! check_authorization "$pubkey" "log_event"; then
@@ -67,34 +92,22 @@ if ! check_authorization "$pubkey" "log_event"; then
         log_event "ROAMING_UNKNOWN: email récupéré via kind 0 → $EMAIL (${pubkey:0:8}…)"
         # Continue vers la création du marker (pas d'exit)
     else
-        # Fallback pubkey-only : créer un répertoire éphémère minimal
-        _PUBKEY_DIR="${HOME}/.zen/game/nostr/.pubkey_${pubkey}"
-        mkdir -p "$_PUBKEY_DIR"
-        printf '%s\n' "$pubkey" > "$_PUBKEY_DIR/HEX"
-        touch "$_PUBKEY_DIR/.roaming"
-        printf '%s\n' "UNKNOWN_ROAMING" > "$_PUBKEY_DIR/SOURCE"
-        NIP42_MARKER="${_PUBKEY_DIR}/.nip42_auth_${pubkey}"
-        NOW_TS=$(date +%s)
-        printf '{"pubkey":"%s","event_hash":"%s","created_at":%s}' \
-            "$pubkey" "$event_id" "$NOW_TS" > "$NIP42_MARKER" 2>/dev/null
-        log_event "ACCEPTED_EPHEMERAL: ${pubkey:0:8}... marker pubkey-only créé (répertoire ${_PUBKEY_DIR##*/})"
+        # Fallback pubkey-only : session seule (+ répertoire éphémère minimal en export complet)
+        EMAIL="" SOURCE="unknown_roaming"
+        _PUBKEY_DIR=$(pubkey_marker_dir "UNKNOWN_ROAMING" roaming)
+        record_auth_session "$_PUBKEY_DIR" >/dev/null
+        log_event "ACCEPTED_EPHEMERAL: ${pubkey:0:8}... session pubkey-only enregistrée${_PUBKEY_DIR:+ (répertoire ${_PUBKEY_DIR##*/})}"
         exit 0
     fi
 fi
 
-# ── WHITELIST AMIS : marker pubkey-only immédiat ────────────────────────────
+# ── WHITELIST AMIS : session pubkey-only immédiate ──────────────────────────
 # amisOfAmis = whitelist de comptes NOSTR tiers (pas de MULTIPASS, pas d'email).
-# Pas de roaming, pas de résolution email — marker minimal et on accepte.
+# Pas de roaming, pas de résolution email — session minimale et on accepte.
 if [[ "$SOURCE" == "amisOfAmis" ]]; then
-    _PUBKEY_DIR="${HOME}/.zen/game/nostr/.pubkey_${pubkey}"
-    mkdir -p "$_PUBKEY_DIR"
-    printf '%s\n' "$pubkey" > "$_PUBKEY_DIR/HEX"
-    printf '%s\n' "AMIS" > "$_PUBKEY_DIR/SOURCE"
-    NIP42_MARKER="${_PUBKEY_DIR}/.nip42_auth_${pubkey}"
-    NOW_TS=$(date +%s)
-    printf '{"pubkey":"%s","event_hash":"%s","created_at":%s}' \
-        "$pubkey" "$event_id" "$NOW_TS" > "$NIP42_MARKER" 2>/dev/null
-    log_event "ACCEPTED_AMIS: ${pubkey:0:8}... marker pubkey-only créé (whitelist amisOfAmis)"
+    EMAIL=""
+    record_auth_session "$(pubkey_marker_dir "AMIS")" >/dev/null
+    log_event "ACCEPTED_AMIS: ${pubkey:0:8}... session pubkey-only enregistrée (whitelist amisOfAmis)"
     exit 0
 fi
 
@@ -114,6 +127,7 @@ if [[ -n "$EMAIL" && "$EMAIL" =~ $EMAIL_REGEX ]]; then
         mkdir -p "$MARKER_DIR"
         printf '%s\n' "$pubkey" > "$MARKER_DIR/HEX"
         touch "$MARKER_DIR/.roaming"
+        signal_identity_change
         if [[ "$SOURCE" == "amisOfAmis_roaming" ]]; then
             printf '%s\n' "AMIS_ROAMING" > "$MARKER_DIR/SOURCE"
             [[ -n "$_HOME_IPFSNODEID" ]] && \
@@ -124,18 +138,12 @@ if [[ -n "$EMAIL" && "$EMAIL" =~ $EMAIL_REGEX ]]; then
         log_event "ROAMING: Création du profil local éphémère pour $EMAIL (source: $SOURCE)"
     fi
     
-    # ── A. pubkey-bound filename ─────────────────────────────────────────────
-    # New secure name: .nip42_auth_<hex_pubkey>
-    NIP42_MARKER="${MARKER_DIR}/.nip42_auth_${pubkey}"
-
-    # ── C. JSON content with pubkey + event_hash + timestamp ─────────────────
-    NOW_TS=$(date +%s)
-    MARKER_JSON="{\"pubkey\":\"${pubkey}\",\"event_hash\":\"${event_id}\",\"created_at\":${NOW_TS}}"
-
-    if printf '%s' "$MARKER_JSON" > "$NIP42_MARKER" 2>/dev/null; then
-        log_event "MARKER: Secure NIP-42 auth marker written for $EMAIL → ${NIP42_MARKER##*/}"
+    # ── A+C. Session + pubkey-bound marker (.nip42_auth_<hex_pubkey>, JSON) ──
+    if NIP42_MARKER=$(record_auth_session "$MARKER_DIR"); then
+        [[ "$NIP42_MARKER" != "stored" ]] && \
+            log_event "MARKER: Secure NIP-42 auth marker written for $EMAIL → ${NIP42_MARKER##*/}"
     else
-        log_event "MARKER_WARN: Could not write NIP-42 auth marker for $EMAIL (path: $NIP42_MARKER)"
+        log_event "MARKER_WARN: Could not write NIP-42 auth marker for $EMAIL (path: $MARKER_DIR)"
     fi
 
     # ── Remove any stale generic (old-format) marker if it still exists ──────
@@ -177,6 +185,7 @@ if [[ -n "$EMAIL" && "$EMAIL" =~ $EMAIL_REGEX ]]; then
             fi
             # Imposer la NOSTR pubkey NIP-42 comme référence (les deux doivent être identiques)
             printf '%s\n' "$pubkey" > "${MARKER_DIR}/HEX"
+            signal_identity_change
         fi
 
         # ── Résoudre HOME_IPFSNODEID + HOME_NODEHEX depuis le path swarm ──────
@@ -223,12 +232,9 @@ elif [[ "$EMAIL" == "CAPTAIN" ]]; then
     # the NIP-42 marker into the captain's actual nostr home directory.
     _CAPTAIN_EMAIL=$(tr -d '[:space:]' < "${HOME}/.zen/game/players/.current/.player" 2>/dev/null)
     if [[ -n "$_CAPTAIN_EMAIL" && "$_CAPTAIN_EMAIL" =~ $EMAIL_REGEX && -d "${KEY_DIR}/${_CAPTAIN_EMAIL}" ]]; then
-        NIP42_MARKER="${KEY_DIR}/${_CAPTAIN_EMAIL}/.nip42_auth_${pubkey}"
-        NOW_TS=$(date +%s)
-        printf '{"pubkey":"%s","event_hash":"%s","created_at":%s}' \
-            "$pubkey" "$event_id" "$NOW_TS" > "$NIP42_MARKER" 2>/dev/null \
+        NIP42_MARKER=$(EMAIL="$_CAPTAIN_EMAIL" record_auth_session "${KEY_DIR}/${_CAPTAIN_EMAIL}") \
             && log_event "MARKER: NIP-42 auth marker for CAPTAIN (${_CAPTAIN_EMAIL}) → ${NIP42_MARKER##*/}" \
-            || log_event "MARKER_WARN: Could not write NIP-42 auth marker for CAPTAIN (path: $NIP42_MARKER)"
+            || log_event "MARKER_WARN: Could not write NIP-42 auth marker for CAPTAIN (path: ${KEY_DIR}/${_CAPTAIN_EMAIL})"
     else
         log_event "MARKER_WARN: CAPTAIN email not resolved (got: ${_CAPTAIN_EMAIL:-empty}) — no marker written"
     fi
@@ -34,13 +34,7 @@ expiration="$expiration"
 if [[ "$status_id" == "atom4love" ]]; then
     # 1. Vérifier le marqueur d'app contre la liste des apps autorisées (config coopérative)
     actual_proof=$(echo "$event_json" | jq -r '.event.tags[] | select(.[0] == "a4l_proof") | .[1]' 2>/dev/null | head -1)
-    valid_proof=false
-    while IFS= read -r app_id; do
-        [[ -z "$app_id" ]] && continue
-        expected_proof=$(printf '%s' "${pubkey}:${app_id}" | sha256sum | awk '{print $1}')
-        [[ "$actual_proof" == "$expected_proof" ]] && valid_proof=true && break
-    done < <(_load_authorized_app_ids)
-    if [[ "$valid_proof" == "false" ]]; then
+    if ! _a4l_proof_valid "$pubkey" "$actual_proof"; then
         log_status "REJECTED: Marqueur app non autorisé pour ${pubkey:0:8}... (reçu=${actual_proof:0:8}…)"
         exit 1
     fi
@@ -53,6 +47,14 @@ if [[ "$status_id" == "atom4love" ]]; then
     omega=$(echo "$content" | jq -r '.omega_bio      // -1' 2>/dev/null)
     a5l=$(echo "$content"   | jq -r '.a5l_amplitude  // ""' 2>/dev/null)
 
+    # Valeurs passées à awk et écrites dans l'index TSV : nombres uniquement
+    num_re='^-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?$'
+    if [[ ! "$phase" =~ $num_re || ! "$omega" =~ $num_re ]] || [[ -n "$a5l" && ! "$a5l" =~ $num_re ]]; then
+        a4l_log "REJECTED: valeurs non numériques — ${pubkey:0:8}..."
+        log_status "REJECTED: Certificat ATOM4LOVE non numérique pour ${pubkey:0:8}..."
+        exit 1
+    fi
+
     # a5l est optionnel (absent des anciens certificats) — si présent, doit être ∈ [0,1]
     if [[ -n "$a5l" ]] && ! awk "BEGIN{exit !($a5l >= 0 && $a5l <= 1)}" 2>/dev/null; then
         a4l_log "REJECTED: a5l_amplitude hors plage [0,1] — ${pubkey:0:8}... (Ψ=$a5l)"
@@ -95,6 +97,8 @@ if [[ "$status_id" == "atom4love" ]]; then
         touch "$_cert_file"
         grep -v "^${pubkey}:" "$_cert_file" > "${_cert_file}.tmp" && mv "${_cert_file}.tmp" "$_cert_file"
         echo "${pubkey}:${created_at}" >> "$_cert_file"
+        # Index des certificats : check_atom4love_cert devient une simple recherche
+        record_atom4love_cert "$pubkey" "$created_at" "$phase" "$omega" "$a5l" "$actual_proof"
 
         exit 0
     else
@@ -108,13 +112,7 @@ fi
 # Seule contrainte : a4l_proof valide. Rafraîchit l'horodatage dans certified.txt.
 if [[ "$status_id" == "atom4love-home" ]]; then
     _home_proof=$(echo "$event_json" | jq -r '.event.tags[] | select(.[0] == "a4l_proof") | .[1]' 2>/dev/null | head -1)
-    _home_valid=false
-    while IFS= read -r _app_id; do
-        [[ -z "$_app_id" ]] && continue
-        _home_expected=$(printf '%s' "${pubkey}:${_app_id}" | sha256sum | awk '{print $1}')
-        [[ "$_home_proof" == "$_home_expected" ]] && _home_valid=true && break
-    done < <(_load_authorized_app_ids)
-    if [[ "$_home_valid" == "false" ]]; then
+    if ! _a4l_proof_valid "$pubkey" "$_home_proof"; then
         log_status "REJECTED: atom4love-home sans preuve valide — ${pubkey:0:8}..."
         exit 1
     fi
@@ -123,6 +121,7 @@ if [[ "$status_id" == "atom4love-home" ]]; then
     touch "$_cert_file"
     grep -v "^${pubkey}:" "$_cert_file" > "${_cert_file}.tmp" && mv "${_cert_file}.tmp" "$_cert_file"
     echo "${pubkey}:${created_at}" >> "$_cert_file"
+    signal_identity_change
     log_status "ATOM4LOVE-HOME: TTL rafraîchi — ${pubkey:0:8}..."
     log_status "ACCEPTED: atom4love-home — ${pubkey:0:8}..."
     exit 0
@@ -132,13 +131,7 @@ fi
 # Seule contrainte : a4l_proof valide. Le contenu est opaque (chiffré).
 if [[ "$status_id" == "atom4love-priv" ]]; then
     _priv_proof=$(echo "$event_json" | jq -r '.event.tags[] | select(.[0] == "a4l_proof") | .[1]' 2>/dev/null | head -1)
-    _priv_valid=false
-    while IFS= read -r _app_id; do
-        [[ -z "$_app_id" ]] && continue
-        _priv_expected=$(printf '%s' "${pubkey}:${_app_id}" | sha256sum | awk '{print $1}')
-        [[ "$_priv_proof" == "$_priv_expected" ]] && _priv_valid=true && break
-    done < <(_load_authorized_app_ids)
-    if [[ "$_priv_valid" == "false" ]]; then
+    if ! _a4l_proof_valid "$pubkey" "$_priv_proof"; then
         log_status "REJECTED: atom4love-priv sans preuve valide — ${pubkey:0:8}..."
         exit 1
     fi
@@ -275,22 +275,18 @@ EOF
             log_cf "SYNCED: Created bien.pubkeys from Nostr event"
         fi
     fi
+
+    # Keep the BIEN_HEX → project reverse index in step with bien.pubkeys
+    if policy_module crowdfunding update "$project_id" >/dev/null 2>&1; then
+        log_cf "INDEXED: Bien index updated for $project_id"
+    fi
     
     # Update project status if project.json exists
     project_file="$project_dir/project.json"
     if [[ -f "$project_file" && -n "$campaign_status" ]]; then
-        # Update status from Nostr event
-        temp_file=$(mktemp)
-        jq --arg status "$campaign_status" \
-           --arg nostr_event "$event_id" \
-           '.status = $status | .last_nostr_event = $nostr_event | .last_sync = "'"$(date -u +%Y-%m-%dT%H:%M:%SZ)"'"' \
-           "$project_file" > "$temp_file" 2>/dev/null
-        
-        if [[ $? -eq 0 ]]; then
-            mv "$temp_file" "$project_file"
+        # Update status from Nostr event (same transaction lock as the crowdfunding ledger)
+        if policy_module ledger status "$project_id" "$campaign_status" "$event_id" 2>/dev/null; then
             log_cf "SYNCED: Updated project status to $campaign_status"
-        else
-            rm -f "$temp_file"
         fi
     fi
 fi
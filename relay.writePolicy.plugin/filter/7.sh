@@ -43,12 +43,35 @@ log_like() {
     log_with_timestamp "$LOG_FILE" "$1"
 }
 
+################################################################################
+# PAYMENT OUTBOX — les paiements ZEN sont déposés dans policy/payments.py
+# (audit par réaction, idempotent sur l'event id) et envoyés groupés par
+# (source, destination) après une courte fenêtre (NIP101_PAYMENT_WINDOW).
+# Variables implicites (scope global) : $pubkey, $event_id,
+# $reacted_event_id, $reacted_author_pubkey
+# Usage: _queue_zen_payment G1PUB_DEST ZEN_AMOUNT COMMENT --wallet DUNIKEY|--home NODE_HEX [OPTIONS...]
+################################################################################
+_queue_zen_payment() {
+    local _g1pub_dest="$1" _zen_amount="$2" _comment="$3"
+    shift 3
+    local _result
+    _result=$(policy_module payments enqueue \
+        --event "$event_id" --sender "$pubkey" --dest "$_g1pub_dest" \
+        --zen "$_zen_amount" --comment "$_comment" \
+        --reacted-event "${reacted_event_id:-}" --reacted-author "${reacted_author_pubkey:-}" \
+        "$@" 2>>"$LOG_FILE")
+    case "$_result" in
+        queued) return 0 ;;
+        duplicate) log_like "PAYMENT: event ${event_id:0:8}... already queued - skipped"; return 0 ;;
+        *) log_like "PAYMENT: ⚠️ could not queue ${_zen_amount}Ẑ to ${_g1pub_dest:0:8}..."; return 1 ;;
+    esac
+}
+
 ################################################################################
 # ROAMING RELAY — forwarde un paiement ZEN vers la home station via DM NIP-44.
 # Appelé uniquement quand ZEN_AMOUNT > 0 et que le .secret.dunikey est absent
 # (utilisateur en roaming sur cette station visiteur).
-# Variables implicites (scope global) : $EMAIL, $pubkey, $event_id,
-# $reacted_event_id, $reacted_author_pubkey, $LOG_FILE
+# Variables implicites (scope global) : $EMAIL, $LOG_FILE
 ################################################################################
 _relay_zen_payment_to_home() {
     local _g1pub_dest="$1" _zen_amount="$2" _comment="$3"
@@ -66,47 +89,14 @@ _relay_zen_payment_to_home() {
         return
     fi
 
-    local _payload
-    _payload=$(python3 -c "
-import json, sys
-print(json.dumps({
-    'email':                sys.argv[1],
-    'sender_pubkey':        sys.argv[2],
-    'event_id':             sys.argv[3],
-    'reacted_event_id':     sys.argv[4],
-    'reacted_author_pubkey':sys.argv[5],
-    'zen_amount':           float(sys.argv[6]),
-    'comment':              sys.argv[7],
-    'g1pub_dest':           sys.argv[8],
-    'is_crowdfunding':      sys.argv[9] == 'true',
-    'project_id':           sys.argv[10],
-    'bien_g1pub':           sys.argv[11],
-}))
-" "$EMAIL" "$pubkey" "$event_id" "${reacted_event_id:-}" \
-  "$reacted_author_pubkey" "$_zen_amount" "$_comment" "$_g1pub_dest" \
-  "$_is_cf" "$_project_id" "$_bien_g1pub" 2>/dev/null)
-
-    [[ -z "$_payload" ]] && \
-        log_like "ROAMING: ⚠️ payload zen_like vide pour $EMAIL" && return
-
-    [[ ! -s "$HOME/.zen/game/secret.nostr" ]] && \
-        log_like "ROAMING: ⚠️ secret.nostr absent — impossible de relayer" && return
-
-    source "$HOME/.zen/game/secret.nostr"
-    local _NODE_NSEC="${NSEC:-}"
-    unset NSEC NPUB HEX
-
-    (
-        python3 "$HOME/.zen/Astroport.ONE/tools/nostr_node_intercom.py" send \
-            --nsec    "$_NODE_NSEC" \
-            --to      "$_home_node_hex" \
-            --channel "zen_like" \
-            --payload "$_payload" \
-            --relays  "wss://relay.copylaradio.com" \
-            >> "$LOG_FILE" 2>&1 \
-        && log_like "ROAMING: ✈️ zen_like relayé → ${_home_node_hex:0:12}... pour $EMAIL (${_zen_amount}Ẑ)" \
-        || log_like "ROAMING: ⚠️ zen_like relay FAILED pour $EMAIL"
-    ) &
+    # Le DM zen_like (payload, signature NODE) est envoyé par le répartiteur,
+    # un seul pour toutes les réactions de la fenêtre vers la même destination
+    local _cf_args=()
+    [[ "$_is_cf" == "true" && -n "$_project_id" ]] && _cf_args=(--project "$_project_id")
+    [[ "$_comment" == CF:*:VOTE:* ]] && _cf_args+=(--vote)
+    _queue_zen_payment "$_g1pub_dest" "$_zen_amount" "$_comment" \
+        --home "$_home_node_hex" --email "$EMAIL" "${_cf_args[@]}" \
+        && log_like "ROAMING: ✈️ zen_like queued → ${_home_node_hex:0:12}... pour $EMAIL (${_zen_amount}Ẑ)"
 }
 
 ################################################################################
@@ -152,9 +142,14 @@ fi
 # AUTHORIZATION CHECK
 ################################################################################
 
-if ! check_authorization "$pubkey" "log_like"; then
+# Liker and reacted author resolved in one pass (AUTH_* arrays); EMAIL / SOURCE
+# stay the liker's identity for the rest of the script
+check_authorizations "$pubkey" "$reacted_author_pubkey"
+if ! auth_log "log_like" "$pubkey"; then
     exit 1
 fi
+EMAIL="${AUTH_EMAIL[$pubkey]}"
+SOURCE="${AUTH_SOURCE[$pubkey]}"
 
 ################################################################################
 # SELF-LIKE PREVENTION
@@ -263,30 +258,14 @@ case "$content" in
                             COMMENT="CF:${BIEN_PROJECT_ID}:ZEN:${ZEN_AMOUNT}:${pubkey:0:8}"
                         fi
                         
-                        log_like "CROWDFUNDING: Sending ${ZEN_AMOUNT}Ẑ ($AMOUNT G1) to Bien $BIEN_PROJECT_ID via $PAYMENT_METHOD"
-                        
-                        ~/.zen/Astroport.ONE/tools/PAYforSURE.sh "$PAYMENT_WALLET" "$AMOUNT" "$BIEN_G1PUB" "$COMMENT" >> "$LOG_FILE" 2>&1
-                        PAYMENT_RESULT=$?
+                        log_like "CROWDFUNDING: Queueing ${ZEN_AMOUNT}Ẑ ($AMOUNT G1) to Bien $BIEN_PROJECT_ID via $PAYMENT_METHOD"
                         
-                        if [[ $PAYMENT_RESULT -eq 0 ]]; then
-                            log_like "CROWDFUNDING: ✅ Successfully sent ${ZEN_AMOUNT}Ẑ to Bien $BIEN_PROJECT_ID"
-                            
-                            # Record contribution in project
-                            record_crowdfunding_contribution "$BIEN_PROJECT_ID" "$pubkey" "$ZEN_AMOUNT" "ZEN" "$event_id"
-                            
-                            # If this is a vote, also record the vote
-                            if [[ "$is_vote" == "true" ]]; then
-                                log_like "VOTE: Recording vote from ${pubkey:0:8}... for project $BIEN_PROJECT_ID"
-                                record_assets_vote "$BIEN_PROJECT_ID" "$pubkey" "$ZEN_AMOUNT" "$event_id"
-                                
-                                # Check if vote threshold reached
-                                if check_vote_threshold "$BIEN_PROJECT_ID"; then
-                                    log_like "VOTE: 🎉 Vote threshold reached for project $BIEN_PROJECT_ID - APPROVED!"
-                                fi
-                            fi
-                        else
-                            log_like "CROWDFUNDING: ❌ Payment failed (exit code: $PAYMENT_RESULT)"
-                        fi
+                        # Sent in batch by policy/payments.py, which then records the
+                        # contribution (and the vote + threshold check) in the ledger
+                        _cf_args=(--project "$BIEN_PROJECT_ID")
+                        [[ "$is_vote" == "true" ]] && _cf_args+=(--vote)
+                        _queue_zen_payment "$BIEN_G1PUB" "$ZEN_AMOUNT" "$COMMENT" \
+                            --wallet "$PAYMENT_WALLET" --email "$_EFFECTIVE_EMAIL" "${_cf_args[@]}"
                     fi
                 else
                     if [[ "$EMAIL" == "amisOfAmis" ]]; then
@@ -314,6 +293,9 @@ case "$content" in
                 if [[ -n "$wallet_info" ]]; then
                     G1PUBNOSTR=$(echo "$wallet_info" | cut -d'|' -f2)
                 fi
+            elif [[ -n "$reacted_author_pubkey" && -s "${AUTH_DIR[$reacted_author_pubkey]}/G1PUBNOSTR" ]]; then
+                # Reacted author is a local MULTIPASS (AUTH_DIR is only set for local keys)
+                G1PUBNOSTR=$(tr -d '[:space:]' < "${AUTH_DIR[$reacted_author_pubkey]}/G1PUBNOSTR")
             else
                 # Search if reacted_author_pubkey is part of UPlanet
                 G1PUBNOSTR=$(~/.zen/Astroport.ONE/tools/search_for_this_hex_in_uplanet.sh "$reacted_author_pubkey" 2>/dev/null)
@@ -353,16 +335,10 @@ case "$content" in
                         fi
                         COMMENT="UPLANET:${UPLANETG1PUB:0:8}:$EMAIL:LIKE:${ZEN_AMOUNT}Z:${reacted_event_id}"
                         
-                        log_like "PAYMENT: Sending ${ZEN_AMOUNT}Ẑ ($AMOUNT G1) to $G1PUBNOSTR via $PAYMENT_METHOD"
-                        
-                        ~/.zen/Astroport.ONE/tools/PAYforSURE.sh "$PAYMENT_WALLET" "$AMOUNT" "$G1PUBNOSTR" "$COMMENT" >> "$LOG_FILE" 2>&1
-                        PAYMENT_RESULT=$?
+                        log_like "PAYMENT: Queueing ${ZEN_AMOUNT}Ẑ ($AMOUNT G1) to $G1PUBNOSTR via $PAYMENT_METHOD"
                         
-                        if [[ $PAYMENT_RESULT -eq 0 ]]; then
-                            log_like "PAYMENT: ✅ Successfully sent ${ZEN_AMOUNT}Ẑ to $G1PUBNOSTR"
-                        else
-                            log_like "PAYMENT: ❌ Failed (exit code: $PAYMENT_RESULT)"
-                        fi
+                        _queue_zen_payment "$G1PUBNOSTR" "$ZEN_AMOUNT" "$COMMENT" \
+                            --wallet "$PAYMENT_WALLET" --email "$_EFFECTIVE_EMAIL"
                     fi
                 else
                     if [[ "$EMAIL" == "amisOfAmis" ]]; then
@@ -30,13 +30,13 @@ description="$description"
 preimage="$preimage"
 amount="$amount"
 
-# Check authorization using common function
-if ! check_authorization "$pubkey" "log_zap"; then
+# Zapper and recipient resolved in one pass (AUTH_* arrays, globals untouched)
+check_authorizations "$pubkey" "$recipient_pubkey"
+if ! auth_log "log_zap" "$pubkey"; then
     exit 1
 fi
-# Save zapper identity before second check_authorization call overwrites globals
-zapper_email="$EMAIL"
-zapper_source="$SOURCE"
+zapper_email="${AUTH_EMAIL[$pubkey]}"
+zapper_source="${AUTH_SOURCE[$pubkey]}"
 
 # Validate required tags
 if [[ -z "$recipient_pubkey" ]]; then
@@ -54,25 +54,22 @@ if [[ -z "$description" ]]; then
     exit 1
 fi
 
-# Check if recipient is part of UPlanet (second call — overwrites EMAIL/SOURCE globals)
-if check_authorization "$recipient_pubkey" "log_zap" 2>/dev/null; then
+# Check if recipient is part of UPlanet
+if auth_log "log_zap" "$recipient_pubkey"; then
     recipient_in_uplanet=true
-    recipient_email="$EMAIL"
-    recipient_source="$SOURCE"
+    recipient_email="${AUTH_EMAIL[$recipient_pubkey]}"
+    recipient_source="${AUTH_SOURCE[$recipient_pubkey]}"
     log_zap "ZAP: ${pubkey:0:8}... zapped ${recipient_pubkey:0:8}... (UPlanet member: $recipient_email from $recipient_source)"
 else
     recipient_in_uplanet=false
     log_zap "ZAP: ${pubkey:0:8}... zapped external user ${recipient_pubkey:0:8}..."
 fi
-# Restore zapper identity for final log
-EMAIL="$zapper_email"
-SOURCE="$zapper_source"
 
 # Log zap details
 [[ -n "$zapped_event_id" ]] && log_zap "ZAP: Event being zapped: ${zapped_event_id:0:8}..."
 [[ -n "$amount" ]] && log_zap "ZAP: Amount: ${amount} millisatoshis"
 
-log_zap "ACCEPTED: Zap from ${pubkey:0:8}... to ${recipient_pubkey:0:8}... (Email: $EMAIL, Source: $SOURCE)"
+log_zap "ACCEPTED: Zap from ${pubkey:0:8}... to ${recipient_pubkey:0:8}... (Email: $zapper_email, Source: $zapper_source)"
 echo ">>> (9735) ZAP: ${pubkey:0:8}... → ${recipient_pubkey:0:8}... (${amount:-unknown} msat)"
 
 exit 0 
\ No newline at end of file
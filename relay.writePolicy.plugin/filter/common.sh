@@ -23,27 +23,106 @@ fi
 
 # Global variables
 KEY_DIR="$HOME/.zen/game/nostr"
+# Répertoire du plugin (package Python policy/), sans fork de dirname
+NIP101_PLUGIN_DIR="${BASH_SOURCE[0]%/*}/.."
 AMISOFAMIS_FILE="${HOME}/.zen/strfry/amisOfAmis.txt"
+# Index des certificats ATOM4LOVE tenu par 30078.sh (lu aussi par policy/certs.py)
+ATOM4LOVE_CERT_INDEX="${HOME}/.zen/strfry/atom4love_certs.idx"
+# Touché après modification d'une source d'identité (policy/identity.py)
+IDENTITY_SIGNAL_FILE="${HOME}/.zen/tmp/policy/identity.changed"
 EMAIL_REGEX='^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$'
 
-# Optimized function to extract multiple values from event JSON in one jq call
-extract_event_data() {
+# Contexte d'événement décodé une seule fois (même format que EventContext.shell()
+# dans policy/event.py) : affectations bash _ev_type, _ev_id, _ev_pubkey, _ev_kind,
+# _ev_created_at, _ev_content et tableaux associatifs indexés par nom de tag
+# (tirets compris) : _ev_first (première valeur), _ev_last (dernière),
+# _ev_all (toutes, une par ligne). Le moteur Python le fournit dans NIP101_EVENT ;
+# sinon un seul appel jq le produit, puis il est exporté aux sous-processus.
+_EVENT_CONTEXT_JQ='
+def txt: if . == null or . == false then "" elif type == "string" then . else tojson end;
+(.event // {}) as $e
+| ([($e.tags // [])[] | select(type == "array" and length > 1 and (.[0] | txt) != "")]
+   | reduce .[] as $t ({}; .[$t[0] | txt] += [$t[1] | txt])) as $tags
+| "_ev_type=\(.type | txt | @sh)",
+  "_ev_id=\($e.id | txt | @sh)",
+  "_ev_pubkey=\($e.pubkey | txt | @sh)",
+  "_ev_kind=\($e.kind | txt | @sh)",
+  "_ev_created_at=\($e.created_at | txt | @sh)",
+  "_ev_content=\($e.content | txt | @sh)",
+  "declare -gA _ev_first=() _ev_last=() _ev_all=()",
+  ($tags | to_entries[] | (.key | @sh) as $k
+   | "_ev_first[\($k)]=\(.value[0] | @sh)",
+     "_ev_last[\($k)]=\(.value[-1] | @sh)",
+     "_ev_all[\($k)]=\(.value | join("\n") | @sh)")'
+# Au-delà, NIP101_EVENT n'est pas exporté (limite d'une variable d'environnement)
+_EVENT_CONTEXT_MAX=98304
+
+# Usage: event_context_load EVENT_JSON
+# Charge le contexte de EVENT_JSON (sans jq s'il est déjà connu). Retourne 1 si le JSON est invalide.
+event_context_load() {
     local event_json="$1"
-    
-    # Extract common fields in a single jq call
-    eval $(echo "$event_json" | jq -r '
-        "event_id=" + .event.id + ";" +
-        "pubkey=" + .event.pubkey + ";" +
-        "content=" + (.event.content | @sh) + ";" +
-        "created_at=" + (.event.created_at | tostring)
-    ')
+    if [[ -z "${NIP101_EVENT_ID:-}" || "$event_json" != *"\"id\":\"${NIP101_EVENT_ID}\""* ]]; then
+        _EV_LOADED=""
+        NIP101_EVENT_ID=""
+        NIP101_EVENT=$(jq -r "$_EVENT_CONTEXT_JQ" <<< "$event_json" 2>/dev/null) || return 1
+    fi
+    if [[ -z "${_EV_LOADED:-}" || "$_EV_LOADED" != "$NIP101_EVENT_ID" ]]; then
+        eval "$NIP101_EVENT"
+        NIP101_EVENT_ID="$_ev_id"
+        _EV_LOADED="$_ev_id"
+        if (( ${#NIP101_EVENT} <= _EVENT_CONTEXT_MAX )); then
+            export NIP101_EVENT NIP101_EVENT_ID
+        else
+            export -n NIP101_EVENT NIP101_EVENT_ID
+        fi
+    fi
+    return 0
+}
+
+# Usage: event_tag NAME → première valeur du tag NAME de l'événement chargé
+event_tag() {
+    printf '%s\n' "${_ev_first[$1]-}"
+}
+
+# Usage: event_tags NAME → toutes les valeurs du tag NAME, une par ligne
+event_tags() {
+    [[ -n "${_ev_all[$1]+set}" ]] && printf '%s\n' "${_ev_all[$1]}"
+    return 0
+}
+
+# Optimized function to extract common event fields (no jq once the context is loaded)
+# Sets: event_id, pubkey, content, created_at
+extract_event_data() {
+    event_context_load "$1" || return 1
+    event_id="$_ev_id"
+    pubkey="$_ev_pubkey"
+    content="$_ev_content"
+    created_at="$_ev_created_at"
+}
+
+# Index d'identité exporté par policy_engine.py (variable NIP101_IDENTITY_INDEX) :
+# une ligne "pubkey<TAB>source<TAB>email<TAB>répertoire" par appartenance, triée.
+# Usage: _identity_index_lookup PUBKEY SOURCE → email sur stdout
+# Retourne 0 si trouvé, 1 si absent, 2 si l'index n'est pas disponible (fallback grep).
+_identity_index_lookup() {
+    local pubkey="$1" source="$2"
+    [[ -n "$NIP101_IDENTITY_INDEX" && -f "$NIP101_IDENTITY_INDEX" ]] || return 2
+    [[ -z "$pubkey" ]] && return 1
+    local row
+    row=$(grep -m1 "^${pubkey}"$'\t'"${source}"$'\t' "$NIP101_IDENTITY_INDEX" 2>/dev/null) || return 1
+    row="${row#*$'\t'}"; row="${row#*$'\t'}"
+    echo "${row%%$'\t'*}"
+    return 0
 }
 
 # Optimized function to check if a key is authorized and get the associated email
 # Uses a single grep call to find both existence and location
 get_key_email() {
     local pubkey="$1"
-    
+
+    _identity_index_lookup "$pubkey" "local"
+    case $? in 0) return 0 ;; 1) echo ""; return 1 ;; esac
+
     # Single grep call that finds the file containing the pubkey and extracts directory in one pass
     local found_file=$(grep -l "^$pubkey$" "$KEY_DIR"/*/HEX 2>/dev/null | head -1)
     if [[ -n "$found_file" ]]; then
@@ -58,6 +137,9 @@ get_key_email() {
 # Uses single grep call instead of cat|grep then grep -l
 search_swarm_for_pubkey() {
     local pubkey="$1"
+
+    _identity_index_lookup "$pubkey" "swarm"
+    case $? in 0) return 0 ;; 1) echo ""; return 1 ;; esac
     
     # First, try swarm directories - single grep call to find file directly
     local found_file=$(grep -l "^$pubkey$" ${HOME}/.zen/tmp/swarm/*/TW/*/HEX 2>/dev/null | head -1)
@@ -83,6 +165,9 @@ search_swarm_for_pubkey() {
 check_amis_of_amis() {
     local pubkey="$1"
     [[ -z "$pubkey" ]] && return 1
+
+    _identity_index_lookup "$pubkey" "amisOfAmis" >/dev/null
+    case $? in 0) return 0 ;; 1) return 1 ;; esac
     
     # Check local file and all swarm files in a single fast grep call
     grep -q -h "^$pubkey$" "$AMISOFAMIS_FILE" "$HOME/.zen/tmp/swarm/"*/amisOfAmis.txt 2>/dev/null
@@ -103,111 +188,186 @@ _load_authorized_app_ids() {
     echo "ATOM4LOVE_ALPHA"
 }
 
+# Vérifie un tag a4l_proof : sha256("<pubkey>:<app_id>") pour une des apps autorisées.
+# Usage: _a4l_proof_valid PUBKEY PROOF → 0 si valide
+_a4l_proof_valid() {
+    local pubkey="$1" proof="$2" app_id
+    [[ -z "$proof" ]] && return 1
+    while IFS= read -r app_id; do
+        [[ -z "$app_id" ]] && continue
+        [[ "$proof" == "$(printf '%s' "${pubkey}:${app_id}" | sha256sum | awk '{print $1}')" ]] && return 0
+    done < <(_load_authorized_app_ids)
+    return 1
+}
+
+# Signale à policy_engine.py qu'une source d'identité (amisOfAmis.txt,
+# atom4love_certified.txt, index des certificats, répertoire MULTIPASS) vient
+# d'être modifiée : il relit ses index après le filtre sans attendre le polling.
+signal_identity_change() {
+    mkdir -p "${IDENTITY_SIGNAL_FILE%/*}" && touch "$IDENTITY_SIGNAL_FILE"
+}
+
+# Ajoute un certificat accepté à l'index (une ligne TSV, appel depuis 30078.sh).
+# Usage: record_atom4love_cert PUBKEY CREATED_AT PHASE OMEGA A5L PROOF
+record_atom4love_cert() {
+    local sep=$'\t\n\r'
+    mkdir -p "$(dirname "$ATOM4LOVE_CERT_INDEX")"
+    # Tabulations et fins de ligne retirées : une seule ligne, six colonnes
+    printf '%s\t%s\t%s\t%s\t%s\t%s\n' "${1//[$sep]/}" "${2//[$sep]/}" "${3//[$sep]/}" \
+        "${4//[$sep]/}" "${5//[$sep]/}" "${6//[$sep]/}" >> "$ATOM4LOVE_CERT_INDEX"
+    signal_identity_change
+}
+
 # Vérifie si un pubkey a publié un certificat d'incarnation ATOM4LOVE valide.
 # Un Kind 30078 d=atom4love avec personal_phase ∈ [0,7) et omega_bio ∈ (0.1,50) suffit.
+# Lit le dernier certificat dans l'index de 30078.sh (certificats importés par
+# backfill_constellation.sh compris : policy.certs index) ; requête au relais local
+# seulement si l'index n'existe pas encore (policy_engine.py le construit au démarrage).
 # Retourne 0 si présent et valide, 1 sinon.
 check_atom4love_cert() {
     local pubkey="$1"
     [[ -z "$pubkey" ]] && return 1
-    local strfry_dir="${HOME}/.zen/strfry"
-    [[ ! -x "${strfry_dir}/strfry" ]] && return 1
-
-    local cert
-    cert=$(cd "$strfry_dir" && ./strfry scan \
-        "{\"authors\":[\"${pubkey}\"],\"kinds\":[30078],\"#d\":[\"atom4love\"]}" \
-        2>/dev/null | jq -sc 'if length > 0 then max_by(.created_at) else null end' 2>/dev/null)
-    [[ -z "$cert" || "$cert" == "null" ]] && return 1
+    local cert phase omega actual_proof
+
+    if [[ -f "$ATOM4LOVE_CERT_INDEX" ]]; then
+        cert=$(awk -F'\t' -v pk="$pubkey" \
+            '$1 == pk && (best == "" || $2 + 0 >= best) { best = $2 + 0; row = $3 "\t" $4 "\t" $6 }
+             END { if (row != "") print row }' "$ATOM4LOVE_CERT_INDEX" 2>/dev/null)
+        [[ -z "$cert" ]] && return 1
+        IFS=$'\t' read -r phase omega actual_proof <<< "$cert"
+    else
+        if relay_query latest "$pubkey" 30078 atom4love; then
+            cert="${RELAY_RESULT%$'\n'}"
+        else
+            local strfry_dir="${HOME}/.zen/strfry"
+            [[ ! -x "${strfry_dir}/strfry" ]] && return 1
+            cert=$(cd "$strfry_dir" && ./strfry scan \
+                "{\"authors\":[\"${pubkey}\"],\"kinds\":[30078],\"#d\":[\"atom4love\"]}" \
+                2>/dev/null | jq -sc 'if length > 0 then max_by(.created_at) else null end' 2>/dev/null)
+        fi
+        [[ -z "$cert" || "$cert" == "null" ]] && return 1
+        actual_proof=$(echo "$cert" | jq -r '.tags[] | select(.[0] == "a4l_proof") | .[1]' 2>/dev/null | head -1)
+        phase=$(echo "$cert" | jq -r '.content | fromjson | .personal_phase // -1' 2>/dev/null)
+        omega=$(echo "$cert" | jq -r '.content | fromjson | .omega_bio // -1' 2>/dev/null)
+    fi
 
     # Vérifier le marqueur d'app contre la liste des apps autorisées (config coopérative)
-    local actual_proof valid_proof=false app_id
-    actual_proof=$(echo "$cert" | jq -r '.tags[] | select(.[0] == "a4l_proof") | .[1]' 2>/dev/null | head -1)
-    while IFS= read -r app_id; do
-        [[ -z "$app_id" ]] && continue
-        local expected_proof
-        expected_proof=$(printf '%s' "${pubkey}:${app_id}" | sha256sum | awk '{print $1}')
-        [[ "$actual_proof" == "$expected_proof" ]] && valid_proof=true && break
-    done < <(_load_authorized_app_ids)
-    [[ "$valid_proof" == "false" ]] && return 1
+    _a4l_proof_valid "$pubkey" "$actual_proof" || return 1
 
     # Vérifier les plages biométriques
-    local phase omega
-    phase=$(echo "$cert" | jq -r '.content | fromjson | .personal_phase // -1' 2>/dev/null)
-    omega=$(echo "$cert" | jq -r '.content | fromjson | .omega_bio // -1' 2>/dev/null)
     awk "BEGIN{exit !($phase >= 0 && $phase < 7 && $omega > 0.1 && $omega < 50)}"
 }
 
-# Main authorization function - consolidates all checks
-check_authorization() {
-    local pubkey="$1"
-    local log_func="$2"  # Function name for logging
-    
-    local authorized=false
-    local email=""
-    local source=""
-    
-    # Check local HEX keys first
-    local local_email=$(get_key_email "$pubkey")
-    if [[ -n "$local_email" ]]; then
-        authorized=true
-        email="$local_email"
-        source="local"
-        $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... found in local keys with email: $email"
-    fi
-    
-    # If not found locally, check swarm
-    if [[ "$authorized" == "false" ]]; then
-        local swarm_email=$(search_swarm_for_pubkey "$pubkey")
-        if [[ -n "$swarm_email" ]]; then
-            authorized=true
-            email="$swarm_email"
-            source="swarm"
-            $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... found in swarm with email: $email"
+# Résolution groupée : check_authorizations PUBKEY... parcourt une seule fois
+# chaque source d'identité pour toutes les clés (index exporté par le moteur,
+# sinon un grep par source) et remplit, indexés par pubkey :
+#   AUTH_AUTHORIZED (true/false), AUTH_EMAIL, AUTH_SOURCE, AUTH_DIR (répertoire MULTIPASS local, vide sinon)
+# Les globales EMAIL / SOURCE ne sont pas modifiées. Retourne 0 si toutes les clés
+# sont autorisées. Le certificat ATOM4LOVE n'est cherché que pour les clés restantes.
+check_authorizations() {
+    declare -gA AUTH_AUTHORIZED=() AUTH_EMAIL=() AUTH_SOURCE=() AUTH_DIR=()
+    local pk pending=() patterns=() found file email rc=0
+    
+    for pk in "$@"; do
+        [[ -z "$pk" || -n "${AUTH_AUTHORIZED[$pk]+x}" ]] && continue
+        AUTH_AUTHORIZED[$pk]=false AUTH_EMAIL[$pk]="" AUTH_SOURCE[$pk]="" AUTH_DIR[$pk]=""
+        # Verdict déjà résolu (et mis en cache) par policy_engine.py pour l'auteur de l'événement
+        if [[ -n "$NIP101_AUTH_SOURCE" && "$pk" == "$NIP101_AUTH_PUBKEY" ]]; then
+            AUTH_AUTHORIZED[$pk]=true AUTH_EMAIL[$pk]="$NIP101_AUTH_EMAIL" AUTH_SOURCE[$pk]="$NIP101_AUTH_SOURCE"
+            [[ "$NIP101_AUTH_SOURCE" == "local" && "$NIP101_AUTH_EMAIL" =~ $EMAIL_REGEX ]] \
+                && AUTH_DIR[$pk]="$KEY_DIR/$NIP101_AUTH_EMAIL"
+            continue
         fi
-    fi
+        pending+=("$pk")
+    done
     
-    # atom4love_certified.txt — persistant, non effacé par 20h12 (TTL 180j géré par le relay)
-    if [[ "$authorized" == "false" ]]; then
-        local _cert_file="${HOME}/.zen/strfry/atom4love_certified.txt"
-        if [[ -f "$_cert_file" ]] && grep -q "^${pubkey}:" "$_cert_file" 2>/dev/null; then
-            authorized=true
-            email="atom4love"
-            source="atom4love_certified"
-            $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... in atom4love_certified.txt"
-        fi
-    fi
-
-    # If still not found, check amisOfAmis.txt
-    if [[ "$authorized" == "false" ]]; then
-        if check_amis_of_amis "$pubkey"; then
-            authorized=true
-            email="amisOfAmis"
-            source="amisOfAmis"
-            $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... found in amisOfAmis.txt"
+    if (( ${#pending[@]} )); then
+        if [[ -n "$NIP101_IDENTITY_INDEX" && -f "$NIP101_IDENTITY_INDEX" ]]; then
+            # Index trié par pubkey puis priorité de source : première ligne retenue
+            while IFS='|' read -r pk found email file; do
+                AUTH_AUTHORIZED[$pk]=true AUTH_SOURCE[$pk]="$found" AUTH_EMAIL[$pk]="$email"
+                [[ "$found" == "local" ]] && AUTH_DIR[$pk]="$file"
+            done < <(awk -F'\t' -v keys="${pending[*]}" '
+                BEGIN { n = split(keys, k, " "); for (i = 1; i <= n; i++) want[k[i]] = 1
+                        split("local swarm atom4love_certified amisOfAmis", s, " "); for (i in s) ok[s[i]] = 1 }
+                ($1 in want) && ($2 in ok) && !($1 in seen) { seen[$1] = 1; print $1 "|" $2 "|" $3 "|" $4 }
+            ' "$NIP101_IDENTITY_INDEX" 2>/dev/null)
+        else
+            for pk in "${pending[@]}"; do patterns+=(-e "$pk"); done
+            # Clés locales puis swarm (TW des nœuds, puis TW de ce nœud) : un grep par source
+            while IFS=: read -r file pk; do
+                [[ "${AUTH_AUTHORIZED[$pk]}" == "false" ]] || continue
+                AUTH_AUTHORIZED[$pk]=true AUTH_SOURCE[$pk]=local AUTH_DIR[$pk]="${file%/HEX}"
+                AUTH_EMAIL[$pk]="${AUTH_DIR[$pk]##*/}"
+            done < <(grep -H -x -F "${patterns[@]}" "$KEY_DIR"/*/HEX 2>/dev/null)
+            while IFS=: read -r file pk; do
+                [[ "${AUTH_AUTHORIZED[$pk]}" == "false" ]] || continue
+                file="${file%/HEX}"
+                AUTH_AUTHORIZED[$pk]=true AUTH_SOURCE[$pk]=swarm AUTH_EMAIL[$pk]="${file##*/}"
+            done < <(grep -H -x -F "${patterns[@]}" "${HOME}"/.zen/tmp/swarm/*/TW/*/HEX \
+                        ${IPFSNODEID:+"${HOME}/.zen/tmp/${IPFSNODEID}"/TW/*/HEX} 2>/dev/null)
+            # atom4love_certified.txt — persistant, non effacé par 20h12 (TTL 180j géré par le relay)
+            while read -r pk; do
+                [[ "${AUTH_AUTHORIZED[$pk]}" == "false" ]] || continue
+                AUTH_AUTHORIZED[$pk]=true AUTH_SOURCE[$pk]=atom4love_certified AUTH_EMAIL[$pk]=atom4love
+            done < <(awk -F: -v keys="${pending[*]}" '
+                BEGIN { n = split(keys, k, " "); for (i = 1; i <= n; i++) want[k[i]] = 1 }
+                ($1 in want) && NF > 1 { print $1 }
+            ' "${HOME}/.zen/strfry/atom4love_certified.txt" 2>/dev/null)
+            while read -r pk; do
+                [[ "${AUTH_AUTHORIZED[$pk]}" == "false" ]] || continue
+                AUTH_AUTHORIZED[$pk]=true AUTH_SOURCE[$pk]=amisOfAmis AUTH_EMAIL[$pk]=amisOfAmis
+            done < <(grep -h -x -F "${patterns[@]}" "$AMISOFAMIS_FILE" "$HOME/.zen/tmp/swarm/"*/amisOfAmis.txt 2>/dev/null)
         fi
+        
+        # Dernier recours : cert d'incarnation ATOM4LOVE (Kind 30078 d=atom4love)
+        for pk in "${pending[@]}"; do
+            [[ "${AUTH_AUTHORIZED[$pk]}" == "false" ]] || continue
+            if check_atom4love_cert "$pk"; then
+                AUTH_AUTHORIZED[$pk]=true AUTH_SOURCE[$pk]=atom4love AUTH_EMAIL[$pk]=atom4love
+                add_to_amis_of_amis "$pk" "ATOM4LOVE certified (auto)"
+            fi
+        done
     fi
+    
+    for pk in "$@"; do
+        [[ -n "$pk" && "${AUTH_AUTHORIZED[$pk]}" == "true" ]] || rc=1
+    done
+    return $rc
+}
 
-    # Dernier recours : cert d'incarnation ATOM4LOVE (Kind 30078 d=atom4love)
-    if [[ "$authorized" == "false" ]]; then
-        if check_atom4love_cert "$pubkey"; then
-            authorized=true
-            email="atom4love"
-            source="atom4love"
-            add_to_amis_of_amis "$pubkey" "ATOM4LOVE certified (auto)"
-            $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... via certificat ATOM4LOVE — ajouté aux amisOfAmis"
-        fi
-    fi
+# Usage: auth_log LOG_FUNC PUBKEY — ligne AUTHORIZED / REJECTED de check_authorization
+# pour une clé résolue par check_authorizations. Retourne 0 si elle est autorisée.
+auth_log() {
+    local log_func="$1" pubkey="$2" state=""
+    [[ -n "$pubkey" ]] && state="${AUTH_AUTHORIZED[$pubkey]}:${AUTH_SOURCE[$pubkey]}"
+    case "$state" in
+        true:local) $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... found in local keys with email: ${AUTH_EMAIL[$pubkey]}" ;;
+        true:swarm) $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... found in swarm with email: ${AUTH_EMAIL[$pubkey]}" ;;
+        true:atom4love_certified) $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... in atom4love_certified.txt" ;;
+        true:amisOfAmis) $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... found in amisOfAmis.txt" ;;
+        true:atom4love) $log_func "AUTHORIZED: Pubkey ${pubkey:0:8}... via certificat ATOM4LOVE — ajouté aux amisOfAmis" ;;
+        true:*) ;;
+        *) $log_func "REJECTED: Pubkey ${pubkey:0:8}... not found in local keys, swarm, or amisOfAmis"
+           return 1 ;;
+    esac
+    return 0
+}
 
-    # Return results via global variables
-    AUTHORIZED="$authorized"
-    EMAIL="$email"
-    SOURCE="$source"
+# Main authorization function - consolidates all checks
+# Une seule clé : résultat dans les globales AUTHORIZED, EMAIL, SOURCE
+check_authorization() {
+    local pubkey="$1"
+    local log_func="$2"  # Function name for logging
     
-    if [[ "$authorized" == "false" ]]; then
-        $log_func "REJECTED: Pubkey ${pubkey:0:8}... not found in local keys, swarm, or amisOfAmis"
-        return 1
+    AUTHORIZED=false EMAIL="" SOURCE=""
+    if [[ -n "$pubkey" ]]; then
+        check_authorizations "$pubkey"
+        AUTHORIZED="${AUTH_AUTHORIZED[$pubkey]}"
+        EMAIL="${AUTH_EMAIL[$pubkey]}"
+        SOURCE="${AUTH_SOURCE[$pubkey]}"
     fi
-    
-    return 0
+    auth_log "$log_func" "$pubkey"
 }
 
 # Resolve the real captain email from ~/.zen/game/players/.current/.player.
@@ -229,7 +389,9 @@ resolve_email_from_kind0() {
 
     [[ -z "$pubkey" ]] && return 1
 
-    if cd "${HOME}/.zen/strfry" 2>/dev/null; then
+    if relay_query latest "$pubkey" 0; then
+        _KIND0_PROFILE="${RELAY_RESULT%$'\n'}"
+    elif cd "${HOME}/.zen/strfry" 2>/dev/null; then
         _KIND0_PROFILE=$(./strfry scan \
             "{\"authors\":[\"${pubkey}\"],\"kinds\":[0]}" 2>/dev/null | \
             jq -s 'if length > 0 then max_by(.created_at) else null end' 2>/dev/null)
@@ -277,26 +439,191 @@ resolve_email_from_kind0() {
 extract_tags() {
     local event_json="$1"
     shift  # Remove first argument
-    local tag_names=("$@")  # Remaining arguments are tag names
-    
-    # Build jq query dynamically
-    local jq_query=""
-    for tag_name in "${tag_names[@]}"; do
-        if [[ -n "$jq_query" ]]; then
-            jq_query="$jq_query + \";\" + "
-        fi
-        jq_query="$jq_query\"${tag_name}=\" + (((.event.tags[] | select(.[0] == \"${tag_name}\") | .[1]) // \"\") | @sh)"
+    event_context_load "$event_json" || return 1
+
+    # Dernière valeur de chaque tag (variable vide si absent) ; les tirets du
+    # nom deviennent des soulignés : report-type → $report_type
+    local tag_name
+    for tag_name in "$@"; do
+        printf -v "${tag_name//-/_}" '%s' "${_ev_last[$tag_name]-}"
     done
-    
-    # Execute single jq call and eval the results
-    eval $(echo "$event_json" | jq -r "$jq_query")
 }
 
 # Utility function for logging with timestamp
+# Horodatage par le printf intégré de bash (pas de fork de `date`)
 log_with_timestamp() {
     local log_file="$1"
     local message="$2"
-    echo "$(date '+%Y-%m-%d %H:%M:%S') - $message" >> "$log_file"
+    printf '%(%Y-%m-%d %H:%M:%S)T - %s\n' -1 "$message" >> "$log_file"
+}
+
+# Usage: policy_module MODULE ARGS... → python3 -m policy.MODULE ARGS...
+policy_module() {
+    local module="$1"
+    shift
+    PYTHONPATH="$NIP101_PLUGIN_DIR${PYTHONPATH:+:$PYTHONPATH}" python3 -m "policy.$module" "$@"
+}
+
+# Requêtes au relais local par la passerelle de policy/relayquery.py : connexion
+# TCP ouverte au premier appel (/dev/tcp, sans fork) puis réutilisée par le shell.
+# Usage: relay_query query FILTER_JSON
+#        relay_query latest PUBKEY KIND [D]     (dernier événement remplaçable)
+#        relay_query count [FILTER_JSON]
+# Résultat dans RELAY_RESULT (événements NDJSON ou nombre) : appeler sans $(...)
+# pour garder la connexion. Retourne 1 si la passerelle ne répond pas ; elle est
+# alors relancée en arrière-plan et l'appelant garde son repli `strfry scan`.
+RELAY_GATEWAY_PORT="${NIP101_RELAY_GATEWAY_PORT:-7778}"
+RELAY_GATEWAY_FD=""
+relay_query() {
+    local op="$1" request line lines=0
+    RELAY_RESULT=""
+    case "$op" in
+        query)  request="{\"op\":\"query\",\"filters\":[$2]}" ;;
+        latest) request="{\"op\":\"latest\",\"author\":\"$2\",\"kind\":$3${4:+,\"d\":\"$4\"}}" ;;
+        count)  request="{\"op\":\"count\",\"filter\":${2:-null}}" ;;
+        *) return 2 ;;
+    esac
+
+    local attempt
+    for attempt in 1 2; do
+        if [[ -z "$RELAY_GATEWAY_FD" ]] \
+            && ! { exec {RELAY_GATEWAY_FD}<>"/dev/tcp/127.0.0.1/$RELAY_GATEWAY_PORT"; } 2>/dev/null; then
+            RELAY_GATEWAY_FD=""
+            policy_module relayquery serve --detach >/dev/null 2>&1
+            return 1
+        fi
+        if printf '%s\n' "${request//$'\n'/ }" >&"$RELAY_GATEWAY_FD" 2>/dev/null; then
+            while IFS= read -r -t "${NIP101_RELAY_TIMEOUT:-10}" line <&"$RELAY_GATEWAY_FD"; do
+                case "$line" in
+                    '["END", '*)
+                        if [[ "$op" == count ]]; then
+                            line="${line#*, }"
+                            RELAY_RESULT="${line%]}"
+                        fi
+                        return 0 ;;
+                    '["ERROR", '*) return 1 ;;
+                esac
+                RELAY_RESULT+="${line}"$'\n'
+                ((lines++))
+            done
+        fi
+        # Connexion fermée (passerelle arrêtée après inactivité) ou réponse incomplète
+        exec {RELAY_GATEWAY_FD}>&-
+        RELAY_GATEWAY_FD=""
+        (( lines > 0 )) && break
+    done
+    RELAY_RESULT=""
+    return 1
+}
+
+# Video statistics (kinds 21/22): append-only delta log folded into
+# nostr_video_stats.json / nostr_long_video_stats.json by policy/videostats.py
+VIDEO_STATS_DELTA="$HOME/.zen/tmp/nostr_video_stats.delta"
+VIDEO_STATS_STAMP="$HOME/.zen/tmp/nostr_video_stats.flushed"
+VIDEO_STATS_INTERVAL="${NIP101_VIDEO_STATS_INTERVAL:-60}"
+
+# Usage: video_stats_add KIND PUBKEY DURATION MIME_TYPE HAS_LOCATION(true/false) FLAG(0/1)
+# Une ligne ajoutée par printf (pas de fork) ; flush en arrière-plan au plus
+# une fois par VIDEO_STATS_INTERVAL secondes
+video_stats_add() {
+    local kind="$1"
+    local pubkey="${2//[$'\t\r\n']/}"
+    local duration="$3"
+    local mime_type="${4//[$'\t\r\n']/ }"
+    local has_location=0
+    local flag="${6:-0}"
+    local now last=0
+    
+    [[ "$5" == "true" ]] && has_location=1
+    [[ "$duration" =~ ^-?[0-9]+([.][0-9]+)?$ ]] || duration=0
+    printf '%s\t%s\t%s\t%s\t%s\t%s\n' "$kind" "$pubkey" "$duration" "$mime_type" "$has_location" "$flag" \
+        >> "$VIDEO_STATS_DELTA"
+    
+    printf -v now '%(%s)T' -1
+    [[ -f "$VIDEO_STATS_STAMP" ]] && read -r last < "$VIDEO_STATS_STAMP"
+    [[ "$last" =~ ^[0-9]+$ ]] || last=0
+    if (( now - last >= ${VIDEO_STATS_INTERVAL%.*} )); then
+        printf '%s\n' "$now" > "$VIDEO_STATS_STAMP"
+        policy_module videostats flush >/dev/null 2>&1 &
+    fi
+}
+
+# UMAP keys (0.01° cells) cached by policy/umapkeys.py:
+# NAMESPACE LAT LON HEX NPUB, NAMESPACE = sha256(UPLANETNAME)[:16]
+UMAP_KEYS_FILE="$HOME/.zen/strfry/umap_keys.tsv"
+
+# Usage: umap_key LAT LON → UMAP_LAT, UMAP_LON (%.2f), UMAP_HEX, UMAP_NPUB
+# Arrondi sous LC_ALL=C : point décimal quelle que soit la locale du nœud
+# (mêmes clés que l'arrondi awk des autres nœuds).
+# Un grep dans la table ; keygen n'est lancé (policy.umapkeys get) que pour
+# une cellule encore inconnue. Retourne 1 si la clé ne peut être dérivée.
+umap_key() {
+    local row
+    UMAP_HEX=""
+    UMAP_NPUB=""
+    
+    [[ "$1" =~ ^-?[0-9]+\.?[0-9]*$ && "$2" =~ ^-?[0-9]+\.?[0-9]*$ ]] || return 1
+    LC_ALL=C printf -v UMAP_LAT '%.2f' "$1"
+    LC_ALL=C printf -v UMAP_LON '%.2f' "$2"
+    if [[ -z "${NIP101_UMAP_NS:-}" ]]; then
+        NIP101_UMAP_NS=$(printf '%s' "$UPLANETNAME" | sha256sum)
+        export NIP101_UMAP_NS="${NIP101_UMAP_NS:0:16}"
+    fi
+    
+    row=$(grep -m1 -F "${NIP101_UMAP_NS}"$'\t'"${UMAP_LAT}"$'\t'"${UMAP_LON}"$'\t' "$UMAP_KEYS_FILE" 2>/dev/null) \
+        || row=$(UPLANETNAME="$UPLANETNAME" policy_module umapkeys get "$UMAP_LAT" "$UMAP_LON" 2>/dev/null) \
+        || return 1
+    row="${row#*$'\t'*$'\t'*$'\t'}"
+    UMAP_HEX="${row%%$'\t'*}"
+    UMAP_NPUB="${row#*$'\t'}"
+    [[ -n "$UMAP_HEX" ]]
+}
+
+# Scheduled deletion of relay replies (policy/expiry.py): the earliest due
+# time is mirrored in EXPIRY_NEXT so callers only fork once something is due
+EXPIRY_DB="$HOME/.zen/strfry/expiry.sqlite"
+EXPIRY_NEXT="$HOME/.zen/tmp/expiry.next"
+EXPIRY_SWEEP_BACKOFF=60
+
+# Usage: expiry_schedule EVENT_ID DUE_AT [LABEL]
+expiry_schedule() {
+    [[ "$1" =~ ^[0-9a-f]{64}$ ]] || return 1
+    policy_module expiry add "$1" "$2" "${3:-}" >/dev/null
+}
+
+# Usage: expiry_sweep_due → lance le balayeur en arrière-plan si une échéance est passée
+# (ou au tout premier passage, pour reprendre les réponses publiées avant l'échéancier)
+expiry_sweep_due() {
+    local now launch=false
+    
+    printf -v now '%(%s)T' -1
+    # Lecture sans verrou : aucun fork tant que rien n'est échu
+    _expiry_due "$now" || return 0
+    # Confirmée sous le verrou de EXPIRY_NEXT (celui du balayeur, policy/expiry.py) :
+    # un seul filtre repousse l'échéance et relance le balayeur pendant qu'il travaille
+    {
+        flock -x 9
+        if _expiry_due "$now"; then
+            printf '%s\n' "$((now + EXPIRY_SWEEP_BACKOFF))" > "$EXPIRY_NEXT"
+            launch=true
+        fi
+    } 9>>"$EXPIRY_NEXT.lock"
+    if [[ "$launch" == "true" ]]; then
+        policy_module expiry sweep >/dev/null 2>&1 &
+    fi
+}
+
+# Usage: _expiry_due NOW → 0 si la prochaine échéance de EXPIRY_NEXT est passée
+_expiry_due() {
+    local next=0
+    
+    if [[ -f "$EXPIRY_NEXT" ]]; then
+        read -r next < "$EXPIRY_NEXT"
+        [[ "$next" =~ ^[0-9]+$ ]] || next=0
+    elif [[ -f "$EXPIRY_DB" ]]; then
+        return 1
+    fi
+    (( $1 >= next ))
 }
 
 # Function to create log directory if it doesn't exist
@@ -343,7 +670,7 @@ extract_all_tags_of_type() {
     local event_json="$1"
     local tag_type="$2"
     
-    echo "$event_json" | jq -r --arg type "$tag_type" '.event.tags[] | select(.[0] == $type) | .[1]' 2>/dev/null
+    event_context_load "$event_json" && event_tags "$tag_type"
 }
 
 # Check if event has a specific tag value
@@ -353,8 +680,13 @@ has_tag_value() {
     local tag_type="$2"
     local tag_value="$3"
     
-    echo "$event_json" | jq -e --arg type "$tag_type" --arg value "$tag_value" \
-        '.event.tags[] | select(.[0] == $type and .[1] == $value)' >/dev/null 2>&1
+    event_context_load "$event_json" || return 1
+    [[ -n "${_ev_all[$tag_type]+set}" ]] || return 1
+    local value
+    while IFS= read -r value; do
+        [[ "$value" == "$tag_value" ]] && return 0
+    done <<< "${_ev_all[$tag_type]}"
+    return 1
 }
 
 # Get specific tag value by type
@@ -363,33 +695,35 @@ get_tag_value() {
     local event_json="$1"
     local tag_type="$2"
     
-    echo "$event_json" | jq -r --arg type "$tag_type" '(.event.tags[] | select(.[0] == $type) | .[1]) // ""' 2>/dev/null | head -1
+    event_context_load "$event_json" && event_tag "$tag_type"
+}
+
+# Index inverse BIEN_HEX → projet (policy/crowdfunding.py), une ligne par projet :
+# BIEN_HEX<TAB>project_id<TAB>BIEN_G1PUB<TAB>BIEN_NPUB — mis à jour par 30904.sh
+BIENS_INDEX="$CROWDFUNDING_DIR/biens.idx"
+
+# Usage: _bien_index_lookup HEX → ligne de l'index (retourne 1 si absent)
+_bien_index_lookup() {
+    local hex_pubkey="$1"
+    [[ -n "$hex_pubkey" && -d "$CROWDFUNDING_DIR" ]] || return 1
+    [[ -f "$BIENS_INDEX" ]] || policy_module crowdfunding rebuild >/dev/null 2>&1
+    awk -F'\t' -v hex="$hex_pubkey" '$1 == hex { print; found = 1; exit } END { exit !found }' \
+        "$BIENS_INDEX" 2>/dev/null
 }
 
 # Check if pubkey is a Bien (crowdfunding project)
 # Returns: project_id if found, empty string otherwise
 is_crowdfunding_bien() {
     local hex_pubkey="$1"
+    local row
     
-    if [[ ! -d "$CROWDFUNDING_DIR" ]]; then
-        echo ""
-        return 1
+    # Reverse index lookup (no scan of every project's bien.pubkeys)
+    if row=$(_bien_index_lookup "$hex_pubkey"); then
+        row="${row#*$'\t'}"
+        echo "${row%%$'\t'*}"
+        return 0
     fi
     
-    # Search for this hex in all project's bien.pubkeys files
-    for project_dir in "$CROWDFUNDING_DIR"/*/; do
-        if [[ -d "$project_dir" ]]; then
-            local pubkeys_file="$project_dir/bien.pubkeys"
-            if [[ -f "$pubkeys_file" ]]; then
-                if grep -q "^BIEN_HEX=$hex_pubkey$" "$pubkeys_file" 2>/dev/null; then
-                    # Return project ID (directory name)
-                    basename "$project_dir"
-                    return 0
-                fi
-            fi
-        fi
-    done
-    
     echo ""
     return 1
 }
@@ -438,50 +772,48 @@ add_to_amis_of_amis() {
     # Ensure directory exists
     mkdir -p "$(dirname "$AMISOFAMIS_FILE")"
     
-    # Check if already present
-    if ! grep -q "^$hex_pubkey$" "$AMISOFAMIS_FILE" 2>/dev/null; then
-        # Add with optional comment
-        if [[ -n "$comment" ]]; then
-            echo "# $comment" >> "$AMISOFAMIS_FILE"
+    # Check and append under the lock shared with policy/auth.py (other filters run concurrently)
+    local added=1
+    {
+        flock -x 9
+        if ! grep -q "^$hex_pubkey$" "$AMISOFAMIS_FILE" 2>/dev/null; then
+            # Add with optional comment
+            if [[ -n "$comment" ]]; then
+                echo "# $comment" >> "$AMISOFAMIS_FILE"
+            fi
+            echo "$hex_pubkey" >> "$AMISOFAMIS_FILE"
+            added=0
         fi
-        echo "$hex_pubkey" >> "$AMISOFAMIS_FILE"
-        return 0
-    fi
+    } 9>>"$AMISOFAMIS_FILE.lock"
     
-    return 1  # Already present
+    [[ $added -eq 0 ]] && signal_identity_change
+    return $added  # 1: already present
 }
 
-# Sync all Bien hex keys to amisOfAmis.txt
+# Sync all Bien hex keys to amisOfAmis.txt (Bien index, one read of amisOfAmis.txt)
+# Returns: number of keys added
 sync_crowdfunding_biens_to_amis() {
     local log_func="$1"
     local added_count=0
+    local message
     
     if [[ ! -d "$CROWDFUNDING_DIR" ]]; then
         return 0
     fi
     
-    for project_dir in "$CROWDFUNDING_DIR"/*/; do
-        if [[ -d "$project_dir" ]]; then
-            local pubkeys_file="$project_dir/bien.pubkeys"
-            local project_id=$(basename "$project_dir")
-            
-            if [[ -f "$pubkeys_file" ]]; then
-                source "$pubkeys_file"
-                if [[ -n "$BIEN_HEX" ]]; then
-                    if add_to_amis_of_amis "$BIEN_HEX" "Crowdfunding Bien: $project_id"; then
-                        added_count=$((added_count + 1))
-                        [[ -n "$log_func" ]] && $log_func "CROWDFUNDING: Added Bien $project_id hex to amisOfAmis"
-                    fi
-                fi
-            fi
-        fi
-    done
+    while IFS= read -r message; do
+        added_count=$((added_count + 1))
+        [[ -n "$log_func" ]] && $log_func "$message"
+    done < <(policy_module crowdfunding sync 2>/dev/null)
     
     return $added_count
 }
 
-# Record contribution to crowdfunding project
-# Updates project.json with new contribution
+# Registre transactionnel du crowdfunding (policy/ledger.py, SQLite WAL) :
+# contributions, votes et totaux ; project.json est réexporté hors transaction
+# (au plus toutes les NIP101_LEDGER_EXPORT_INTERVAL s, aussitôt pour un statut).
+
+# Record contribution to crowdfunding project (idempotent on tx_event_id)
 record_crowdfunding_contribution() {
     local project_id="$1"
     local contributor_hex="$2"
@@ -489,129 +821,43 @@ record_crowdfunding_contribution() {
     local currency="${4:-ZEN}"
     local tx_event_id="$5"
     
-    local project_file="$CROWDFUNDING_DIR/$project_id/project.json"
-    
-    if [[ ! -f "$project_file" ]]; then
-        return 1
-    fi
-    
-    # Create contribution record
-    local timestamp=$(date -u +%Y-%m-%dT%H:%M:%SZ)
-    local temp_file=$(mktemp)
-    
-    jq --arg hex "$contributor_hex" \
-       --argjson amount "$amount" \
-       --arg currency "$currency" \
-       --arg ts "$timestamp" \
-       --arg event_id "$tx_event_id" \
-       '.contributions += [{
-           "contributor_hex": $hex,
-           "amount": $amount,
-           "currency": $currency,
-           "timestamp": $ts,
-           "event_id": $event_id
-       }] | .totals.zen_convertible_collected += $amount' \
-       "$project_file" > "$temp_file" 2>/dev/null
-    
-    if [[ $? -eq 0 ]]; then
-        mv "$temp_file" "$project_file"
-        return 0
-    else
-        rm -f "$temp_file"
-        return 1
-    fi
+    [[ -f "$CROWDFUNDING_DIR/$project_id/project.json" ]] || return 1
+    policy_module ledger contribute "$project_id" "$contributor_hex" "$amount" "$currency" "$tx_event_id"
 }
 
-# Record vote for ASSETS usage
+# Record vote for ASSETS usage (threshold checked in the same transaction)
+# Returns: 0 recorded, 1 error, 2 vote not active, 3 already voted
 record_assets_vote() {
     local project_id="$1"
     local voter_hex="$2"
     local vote_amount="$3"
     local vote_event_id="$4"
     
-    local project_file="$CROWDFUNDING_DIR/$project_id/project.json"
-    
-    if [[ ! -f "$project_file" ]]; then
-        return 1
-    fi
-    
-    # Check if vote is active
-    local vote_active=$(jq -r '.vote.assets_vote_active // false' "$project_file")
-    if [[ "$vote_active" != "true" ]]; then
-        return 2  # Vote not active
-    fi
-    
-    # Check if already voted
-    local already_voted=$(jq -r --arg hex "$voter_hex" '.vote.voters[] | select(. == $hex)' "$project_file" 2>/dev/null)
-    if [[ -n "$already_voted" ]]; then
-        return 3  # Already voted
-    fi
-    
-    # Record vote
-    local temp_file=$(mktemp)
-    jq --arg hex "$voter_hex" \
-       --argjson amount "$vote_amount" \
-       --arg event_id "$vote_event_id" \
-       '.vote.voters += [$hex] |
-        .vote.voters_count = (.vote.voters | length) |
-        .vote.votes_zen_total += $amount |
-        .vote.vote_events += [{hex: $hex, amount: $amount, event_id: $event_id}]' \
-       "$project_file" > "$temp_file" 2>/dev/null
-    
-    if [[ $? -eq 0 ]]; then
-        mv "$temp_file" "$project_file"
-        
-        # Check if vote threshold reached
-        check_vote_threshold "$project_id"
-        return 0
-    else
-        rm -f "$temp_file"
-        return 1
-    fi
+    [[ -f "$CROWDFUNDING_DIR/$project_id/project.json" ]] || return 1
+    policy_module ledger vote "$project_id" "$voter_hex" "$vote_amount" "$vote_event_id"
 }
 
 # Check if vote threshold is reached and update status
+# Returns: 0 if the vote is approved
 check_vote_threshold() {
     local project_id="$1"
-    local project_file="$CROWDFUNDING_DIR/$project_id/project.json"
     
-    if [[ ! -f "$project_file" ]]; then
-        return 1
-    fi
-    
-    local votes_total=$(jq -r '.vote.votes_zen_total // 0' "$project_file")
-    local voters_count=$(jq -r '.vote.voters_count // 0' "$project_file")
-    local threshold=$(jq -r '.vote.vote_threshold // 100' "$project_file")
-    local quorum=$(jq -r '.vote.vote_quorum // 10' "$project_file")
-    
-    # Check both conditions
-    if [[ $(echo "$votes_total >= $threshold" | bc -l) -eq 1 ]] && \
-       [[ $(echo "$voters_count >= $quorum" | bc -l) -eq 1 ]]; then
-        
-        # Update vote status to approved
-        local temp_file=$(mktemp)
-        jq '.vote.vote_status = "approved" | 
-            .vote.approved_at = "'"$(date -u +%Y-%m-%dT%H:%M:%SZ)"'" | 
-            .status = "funded"' "$project_file" > "$temp_file"
-        mv "$temp_file" "$project_file"
-        
-        return 0  # Vote approved
-    fi
-    
-    return 1  # Vote not yet approved
+    [[ -f "$CROWDFUNDING_DIR/$project_id/project.json" ]] || return 1
+    policy_module ledger threshold "$project_id"
 }
 
 # Search for Bien G1PUB by hex (extends search_for_this_hex_in_uplanet.sh)
 search_bien_g1pub() {
     local hex_pubkey="$1"
-    
-    # First check if this is a crowdfunding Bien
-    local project_id=$(is_crowdfunding_bien "$hex_pubkey")
-    if [[ -n "$project_id" ]]; then
-        local wallet_info=$(get_bien_wallet_info "$project_id")
-        if [[ -n "$wallet_info" ]]; then
-            # Return G1PUB (second field)
-            echo "$wallet_info" | cut -d'|' -f2
+    local row
+    
+    # Crowdfunding Bien: G1PUB is the third field of the index line
+    if row=$(_bien_index_lookup "$hex_pubkey"); then
+        row="${row#*$'\t'}"
+        row="${row#*$'\t'}"
+        row="${row%%$'\t'*}"
+        if [[ -n "$row" ]]; then
+            echo "$row"
             return 0
         fi
     fi
@@ -0,0 +1,6 @@
+"""
+Moteur de politique d'écriture NIP-101 pour strfry (writePolicy plugin).
+
+Voir policy_engine.py pour le point d'entrée et all_but_blacklist.sh pour
+l'implémentation shell de référence.
+"""
@@ -0,0 +1,113 @@
+"""
+Équivalent Python de check_authorization() (filter/common.sh).
+
+Même cascade et mêmes lignes de log : clés locales, swarm,
+atom4love_certified.txt, amisOfAmis puis, en dernier recours, certificat
+ATOM4LOVE (la clé est alors ajoutée à amisOfAmis.txt).
+"""
+
+import fcntl
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from . import config
+from .certs import check_atom4love_cert
+from .identity import IdentityIndex, signal_change
+
+# Sources reconnues sans effet de bord, dans l'ordre de check_authorization()
+AUTH_SOURCES = ("local", "swarm", "atom4love_certified", "amisOfAmis")
+
+AUTH_MESSAGES = {
+    "local": "found in local keys with email: {email}",
+    "swarm": "found in swarm with email: {email}",
+    "atom4love_certified": "in atom4love_certified.txt",
+    "amisOfAmis": "found in amisOfAmis.txt",
+    "atom4love": "via certificat ATOM4LOVE — ajouté aux amisOfAmis",
+}
+
+
+class Authorization(NamedTuple):
+    authorized: bool
+    email: str
+    source: str
+
+
+UNAUTHORIZED = Authorization(False, "", "")
+
+
+@contextmanager
+def amis_of_amis_locked(path: str = config.AMIS_OF_AMIS_FILE) -> Iterator[None]:
+    """Verrou des ajouts à amisOfAmis.txt, partagé avec add_to_amis_of_amis
+    (filter/common.sh) : lecture et ajout ne se croisent pas entre filtres."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def add_to_amis_of_amis(pubkey: str, comment: str = "", path: str = config.AMIS_OF_AMIS_FILE) -> bool:
+    """Ajoute `pubkey` à amisOfAmis.txt (avec commentaire). False si déjà présente."""
+    if not pubkey:
+        return False
+    with amis_of_amis_locked(path):
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                if any(line.rstrip("\n") == pubkey for line in f):
+                    return False
+        except FileNotFoundError:
+            pass
+        with open(path, "a", encoding="utf-8") as f:
+            if comment:
+                f.write(f"# {comment}\n")
+            f.write(pubkey + "\n")
+    signal_change()
+    return True
+
+
+def resolve(identities: IdentityIndex, pubkey: str) -> Authorization:
+    """Sources sans effet de bord uniquement (UNAUTHORIZED si aucune ne correspond)."""
+    for identity in identities.identities(pubkey):
+        if identity.source in AUTH_SOURCES:
+            return Authorization(True, identity.email, identity.source)
+    return UNAUTHORIZED
+
+
+def log_authorization(log: Callable[[str], None], pubkey: str, auth: Authorization) -> None:
+    """Ligne AUTHORIZED / REJECTED de check_authorization() pour une clé résolue."""
+    if auth.authorized:
+        log(f"AUTHORIZED: Pubkey {pubkey[:8]}... " + AUTH_MESSAGES[auth.source].format(email=auth.email))
+    else:
+        log(f"REJECTED: Pubkey {pubkey[:8]}... not found in local keys, swarm, or amisOfAmis")
+
+
+def check_authorizations(identities: IdentityIndex, pubkeys: Iterable[str],
+                         known: Optional[Dict[str, Authorization]] = None) -> Dict[str, Authorization]:
+    """Cascade pour plusieurs clés (zappeur et destinataire…) : sources d'identité
+    consultées une fois, certificat ATOM4LOVE pour les seules clés restantes. Sans log."""
+    known = known or {}
+    results: Dict[str, Authorization] = {}
+    for pubkey in pubkeys:
+        if pubkey in results:
+            continue
+        auth = known.get(pubkey)
+        results[pubkey] = auth if auth is not None and auth.authorized else resolve(identities, pubkey)
+    for pubkey, auth in results.items():
+        if not auth.authorized and pubkey and check_atom4love_cert(pubkey):
+            add_to_amis_of_amis(pubkey, "ATOM4LOVE certified (auto)")
+            identities.mark_stale()
+            results[pubkey] = Authorization(True, "atom4love", "atom4love")
+    return results
+
+
+def check_authorization(identities: IdentityIndex, pubkey: str,
+                        log: Optional[Callable[[str], None]] = None,
+                        known: Optional[Authorization] = None) -> Authorization:
+    """Cascade complète ; `known` évite de la refaire (verdict mis en cache)."""
+    auth = check_authorizations(identities, [pubkey], {pubkey: known} if known is not None else None)[pubkey]
+    if log is not None:
+        log_authorization(log, pubkey, auth)
+    return auth
@@ -0,0 +1,275 @@
+"""
+Sessions NIP-42 (kind 22242) avec expiration.
+
+filter/22242.sh écrivait un marqueur .nip42_auth_<hex> par authentification
+dans le répertoire MULTIPASS (~/.zen/game/nostr/<email>/) ou dans un
+répertoire .pubkey_<hex> créé pour chaque clé inconnue ; l'expiration était
+laissée à l'API (300 s) et ces répertoires n'étaient jamais supprimés. Les
+sessions sont désormais gardées dans ~/.zen/strfry/nip42_sessions.sqlite,
+une ligne par pubkey (clé primaire) :
+
+    pubkey  event_hash  created_at  email  source  expires_at
+
+Une nouvelle authentification remplace la ligne ; les lignes échues sont
+ignorées à la lecture et purgées par l'index expires_at (au plus une fois par
+NIP42_PURGE_INTERVAL), ainsi que les répertoires .pubkey_<hex> sans session
+plus vieux que NIP42_DIR_RETENTION qui ne contiennent que les fichiers créés
+par 22242.sh.
+
+Lecture par un autre processus (API UPassport) : `lookup(pubkey)` ouvre la
+base en lecture seule (`mode=ro`) et retourne le même JSON que le marqueur,
+complété de email, source et expires_at — ou `python3 -m policy.authsessions
+get PUBKEY`.
+
+Les marqueurs restent exportés pour compatibilité selon NIP101_NIP42_MARKERS :
+  all   (défaut) comme avant, y compris dans les répertoires .pubkey_<hex>
+  known seulement dans les répertoires de comptes (MULTIPASS, roaming, CAPTAIN)
+  none  aucun fichier, la base seule fait foi
+
+Usage en ligne de commande :
+    python3 -m policy.authsessions upsert PUBKEY EVENT_HASH [--email EMAIL] [--source SOURCE] [--marker-dir DIR]
+    python3 -m policy.authsessions get PUBKEY
+    python3 -m policy.authsessions purge
+    python3 -m policy.authsessions stats
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from . import config
+
+NIP42_SESSIONS_DB = os.path.join(config.STRFRY_DIR, "nip42_sessions.sqlite")
+# Même durée que la vérification de l'API (check_nip42_auth_local_marker)
+NIP42_TTL = float(os.environ.get("NIP101_NIP42_TTL", "300"))
+NIP42_PURGE_INTERVAL = float(os.environ.get("NIP101_NIP42_PURGE_INTERVAL", "600"))
+NIP42_DIR_RETENTION = float(os.environ.get("NIP101_NIP42_DIR_RETENTION", "86400"))
+
+MARKERS_ALL, MARKERS_KNOWN, MARKERS_NONE = "all", "known", "none"
+NIP42_MARKERS = os.environ.get("NIP101_NIP42_MARKERS", MARKERS_ALL)
+
+PUBKEY_DIR_PREFIX = ".pubkey_"
+# Fichiers écrits par 22242.sh dans un répertoire .pubkey_<hex>
+PUBKEY_DIR_FILES = ("HEX", "SOURCE", ".roaming")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    pubkey     TEXT PRIMARY KEY,
+    event_hash TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    email      TEXT NOT NULL DEFAULT '',
+    source     TEXT NOT NULL DEFAULT '',
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+COLUMNS = "pubkey, event_hash, created_at, email, source, expires_at"
+
+
+class AuthSession(NamedTuple):
+    pubkey: str
+    event_hash: str
+    created_at: int
+    email: str
+    source: str
+    expires_at: float
+
+    def marker(self) -> str:
+        """Contenu du marqueur .nip42_auth_<hex> (format inchangé pour l'API)."""
+        return json.dumps({"pubkey": self.pubkey, "event_hash": self.event_hash,
+                           "created_at": self.created_at}, separators=(",", ":"))
+
+    def to_dict(self) -> Dict[str, object]:
+        return self._asdict()
+
+
+def marker_path(marker_dir: str, pubkey: str) -> str:
+    return os.path.join(marker_dir, f".nip42_auth_{pubkey}")
+
+
+def write_marker(session: AuthSession, marker_dir: str, mode: str = NIP42_MARKERS) -> Optional[str]:
+    """Export de compatibilité : écrit le marqueur si `mode` le permet (chemin écrit, sinon None)."""
+    if not marker_dir or mode == MARKERS_NONE:
+        return None
+    if mode == MARKERS_KNOWN and os.path.basename(marker_dir.rstrip("/")).startswith(PUBKEY_DIR_PREFIX):
+        return None
+    path = marker_path(marker_dir, session.pubkey)
+    fd, tmp = tempfile.mkstemp(dir=marker_dir, prefix=".nip42.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(session.marker())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+class AuthSessionStore:
+    """Sessions NIP-42 par pubkey (upsert et lecture par clé primaire)."""
+
+    def __init__(self, path: str = NIP42_SESSIONS_DB, ttl: float = NIP42_TTL,
+                 purge_interval: float = NIP42_PURGE_INTERVAL,
+                 dir_retention: float = NIP42_DIR_RETENTION, key_dir: str = config.KEY_DIR):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.dir_retention = dir_retention
+        self.key_dir = key_dir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ---------------------------------------------------------------- sessions
+
+    def upsert(self, pubkey: str, event_hash: str, email: str = "", source: str = "",
+               now: Optional[float] = None) -> AuthSession:
+        """Enregistre (ou renouvelle) la session de `pubkey`."""
+        now = time.time() if now is None else now
+        session = AuthSession(pubkey, event_hash, int(now), email, source, now + self.ttl)
+        self.conn.execute(f"INSERT OR REPLACE INTO sessions ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", session)
+        if now - float(self._meta("purged_at") or 0) >= self.purge_interval:
+            self.purge(now)
+        return session
+
+    def get(self, pubkey: str, now: Optional[float] = None) -> Optional[AuthSession]:
+        """Session en cours de `pubkey` (None si absente ou échue)."""
+        now = time.time() if now is None else now
+        row = self.conn.execute(f"SELECT {COLUMNS} FROM sessions WHERE pubkey = ? AND expires_at > ?",
+                                (pubkey, now)).fetchone()
+        return AuthSession(*row) if row else None
+
+    # ------------------------------------------------------------------ expiry
+
+    def _prune_pubkey_dirs(self, now: float) -> int:
+        """Supprime les répertoires .pubkey_<hex> abandonnés (aucune session, rien d'autre dedans)."""
+        try:
+            names = [n for n in os.listdir(self.key_dir) if n.startswith(PUBKEY_DIR_PREFIX)]
+        except OSError:
+            return 0
+        removed = 0
+        for name in names:
+            pubkey = name[len(PUBKEY_DIR_PREFIX):]
+            path = os.path.join(self.key_dir, name)
+            allowed = set(PUBKEY_DIR_FILES) | {f".nip42_auth_{pubkey}"}
+            try:
+                if now - os.stat(path).st_mtime < self.dir_retention or not set(os.listdir(path)) <= allowed:
+                    continue
+                marker = marker_path(path, pubkey)
+                if os.path.exists(marker) and now - os.stat(marker).st_mtime < self.dir_retention:
+                    continue
+            except OSError:
+                continue
+            if self.get(pubkey, now) is None:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def purge(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Supprime les sessions échues et les répertoires .pubkey_<hex> abandonnés."""
+        now = time.time() if now is None else now
+        sessions = self.conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+        dirs = self._prune_pubkey_dirs(now)
+        self._set_meta("purged_at", str(now))
+        return {"sessions": sessions, "pubkey_dirs": dirs}
+
+    def stats(self) -> Dict[str, float]:
+        now = time.time()
+        active, expired = self.conn.execute(
+            "SELECT COALESCE(SUM(expires_at > ?), 0), COALESCE(SUM(expires_at <= ?), 0) FROM sessions",
+            (now, now)).fetchone()
+        return {"active": active, "expired": expired, "ttl_seconds": self.ttl, "markers": NIP42_MARKERS,
+                "purged_at": float(self._meta("purged_at") or 0)}
+
+
+_default_store: Optional[AuthSessionStore] = None
+
+
+def default_store() -> AuthSessionStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = AuthSessionStore()
+    return _default_store
+
+
+def lookup(pubkey: str, path: str = NIP42_SESSIONS_DB, now: Optional[float] = None) -> Optional[Dict[str, object]]:
+    """Lecture seule pour les autres processus : session en cours de `pubkey`, sinon None."""
+    now = time.time() if now is None else now
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+    except sqlite3.Error:
+        return None
+    try:
+        row = conn.execute(f"SELECT {COLUMNS} FROM sessions WHERE pubkey = ? AND expires_at > ?",
+                           (pubkey, now)).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return AuthSession(*row).to_dict() if row else None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    if args[:1] == ["upsert"]:
+        parser = argparse.ArgumentParser(prog="python3 -m policy.authsessions upsert")
+        parser.add_argument("pubkey")
+        parser.add_argument("event_hash")
+        parser.add_argument("--email", default="")
+        parser.add_argument("--source", default="")
+        parser.add_argument("--marker-dir", default="")
+        opts = parser.parse_args(args[1:])
+        store = AuthSessionStore()
+        try:
+            session = store.upsert(opts.pubkey, opts.event_hash, opts.email, opts.source)
+        finally:
+            store.close()
+        try:
+            marker = write_marker(session, opts.marker_dir)
+        except OSError as e:
+            print(f"marker not written: {e}", file=sys.stderr)
+            return 1
+        print(marker or "stored")
+        return 0
+    if args[:1] == ["get"] and len(args) == 2:
+        session = lookup(args[1])
+        if session is None:
+            return 1
+        print(json.dumps(session))
+        return 0
+    if args in (["purge"], ["stats"]):
+        store = AuthSessionStore()
+        try:
+            print(json.dumps(store.purge() if args == ["purge"] else store.stats(), indent=2))
+        finally:
+            store.close()
+        return 0
+    print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+Banc de mesure du plugin writePolicy : fixture ~/.zen synthétique, corpus
+JSONL rejoué à travers la politique, rapport comparable à une référence.
+
+    python3 -m policy.bench fixture DIR [--multipass N] [--swarm-nodes N]
+        [--swarm-users N] [--amis N] [--blacklist N] [--projects N] [--seed S]
+    python3 -m policy.bench corpus DIR OUT.jsonl [--events N]
+        [--kinds 1:50,7:20,...] [--users player:40,uplanet:20,...] [--seed S]
+    python3 -m policy.bench run DIR CORPUS.jsonl [--engine python|bash]
+        [--save-baseline FICHIER] [--baseline FICHIER] [--tolerance 0.10]
+
+La fixture est un HOME complet (DIR/.zen/...) : la politique est lancée avec
+HOME=DIR et ne touche jamais le vrai ~/.zen. Les filtres qui appellent des
+outils absents de la fixture (strfry, Astroport.ONE…) échouent rapidement,
+comme sur un relai sans ces outils.
+
+Le rapport donne le débit (événements/s), les latences de verdict p50 / p95 /
+p99 (écriture de la ligne → réponse lue) et les processus créés par événement
+(compteur `processes` de /proc/stat, donc global à la machine : à lancer sur
+un hôte calme). `--baseline` compare au rapport sauvegardé et sort en erreur
+si une métrique se dégrade de plus de `--tolerance`.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import config
+
+FIXTURE_MANIFEST = "bench_fixture.json"
+
+DEFAULT_KINDS = "1:40,7:20,0:10,3:10,30023:5,9735:5,21:5,30904:5"
+DEFAULT_USERS = "player:40,uplanet:20,nobody:30,blacklisted:10"
+
+# Seuils de régression : True si une valeur plus grande est meilleure
+BASELINE_METRICS = {
+    "events_per_sec": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "spawns_per_event": False,
+}
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    """"1:40,7:20" → [("1", 40.0), ("7", 20.0)]."""
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition(":")
+        if name:
+            mix.append((name, float(weight or 1)))
+    if not mix or sum(w for _, w in mix) <= 0:
+        raise ValueError(f"invalid mix: {spec!r}")
+    return mix
+
+
+def _hex(rng: random.Random) -> str:
+    return f"{rng.getrandbits(256):064x}"
+
+
+def _write(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+# ------------------------------------------------------------------- fixture
+
+def build_fixture(root: str, multipass: int = 100, swarm_nodes: int = 10, swarm_users: int = 20,
+                  amis: int = 500, blacklist: int = 1000, projects: int = 5, seed: int = 1) -> dict:
+    """Crée DIR/.zen avec les fichiers lus par la politique ; retourne le manifeste."""
+    rng = random.Random(seed)
+    zen = os.path.join(root, ".zen")
+    strfry = os.path.join(zen, "strfry")
+    swarm = os.path.join(zen, "tmp", "swarm")
+    manifest: Dict[str, list] = {"player": [], "uplanet": [], "nobody": [], "blacklisted": []}
+
+    for i in range(multipass):
+        key = _hex(rng)
+        _write(os.path.join(zen, "game", "nostr", f"user{i}@bench.test", "HEX"), key + "\n")
+        manifest["player"].append(key)
+
+    for n in range(swarm_nodes):
+        node = os.path.join(swarm, f"12D3KooWBench{n:04d}")
+        node_key = _hex(rng)
+        _write(os.path.join(node, "HEX"), node_key + "\n")
+        manifest["uplanet"].append(node_key)
+        for u in range(swarm_users):
+            _write(os.path.join(node, "TW", f"remote{n}.{u}@bench.test", "HEX"), _hex(rng) + "\n")
+        _write(os.path.join(node, "amisOfAmis.txt"), "".join(_hex(rng) + "\n" for _ in range(amis // 10)))
+
+    amis_keys = [_hex(rng) for _ in range(amis)]
+    _write(os.path.join(strfry, "amisOfAmis.txt"), "".join(k + "\n" for k in amis_keys))
+    manifest["uplanet"].extend(amis_keys)
+
+    blacklisted = [_hex(rng) for _ in range(blacklist)]
+    _write(os.path.join(strfry, "blacklist.txt"), "".join(k + "\n" for k in blacklisted))
+    manifest["blacklisted"] = blacklisted
+
+    manifest["nobody"] = [_hex(rng) for _ in range(max(100, multipass))]
+
+    manifest["projects"] = []
+    for p in range(projects):
+        project_id = f"CF-BENCH{p:03d}"
+        bien_hex = _hex(rng)
+        _write(os.path.join(zen, "game", "crowdfunding", project_id, "bien.pubkeys"),
+               f"BIEN_HEX={bien_hex}\nBIEN_G1PUB=G1bench{p}\nBIEN_NPUB=npub1bench{p}\n")
+        manifest["projects"].append([project_id, bien_hex])
+
+    os.makedirs(os.path.join(zen, "tmp"), exist_ok=True)
+    _write(os.path.join(root, FIXTURE_MANIFEST), json.dumps(manifest))
+    return manifest
+
+
+# -------------------------------------------------------------------- corpus
+
+def _event(kind: int, pubkey: str, rng: random.Random, manifest: dict, seq: int) -> dict:
+    """Événement plausible pour `kind` (tags requis par les filtres présents)."""
+    other = rng.choice(manifest["player"] or manifest["nobody"])
+    tags: List[list] = []
+    content = ""
+    if kind == 0:
+        content = json.dumps({"name": f"bench{seq}", "about": "replay benchmark"})
+    elif kind == 1:
+        content = rng.choice(["gm", "Hello UPlanet", "x" * 80 + " long visitor message for the benchmark"])
+        tags = [["g", f"{rng.uniform(-80, 80):.2f},{rng.uniform(-170, 170):.2f}"]]
+    elif kind == 7:
+        content = rng.choice(["+", "👍", "-", "🔥"])
+        tags = [["e", _hex(rng)], ["p", other]]
+    elif kind == 30023:
+        content = "# Bench\n\nArticle body."
+        tags = [["d", f"bench-{seq}"], ["title", "Bench article"]]
+    elif kind == 9735:
+        tags = [["p", other], ["bolt11", "lnbc1bench"], ["description", "{}"]]
+    elif kind in (21, 22):
+        content = "bench video"
+        tags = [["url", f"https://ipfs.bench/{seq}.mp4"], ["title", "Bench video"]]
+    elif kind == 30904:
+        project_id, bien_hex = rng.choice(manifest["projects"]) if manifest["projects"] else ("CF-X", _hex(rng))
+        content = json.dumps({"bien_identity": {"hex": bien_hex, "g1pub": "G1bench"}})
+        tags = [["d", project_id], ["title", "Bench project"], ["t", "crowdfunding"], ["g", "0.00,0.00"]]
+    else:
+        content = "bench"
+    return {
+        "id": f"{seq:064x}", "pubkey": pubkey, "kind": kind,
+        "created_at": 1700000000 + seq, "content": content, "tags": tags, "sig": "0" * 128,
+    }
+
+
+def build_corpus(root: str, out: str, events: int = 1000, kinds: str = DEFAULT_KINDS,
+                 users: str = DEFAULT_USERS, seed: int = 1) -> int:
+    """Écrit `events` lignes du protocole plugin strfry dans `out`."""
+    with open(os.path.join(root, FIXTURE_MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    rng = random.Random(seed)
+    kind_mix = parse_mix(kinds)
+    user_mix = [(name, w) for name, w in parse_mix(users) if manifest.get(name)]
+    if not user_mix:
+        raise ValueError("no user class of the mix exists in the fixture")
+    with open(out, "w", encoding="utf-8") as f:
+        for seq in range(events):
+            kind = int(rng.choices([k for k, _ in kind_mix], [w for _, w in kind_mix])[0])
+            user_class = rng.choices([u for u, _ in user_mix], [w for _, w in user_mix])[0]
+            event = _event(kind, rng.choice(manifest[user_class]), rng, manifest, seq)
+            f.write(json.dumps({
+                "type": "new", "event": event, "receivedAt": event["created_at"],
+                "sourceType": "IP4", "sourceInfo": "127.0.0.1",
+            }) + "\n")
+    return events
+
+
+# ----------------------------------------------------------------------- run
+
+def _process_count() -> Optional[int]:
+    """Processus créés depuis le démarrage (ligne `processes` de /proc/stat)."""
+    try:
+        with open("/proc/stat") as f:
+            for line in f:
+                if line.startswith("processes "):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def policy_command(engine: str) -> Tuple[List[str], Dict[str, str]]:
+    if engine == "bash":
+        return [os.path.join(config.PLUGIN_DIR, "all_but_blacklist.sh")], {"NIP101_POLICY_ENGINE": "bash"}
+    return [sys.executable, os.path.join(config.PLUGIN_DIR, "policy_engine.py")], {}
+
+
+def replay(root: str, corpus: str, engine: str = "python") -> dict:
+    """Rejoue `corpus` à travers la politique (HOME=root), un événement à la fois."""
+    with open(corpus, encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    command, extra_env = policy_command(engine)
+    env = dict(os.environ, HOME=os.path.abspath(root), **extra_env)
+    stderr_path = os.path.join(root, ".zen", "tmp", "bench.stderr.log")
+
+    spawns_before = _process_count()
+    started = time.perf_counter()
+    latencies: List[float] = []
+    actions: Dict[str, int] = {}
+    with open(stderr_path, "a") as stderr:
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=stderr, env=env, text=True, bufsize=1)
+        assert proc.stdin is not None and proc.stdout is not None
+        replay_started = time.perf_counter()
+        for line in lines:
+            t0 = time.perf_counter()
+            proc.stdin.write(line + "\n")
+            proc.stdin.flush()
+            response = proc.stdout.readline()
+            latencies.append(time.perf_counter() - t0)
+            if not response:
+                raise RuntimeError(f"policy exited early (see {stderr_path})")
+            try:
+                action = json.loads(response).get("action", "?")
+            except ValueError:
+                action = "invalid"
+            actions[action] = actions.get(action, 0) + 1
+        replay_seconds = time.perf_counter() - replay_started
+        proc.stdin.close()
+        proc.wait()
+    total_seconds = time.perf_counter() - started
+    spawns_after = _process_count()
+
+    latencies.sort()
+    events = len(latencies)
+    spawns = None if spawns_before is None or spawns_after is None else spawns_after - spawns_before - 1
+    return {
+        "engine": engine,
+        "events": events,
+        "actions": actions,
+        "replay_seconds": round(replay_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "events_per_sec": round(events / replay_seconds, 1) if replay_seconds > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "spawns_per_event": round(spawns / events, 2) if spawns is not None and events else None,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Lignes de comparaison ; celles qui commencent par REGRESSION font échouer le run."""
+    lines = []
+    for metric, higher_is_better in BASELINE_METRICS.items():
+        new, old = report.get(metric), baseline.get(metric)
+        if new is None or old is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        status = "REGRESSION" if worse > tolerance else "ok"
+        lines.append(f"{status:<10} {metric:<17} {old:>12} → {new:<12} ({change:+.1%})")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python3 -m policy.bench",
+                                     description="Benchmark the strfry write policy on a synthetic ~/.zen")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("fixture", help="generate a synthetic ~/.zen tree under DIR")
+    p.add_argument("root")
+    p.add_argument("--multipass", type=int, default=100)
+    p.add_argument("--swarm-nodes", type=int, default=10)
+    p.add_argument("--swarm-users", type=int, default=20)
+    p.add_argument("--amis", type=int, default=500)
+    p.add_argument("--blacklist", type=int, default=1000)
+    p.add_argument("--projects", type=int, default=5)
+    p.add_argument("--seed", type=int, default=1)
+
+    p = sub.add_parser("corpus", help="generate a JSONL corpus of plugin input lines")
+    p.add_argument("root")
+    p.add_argument("out")
+    p.add_argument("--events", type=int, default=1000)
+    p.add_argument("--kinds", default=DEFAULT_KINDS)
+    p.add_argument("--users", default=DEFAULT_USERS)
+    p.add_argument("--seed", type=int, default=1)
+
+    p = sub.add_parser("run", help="replay a corpus through the policy and report")
+    p.add_argument("root")
+    p.add_argument("corpus")
+    p.add_argument("--engine", choices=("python", "bash"), default="python")
+    p.add_argument("--save-baseline")
+    p.add_argument("--baseline")
+    p.add_argument("--tolerance", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "fixture":
+        manifest = build_fixture(args.root, args.multipass, args.swarm_nodes, args.swarm_users,
+                                 args.amis, args.blacklist, args.projects, args.seed)
+        print(f"fixture in {args.root}: " + ", ".join(f"{k}={len(v)}" for k, v in manifest.items()))
+        return 0
+    if args.command == "corpus":
+        count = build_corpus(args.root, args.out, args.events, args.kinds, args.users, args.seed)
+        print(f"{count} events written to {args.out}")
+        return 0
+
+    report = replay(args.root, args.corpus, args.engine)
+    print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            lines = compare(report, json.load(f), args.tolerance)
+        print("\n".join(lines))
+        if any(line.startswith("REGRESSION") for line in lines):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
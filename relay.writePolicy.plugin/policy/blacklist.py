@@ -0,0 +1,314 @@
+"""
+Blacklist en mémoire (appartenance O(1)) adossée à blacklist.txt et à un journal.
+
+blacklist.txt reste le format d'échange (import / export) et le store lit
+seulement la fin du fichier quand il grossit. Un retrait (whitelist) est un
+seul ajout au journal : une ligne `-<pubkey> <taille> <inode>` dans
+blacklist.txt.journal. blacklist.txt peut donc encore contenir des clés
+retirées : les scripts interrogent le store (`python3 -m policy.blacklist
+contains`, all_but_blacklist.sh) plutôt que de lire le fichier par grep.
+
+La taille enregistrée ordonne le retrait par rapport aux ajouts faits par les
+autres écrivains, ce qui permet de rejouer fichier + journal à l'identique.
+Si blacklist.txt a été remplacé par un autre outil (inode différent), le
+retrait s'applique après tout le fichier.
+
+La compaction (maybe_compact, COMPACT_INTERVAL après le premier retrait en
+attente) applique le journal dans blacklist.txt (remplacement atomique) puis
+vide le journal, sous blacklist.txt.lock. Tout ajout doit tenir ce verrou
+(`python3 -m policy.blacklist add`, ou
+`flock blacklist.txt.lock sh -c 'echo "$pubkey" >> blacklist.txt'`) : un
+`echo >>` sans verrou pendant la compaction peut viser l'ancien fichier.
+
+Usage en ligne de commande :
+    python3 -m policy.blacklist contains|add|remove PUBKEY
+    python3 -m policy.blacklist compact
+    python3 -m policy.blacklist export [FICHIER]
+    python3 -m policy.blacklist import FICHIER
+"""
+
+import fcntl
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import config
+
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+# Compacter au plus tard après ce délai (s) s'il reste des retraits en attente
+COMPACT_INTERVAL = float(os.environ.get("NIP101_BLACKLIST_COMPACT_INTERVAL", "60"))
+
+
+class BlacklistStore:
+    """Ensemble des pubkeys blacklistées, rechargé incrémentalement."""
+
+    def __init__(self, path: str = config.BLACKLIST_FILE, interval: float = config.REFRESH_INTERVAL):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.lock_path = path + LOCK_SUFFIX
+        self.interval = interval
+        self._keys: Dict[str, None] = {}
+        self._base_id: Optional[Tuple[int, int]] = None
+        self._base_offset = 0
+        self._journal_id: Optional[Tuple[int, int]] = None
+        self._journal_offset = 0
+        self._checked_at = 0.0
+        self._pending_since: Optional[float] = None
+        self.journal_ops = 0
+        self.compactions = 0
+        self.reloads = 0
+
+    # ------------------------------------------------------------------ helpers
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_id(path: str) -> Tuple[Optional[Tuple[int, int]], int]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None, 0
+        return (st.st_dev, st.st_ino), st.st_size
+
+    @staticmethod
+    def _read_lines(path: str, offset: int, final: bool = False) -> Tuple[List[Tuple[str, int]], int]:
+        """Lignes complètes à partir de `offset` avec leur offset de fin.
+        `final` : la fin du fichier termine aussi la dernière ligne (fichier
+        édité à la main), sans avancer l'offset retourné au-delà."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return [], offset
+        lines = []
+        end = offset
+        for raw in data.splitlines(keepends=True):
+            if not raw.endswith(b"\n"):
+                # ligne en cours d'écriture : relue au prochain passage
+                if final:
+                    lines.append((raw.decode("utf-8", "replace").strip(), end + len(raw)))
+                break
+            end += len(raw)
+            lines.append((raw.decode("utf-8", "replace").strip(), end))
+        return lines, end
+
+    @staticmethod
+    def _parse_op(line: str, base_inode: int) -> Optional[Tuple[str, str, float]]:
+        """(op, clé, offset) ; offset infini si l'op vise une autre version du fichier."""
+        op, fields = line[:1], line[1:].split()
+        if op not in ("+", "-") or not fields:
+            return None
+        try:
+            offset = float(fields[1]) if len(fields) > 1 else 0.0
+            if len(fields) > 2 and int(fields[2]) != base_inode:
+                offset = float("inf")
+        except ValueError:
+            return None
+        return op, fields[0], offset
+
+    def _apply(self, op: str, key: str) -> None:
+        if op == "+":
+            self._keys[key] = None
+        else:
+            self._keys.pop(key, None)
+
+    # ------------------------------------------------------------------ loading
+
+    def reload(self) -> None:
+        """Relecture complète : blacklist.txt fusionné avec le journal selon les offsets."""
+        base_id, _ = self._file_id(self.path)
+        journal_id, _ = self._file_id(self.journal_path)
+        base, base_end = self._read_lines(self.path, 0, final=True)
+        journal, journal_end = self._read_lines(self.journal_path, 0)
+        keys: Dict[str, None] = {}
+        self._keys = keys
+        i = 0
+        ops = 0
+        base_inode = base_id[1] if base_id else 0
+        for line, _ in journal:
+            parsed = self._parse_op(line, base_inode)
+            if parsed is None:
+                continue
+            op, key, offset = parsed
+            while i < len(base) and base[i][1] <= offset:
+                if base[i][0]:
+                    keys[base[i][0]] = None
+                i += 1
+            self._apply(op, key)
+            ops += 1
+        for line, _ in base[i:]:
+            if line:
+                keys[line] = None
+        self._base_id, self._base_offset = base_id, base_end
+        self._journal_id, self._journal_offset = journal_id, journal_end
+        self.journal_ops = ops
+        # Premier retrait en attente : un rechargement ne repousse pas la compaction
+        if not ops:
+            self._pending_since = None
+        elif self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self.reloads += 1
+
+    def refresh(self, force: bool = False) -> None:
+        """Suit les ajouts en fin de blacklist.txt ; relecture complète si un autre
+        processus a écrit dans le journal ou remplacé les fichiers."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.interval:
+            return
+        self._checked_at = now
+        base_id, base_size = self._file_id(self.path)
+        journal_id, journal_size = self._file_id(self.journal_path)
+        if (base_id != self._base_id or base_size < self._base_offset
+                or journal_id != self._journal_id or journal_size != self._journal_offset):
+            self.reload()
+            return
+        if base_size > self._base_offset:
+            lines, self._base_offset = self._read_lines(self.path, self._base_offset)
+            for line, _ in lines:
+                if line:
+                    self._keys[line] = None
+
+    # ------------------------------------------------------------------ queries
+
+    def __contains__(self, pubkey: str) -> bool:
+        self.refresh()
+        return pubkey in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def keys(self) -> List[str]:
+        self.refresh()
+        return list(self._keys)
+
+    # ------------------------------------------------------------------ writers
+
+    def add(self, pubkey: str) -> bool:
+        """Ajoute `pubkey` en fin de blacklist.txt (comme `echo >> blacklist.txt`)."""
+        with self._locked():
+            self.refresh(force=True)
+            if pubkey in self._keys:
+                return False
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(pubkey + "\n")
+            self.refresh(force=True)
+        return True
+
+    def remove(self, pubkey: str) -> bool:
+        """Retire `pubkey` : une ligne ajoutée au journal."""
+        with self._locked():
+            self.refresh(force=True)
+            if pubkey not in self._keys:
+                return False
+            # Taille sous verrou : le retrait suit tout ce que contient le fichier,
+            # y compris une dernière ligne sans fin de ligne
+            base_id, size = self._file_id(self.path)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(f"-{pubkey} {size} {base_id[1] if base_id else 0}\n")
+            self.refresh(force=True)
+        return True
+
+    def compact(self) -> bool:
+        """Applique le journal dans blacklist.txt et le vide. False si rien à faire."""
+        with self._locked():
+            return self._compact()
+
+    def _compact(self) -> bool:
+        self.reload()
+        if not self.journal_ops:
+            return False
+        directory = os.path.dirname(self.path)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".blacklist.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(key + "\n" for key in self._keys)
+        consumed = self._base_offset
+        with open(self.path, "rb") as old:
+            os.replace(tmp, self.path)
+            # Au mieux pour un écrivain hors verrou : recopier ce qu'il a déjà
+            # ajouté à l'ancien fichier (les ajouts du store tiennent le verrou)
+            old.seek(consumed)
+            late = old.read()
+        if late:
+            with open(self.path, "ab") as f:
+                f.write(late)
+        open(self.journal_path, "w").close()
+        self.reload()
+        self.compactions += 1
+        return True
+
+    def maybe_compact(self) -> bool:
+        """Compaction périodique : seulement si des retraits attendent depuis COMPACT_INTERVAL."""
+        if self._pending_since is None or time.monotonic() - self._pending_since < COMPACT_INTERVAL:
+            return False
+        return self.compact()
+
+    def export(self, path: str) -> None:
+        self.refresh(force=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(key + "\n" for key in self._keys)
+        os.replace(tmp, path)
+
+    def import_file(self, path: str) -> int:
+        """Ajoute les clés d'un fichier au format blacklist.txt. Retourne le nombre ajouté."""
+        with open(path, encoding="utf-8", errors="replace") as f:
+            wanted = [line.strip() for line in f if line.strip()]
+        with self._locked():
+            self.refresh(force=True)
+            new = [key for key in dict.fromkeys(wanted) if key not in self._keys]
+            if new:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(key + "\n" for key in new)
+            self.refresh(force=True)
+        return len(new)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keys": len(self._keys),
+            "journal_ops": self.journal_ops,
+            "compactions": self.compactions,
+            "reloads": self.reloads,
+        }
+
+
+def main(argv: List[str]) -> int:
+    store = BlacklistStore()
+    command = argv[0] if argv else ""
+    arg = argv[1] if len(argv) > 1 else ""
+    if command == "contains" and arg:
+        return 0 if arg in store else 1
+    if command == "add" and arg:
+        return 0 if store.add(arg) else 1
+    if command == "remove" and arg:
+        return 0 if store.remove(arg) else 1
+    if command == "compact":
+        store.compact()
+        return 0
+    if command == "export":
+        if arg:
+            store.export(arg)
+        else:
+            sys.stdout.writelines(key + "\n" for key in store.keys())
+        return 0
+    if command == "import" and arg:
+        print(store.import_file(arg))
+        return 0
+    print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
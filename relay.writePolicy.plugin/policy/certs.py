@@ -0,0 +1,402 @@
+"""
+Vérification des certificats d'incarnation ATOM4LOVE (Kind 30078 d=atom4love).
+
+Équivalent de check_atom4love_cert() dans filter/common.sh, sans `strfry scan`
+par vérification : filter/30078.sh ajoute chaque certificat accepté à un index
+persistant (~/.zen/strfry/atom4love_certs.idx), une ligne TSV par certificat :
+
+    pubkey  created_at  personal_phase  omega_bio  a5l_amplitude  a4l_proof
+
+Les filtres shell lisent ce fichier par awk : un certificat dont
+a5l_amplitude n'est pas un nombre de [0,1] (ou dont les plages φ/ω sont
+hors limites) n'est pas indexé, et row() retire tabulations et fins de ligne
+de chaque champ.
+
+Le dernier certificat de chaque pubkey est gardé en mémoire. Les preuves
+attendues (sha256 "<pubkey>:<app_id>") sont calculées une fois par pubkey et
+recalculées seulement quand AUTHORIZED_APPS change dans
+cooperative_config.cache.json : une vérification devient une recherche dans
+un ensemble.
+
+Si l'index n'existe pas encore, il est construit par une seule requête de
+tous les certificats au relais local (policy.relayquery). `strfry import`
+ne passe pas par 30078.sh : backfill_constellation.sh ajoute les certificats
+de chaque lot importé (`index FICHIER`).
+
+Usage en ligne de commande :
+    python3 -m policy.certs check PUBKEY
+    python3 -m policy.certs index EVENTS.ndjson
+    python3 -m policy.certs rebuild
+    python3 -m policy.certs compact
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from . import config, relayquery
+from .config import TMP_DIR
+
+COOPERATIVE_CACHE = os.path.join(TMP_DIR, "cooperative_config.cache.json")
+DEFAULT_APP_ID = "ATOM4LOVE_ALPHA"
+CERT_QUERY = {"kinds": [30078], "#d": ["atom4love"]}
+
+
+def load_authorized_app_ids(path: str = COOPERATIVE_CACHE) -> List[str]:
+    """Liste des proof salts autorisés (AUTHORIZED_APPS du cache coopératif)."""
+    try:
+        with open(path) as f:
+            ids = json.load(f).get("AUTHORIZED_APPS") or ""
+    except (OSError, ValueError, AttributeError):
+        ids = ""
+    apps = [app.strip() for app in str(ids).split(",") if app.strip()]
+    return apps or [DEFAULT_APP_ID]
+
+
+def app_proof(pubkey: str, app_id: str) -> str:
+    """sha256("<pubkey>:<app_id>") — valeur attendue du tag a4l_proof."""
+    return hashlib.sha256(f"{pubkey}:{app_id}".encode()).hexdigest()
+
+
+def first_tag_value(event: dict, name: str) -> Optional[str]:
+    for tag in event.get("tags") or []:
+        if isinstance(tag, list) and len(tag) > 1 and tag[0] == name:
+            return tag[1]
+    return None
+
+
+def in_range(phase: float, omega: float) -> bool:
+    """Plages biométriques φ ∈ [0,7), ω ∈ (0.1,50)."""
+    return 0 <= phase < 7 and 0.1 < omega < 50
+
+
+def parse_a5l(value) -> Optional[str]:
+    """a5l_amplitude (optionnel) : "" si absent, None s'il n'est pas un nombre de [0,1]."""
+    if value is None or value == "":
+        return ""
+    if isinstance(value, bool):
+        return None
+    try:
+        amplitude = float(value)
+    except (TypeError, ValueError):
+        return None
+    return repr(amplitude) if 0 <= amplitude <= 1 else None
+
+
+def _field(value: str) -> str:
+    """Champ TSV de l'index : sans tabulation ni fin de ligne."""
+    return value.translate({ord("\t"): None, ord("\n"): None, ord("\r"): None})
+
+
+def is_valid_cert(event: dict, app_ids: Optional[List[str]] = None) -> bool:
+    """Preuve d'app valide et plages biométriques."""
+    pubkey = event.get("pubkey", "")
+    proof = first_tag_value(event, "a4l_proof")
+    if not proof or proof not in {app_proof(pubkey, a) for a in (app_ids or load_authorized_app_ids())}:
+        return False
+    cert = Cert.from_event(event)
+    return cert is not None and in_range(cert.phase, cert.omega)
+
+
+def scan_events(query: dict) -> List[dict]:
+    """Événements de la base strfry locale correspondant à `query` (policy.relayquery)."""
+    return relayquery.query(query)
+
+
+def scan_latest_cert(pubkey: str) -> Optional[dict]:
+    """Dernier Kind 30078 d=atom4love publié par `pubkey` dans la base strfry locale."""
+    return relayquery.latest(pubkey, 30078, "atom4love")
+
+
+class Cert(NamedTuple):
+    created_at: int
+    phase: float
+    omega: float
+    a5l: str
+    proof: str
+
+    @classmethod
+    def from_event(cls, event: dict) -> Optional["Cert"]:
+        try:
+            content = json.loads(event.get("content") or "{}")
+            phase = float(content.get("personal_phase", -1))
+            omega = float(content.get("omega_bio", -1))
+            a5l = parse_a5l(content.get("a5l_amplitude"))
+            if a5l is None:
+                return None  # rejeté par 30078.sh
+            return cls(int(event.get("created_at") or 0), phase, omega, a5l,
+                       str(first_tag_value(event, "a4l_proof") or ""))
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    @classmethod
+    def from_row(cls, fields: List[str]) -> Optional["Cert"]:
+        try:
+            return cls(int(fields[1]), float(fields[2]), float(fields[3]), fields[4], fields[5])
+        except (IndexError, ValueError):
+            return None
+
+    def indexable(self) -> bool:
+        """Certificat que 30078.sh aurait accepté (plages et a5l)."""
+        return in_range(self.phase, self.omega) and parse_a5l(self.a5l) is not None
+
+    def row(self, pubkey: str) -> str:
+        return "\t".join(_field(value) for value in (
+            pubkey, str(self.created_at), repr(self.phase), repr(self.omega), self.a5l, self.proof)) + "\n"
+
+
+class CertIndex:
+    """Dernier certificat par pubkey + ensemble des pubkeys dont il est valide."""
+
+    def __init__(self, path: str = config.ATOM4LOVE_CERT_INDEX_FILE,
+                 apps_path: str = COOPERATIVE_CACHE, interval: float = config.REFRESH_INTERVAL):
+        self.path = path
+        self.apps_path = apps_path
+        self.interval = interval
+        self._certs: Dict[str, Cert] = {}
+        self._valid: Set[str] = set()
+        self._proofs: Dict[str, Set[str]] = {}
+        self._app_ids: List[str] = []
+        self._apps_signature: Optional[Tuple[int, int]] = None
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        self._lines = 0
+        self._checked_at = 0.0
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.proof_computations = 0
+        self.reloads = 0
+        self.rebuilds = 0
+
+    # ------------------------------------------------------------------ proofs
+
+    def _expected(self, pubkey: str) -> Set[str]:
+        proofs = self._proofs.get(pubkey)
+        if proofs is None:
+            proofs = {app_proof(pubkey, app_id) for app_id in self._app_ids}
+            self.proof_computations += len(self._app_ids)
+            self._proofs[pubkey] = proofs
+        return proofs
+
+    def _check(self, pubkey: str) -> None:
+        cert = self._certs[pubkey]
+        if cert.proof in self._expected(pubkey) and in_range(cert.phase, cert.omega):
+            self._valid.add(pubkey)
+        else:
+            self._valid.discard(pubkey)
+
+    def _refresh_apps(self) -> bool:
+        try:
+            st = os.stat(self.apps_path)
+            signature: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        if signature == self._apps_signature and self._app_ids:
+            return False
+        self._apps_signature = signature
+        app_ids = load_authorized_app_ids(self.apps_path)
+        if app_ids == self._app_ids:
+            return False
+        self._app_ids = app_ids
+        self._proofs.clear()
+        for pubkey in self._certs:
+            self._check(pubkey)
+        return True
+
+    # ----------------------------------------------------------------- loading
+
+    def _add(self, pubkey: str, cert: Cert) -> bool:
+        known = self._certs.get(pubkey)
+        if known is not None and known.created_at > cert.created_at:
+            return False
+        self._certs[pubkey] = cert
+        self._check(pubkey)
+        return True
+
+    def _read(self, offset: int) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return False
+        changed = False
+        for raw in data.splitlines(keepends=True):
+            if not raw.endswith(b"\n"):
+                break  # ligne en cours d'écriture : relue au prochain passage
+            self._offset += len(raw)
+            self._lines += 1
+            fields = raw.decode("utf-8", "replace").rstrip("\n").split("\t")
+            cert = Cert.from_row(fields)
+            if cert is not None and fields[0]:
+                changed = self._add(fields[0], cert) or changed
+        return changed
+
+    def reload(self) -> None:
+        self._certs.clear()
+        self._valid.clear()
+        self._offset = self._lines = 0
+        self._read(0)
+        self.reloads += 1
+
+    def refresh(self, force: bool = False) -> None:
+        """Suit les ajouts de 30078.sh ; relecture complète si le fichier a été remplacé."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.interval:
+            return
+        self._checked_at = now
+        changed = self._refresh_apps()
+        if not self.rebuilds and self._file_id is None and not os.path.exists(self.path):
+            self.rebuild()  # premier démarrage : certificats déjà en base
+        try:
+            st: Optional[os.stat_result] = os.stat(self.path)
+        except OSError:
+            st = None
+        if st is not None:
+            file_id = (st.st_dev, st.st_ino)
+            if file_id != self._file_id or st.st_size < self._offset:
+                self._file_id = file_id
+                self.reload()
+                changed = True
+            elif st.st_size > self._offset:
+                changed = self._read(self._offset) or changed
+        if changed:
+            self.version += 1
+
+    def mark_stale(self) -> None:
+        self._checked_at = 0.0
+
+    # ----------------------------------------------------------------- queries
+
+    def is_certified(self, pubkey: str) -> bool:
+        """True si le dernier certificat de `pubkey` est valide (preuve d'app + plages)."""
+        self.refresh()
+        if pubkey in self._valid:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, pubkey: str) -> Optional[Cert]:
+        self.refresh()
+        return self._certs.get(pubkey)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "certs": len(self._certs),
+            "valid": len(self._valid),
+            "apps": len(self._app_ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "proof_computations": self.proof_computations,
+            "reloads": self.reloads,
+            "rebuilds": self.rebuilds,
+        }
+
+    # ------------------------------------------------------------------ écriture
+
+    def _write(self, certs: Dict[str, Cert]) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".atom4love_certs.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for pubkey in sorted(certs):
+                f.write(certs[pubkey].row(pubkey))
+        os.replace(tmp, self.path)
+
+    def index_file(self, path: str) -> int:
+        """Ajoute à l'index les certificats d'un fichier NDJSON importé par `strfry import`.
+
+        Sans index, rien n'est écrit : la reconstruction du premier démarrage
+        lira ces certificats dans la base."""
+        if not os.path.exists(self.path):
+            return 0
+        rows = []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if "atom4love" not in line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if (not isinstance(event, dict) or event.get("kind") != 30078
+                        or first_tag_value(event, "d") != "atom4love"):
+                    continue
+                pubkey = str(event.get("pubkey") or "")
+                cert = Cert.from_event(event)
+                if pubkey and cert is not None and cert.indexable():
+                    rows.append(cert.row(pubkey))
+        if rows:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(rows))
+        return len(rows)
+
+    def rebuild(self) -> int:
+        """Reconstruit l'index depuis la base strfry (un seul scan). Retourne le nombre de certificats."""
+        certs: Dict[str, Cert] = {}
+        for event in scan_events(CERT_QUERY):
+            pubkey = str(event.get("pubkey") or "")
+            cert = Cert.from_event(event)
+            if not pubkey or cert is None or not cert.indexable():
+                continue
+            if pubkey not in certs or cert.created_at > certs[pubkey].created_at:
+                certs[pubkey] = cert
+        self.rebuilds += 1
+        try:
+            self._write(certs)
+        except OSError:
+            return 0
+        self._file_id = None
+        return len(certs)
+
+    def compact(self) -> bool:
+        """Réécrit l'index avec une ligne par pubkey si les doublons dominent."""
+        self.refresh(force=True)
+        if self._lines <= 2 * len(self._certs):
+            return False
+        self._write(self._certs)
+        self.refresh(force=True)
+        return True
+
+
+_default_index: Optional[CertIndex] = None
+
+
+def default_index() -> CertIndex:
+    """Index partagé par le moteur et check_authorization()."""
+    global _default_index
+    if _default_index is None:
+        _default_index = CertIndex()
+    return _default_index
+
+
+def check_atom4love_cert(pubkey: str) -> bool:
+    """True si `pubkey` a publié un certificat ATOM4LOVE valide."""
+    return bool(pubkey) and default_index().is_certified(pubkey)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    index = default_index()
+    if args[:1] == ["check"] and len(args) == 2:
+        return 0 if check_atom4love_cert(args[1]) else 1
+    if args[:1] == ["index"] and len(args) == 2:
+        print(f"{index.index_file(args[1])} certificates indexed from {args[1]}")
+        return 0
+    if args == ["rebuild"]:
+        print(f"{index.rebuild()} certificates indexed in {index.path}")
+        return 0
+    if args == ["compact"]:
+        print("compacted" if index.compact() else "nothing to compact")
+        return 0
+    print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
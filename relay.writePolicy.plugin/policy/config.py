@@ -0,0 +1,77 @@
+"""
+Chemins et constantes partagés par le moteur de politique d'écriture.
+
+Les valeurs reprennent celles de all_but_blacklist.sh et filter/common.sh
+pour que le moteur Python et les filtres shell lisent les mêmes fichiers.
+"""
+
+import json
+import os
+import re
+
+HOME = os.path.expanduser("~")
+ZEN_DIR = os.path.join(HOME, ".zen")
+TMP_DIR = os.path.join(ZEN_DIR, "tmp")
+STRFRY_DIR = os.path.join(ZEN_DIR, "strfry")
+SWARM_DIR = os.path.join(TMP_DIR, "swarm")
+
+# MULTIPASS : ~/.zen/game/nostr/<email>/HEX
+KEY_DIR = os.path.join(ZEN_DIR, "game", "nostr")
+
+BLACKLIST_FILE = os.path.join(STRFRY_DIR, "blacklist.txt")
+AMIS_OF_AMIS_FILE = os.path.join(STRFRY_DIR, "amisOfAmis.txt")
+ATOM4LOVE_CERTIFIED_FILE = os.path.join(STRFRY_DIR, "atom4love_certified.txt")
+ATOM4LOVE_CERT_INDEX_FILE = os.path.join(STRFRY_DIR, "atom4love_certs.idx")
+LOG_FILE = os.path.join(TMP_DIR, "strfry.log")
+
+# État exporté par le moteur (index, statistiques…)
+POLICY_DIR = os.path.join(TMP_DIR, "policy")
+IDENTITY_INDEX_FILE = os.path.join(POLICY_DIR, "identity.tsv")
+# Touché par les filtres qui modifient une source d'identité (signal_change)
+IDENTITY_SIGNAL_FILE = os.path.join(POLICY_DIR, "identity.changed")
+STATS_FILE = os.path.join(POLICY_DIR, "stats.json")
+METRICS_FILE = os.path.join(POLICY_DIR, "metrics.prom")
+JOBS_DIR = os.path.join(POLICY_DIR, "jobs")
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILTER_DIR = os.path.join(PLUGIN_DIR, "filter")
+
+EMAIL_REGEX = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$")
+
+# Intervalle minimal (secondes) entre deux vérifications des fichiers sources
+REFRESH_INTERVAL = float(os.environ.get("NIP101_POLICY_REFRESH", "1"))
+# Intervalle (secondes) entre deux écritures de STATS_FILE
+STATS_INTERVAL = float(os.environ.get("NIP101_POLICY_STATS_INTERVAL", "60"))
+
+# Cache des verdicts par pubkey : durée de vie (s) des verdicts autorisés,
+# des verdicts "nobody" (cache négatif) et nombre maximal d'entrées
+VERDICT_TTL = float(os.environ.get("NIP101_VERDICT_TTL", "60"))
+VERDICT_NEGATIVE_TTL = float(os.environ.get("NIP101_VERDICT_NEGATIVE_TTL", "10"))
+VERDICT_CACHE_SIZE = int(os.environ.get("NIP101_VERDICT_CACHE_SIZE", "10000"))
+
+# File des effets de bord : threads, travaux en attente au plus (au-delà, le
+# travail est abandonné et journalisé), tentatives, délai initial entre tentatives (s), durée maximale d'un
+# filtre shell en arrière-plan (s), attente à l'arrêt (s)
+JOB_WORKERS = int(os.environ.get("NIP101_JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.environ.get("NIP101_JOB_MAX_PENDING", "1000"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("NIP101_JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.environ.get("NIP101_JOB_RETRY_DELAY", "5"))
+JOB_TIMEOUT = float(os.environ.get("NIP101_JOB_TIMEOUT", "600"))
+JOB_DRAIN_TIMEOUT = float(os.environ.get("NIP101_JOB_DRAIN_TIMEOUT", "10"))
+
+# Journalisation tamponnée (policy/logs.py) : niveau par défaut, niveaux par
+# sous-système ("strfry=WARNING,nostr_likes=DEBUG"), rotation et délai d'écriture
+LOG_LEVEL = os.environ.get("NIP101_LOG_LEVEL", "INFO")
+LOG_LEVELS = os.environ.get("NIP101_LOG_LEVELS", "")
+LOG_MAX_BYTES = int(os.environ.get("NIP101_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("NIP101_LOG_BACKUPS", "3"))
+LOG_FLUSH_INTERVAL = float(os.environ.get("NIP101_LOG_FLUSH_INTERVAL", "0.5"))
+
+
+def load_ipfs_node_id() -> str:
+    """Lit Identity.PeerID depuis ~/.ipfs/config (vide si absent)."""
+    try:
+        with open(os.path.join(HOME, ".ipfs", "config")) as f:
+            return json.load(f).get("Identity", {}).get("PeerID", "") or ""
+    except (OSError, ValueError, AttributeError):
+        return ""
@@ -0,0 +1,318 @@
+"""
+Lecture des projets de crowdfunding (~/.zen/game/crowdfunding/<project_id>/).
+
+Équivalents de is_crowdfunding_bien, get_bien_wallet_info,
+search_bien_g1pub et sync_crowdfunding_biens_to_amis de filter/common.sh.
+
+Les clés des Biens sont lues dans un index inverse
+(~/.zen/game/crowdfunding/biens.idx), une ligne TSV par projet :
+
+    BIEN_HEX  project_id  BIEN_G1PUB  BIEN_NPUB
+
+filter/30904.sh le met à jour quand il enregistre ou modifie une campagne
+(`python3 -m policy.crowdfunding update PROJECT`). Les projets créés par
+d'autres outils sont rattrapés toutes les 5 minutes (seuls les répertoires
+absents de l'index sont examinés). Une recherche par clé hex ne parcourt donc
+plus tous les projets, et la synchronisation vers amisOfAmis.txt lit ce
+fichier une fois et n'ajoute que les clés manquantes.
+
+Usage en ligne de commande :
+    python3 -m policy.crowdfunding update PROJECT
+    python3 -m policy.crowdfunding rebuild
+    python3 -m policy.crowdfunding lookup HEX
+    python3 -m policy.crowdfunding sync
+"""
+
+import fcntl
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import config
+from .auth import amis_of_amis_locked
+from .identity import signal_change
+
+CROWDFUNDING_DIR = os.path.join(config.ZEN_DIR, "game", "crowdfunding")
+BIENS_INDEX_FILE = os.path.join(CROWDFUNDING_DIR, "biens.idx")
+# Horodatage de la dernière sync vers amisOfAmis, partagé avec filter/7.sh
+BIENS_SYNC_CACHE = os.path.join(config.TMP_DIR, "cf_biens_amis.cache")
+BIENS_SYNC_INTERVAL = 300
+
+
+def read_bien_pubkeys(project_id: str, base_dir: str = CROWDFUNDING_DIR) -> Dict[str, str]:
+    """Variables BIEN_HEX / BIEN_G1PUB / BIEN_NPUB de bien.pubkeys (vide si absent)."""
+    values: Dict[str, str] = {}
+    try:
+        with open(os.path.join(base_dir, project_id, "bien.pubkeys"), encoding="utf-8") as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep and not key.startswith("#"):
+                    values[key] = value.strip().strip("\"'")
+    except OSError:
+        pass
+    return values
+
+
+def projects(base_dir: str = CROWDFUNDING_DIR) -> List[str]:
+    try:
+        names = sorted(os.listdir(base_dir))
+    except OSError:
+        return []
+    return [n for n in names if os.path.isdir(os.path.join(base_dir, n))]
+
+
+class Bien(NamedTuple):
+    hex: str
+    project_id: str
+    g1pub: str
+    npub: str
+
+    def row(self) -> str:
+        return "\t".join(self) + "\n"
+
+
+class BienIndex:
+    """Index BIEN_HEX → projet / G1PUB / NPUB (et projet → Bien), rechargé au changement du fichier."""
+
+    def __init__(self, path: str = BIENS_INDEX_FILE, base_dir: str = CROWDFUNDING_DIR,
+                 interval: float = config.REFRESH_INTERVAL, reconcile_interval: float = BIENS_SYNC_INTERVAL):
+        self.path = path
+        self.base_dir = base_dir
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        self._reconciled_at: Optional[float] = None
+        self.lock_path = path + ".lock"
+        self._by_hex: Dict[str, Bien] = {}
+        self._by_project: Dict[str, Bien] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self.version = 0
+        self.reloads = 0
+        self.rebuilds = 0
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ----------------------------------------------------------------- lecture
+
+    def _load(self) -> Dict[str, Bien]:
+        biens: Dict[str, Bien] = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) == 4 and fields[1]:
+                        biens[fields[1]] = Bien(*fields)
+        except OSError:
+            pass
+        return biens
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.interval:
+            return
+        self._checked_at = now
+        if self._reconciled_at is None or now - self._reconciled_at >= self.reconcile_interval:
+            self._reconciled_at = now
+            if not os.path.exists(self.path):
+                if os.path.isdir(self.base_dir):
+                    self.rebuild()
+            else:
+                self.reconcile()
+        try:
+            st = os.stat(self.path)
+            signature: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_ino)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self._by_project = self._load()
+        self._by_hex = {b.hex: b for b in self._by_project.values() if b.hex}
+        self.version += 1
+        self.reloads += 1
+
+    def mark_stale(self) -> None:
+        self._checked_at = 0.0
+
+    def by_hex(self, hex_pubkey: str) -> Optional[Bien]:
+        self.refresh()
+        return self._by_hex.get(hex_pubkey) if hex_pubkey else None
+
+    def by_project(self, project_id: str) -> Optional[Bien]:
+        self.refresh()
+        return self._by_project.get(project_id) if project_id else None
+
+    def biens(self) -> List[Bien]:
+        self.refresh()
+        return list(self._by_project.values())
+
+    # ---------------------------------------------------------------- écriture
+
+    def _read_project(self, project_id: str) -> Optional[Bien]:
+        if not os.path.isfile(os.path.join(self.base_dir, project_id, "bien.pubkeys")):
+            return None
+        values = read_bien_pubkeys(project_id, self.base_dir)
+        return Bien(values.get("BIEN_HEX", ""), project_id, values.get("BIEN_G1PUB", ""),
+                    values.get("BIEN_NPUB", ""))
+
+    def _write(self, biens: Dict[str, Bien]) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".biens.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for project_id in sorted(biens):
+                f.write(biens[project_id].row())
+        os.replace(tmp, self.path)
+
+    def update(self, project_id: str) -> Optional[Bien]:
+        """Réindexe un projet depuis son bien.pubkeys (retiré s'il n'en a plus)."""
+        with self._locked():
+            biens = self._load()
+            bien = self._read_project(project_id)
+            if bien is None:
+                biens.pop(project_id, None)
+            else:
+                biens[project_id] = bien
+            self._write(biens)
+        self.refresh(force=True)
+        return bien
+
+    def reconcile(self) -> int:
+        """Ajoute les projets non indexés qui ont un bien.pubkeys et retire les
+        projets supprimés, sans relire les autres. Retourne le nombre de changements."""
+        names = projects(self.base_dir)
+        with self._locked():
+            biens = self._load()
+            known = set(names)
+            changes = [p for p in biens if p not in known]
+            for project_id in changes:
+                del biens[project_id]
+            for project_id in names:
+                if project_id not in biens:
+                    bien = self._read_project(project_id)
+                    if bien is not None:
+                        biens[project_id] = bien
+                        changes.append(project_id)
+            if changes:
+                self._write(biens)
+        return len(changes)
+
+    def rebuild(self) -> int:
+        """Reconstruit l'index depuis tous les bien.pubkeys. Retourne le nombre de Biens."""
+        with self._locked():
+            biens = {}
+            for project_id in projects(self.base_dir):
+                bien = self._read_project(project_id)
+                if bien is not None:
+                    biens[project_id] = bien
+            self._write(biens)
+        self.rebuilds += 1
+        return len(biens)
+
+    def stats(self) -> Dict[str, int]:
+        return {"biens": len(self._by_project), "reloads": self.reloads, "rebuilds": self.rebuilds}
+
+
+_default_index: Optional[BienIndex] = None
+
+
+def default_index() -> BienIndex:
+    global _default_index
+    if _default_index is None:
+        _default_index = BienIndex()
+    return _default_index
+
+
+def is_crowdfunding_bien(hex_pubkey: str) -> str:
+    """project_id dont le Bien a cette clé hex, chaîne vide sinon."""
+    bien = default_index().by_hex(hex_pubkey)
+    return bien.project_id if bien else ""
+
+
+def get_bien_wallet_info(project_id: str) -> Optional[Dict[str, str]]:
+    """{"hex", "g1pub", "npub"} du Bien, None si le projet n'a pas de bien.pubkeys."""
+    bien = default_index().by_project(project_id)
+    if bien is None:
+        return None
+    return {"hex": bien.hex, "g1pub": bien.g1pub, "npub": bien.npub}
+
+
+def search_bien_g1pub(hex_pubkey: str) -> str:
+    """G1PUB du Bien ayant cette clé hex, chaîne vide sinon."""
+    bien = default_index().by_hex(hex_pubkey)
+    return bien.g1pub if bien else ""
+
+
+def sync_biens_to_amis(log: Optional[Callable[[str], None]] = None, force: bool = False) -> int:
+    """Ajoute les clés des Biens absentes d'amisOfAmis.txt (au plus toutes les
+    5 min sauf `force`) : le fichier est lu une fois, quel que soit le nombre de Biens."""
+    try:
+        age: Optional[float] = time.time() - os.stat(BIENS_SYNC_CACHE).st_mtime
+    except OSError:
+        age = None
+    if not force and age is not None and age <= BIENS_SYNC_INTERVAL:
+        return 0
+    index = default_index()
+    index.refresh(force=True)
+    path = config.AMIS_OF_AMIS_FILE
+    lines = []
+    added = []
+    with amis_of_amis_locked(path):
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                present = {line.rstrip("\n") for line in f}
+        except OSError:
+            present = set()
+        for bien in index.biens():
+            if bien.hex and bien.hex not in present:
+                present.add(bien.hex)
+                lines.append(f"# Crowdfunding Bien: {bien.project_id}\n{bien.hex}\n")
+                added.append(bien.project_id)
+        if lines:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+    if lines:
+        signal_change()
+    if log:
+        for project_id in added:
+            log(f"CROWDFUNDING: Added Bien {project_id} hex to amisOfAmis")
+    os.makedirs(os.path.dirname(BIENS_SYNC_CACHE), exist_ok=True)
+    with open(BIENS_SYNC_CACHE, "a"):
+        os.utime(BIENS_SYNC_CACHE)
+    return len(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    index = default_index()
+    if args[:1] == ["update"] and len(args) == 2:
+        bien = index.update(args[1])
+        print(bien.row() if bien else f"{args[1]}: no bien.pubkeys", end="" if bien else "\n")
+        return 0
+    if args == ["rebuild"]:
+        print(f"{index.rebuild()} biens indexed in {index.path}")
+        return 0
+    if args == ["sync"]:
+        sync_biens_to_amis(lambda message: print(message), force=True)
+        return 0
+    if args[:1] == ["lookup"] and len(args) == 2:
+        bien = index.by_hex(args[1])
+        if bien is None:
+            return 1
+        print(bien.row(), end="")
+        return 0
+    print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
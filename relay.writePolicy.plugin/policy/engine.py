@@ -0,0 +1,424 @@
+"""
+Moteur de politique d'écriture strfry persistant.
+
+Remplace la boucle de all_but_blacklist.sh : chaque ligne reçue sur stdin est
+décodée une seule fois (EventContext, policy/event.py), la blacklist et la
+classification nobody / player / uplanet sont résolues depuis l'état en
+mémoire, et les filtres par kind portés en Python (policy/filters)
+s'exécutent dans le processus. Seuls les kinds non portés lancent encore
+filter/$kind.sh en sous-processus. Les décisions sont identiques à celles du
+script shell.
+
+Les handlers qui n'ont besoin que du verdict (1, 7, 21, 22, 30904) confient
+les effets de bord lents à la file de travaux (policy/jobs.py) : le script
+shell y est relancé en arrière-plan après la réponse à strfry.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Optional, TextIO, Tuple
+
+from . import auth, certs, config, filters, logs, umapkeys
+from .blacklist import BlacklistStore
+from .event import EventContext
+from .eventcounts import EventCounts
+from .identity import IdentityIndex, signal_mtime
+from .jobs import WorkQueue
+from .ledger import LEDGER_EXPORT_INTERVAL, LEDGER_FILE, Ledger
+from .metrics import Metrics
+from .verdicts import Verdict, VerdictCache
+from .videostats import VideoStats
+
+
+class PolicyEngine:
+    """Décide accept / reject pour chaque message du protocole plugin strfry."""
+
+    def __init__(self, log_file: str = config.LOG_FILE, filter_dir: str = config.FILTER_DIR):
+        self.filter_dir = filter_dir
+        self.logs = logs.writer()
+        self.log_file = log_file
+
+        self.node_id = config.load_ipfs_node_id()
+        self.blacklist = BlacklistStore()
+        self.identities = IdentityIndex(node_id=self.node_id)
+        self.certs = certs.default_index()
+        self._identity_signal = signal_mtime()
+        self.verdicts = VerdictCache()
+        self.video_stats = VideoStats()
+        # Verdicts par jour, kind, type d'utilisateur et action (policy/eventcounts.py)
+        self.event_counts = EventCounts()
+        # Espace de noms des clés UMAP en cache (umap_key dans common.sh)
+        self.umap_namespace = umapkeys.namespace(umapkeys.uplanet_name())
+        self._exported_version = -1
+        self._stats_written_at = time.monotonic()
+        self._ledger_exported_at = time.monotonic()
+        # kind -> latence et verdicts du filtre (python ou shell)
+        self.filter_stats: Dict[str, dict] = {}
+        self.metrics = Metrics()
+        self.metrics.describe("stage_seconds", "Time spent per stage of the policy path")
+        self.metrics.describe("filter_seconds", "Per-kind filter time (python handler or shell script)")
+        self.metrics.describe("event_seconds", "Total verdict time per event")
+        self.metrics.describe("events_total", "Verdicts by action, user type and kind")
+        self.jobs = WorkQueue(log=self.log)
+        self.jobs.register("filter", self._run_filter_job)
+        self.jobs.start()
+
+    # ------------------------------------------------------------------ logging
+
+    def log(self, message: str, level: int = logs.INFO) -> None:
+        started = time.perf_counter()
+        self.logs.write(self.log_file, message, level)
+        self.metrics.observe("stage_seconds", time.perf_counter() - started, stage="log")
+
+    def echo(self, message: str) -> None:
+        """Ligne brute dans strfry.log (stdout d'un filtre)."""
+        self.logs.raw(self.log_file, message)
+
+    # ---------------------------------------------------------------- blacklist
+
+    def _remove_from_blacklist(self, pubkey: str) -> None:
+        try:
+            self.blacklist.remove(pubkey)
+        except OSError as e:
+            self.log(f"Failed to remove {pubkey} from blacklist: {e}", logs.ERROR)
+
+    def is_key_blacklisted(self, pubkey: str) -> bool:
+        if pubkey not in self.blacklist:
+            return False
+        if self.identities.has(pubkey, "local"):
+            self.log(f"Found pubkey {pubkey} in MULTIPASS account, removing from blacklist")
+            self._remove_from_blacklist(pubkey)
+            self.log(f"Removed pubkey {pubkey} from blacklist due to MULTIPASS account")
+            return False
+        if self.identities.has(pubkey, "amisOfAmis"):
+            self.log(f"Found pubkey {pubkey} in amisOfAmis.txt, removing from blacklist")
+            self._remove_from_blacklist(pubkey)
+            self.log(f"Removed pubkey {pubkey} from blacklist due to amisOfAmis.txt")
+            return False
+        return True
+
+    # ----------------------------------------------------------- classification
+
+    def classify_user(self, pubkey: str) -> str:
+        """nobody, player ou uplanet — même cascade que classify_user()."""
+        identities = self.identities.identities(pubkey)
+        sources = {i.source for i in identities}
+        if "local" in sources:
+            email = identities[0].email
+            if config.EMAIL_REGEX.match(email) or email == "CAPTAIN":
+                return "player"
+            return "uplanet"
+        if "amisOfAmis" in sources:
+            return "player" if self.certs.is_certified(pubkey) else "uplanet"
+        if sources & {"swarm_node", "captain"}:
+            return "uplanet"
+        return "nobody"
+
+    def verdict(self, pubkey: str) -> Verdict:
+        """Classification + source d'autorisation, via le cache de verdicts."""
+        self.identities.refresh()
+        self.certs.refresh()
+        self.verdicts.sync((self.identities.version, self.certs.version))
+        cached = self.verdicts.get(pubkey)
+        if cached is not None:
+            return cached
+        user_type = self.classify_user(pubkey)
+        resolved = auth.resolve(self.identities, pubkey)
+        verdict = Verdict(user_type, resolved.source, resolved.email)
+        self.verdicts.put(pubkey, verdict)
+        return verdict
+
+    # ------------------------------------------------------------------ filters
+
+    def filter_path(self, kind) -> Optional[str]:
+        path = os.path.join(self.filter_dir, f"{kind}.sh")
+        return path if os.access(path, os.X_OK) else None
+
+    def _filter_env(self, ev: EventContext, verdict: Verdict) -> dict:
+        """Environnement des filtres shell : événement déjà décodé (NIP101_EVENT),
+        index d'identité exporté à jour et verdict de l'auteur (court-circuite
+        check_authorization dans common.sh)."""
+        env = dict(os.environ, NIP101_AUTH_PUBKEY=ev.pubkey, NIP101_AUTH_SOURCE=verdict.source,
+                   NIP101_AUTH_EMAIL=verdict.email, NIP101_USER_TYPE=verdict.user_type,
+                   NIP101_UMAP_NS=self.umap_namespace, **ev.shell_env())
+        if self._exported_version != self.identities.version:
+            try:
+                self.identities.export(config.IDENTITY_INDEX_FILE)
+                self._exported_version = self.identities.version
+            except OSError as e:
+                self.log(f"Identity index export failed: {e}", logs.WARNING)
+                return env
+        env["NIP101_IDENTITY_INDEX"] = config.IDENTITY_INDEX_FILE
+        return env
+
+    def run_filter(self, path: str, ev: EventContext, verdict: Verdict) -> int:
+        """Lance filter/$kind.sh, stdout + stderr redirigés dans strfry.log."""
+        try:
+            with self.logs.stream(self.log_file) as out:
+                return subprocess.run(
+                    [path, ev.line], stdin=subprocess.DEVNULL,
+                    stdout=out, stderr=subprocess.STDOUT, env=self._filter_env(ev, verdict),
+                ).returncode
+        except OSError as e:
+            self.log(f"Filter {os.path.basename(path)} failed to start: {e}", logs.ERROR)
+            return 1
+        finally:
+            self.check_identity_signal()
+
+    def check_identity_signal(self) -> None:
+        """Après un filtre shell : un stat de IDENTITY_SIGNAL_FILE, touché par les
+        filtres qui ont modifié amisOfAmis.txt, atom4love_certified.txt…"""
+        mtime = signal_mtime()
+        if mtime != self._identity_signal:
+            self._identity_signal = mtime
+            self.identities.mark_stale()
+            self.certs.mark_stale()
+
+    def run_kind_filter(self, kind, path: Optional[str], ev: EventContext, verdict: Verdict) -> bool:
+        """Handler Python du kind s'il existe, sinon filter/$kind.sh. True = accept."""
+        handler = filters.get_handler(kind)
+        started = time.perf_counter()
+        accepted = None
+        mode = "python"
+        if handler is not None:
+            ctx = filters.FilterContext(self, ev, verdict)
+            try:
+                result = handler(ctx)  # None : décision laissée au script shell
+                accepted = None if result is None and path else bool(result)
+            except Exception as e:  # repli sur le script shell s'il existe
+                self.log(f"Filter {kind} handler failed: {e!r}", logs.ERROR)
+                accepted = None if path else False
+        if accepted is None:
+            mode = "shell"
+            accepted = self.run_filter(path, ev, verdict) == 0
+        self._record_filter(kind, mode, time.perf_counter() - started, accepted)
+        return accepted
+
+    def defer_filter(self, ctx: "filters.FilterContext") -> None:
+        """Dépose filter/$kind.sh dans la file de travaux (effets de bord seulement)."""
+        env = self._filter_env(ctx.event_context, ctx.verdict)
+        overrides = {k: v for k, v in env.items() if k.startswith("NIP101_")}
+        args = {"kind": ctx.kind, "line": ctx.line, "env": overrides}
+        # Une voie par script : pas deux instances de filter/$kind.sh en parallèle
+        if self.jobs.submit("filter", args, lane=f"filter/{ctx.kind}.sh") is None:
+            self.log(f"Job queue full ({self.jobs.max_pending}): deferred filter {ctx.kind}.sh dropped "
+                     f"for event {ctx.event_context.id[:16]}", logs.WARNING)
+
+    def _run_filter_job(self, job: dict) -> bool:
+        """Travail "filter" : le code de sortie est ignoré, seul un échec de
+        lancement ou une mort par signal est retenté."""
+        args = job["args"]
+        path = self.filter_path(args["kind"])
+        if path is None:
+            return True
+        try:
+            with self.logs.stream(self.log_file) as out:
+                returncode = subprocess.run(
+                    [path, args["line"]], stdin=subprocess.DEVNULL, stdout=out,
+                    stderr=subprocess.STDOUT, env=dict(os.environ, **args["env"]),
+                    timeout=config.JOB_TIMEOUT,
+                ).returncode
+        except subprocess.TimeoutExpired:
+            # Effets de bord peut-être partiels : ne pas relancer
+            self.log(f"Deferred filter {args['kind']}.sh timed out after {config.JOB_TIMEOUT}s "
+                     f"(job {job['id']})", logs.WARNING)
+            return True
+        except OSError as e:
+            self.log(f"Deferred filter {args['kind']}.sh failed to start: {e}", logs.ERROR)
+            return False
+        finally:
+            self.check_identity_signal()
+        return returncode >= 0
+
+    def _record_filter(self, kind, mode: str, seconds: float, accepted: bool) -> None:
+        entry = self.filter_stats.setdefault(str(kind), {
+            "mode": mode, "runs": 0, "rejects": 0, "seconds_total": 0.0, "max_seconds": 0.0,
+        })
+        entry["mode"] = mode
+        entry["runs"] += 1
+        entry["rejects"] += 0 if accepted else 1
+        entry["seconds_total"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        self.metrics.observe("filter_seconds", seconds, kind=str(kind), mode=mode)
+
+    # -------------------------------------------------------------------- stats
+
+    def stats(self) -> dict:
+        return {
+            "identity": self.identities.stats(),
+            "blacklist": self.blacklist.stats(),
+            "verdicts": self.verdicts.stats(),
+            "certs": self.certs.stats(),
+            "jobs": self.jobs.stats(),
+            "event_counts": self.event_counts.stats(),
+            "stages": self.metrics.summary(),
+            "logs": self.logs.stats(),
+            "filters": {
+                kind: dict(entry, seconds_total=round(entry["seconds_total"], 6),
+                           max_seconds=round(entry["max_seconds"], 6),
+                           avg_seconds=round(entry["seconds_total"] / entry["runs"], 6))
+                for kind, entry in self.filter_stats.items()
+            },
+        }
+
+    def maintenance(self) -> None:
+        """Tâches périodiques hors chemin critique (appelées après chaque réponse)."""
+        try:
+            if self.blacklist.maybe_compact():
+                self.log(f"Blacklist compacted ({len(self.blacklist)} keys)")
+        except OSError as e:
+            self.log(f"Blacklist compaction failed: {e}", logs.WARNING)
+        try:
+            self.video_stats.maybe_flush()
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"Video stats flush failed: {e}", logs.WARNING)
+        try:
+            self.event_counts.maybe_flush()
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"Event counts flush failed: {e}", logs.WARNING)
+        self.export_ledger()
+        self.write_stats()
+
+    def export_ledger(self, force: bool = False) -> None:
+        """Réexporte les project.json laissés en attente par les écritures du registre."""
+        now = time.monotonic()
+        if not force and now - self._ledger_exported_at < LEDGER_EXPORT_INTERVAL:
+            return
+        self._ledger_exported_at = now
+        if not os.path.exists(LEDGER_FILE):
+            return
+        try:
+            ledger = Ledger()
+            try:
+                ledger.export_due(interval=0 if force else LEDGER_EXPORT_INTERVAL)
+            finally:
+                ledger.close()
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"Crowdfunding ledger export failed: {e}", logs.WARNING)
+
+    def write_stats(self, force: bool = False) -> None:
+        """Écrit STATS_FILE au plus une fois par STATS_INTERVAL secondes."""
+        now = time.monotonic()
+        if not force and now - self._stats_written_at < config.STATS_INTERVAL:
+            return
+        self._stats_written_at = now
+        try:
+            os.makedirs(config.POLICY_DIR, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=config.POLICY_DIR)
+            with os.fdopen(fd, "w") as f:
+                json.dump(dict(self.stats(), updated_at=int(time.time())), f, indent=2)
+            os.replace(tmp, config.STATS_FILE)
+            self.metrics.write(config.METRICS_FILE)
+        except OSError as e:
+            self.log(f"Stats export failed: {e}", logs.WARNING)
+
+    # ------------------------------------------------------------------ verdict
+
+    def _kind_label(self, kind, has_filter: Optional[bool] = None) -> str:
+        """Label `kind` des métriques : les kinds sans filtre sont regroupés ("other")."""
+        if has_filter is None:
+            has_filter = filters.get_handler(kind) is not None or self.filter_path(kind) is not None
+        return str(kind) if has_filter else "other"
+
+    def _stage(self, stage: str, started: float) -> float:
+        now = time.perf_counter()
+        self.metrics.observe("stage_seconds", now - started, stage=stage)
+        return now
+
+    def process_new_event(self, ev: EventContext) -> str:
+        started = time.perf_counter()
+        action, user_type, kind_label = self._decide(ev)
+        self.metrics.observe("event_seconds", time.perf_counter() - started, action=action)
+        self.metrics.inc("events_total", action=action, user_type=user_type, kind=kind_label)
+        self.event_counts.add(ev.kind, user_type, action)
+        return action
+
+    def _decide(self, ev: EventContext) -> Tuple[str, str, str]:
+        """(action, type d'utilisateur, label du kind) pour un événement "new"."""
+        event_id, pubkey, kind = ev.id, ev.pubkey, ev.kind
+        self.log(f"Processing event ID: {event_id}, pubkey: {pubkey}, kind: {kind}")
+
+        t = time.perf_counter()
+        blacklisted = self.is_key_blacklisted(pubkey)
+        t = self._stage("blacklist", t)
+        if blacklisted:
+            self.log(f"Rejecting ALL events (kind {kind}) from blacklisted pubkey: {pubkey}")
+            return "reject", "blacklisted", self._kind_label(kind)
+
+        verdict = self.verdict(pubkey)
+        t = self._stage("classify", t)
+        user_type = verdict.user_type
+        self.log(f"User classification for {pubkey}: {user_type}")
+
+        path = self.filter_path(kind)
+        has_filter = path is not None or filters.get_handler(kind) is not None
+        self._stage("filter_lookup", t)
+        kind_label = self._kind_label(kind, has_filter)
+        if user_type == "nobody":
+            if not has_filter:
+                self.log(f"Rejecting event (kind {kind}) from 'nobody' pubkey: {pubkey} (no specific filter)")
+                return "reject", user_type, kind_label
+            self.log(f"Running filter {kind}.sh for 'nobody' user: {pubkey}")
+            if not self.run_kind_filter(kind, path, ev, verdict):
+                self.log(f"Filter {kind}.sh rejected event from 'nobody': {event_id}")
+                return "reject", user_type, kind_label
+            self.log(f"Filter {kind}.sh accepted event from 'nobody': {event_id}")
+            return "accept", user_type, kind_label
+
+        if has_filter and not self.run_kind_filter(kind, path, ev, verdict):
+            self.log(f"Filter {kind}.sh rejected event: {event_id}")
+            return "reject", user_type, kind_label
+
+        self.log(f"Accepting event: {event_id}")
+        return "accept", user_type, kind_label
+
+    def handle_line(self, line: str) -> Optional[dict]:
+        """Réponse JSON pour une ligne du protocole plugin (None pour une ligne vide)."""
+        if not line:
+            return None
+        started = time.perf_counter()
+        ev = EventContext.parse(line)
+        self._stage("parse", started)
+        if ev is None:
+            return {"action": "reject"}
+        event_id = ev.event.get("id")
+        if ev.type != "new":
+            return {"id": event_id, "action": "accept"}
+        try:
+            action = self.process_new_event(ev)
+        except Exception as e:  # une erreur ne doit jamais bloquer strfry
+            self.log(f"Policy engine error on {event_id}: {e!r}", logs.ERROR)
+            action = "reject"
+        return {"id": event_id, "action": action}
+
+    def run(self, stdin: TextIO = sys.stdin, stdout: TextIO = sys.stdout) -> None:
+        for raw in stdin:
+            response = self.handle_line(raw.rstrip("\n"))
+            if response is not None:
+                stdout.write(json.dumps(response) + "\n")
+                stdout.flush()
+            self.maintenance()
+        if not self.jobs.drain(config.JOB_DRAIN_TIMEOUT):
+            self.log("Deferred jobs still running at shutdown, they will resume on restart", logs.WARNING)
+        self.jobs.stop()
+        try:
+            self.video_stats.maybe_flush(force=True)
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"Video stats flush failed: {e}", logs.WARNING)
+        self.video_stats.close()
+        try:
+            self.event_counts.flush()
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"Event counts flush failed: {e}", logs.WARNING)
+        self.event_counts.close()
+        self.export_ledger(force=True)
+        self.write_stats(force=True)
+
+
+def main() -> None:
+    PolicyEngine().run()
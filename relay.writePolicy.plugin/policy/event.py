@@ -0,0 +1,129 @@
+"""
+Contexte d'événement décodé une seule fois par ligne du protocole plugin.
+
+Le moteur construit un EventContext par ligne lue sur stdin et le passe à
+toutes les étapes (liste noire, classification, handlers Python). Les tags
+sont rangés dans un multimap nom → valeurs (ordre du document), construit au
+premier accès : `first()` (équivalent de `jq … | head -1`), `last()` (valeur
+laissée par extract_tags) et `all()`, y compris pour les noms avec tiret
+(report-type, friction-amount…).
+
+Les filtres qui tournent encore en sous-processus reçoivent la forme
+sérialisée `shell()` dans NIP101_EVENT (affectations bash déjà échappées) :
+event_context_load() de filter/common.sh la charge par un simple `eval`, sans
+relancer `jq` sur l'événement.
+"""
+
+import json
+import shlex
+from typing import Dict, List, Optional
+
+# Au-delà, NIP101_EVENT n'est pas exporté (limite d'une variable
+# d'environnement sous Linux : 128 Kio) et common.sh retombe sur jq.
+SHELL_MAX_BYTES = 96 * 1024
+
+
+def json_text(value) -> str:
+    """Rendu de `jq -r '.x // empty'` : chaîne brute, vide pour null/false."""
+    if value is None or value is False:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class EventContext:
+    """Message plugin décodé : type, événement, champs et multimap des tags."""
+
+    def __init__(self, line: str, message: dict):
+        self.line = line
+        self.message = message
+        event = message.get("event")
+        self.event: dict = event if isinstance(event, dict) else {}
+        self.type = message.get("type")
+        self.id = str(self.event.get("id") or "")
+        self.pubkey = str(self.event.get("pubkey") or "")
+        self.kind = self.event.get("kind")
+        self.content = json_text(self.event.get("content"))
+        self.created_at = self.event.get("created_at")
+        self._tags: Optional[Dict[str, List[str]]] = None
+        self._content_json: Optional[dict] = None
+        self._shell: Optional[str] = None
+
+    @classmethod
+    def parse(cls, line: str) -> Optional["EventContext"]:
+        """None si la ligne n'est pas un objet JSON."""
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return None
+        return cls(line, message) if isinstance(message, dict) else None
+
+    # -------------------------------------------------------------------- tags
+
+    @property
+    def tag_map(self) -> Dict[str, List[str]]:
+        if self._tags is None:
+            tags: Dict[str, List[str]] = {}
+            for tag in self.event.get("tags") or []:
+                if isinstance(tag, list) and len(tag) > 1 and tag[0] not in (None, ""):
+                    tags.setdefault(json_text(tag[0]), []).append(json_text(tag[1]))
+            self._tags = tags
+        return self._tags
+
+    def all(self, name: str) -> List[str]:
+        return self.tag_map.get(name, [])
+
+    def first(self, name: str) -> str:
+        values = self.tag_map.get(name)
+        return values[0] if values else ""
+
+    def last(self, name: str) -> str:
+        values = self.tag_map.get(name)
+        return values[-1] if values else ""
+
+    def has(self, name: str, value: str) -> bool:
+        return value in self.tag_map.get(name, ())
+
+    # ----------------------------------------------------------------- content
+
+    def content_json(self) -> dict:
+        """Content décodé (dict vide si ce n'est pas un objet JSON)."""
+        if self._content_json is None:
+            try:
+                parsed = json.loads(self.content)
+            except ValueError:
+                parsed = None
+            self._content_json = parsed if isinstance(parsed, dict) else {}
+        return self._content_json
+
+    # ----------------------------------------------------------- sérialisation
+
+    def shell(self) -> str:
+        """Affectations bash lues par event_context_load() (filter/common.sh)."""
+        if self._shell is None:
+            q = shlex.quote
+            lines = [
+                f"_ev_type={q(json_text(self.type))}",
+                f"_ev_id={q(self.id)}",
+                f"_ev_pubkey={q(self.pubkey)}",
+                f"_ev_kind={q(json_text(self.kind))}",
+                f"_ev_created_at={q(json_text(self.created_at))}",
+                f"_ev_content={q(self.content)}",
+                "declare -gA _ev_first=() _ev_last=() _ev_all=()",
+            ]
+            for name, values in self.tag_map.items():
+                key = q(name)
+                lines.append(f"_ev_first[{key}]={q(values[0])}")
+                lines.append(f"_ev_last[{key}]={q(values[-1])}")
+                lines.append(f"_ev_all[{key}]={q(chr(10).join(values))}")
+            self._shell = "\n".join(lines) + "\n"
+        return self._shell
+
+    def shell_env(self) -> Dict[str, str]:
+        """NIP101_EVENT / NIP101_EVENT_ID pour un filtre shell (vide si trop gros)."""
+        serialized = self.shell()
+        if (not self.id or "\0" in serialized
+                or len(serialized.encode("utf-8", "surrogatepass")) > SHELL_MAX_BYTES):
+            return {}
+        return {"NIP101_EVENT": serialized, "NIP101_EVENT_ID": self.id}
@@ -0,0 +1,278 @@
+"""
+Compteurs d'événements du relais par jour, kind, classe d'utilisateur et action.
+
+backfill_constellation.sh comptait la base par `strfry scan --count '{}'`
+(un parcours complet avant et après chaque synchronisation). Le moteur compte
+désormais chaque verdict quand il le rend (PolicyEngine.process_new_event) :
+un Counter en mémoire, replié au plus une fois par EVENT_COUNTS_INTERVAL
+secondes (et à l'arrêt) dans ~/.zen/strfry/event_counts.sqlite :
+
+    counts (day, kind, user_class, action, n)   day AAAA-MM-JJ (UTC)
+    totals (action, n)                          accept, reject, import, added
+
+user_class est la classe du moteur (nobody, player, uplanet, blacklisted).
+`strfry import` ne passe pas par le writePolicy : backfill_constellation.sh
+ajoute chaque lot importé (`import FICHIER`, action import, classe backfill).
+
+Nombre d'événements stockés, lu en O(1) :
+    stored = base + (added depuis le dernier comptage réel)
+`added` ne compte que les kinds qui ajoutent une ligne à la base : ni les
+éphémères (20000-29999, jamais stockés), ni les remplaçables (0, 3,
+10000-19999, 30000-39999), qui remplacent la version précédente. Il reste
+une estimation (doublons écartés par strfry, suppressions, première version
+d'un remplaçable) : `stored` la recale par un comptage réel (NIP-45 COUNT
+via policy.relayquery) quand ce comptage a plus de EVENT_COUNTS_CALIBRATE
+secondes. Chaque flush recopie "stored accept reject import" dans
+~/.zen/strfry/event_counts.total (stored = "-" avant le premier comptage),
+lisible par un `read` shell sans processus.
+
+Usage en ligne de commande :
+    python3 -m policy.eventcounts stored
+    python3 -m policy.eventcounts import EVENTS.ndjson
+    python3 -m policy.eventcounts calibrate
+    python3 -m policy.eventcounts summary [DAYS]
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from . import config
+
+EVENT_COUNTS_DB = os.path.join(config.STRFRY_DIR, "event_counts.sqlite")
+EVENT_COUNTS_TOTAL_FILE = os.path.join(config.STRFRY_DIR, "event_counts.total")
+EVENT_COUNTS_INTERVAL = float(os.environ.get("NIP101_EVENT_COUNTS_INTERVAL", "10"))
+EVENT_COUNTS_CALIBRATE = float(os.environ.get("NIP101_EVENT_COUNTS_CALIBRATE", "86400"))
+
+ACTIONS = ("accept", "reject", "import")
+# Total des accept + import qui ajoutent une ligne à la base (adds_row)
+ADDED = "added"
+KIND_FIELD = re.compile(r'"kind"\s*:\s*(\d+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counts (
+    day        TEXT NOT NULL,
+    kind       INTEGER NOT NULL,
+    user_class TEXT NOT NULL,
+    action     TEXT NOT NULL,
+    n          INTEGER NOT NULL,
+    PRIMARY KEY (day, kind, user_class, action)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totals (
+    action TEXT PRIMARY KEY,
+    n      INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+Key = Tuple[str, int, str, str]
+
+
+def _day(now: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+
+def _kind(kind) -> int:
+    try:
+        return int(kind)
+    except (TypeError, ValueError):
+        return -1
+
+
+def adds_row(kind: int) -> bool:
+    """False pour les kinds qui n'augmentent pas la base : éphémères et remplaçables."""
+    return kind >= 0 and kind not in (0, 3) and not 10000 <= kind < 40000
+
+
+class EventCounts:
+    """Compteurs en mémoire repliés périodiquement dans la base SQLite."""
+
+    def __init__(self, db_file: str = EVENT_COUNTS_DB, total_file: str = EVENT_COUNTS_TOTAL_FILE,
+                 interval: float = EVENT_COUNTS_INTERVAL):
+        self.db_file = db_file
+        self.total_file = total_file
+        self.interval = interval
+        self.pending: Counter = Counter()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._flushed_at = time.monotonic()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # ---------------------------------------------------------------- comptage
+
+    def add(self, kind, user_class: str, action: str, n: int = 1) -> None:
+        """Compte `n` verdicts (O(1), en mémoire jusqu'au prochain flush)."""
+        self.pending[(_day(), _kind(kind), user_class, action)] += n
+
+    def maybe_flush(self, force: bool = False) -> int:
+        """Flush au plus une fois par `interval` (maintenance du moteur)."""
+        if not force and time.monotonic() - self._flushed_at < self.interval:
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """Ajoute les compteurs en attente à la base ; retourne le nombre de verdicts appliqués."""
+        self._flushed_at = time.monotonic()
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, Counter()
+        totals: Counter = Counter()
+        for (_, kind, _, action), n in pending.items():
+            totals[action] += n
+            if action in ("accept", "import") and adds_row(kind):
+                totals[ADDED] += n
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT INTO counts (day, kind, user_class, action, n) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (day, kind, user_class, action) DO UPDATE SET n = n + excluded.n",
+                [key + (n,) for key, n in pending.items()])
+            self.conn.executemany(
+                "INSERT INTO totals (action, n) VALUES (?, ?) "
+                "ON CONFLICT (action) DO UPDATE SET n = n + excluded.n", totals.items())
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            self.pending.update(pending)
+            raise
+        self.write_total()
+        return sum(pending.values())
+
+    def import_file(self, path: str) -> int:
+        """Compte les événements d'un fichier NDJSON importé par `strfry import`."""
+        kinds: Counter = Counter()
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                m = KIND_FIELD.search(line)
+                if m:
+                    kinds[int(m.group(1))] += 1
+        for kind, n in kinds.items():
+            self.add(kind, "backfill", "import", n)
+        return self.flush()
+
+    # ------------------------------------------------------------------ lecture
+
+    def totals(self) -> Dict[str, int]:
+        counts = dict(self.conn.execute("SELECT action, n FROM totals").fetchall())
+        return {action: counts.get(action, 0) for action in ACTIONS + (ADDED,)}
+
+    def stored(self, totals: Optional[Dict[str, int]] = None) -> Optional[int]:
+        """Estimation du nombre d'événements stockés (None avant le premier comptage réel)."""
+        base = self._meta("base")
+        base_added = self._meta("base_net")
+        if base is None or base_added is None:
+            return None
+        totals = totals or self.totals()
+        return max(0, int(base) + totals[ADDED] - int(base_added))
+
+    def calibration_age(self) -> Optional[float]:
+        calibrated_at = self._meta("calibrated_at")
+        return None if calibrated_at is None else time.time() - float(calibrated_at)
+
+    def calibrate(self, count: Optional[int] = None) -> int:
+        """Recale l'estimation sur un comptage réel de la base strfry."""
+        if count is None:
+            from . import relayquery
+            count = relayquery.count()
+        self.flush()
+        totals = self.totals()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._set_meta("base", count)
+            self._set_meta("base_net", totals[ADDED])
+            self._set_meta("calibrated_at", time.time())
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.write_total()
+        return count
+
+    def current(self, max_age: float = EVENT_COUNTS_CALIBRATE) -> int:
+        """Nombre d'événements stockés, recalé si le dernier comptage a plus de `max_age` s."""
+        age = self.calibration_age()
+        stored = self.stored()
+        if age is None or age > max_age or stored is None:
+            return self.calibrate()
+        return stored
+
+    def write_total(self) -> None:
+        """Recopie "stored accept reject import" dans `total_file` (lecture shell)."""
+        totals = self.totals()
+        stored = self.stored(totals)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.total_file), prefix=".event_counts.")
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{'-' if stored is None else stored} {totals['accept']} {totals['reject']} {totals['import']}\n")
+        os.replace(tmp, self.total_file)
+
+    def summary(self, days: int = 1) -> dict:
+        """Compteurs des `days` derniers jours par action, classe et kind."""
+        since = _day(time.time() - (days - 1) * 86400)
+        result: Dict[str, dict] = {}
+        for action, user_class, kind, n in self.conn.execute(
+                "SELECT action, user_class, kind, SUM(n) FROM counts WHERE day >= ? "
+                "GROUP BY action, user_class, kind ORDER BY action, user_class, kind", (since,)):
+            entry = result.setdefault(action, {"total": 0, "by_class": {}, "by_kind": {}})
+            entry["total"] += n
+            entry["by_class"][user_class] = entry["by_class"].get(user_class, 0) + n
+            entry["by_kind"][str(kind)] = entry["by_kind"].get(str(kind), 0) + n
+        return {"since": since, "stored": self.stored(), "totals": self.totals(), "actions": result}
+
+    def stats(self) -> dict:
+        return {"pending": sum(self.pending.values()), "interval_seconds": self.interval}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    counts = EventCounts()
+    try:
+        if args == ["stored"]:
+            print(counts.current())
+        elif args[:1] == ["import"] and len(args) == 2:
+            print(f"{counts.import_file(args[1])} imported events counted")
+        elif args == ["calibrate"]:
+            print(counts.calibrate())
+        elif args[:1] == ["summary"] and len(args) <= 2 and all(a.isdigit() for a in args[1:]):
+            print(json.dumps(counts.summary(int(args[1]) if len(args) == 2 else 1), indent=2))
+        else:
+            print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+            return 2
+    except OSError as e:
+        print(f"event counts unavailable: {e}", file=sys.stderr)
+        return 1
+    finally:
+        counts.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
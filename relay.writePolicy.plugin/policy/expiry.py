@@ -0,0 +1,261 @@
+"""
+Suppression planifiée des réponses aux visiteurs (avertissements et #BRO).
+
+filter/1.sh lançait `cleanup_warning_messages &` à chaque message de
+visiteur : dérivation de la clé UMAP 0.00,0.00 puis `strfry scan` de tous
+ses kind 1 antérieurs à 48 h. Pendant une vague de spam, des dizaines de
+scans se chevauchaient. Désormais chaque réponse publiée est enregistrée
+avec son échéance dans ~/.zen/strfry/expiry.sqlite (index sur due_at) :
+
+    python3 -m policy.expiry add EVENT_ID DUE_AT [LABEL]
+
+Un seul balayeur à la fois (flock non bloquant) supprime les réponses
+échues par lots de EXPIRY_BATCH identifiants (`strfry delete --filter
+{"ids": [...]}`) : le coût dépend du nombre de réponses expirées, pas du
+nombre de messages reçus. La prochaine échéance est recopiée dans
+~/.zen/tmp/expiry.next, lue par `expiry_sweep_due` (filter/common.sh) sans
+lancer de processus tant que rien n'est échu ; le balayeur et
+`expiry_sweep_due` (qui la repousse avant de le relancer) ne l'écrivent que
+sous expiry.next.lock. Un lot dont la suppression échoue est reporté de
+EXPIRY_RETRY_DELAY secondes.
+
+Au premier balayage, les réponses publiées avant ce module (auteur UMAP
+0.00,0.00, « Hello NOSTR visitor » ou tag t=BRO) sont reprises par une seule
+requête au relais local (policy.relayquery), avec l'échéance created_at +
+VISITOR_REPLY_TTL.
+
+Usage en ligne de commande :
+    python3 -m policy.expiry add EVENT_ID DUE_AT [LABEL]
+    python3 -m policy.expiry sweep
+    python3 -m policy.expiry stats
+"""
+
+import fcntl
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from . import config
+from .relayquery import query
+from .umapkeys import default_cache
+
+EXPIRY_DB = os.path.join(config.STRFRY_DIR, "expiry.sqlite")
+EXPIRY_LOCK = os.path.join(config.STRFRY_DIR, "expiry.lock")
+EXPIRY_NEXT_FILE = os.path.join(config.TMP_DIR, "expiry.next")
+KIND1_LOG = os.path.join(config.TMP_DIR, "nostr_kind1_messages.log")
+
+EXPIRY_BATCH = int(os.environ.get("NIP101_EXPIRY_BATCH", "500"))
+EXPIRY_RETRY_DELAY = float(os.environ.get("NIP101_EXPIRY_RETRY_DELAY", "300"))
+# Même durée que WARNING_MESSAGE_TTL dans filter/1.sh
+VISITOR_REPLY_TTL = float(os.environ.get("NIP101_VISITOR_REPLY_TTL", "172800"))
+STRFRY_TIMEOUT = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduled (
+    event_id TEXT PRIMARY KEY,
+    due_at   REAL NOT NULL,
+    label    TEXT NOT NULL DEFAULT '',
+    attempts INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scheduled_due ON scheduled (due_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def is_visitor_reply(event: dict) -> bool:
+    """Avertissement « Hello NOSTR visitor » ou réponse #BRO (filtre jq de l'ancien nettoyage)."""
+    if "Hello NOSTR visitor" in (event.get("content") or ""):
+        return True
+    return any(isinstance(t, list) and len(t) > 1 and t[0] == "t" and t[1] == "BRO"
+               for t in event.get("tags") or [])
+
+
+class ExpiryQueue:
+    """Échéancier persistant d'événements à supprimer de la base strfry."""
+
+    def __init__(self, path: str = EXPIRY_DB, lock_path: str = EXPIRY_LOCK,
+                 next_file: str = EXPIRY_NEXT_FILE, batch: int = EXPIRY_BATCH,
+                 retry_delay: float = EXPIRY_RETRY_DELAY, strfry_dir: str = config.STRFRY_DIR):
+        self.path = path
+        self.lock_path = lock_path
+        self.next_file = next_file
+        self.batch = batch
+        self.retry_delay = retry_delay
+        self.strfry_dir = strfry_dir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @contextmanager
+    def _next_locked(self) -> Iterator[None]:
+        with open(self.next_file + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_next(self) -> Optional[float]:
+        """Recopie la plus proche échéance dans next_file (supprimé si la file est vide)."""
+        os.makedirs(os.path.dirname(self.next_file), exist_ok=True)
+        with self._next_locked():
+            due = self.conn.execute("SELECT MIN(due_at) FROM scheduled").fetchone()[0]
+            if due is None:
+                try:
+                    os.unlink(self.next_file)
+                except FileNotFoundError:
+                    pass
+                return None
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.next_file), prefix=".expiry.")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(f"{int(due)}\n")
+                os.replace(tmp, self.next_file)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            return due
+
+    # ------------------------------------------------------------- planification
+
+    def add(self, event_id: str, due_at: float, label: str = "") -> bool:
+        """Planifie la suppression de `event_id` ; False si déjà planifié."""
+        added = self.conn.execute(
+            "INSERT OR IGNORE INTO scheduled (event_id, due_at, label) VALUES (?, ?, ?)",
+            (event_id, float(due_at), label)).rowcount > 0
+        if added:
+            self._write_next()
+        return added
+
+    def _import_visitor_replies(self) -> int:
+        """Reprise unique des réponses publiées avant l'échéancier (une seule requête)."""
+        umap = default_cache().resolve("0.00", "0.00")
+        if umap is None:
+            return 0
+        rows = [(e["id"], float(e.get("created_at") or 0) + VISITOR_REPLY_TTL, "visitor_reply")
+                for e in query({"authors": [umap.hex], "kinds": [1]})
+                if isinstance(e.get("id"), str) and is_visitor_reply(e)]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO scheduled (event_id, due_at, label) VALUES (?, ?, ?)", rows)
+            self._set_meta("visitor_replies_imported", str(int(time.time())))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    # --------------------------------------------------------------- balayage
+
+    def _delete(self, event_ids: List[str]) -> bool:
+        """Supprime un lot d'événements de la base strfry."""
+        if not os.access(os.path.join(self.strfry_dir, "strfry"), os.X_OK):
+            return False
+        try:
+            with open(KIND1_LOG, "a") as log:
+                return subprocess.run(
+                    ["./strfry", "delete", "--filter", json.dumps({"ids": event_ids})],
+                    cwd=self.strfry_dir, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                    timeout=STRFRY_TIMEOUT,
+                ).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            return False
+
+    def _sweep(self, now: float) -> int:
+        deleted = 0
+        while True:
+            ids = [r[0] for r in self.conn.execute(
+                "SELECT event_id FROM scheduled WHERE due_at <= ? ORDER BY due_at LIMIT ?",
+                (now, self.batch))]
+            if not ids:
+                return deleted
+            marks = ",".join("?" * len(ids))
+            if not self._delete(ids):
+                self.conn.execute(
+                    f"UPDATE scheduled SET due_at = ?, attempts = attempts + 1 WHERE event_id IN ({marks})",
+                    [now + self.retry_delay] + ids)
+                return deleted
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(f"DELETE FROM scheduled WHERE event_id IN ({marks})", ids)
+                self._set_meta("deleted_total", str(int(self._meta("deleted_total") or 0) + len(ids)))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            deleted += len(ids)
+
+    def sweep(self, now: Optional[float] = None) -> Optional[int]:
+        """Supprime les réponses échues ; None si un autre balayeur est actif."""
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            try:
+                if not self._meta("visitor_replies_imported"):
+                    self._import_visitor_replies()
+                deleted = self._sweep(time.time() if now is None else now)
+                self._set_meta("swept_at", str(time.time()))
+                self._write_next()
+                return deleted
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, float]:
+        now = time.time() if now is None else now
+        scheduled, due, next_due = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(due_at <= ?), 0), MIN(due_at) FROM scheduled", (now,)).fetchone()
+        return {"scheduled": scheduled, "due": due, "next_due": next_due or 0,
+                "deleted_total": int(self._meta("deleted_total") or 0),
+                "swept_at": float(self._meta("swept_at") or 0)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    if not args or args[0] not in ("add", "sweep", "stats") or (args[0] == "add" and len(args) not in (3, 4)):
+        print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+        return 2
+    queue = ExpiryQueue()
+    try:
+        if args[0] == "add":
+            try:
+                due_at = float(args[2])
+            except ValueError:
+                print(f"Invalid due time: {args[2]}", file=sys.stderr)
+                return 2
+            print("scheduled" if queue.add(args[1], due_at, args[3] if len(args) == 4 else "") else "duplicate")
+        elif args[0] == "sweep":
+            deleted = queue.sweep()
+            print("busy" if deleted is None else f"{deleted} expired events deleted")
+        else:
+            print(json.dumps(queue.stats(), indent=2))
+        return 0
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""
+Filtres par kind exécutés dans le processus du moteur (ports de filter/$kind.sh).
+
+NIP101_SHELL_FILTERS="7,30078" force le script shell pour ces kinds ;
+NIP101_SHELL_FILTERS=all désactive tous les handlers Python.
+"""
+
+import os
+from typing import Optional
+
+from . import kind0, kind1, kind4, kind7, kind21, kind1984, kind9735, kind30023  # noqa: F401
+from . import kind22242, kind30303, kind30506, kind30508, kind30800, kind30904  # noqa: F401
+from .base import REGISTRY, FilterContext, FilterHandler, register
+
+__all__ = ["FilterContext", "FilterHandler", "REGISTRY", "get_handler", "register"]
+
+_SHELL_ONLY = os.environ.get("NIP101_SHELL_FILTERS", "")
+
+
+def get_handler(kind) -> Optional[FilterHandler]:
+    if _SHELL_ONLY == "all" or str(kind) in _SHELL_ONLY.split(","):
+        return None
+    try:
+        return REGISTRY.get(int(kind))
+    except (TypeError, ValueError):
+        return None
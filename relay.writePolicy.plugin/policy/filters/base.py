@@ -0,0 +1,120 @@
+"""
+Registre des filtres par kind et contexte passé aux handlers.
+
+Un handler reçoit l'événement déjà décodé (EventContext construit une fois
+par le moteur) et retourne True (accept) ou False
+(reject), comme le code de sortie de filter/$kind.sh. Les kinds sans handler
+continuent d'utiliser le script shell en sous-processus.
+
+Un handler peut ne calculer que le verdict et confier les effets de bord au
+script shell, exécuté plus tard par la file de travaux (ctx.defer()).
+S'il retourne None, le script shell est exécuté aussitôt et décide (cas
+rares laissés au shell).
+"""
+
+import os
+from typing import Callable, Dict, List, Optional
+
+from .. import config, logs
+from ..auth import Authorization, check_authorization, check_authorizations
+from ..event import EventContext, json_text
+from ..verdicts import Verdict
+
+
+def log_with_timestamp(path: str, message: str) -> None:
+    """Même format que log_with_timestamp() de common.sh (écriture tamponnée)."""
+    logs.writer().write(path, message)
+
+
+def logger(name: str) -> Callable[[str], None]:
+    """Fonction de log vers ~/.zen/tmp/<name> (log_zap, log_report…)."""
+    return logs.logger(os.path.join(config.TMP_DIR, name))
+
+
+class StagedLog:
+    """Lignes de log retenues, écrites seulement en cas de rejet : si l'événement
+    est accepté, le filtre shell différé les écrira lui-même."""
+
+    def __init__(self, log: Callable[[str], None]):
+        self._log = log
+        self.lines: List[str] = []
+
+    def __call__(self, message: str) -> None:
+        self.lines.append(message)
+
+    def flush(self) -> None:
+        for message in self.lines:
+            self._log(message)
+        self.lines = []
+
+
+class FilterContext:
+    """Événement décodé (partagé, jamais re-parsé) + accès au moteur pour un handler."""
+
+    def __init__(self, engine, event: EventContext, verdict: Verdict):
+        self.engine = engine
+        self.event_context = event
+        self.line = event.line
+        self.event = event.event
+        self.verdict = verdict
+        self.deferred = False
+        self.id = event.id
+        self.pubkey = event.pubkey
+        self.kind = event.kind
+        self.content = event.content
+        self.created_at = event.created_at
+        self._authorization = Authorization(bool(verdict.source), verdict.email, verdict.source)
+
+    def tags(self, name: str) -> List[str]:
+        return self.event_context.all(name)
+
+    def tag(self, name: str) -> str:
+        """Valeur laissée par extract_tags (dernière occurrence), vide si absente."""
+        return self.event_context.last(name)
+
+    def first_tag(self, name: str) -> str:
+        """Équivalent de `jq '.event.tags[] | select(.[0]==name) | .[1]' | head -1`."""
+        return self.event_context.first(name)
+
+    def content_json(self) -> dict:
+        """Content décodé (dict vide si ce n'est pas un objet JSON)."""
+        return self.event_context.content_json()
+
+    def authorize(self, pubkey: Optional[str] = None,
+                  log: Optional[Callable[[str], None]] = None) -> Authorization:
+        """check_authorization() pour l'auteur (verdict en cache) ou une autre clé."""
+        pubkey = self.pubkey if pubkey is None else pubkey
+        known = self._authorization if pubkey == self.pubkey else None
+        return check_authorization(self.engine.identities, pubkey, log, known)
+
+    def authorize_many(self, *pubkeys: str) -> Dict[str, Authorization]:
+        """check_authorizations() : une résolution pour toutes les clés (sans log,
+        voir log_authorization), verdict en cache pour l'auteur."""
+        known = {self.pubkey: self._authorization} if self._authorization.authorized else None
+        return check_authorizations(self.engine.identities, pubkeys, known)
+
+    def has_tag(self, name: str, value: str) -> bool:
+        return self.event_context.has(name, value)
+
+    def defer(self) -> None:
+        """Exécute filter/$kind.sh en arrière-plan (effets de bord), code de sortie ignoré."""
+        if not self.deferred:
+            self.deferred = True
+            self.engine.defer_filter(self)
+
+    def echo(self, message: str) -> None:
+        """Sortie standard du filtre shell (redirigée dans strfry.log)."""
+        self.engine.echo(message)
+
+
+FilterHandler = Callable[[FilterContext], Optional[bool]]
+
+REGISTRY: Dict[int, FilterHandler] = {}
+
+
+def register(*kinds: int) -> Callable[[FilterHandler], FilterHandler]:
+    def decorator(handler: FilterHandler) -> FilterHandler:
+        for kind in kinds:
+            REGISTRY[kind] = handler
+        return handler
+    return decorator
@@ -0,0 +1,45 @@
+"""Kind 0 — profils (port de filter/0.sh) : rejet des bots RSS, journal détaillé."""
+
+import re
+
+from .base import FilterContext, json_text, logger, register
+
+log = logger("nostr_kind0.log")
+
+RSS_NAME = re.compile(r"\(RSS Feed\)", re.IGNORECASE)
+RSS_NIP05 = re.compile(r"@atomstr\.data\.haus$", re.IGNORECASE)
+
+
+@register(0)
+def profile(ctx: FilterContext) -> bool:
+    profile = ctx.content_json()
+
+    def field(key: str) -> str:
+        return json_text(profile.get(key))
+
+    name, nip05 = field("name"), field("nip05")
+
+    if RSS_NAME.search(name):
+        log(f"REJECTED: RSS bot by name pattern: {name} (pubkey: {ctx.pubkey})")
+        return False
+    if nip05 and RSS_NIP05.search(nip05):
+        log(f"REJECTED: atomstr.data.haus RSS bot (nip05: {nip05}, pubkey: {ctx.pubkey})")
+        return False
+
+    # Kind 0 ouvert : tout profil étranger est accepté (le relay sert d'annuaire).
+    log("=== Profile update (kind 0) ===")
+    log(f"Pubkey: {ctx.pubkey}")
+    log(f"Event ID: {ctx.id}")
+    log(f"Created at: {json_text(ctx.created_at)}")
+    log(f"Name: {name}")
+    log(f"Display Name: {field('display_name')}")
+    log(f"About: {field('about')}")
+    log(f"Picture URL: {field('picture')}")
+    log(f"Picture 64: {field('picture_64')}")
+    log(f"Website: {field('website')}")
+    log(f"NIP-05: {nip05}")
+    log(f"G1PUB: {field('g1pub')}")
+    log(f"Full content: {ctx.content}")
+    log("================================")
+    log(f"ACCEPTED: pubkey {ctx.pubkey} (name: {name}, nip05: {nip05})")
+    return True
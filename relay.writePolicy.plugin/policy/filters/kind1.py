@@ -0,0 +1,86 @@
+"""
+Kind 1 — messages texte UPlanet (verdict de filter/1.sh).
+
+Classification (player / uplanet / nobody) et rejets (#secret, message de
+visiteur trop court) sont calculés ici ; mise en file des réponses IA
+(policy/iaqueue.py) et avertissements aux visiteurs restent dans 1.sh,
+exécuté en arrière-plan.
+"""
+
+import os
+import re
+
+from .. import config
+from .base import FilterContext, StagedLog, logger, register
+
+log = logger("nostr_kind1_messages.log")
+
+LAST_EVENT_FILE = os.path.join(config.STRFRY_DIR, "pubkey_counts", "lastevent")
+VISITOR_MIN_LENGTH = 50
+
+
+def classify(ctx: FilterContext, staged: StagedLog) -> str:
+    """player, uplanet ou nobody (classification propre à 1.sh)."""
+    identities = ctx.engine.identities
+    email = identities.get_key_email(ctx.pubkey)
+    if email:
+        if re.match(config.EMAIL_REGEX, email) or email == "CAPTAIN":
+            staged(f"Local NOSTR player account: {email}")
+            return "player"
+        staged(f"Local NOSTR UPlanet account: {email}")
+        return "uplanet"
+    if identities.has(ctx.pubkey, "amisOfAmis"):
+        staged(f"Pubkey {ctx.pubkey} is in amisOfAmis.txt, setting check to uplanet")
+        return "uplanet"
+    return "nobody"
+
+
+def read_last_event() -> str:
+    try:
+        with open(LAST_EVENT_FILE, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+@register(1)
+def text_note(ctx: FilterContext) -> bool:
+    staged = StagedLog(log)
+
+    g = ctx.tag("g")
+    if g:
+        # `cut -d',' -f1` / `-f2` : sans virgule, cut rend la ligne entière
+        fields = g.split(",")
+        lat, lon = fields[0].strip(), (fields[1] if len(fields) > 1 else g).strip()
+        staged(f"Extracted precise coordinates from 'g' tag: lat={lat}, lon={lon}")
+        if not ctx.tag("latitude") or not ctx.tag("longitude"):
+            staged(f"Extracted coordinates from 'g' tag: lat={lat}, lon={lon}")
+
+    check = classify(ctx, staged)
+
+    content = ctx.content
+    is_secret = "#secret" in content
+    if is_secret:
+        staged("SECRET message detected, will return 1 to reject event from relay")
+    if "#plantnet" in content:
+        staged("PLANTNET message detected - will be processed by UPlanet_IA_Responder.sh")
+
+    if check == "nobody":
+        if len(content) <= VISITOR_MIN_LENGTH:
+            staged(f"Message from nobody ({ctx.pubkey}) too short ({len(content)} chars), "
+                   "rejecting without response")
+            staged(f"Short message content: '{content}'")
+            staged.flush()
+            return False
+        # Avertissement, réponse BRO et limite de messages du visiteur
+        ctx.defer()
+        return True
+
+    if check == "player" and ("#BRO" in content or "#BOT" in content):
+        if read_last_event() == ctx.id:
+            return True
+        ctx.defer()
+        return not is_secret
+
+    # Autres messages autorisés : rien à faire dans 1.sh (la file IA a son propre répartiteur)
+    return True
@@ -0,0 +1,126 @@
+"""
+Kind 1984 — signalements NIP-56 (port de filter/1984.sh).
+
+report-type=friction ouvre un dossier de médiation WoTx² dans
+~/.zen/tmp/justice_pending/ et lance N1Mediation.sh en arrière-plan.
+"""
+
+import json
+import os
+import subprocess
+import time
+
+from .. import config, logs
+from ..auth import log_authorization
+from .base import FilterContext, log_with_timestamp, logger, register
+
+log = logger("nostr_reports.1984.log")
+JUSTICE_LOG = os.path.join(config.TMP_DIR, "justice_cases.log")
+PENDING_DIR = os.path.join(config.TMP_DIR, "justice_pending")
+MEDIATION_SCRIPT = os.path.join(config.ZEN_DIR, "Astroport.ONE", "ASTROBOT", "N1Mediation.sh")
+
+
+def _amount(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def open_friction_case(ctx: FilterContext, reporter_email: str, reported: str, reported_email: str) -> None:
+    amount = ctx.first_tag("friction-amount") or "0"
+    friction_object = ctx.first_tag("object")
+    # Seuil de niveau selon montant (barème mutualiste)
+    if _amount(amount) > 50:
+        level = "constellation"
+    elif _amount(amount) > 10:
+        level = "N2"
+    else:
+        level = "N1"
+
+    case_id = f"friction-{ctx.pubkey[:6]}-{reported[:6]}-{int(time.time())}"
+    os.makedirs(PENDING_DIR, exist_ok=True)
+    case_file = os.path.join(PENDING_DIR, f"{case_id}.json")
+    case = {
+        "case_id": case_id,
+        "plaignant": ctx.pubkey,
+        "plaignant_email": reporter_email,
+        "défendeur": reported,
+        "défendeur_email": reported_email,
+        "origin_event_id": ctx.id,
+        "amount_zen": int(_amount(amount)) if _amount(amount).is_integer() else _amount(amount),
+        "object_dtag": friction_object,
+        "reason": ctx.tag("reason"),
+        "level": level,
+        "status": f"{level}_ouvert",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(case_file, "w", encoding="utf-8") as f:
+        json.dump(case, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+    log(f"FRICTION: Dossier {case_id} créé (niveau {level}, montant: {amount}Ẑ)")
+    log_with_timestamp(JUSTICE_LOG, f"FRICTION {case_id} | plaignant:{ctx.pubkey[:8]} | défendeur:{reported[:8]}"
+                                    f" | level:{level} | amount:{amount}Ẑ | object:{friction_object}")
+
+    if not os.access(MEDIATION_SCRIPT, os.X_OK):
+        log(f"FRICTION: N1Mediation.sh absent — dossier en attente dans {PENDING_DIR}")
+        return
+    with logs.writer().stream(os.path.join(config.TMP_DIR, "nostr_kind30506.log")) as out:
+        proc = subprocess.Popen(["bash", MEDIATION_SCRIPT, case_file], stdin=subprocess.DEVNULL,
+                                stdout=out, stderr=subprocess.STDOUT, start_new_session=True)
+    log(f"FRICTION: N1Mediation.sh lancé (PID {proc.pid})")
+
+
+@register(1984)
+def report(ctx: FilterContext) -> bool:
+    reported = ctx.tag("p")
+    # Rapporteur et partie signalée résolus ensemble
+    auths = ctx.authorize_many(ctx.pubkey, reported)
+    reporter = auths[ctx.pubkey]
+    log_authorization(log, ctx.pubkey, reporter)
+    if not reporter.authorized:
+        return False
+
+    report_type = ctx.first_tag("report-type")
+    if not reported:
+        log("REJECTED: 'p' tag manquant (pubkey de la personne signalée)")
+        return False
+    if not report_type:
+        log("REJECTED: 'report-type' tag manquant")
+        return False
+
+    member = auths[reported]
+    log_authorization(log, reported, member)
+    if member.authorized:
+        log(f"REPORT: {ctx.pubkey[:8]}... signale {reported[:8]}... "
+            f"(membre UPlanet: {member.email} depuis {member.source})")
+    else:
+        log(f"REPORT: {ctx.pubkey[:8]}... signale utilisateur externe {reported[:8]}...")
+
+    reported_event_id, reason = ctx.tag("e"), ctx.tag("reason")
+    log(f"REPORT: Type: {report_type}")
+    if reported_event_id:
+        log(f"REPORT: Événement signalé: {reported_event_id[:8]}...")
+    if reason:
+        log(f"REPORT: Raison: {reason}")
+    if ctx.content:
+        log(f"REPORT: Détails: {ctx.content}")
+
+    if report_type in ("spam", "impersonation", "harassment", "illegal"):
+        log(f"URGENT: Rapport haute priorité: {report_type}")
+    elif report_type in ("fake", "scam", "phishing"):
+        log(f"WARNING: Rapport sécurité: {report_type}")
+    elif report_type == "friction":
+        # Protocole de médiation WoTx² N1/N2
+        log(f"FRICTION: Déclaration reçue de {ctx.pubkey[:8]}... contre {reported[:8]}...")
+        if member.authorized:
+            open_friction_case(ctx, reporter.email, reported, member.email)
+        else:
+            log(f"FRICTION: Pas de dossier N1 — {reported[:8]}... n'est pas membre UPlanet MULTIPASS")
+    else:
+        log(f"INFO: Type de rapport standard: {report_type}")
+
+    log(f"ACCEPTED: Rapport de {ctx.pubkey[:8]}... (Email: {reporter.email}, Source: {reporter.source})")
+    ctx.echo(f">>> (1984) REPORT: {ctx.pubkey[:8]}... → {reported[:8]}... ({report_type})")
+    return True
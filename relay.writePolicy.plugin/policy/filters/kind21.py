@@ -0,0 +1,14 @@
+"""
+Kinds 21 / 22 — vidéos NIP-71 (filter/21.sh, filter/22.sh).
+
+Toujours acceptées : journal, statistiques et suivi UMAP sont des effets de
+bord exécutés en arrière-plan par le script shell.
+"""
+
+from .base import FilterContext, register
+
+
+@register(21, 22)
+def video(ctx: FilterContext) -> bool:
+    ctx.defer()
+    return True
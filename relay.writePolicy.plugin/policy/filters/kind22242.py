@@ -0,0 +1,72 @@
+"""
+Kind 22242 — authentification NIP-42 (chemin rapide de filter/22242.sh).
+
+Clé locale avec répertoire MULTIPASS existant ou clé amisOfAmis : la session
+est enregistrée dans le magasin policy.authsessions (et le marqueur exporté
+selon NIP101_NIP42_MARKERS) sans lancer de shell. Les cas roaming (swarm,
+résolution kind 0, clé inconnue) et CAPTAIN retournent None : 22242.sh est
+alors exécuté de façon synchrone.
+"""
+
+import os
+from typing import Optional
+
+from .. import config
+from ..authsessions import MARKERS_ALL, NIP42_MARKERS, PUBKEY_DIR_PREFIX, default_store, write_marker
+from .base import FilterContext, StagedLog, logger, register
+
+log = logger("nostr.auth.22242.log")
+
+# Sources traitées par le shell (copie du contexte swarm, profil roaming)
+SHELL_SOURCES = ("swarm", "amisOfAmis_roaming")
+
+
+def _pubkey_dir(pubkey: str) -> Optional[str]:
+    """Répertoire .pubkey_<hex> de 22242.sh, créé seulement pour l'export complet."""
+    if NIP42_MARKERS != MARKERS_ALL:
+        return None
+    path = os.path.join(config.KEY_DIR, PUBKEY_DIR_PREFIX + pubkey)
+    os.makedirs(path, exist_ok=True)
+    for name, value in (("HEX", pubkey), ("SOURCE", "AMIS")):
+        with open(os.path.join(path, name), "w", encoding="utf-8") as f:
+            f.write(value + "\n")
+    return path
+
+
+@register(22242)
+def nip42_auth(ctx: FilterContext) -> Optional[bool]:
+    staged = StagedLog(log)
+    auth = ctx.authorize(log=staged)
+    if not auth.authorized or auth.source in SHELL_SOURCES or auth.email == "CAPTAIN":
+        return None
+    short = ctx.pubkey[:8]
+    email = auth.email if config.EMAIL_REGEX.match(auth.email or "") else ""
+    marker_dir = os.path.join(config.KEY_DIR, email) if email else None
+    if marker_dir and not os.path.isdir(marker_dir):
+        return None
+    staged.flush()
+
+    if auth.source == "amisOfAmis":
+        session = default_store().upsert(ctx.pubkey, ctx.id, source=auth.source)
+        write_marker(session, _pubkey_dir(ctx.pubkey))
+        log(f"ACCEPTED_AMIS: {short}... session pubkey-only enregistrée (whitelist amisOfAmis)")
+        return True
+
+    session = default_store().upsert(ctx.pubkey, ctx.id, email=email, source=auth.source)
+    if marker_dir:
+        try:
+            marker = write_marker(session, marker_dir)
+            if marker:
+                log(f"MARKER: Secure NIP-42 auth marker written for {email} → {os.path.basename(marker)}")
+        except OSError:
+            log(f"MARKER_WARN: Could not write NIP-42 auth marker for {email} (path: {marker_dir})")
+        legacy = os.path.join(marker_dir, ".nip42_auth")
+        if os.path.isfile(legacy):
+            try:
+                os.unlink(legacy)
+                log(f"CLEANUP: Removed legacy .nip42_auth marker for {email}")
+            except OSError:
+                pass
+    log(f"ACCEPTED: Kind 22242 event from {ctx.pubkey}... (event: {ctx.id[:16]}..., "
+        f"Email: {auth.email}, Source: {auth.source})")
+    return True
@@ -0,0 +1,15 @@
+"""Kind 30023 — articles longs (port de filter/30023.sh)."""
+
+from .base import FilterContext, register
+
+
+@register(30023)
+def article(ctx: FilterContext) -> bool:
+    auth = ctx.authorize()
+    if not auth.authorized:
+        ctx.echo(f">>> (30023) REJECTED: Blog article from unauthorized {ctx.pubkey[:8]}...")
+        return False
+    title = ctx.tag("title") or "'Untitled Article'"
+    article_id = ctx.tag("d") or "'no-id'"
+    ctx.echo(f">>> (30023) BLOG: {title} (ID: {article_id}) from {ctx.pubkey[:8]}... ({auth.email})")
+    return True
@@ -0,0 +1,22 @@
+"""Kinds 30303 (TrocZen BON) et 30500 (WoTx2 permit) — journal seul (filter/30303.sh, 30500.sh)."""
+
+from .base import FilterContext, logger, register
+
+TITLES = {
+    30303: ("nostr_kind30303.log", "=== TrocZen BON (kind 30303) ==="),
+    30500: ("nostr_kind30500.log", "=== WoTx2 — Définition permit (kind 30500) ==="),
+}
+LOGS = {kind: logger(name) for kind, (name, _) in TITLES.items()}
+
+
+@register(*TITLES)
+def log_only(ctx: FilterContext) -> bool:
+    log = LOGS[ctx.kind]
+    log(TITLES[ctx.kind][1])
+    log(f"Pubkey: {ctx.pubkey}")
+    log(f"Event ID: {ctx.id}")
+    log(f"Full content: {ctx.content}")
+    if ctx.engine.identities.has(ctx.pubkey, "amisOfAmis"):
+        log(f"Pubkey {ctx.pubkey} is in amisOfAmis.txt")
+    log("================================")
+    return True
@@ -0,0 +1,31 @@
+"""Kind 30506 — dossiers de médiation WoTx² (port de filter/30506.sh)."""
+
+from .base import FilterContext, logger, register
+
+log = logger("nostr_kind30506.log")
+
+
+@register(30506)
+def mediation_case(ctx: FilterContext) -> bool:
+    case_id, tag_t, case_status = ctx.tag("d"), ctx.tag("t"), ctx.tag("status")
+    log("=== Kind 30506 — Dossier médiation ===")
+    log(f"Pubkey    : {ctx.pubkey}")
+    log(f"Event ID  : {ctx.id}")
+    log(f"Case ID   : {case_id}")
+    log(f"Type      : {tag_t}")
+    log(f"Status    : {case_status}")
+
+    # Seuls les membres MULTIPASS (local, swarm ou amisOfAmis) peuvent créer des dossiers
+    if not ctx.authorize(log=log).authorized:
+        log("REJECTED: pubkey non autorisée pour Kind 30506")
+        return False
+    if tag_t != "friction":
+        log(f"REJECTED: Kind 30506 avec t='{tag_t}' — seul 'friction' est accepté")
+        return False
+    if not case_id.startswith("friction-"):
+        log(f"REJECTED: case_id invalide (doit commencer par 'friction-'): {case_id}")
+        return False
+
+    log(f"ACCEPTED: Dossier {case_id} ({case_status}) par {ctx.pubkey[:8]}...")
+    log("=======================================")
+    return True
@@ -0,0 +1,42 @@
+"""Kind 30508 — match vibratoire ATOM4LOVE (port de filter/30508.sh)."""
+
+import re
+
+from .base import FilterContext, json_text, logger, register
+
+log = logger("nostr_kind30508.log")
+
+HEX64 = re.compile(r"^[0-9a-f]{64}$")
+
+
+@register(30508)
+def vibration_match(ctx: FilterContext) -> bool:
+    partner = ctx.tag("d")
+    k_value = json_text(ctx.content_json().get("k"))
+    log("=== Kind 30508 — Match vibratoire A4L ===")
+    log(f"Pubkey    : {ctx.pubkey}")
+    log(f"Event ID  : {ctx.id}")
+    log(f"Partner   : {partner}")
+    log(f"k         : {k_value}")
+
+    if not ctx.authorize(log=log).authorized:
+        log("REJECTED: pubkey non autorisée pour Kind 30508")
+        return False
+    if not k_value:
+        log("REJECTED: champ k absent du content JSON")
+        return False
+    # Seuil super-cohérence cabine-33 : k ∈ [0.85, 1.0]
+    try:
+        in_range = 0.85 <= float(k_value) <= 1.0
+    except ValueError:
+        in_range = False
+    if not in_range:
+        log(f"REJECTED: k={k_value} hors seuil [0.85, 1.0]")
+        return False
+    if not HEX64.match(partner):
+        log(f"REJECTED: tag d (partner pubkey) invalide : '{partner}'")
+        return False
+
+    log(f"ACCEPTED: k={k_value} entre {ctx.pubkey[:8]}… et {partner[:8]}…")
+    log("=========================================")
+    return True
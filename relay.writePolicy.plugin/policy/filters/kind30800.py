@@ -0,0 +1,50 @@
+"""
+Kind 30800 — événements remplaçables UPlanet (port de filter/30800.sh).
+
+d=cooperative-config n'est accepté que de la clé uplanet.G1.nostr de la
+station (~/.zen/tmp/<IPFSNODEID>/UPLANET/G1HEX).
+"""
+
+import os
+
+from .. import config
+from .base import FilterContext, logger, register
+
+log = logger("nostr_30800.log")
+
+
+@register(30800)
+def uplanet_replaceable(ctx: FilterContext) -> bool:
+    d_tag = ctx.tag("d")
+    short = ctx.pubkey[:8]
+    log(f"KIND 30800: pubkey={short}... d={d_tag or repr('<none>')}")
+
+    if d_tag == "cooperative-config":
+        g1hex_file = os.path.join(config.TMP_DIR, ctx.engine.node_id, "UPLANET", "G1HEX")
+        try:
+            with open(g1hex_file, encoding="utf-8") as f:
+                expected = "".join(f.read().split())
+        except OSError:
+            expected = ""
+        if not expected:
+            # Relay pas encore initialisé : accepté avec avertissement
+            log(f"WARN: G1HEX not found ({g1hex_file}) — accepting (relay not initialized)")
+            ctx.echo(">>> (30800) WARN: cooperative-config accepted without G1HEX check (relay init pending)")
+            return True
+        if ctx.pubkey == expected:
+            log(f"ACCEPTED: cooperative-config from station G1 key {short}...")
+            ctx.echo(f">>> (30800) cooperative-config from {short}...")
+            return True
+        log(f"REJECTED: cooperative-config from unauthorized key {short}... (expected: {expected[:8]}...)")
+        ctx.echo(f">>> (30800) REJECTED: fake cooperative-config from {short}...")
+        return False
+
+    if d_tag == "did":
+        log(f"ACCEPTED: DID document from {short}...")
+        ctx.echo(f">>> (30800) DID from {short}...")
+        return True
+
+    # Compatibilité ascendante : autres valeurs de d acceptées
+    log(f"ACCEPTED: kind 30800 d='{d_tag or '<none>'}' from {short}... (forward compat)")
+    ctx.echo(f">>> (30800) kind 30800 d='{d_tag}' from {short}...")
+    return True
@@ -0,0 +1,101 @@
+"""
+Kind 30904 — campagnes de crowdfunding (verdict de filter/30904.sh).
+
+Autorisation et champs obligatoires sont vérifiés ici ; l'enregistrement du
+Bien dans amisOfAmis et la synchronisation des fichiers du projet restent
+dans 30904.sh, exécuté en arrière-plan une fois l'événement accepté.
+"""
+
+import hashlib
+from typing import Tuple
+
+from .. import crowdfunding
+from .base import FilterContext, StagedLog, json_text, logger, register
+
+log = logger("nostr_crowdfunding.log")
+
+
+def project_id_from_d(d_tag: str) -> str:
+    """CF-<8 premiers hex de md5("$d\\n") en majuscules>, comme `echo | md5sum`."""
+    return "CF-" + hashlib.md5((d_tag + "\n").encode()).hexdigest()[:8].upper()
+
+
+def bien_identity(ctx: FilterContext, log) -> Tuple[str, str]:
+    """(hex, g1pub) du Bien : content JSON bien_identity, puis tags i=g1pub: et p[3]=bien."""
+    content = ctx.content_json()
+    bien_hex = bien_g1pub = ""
+    if content.get("bien_identity") not in (None, False):
+        identity = content["bien_identity"]
+        identity = identity if isinstance(identity, dict) else {}
+        bien_hex = json_text(identity.get("hex"))
+        bien_g1pub = json_text(identity.get("g1pub"))
+        log("EXTRACTED: Bien identity from content JSON")
+
+    i_tag = ctx.first_tag("i")
+    if i_tag.startswith("g1pub:"):
+        g1pub_value = i_tag[len("g1pub:"):]
+        if not bien_g1pub:
+            bien_g1pub = g1pub_value
+            log("EXTRACTED: Bien g1pub from i tag")
+        elif bien_g1pub != g1pub_value:
+            log("WARNING: Bien g1pub mismatch between content JSON and i tag")
+
+    hex_from_tag = next((str(t[1]) for t in ctx.event.get("tags") or []
+                         if isinstance(t, list) and len(t) > 3 and t[0] == "p" and t[3] == "bien"), "")
+    if hex_from_tag:
+        if not bien_hex:
+            bien_hex = hex_from_tag
+            log("EXTRACTED: Bien hex from p tag")
+        elif bien_hex != hex_from_tag:
+            log("WARNING: Bien hex mismatch between content JSON and p tag")
+    return bien_hex, bien_g1pub
+
+
+@register(30904)
+def campaign(ctx: FilterContext) -> bool:
+    staged = StagedLog(log)
+
+    def reject(message: str) -> bool:
+        staged(f"REJECTED: {message}")
+        staged.flush()
+        return False
+
+    identities = ctx.engine.identities
+    local_email = identities.get_key_email(ctx.pubkey)
+    if local_email:
+        staged(f"AUTHORIZED: Campaign from local user {local_email}")
+    elif identities.has(ctx.pubkey, "amisOfAmis"):
+        staged(f"AUTHORIZED: Campaign from amisOfAmis {ctx.pubkey[:8]}...")
+    else:
+        bien_project = crowdfunding.is_crowdfunding_bien(ctx.pubkey)
+        if not bien_project:
+            ctx.echo(f">>> (30904) REJECTED: Campaign from unauthorized user {ctx.pubkey[:8]}...")
+            return reject(f"Crowdfunding campaign from unauthorized {ctx.pubkey[:8]}...")
+        staged(f"AUTHORIZED: Campaign update from Bien {bien_project}")
+
+    d_tag = ctx.tag("d")
+    # (valeur, message de log_cf, message sur stdout) dans l'ordre de 30904.sh
+    checks = (
+        (ctx.tag("title"), "Missing required 'title' tag", None),
+        (ctx.has_tag("t", "crowdfunding"), "Missing required ['t', 'crowdfunding'] tag", None),
+        (d_tag and project_id_from_d(d_tag), "Missing required 'project-id' tag", None),
+        (ctx.tag("g"), "Missing required 'g' tag (geographic coordinates)", "Missing required 'g' tag"),
+    )
+    for ok, message, echoed in checks:
+        if not ok:
+            ctx.echo(f">>> (30904) REJECTED: {echoed or message}")
+            return reject(message)
+
+    if not ctx.tag("ipfsnodeid") and not ctx.content_json().get("creator_node_id"):
+        staged("WARNING: Missing 'ipfsnodeid' tag - cannot prevent duplication")
+
+    bien_hex, bien_g1pub = bien_identity(ctx, staged)
+    if not bien_hex:
+        ctx.echo(">>> (30904) REJECTED: Missing required bien_identity.hex")
+        return reject("Missing required bien_identity.hex (Bien cannot receive payments)")
+    if not bien_g1pub:
+        ctx.echo(">>> (30904) REJECTED: Missing required bien_identity.g1pub")
+        return reject("Missing required bien_identity.g1pub (Bien wallet required)")
+
+    ctx.defer()
+    return True
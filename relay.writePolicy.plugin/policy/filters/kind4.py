@@ -0,0 +1,42 @@
+"""
+Kind 4 — DMs chiffrés (port de filter/4.sh).
+
+Toujours acceptés ; un DM adressé au NODE local (tag p = HEX de
+~/.zen/game/secret.nostr) est déposé dans ~/.zen/tmp/bro_dm_queue/ pour
+bro_dm_daemon.sh.
+"""
+
+import json
+import os
+import re
+import tempfile
+
+from .. import config
+from .base import FilterContext, register
+
+SECRET_FILE = os.path.join(config.ZEN_DIR, "game", "secret.nostr")
+QUEUE_DIR = os.path.join(config.TMP_DIR, "bro_dm_queue")
+
+
+def node_hex() -> str:
+    try:
+        with open(SECRET_FILE, encoding="utf-8", errors="replace") as f:
+            data = f.read()
+    except OSError:
+        return ""
+    return re.sub(r"\s", "", "".join(re.findall(r"HEX=([^;]+)", data)))
+
+
+@register(4)
+def direct_message(ctx: FilterContext) -> bool:
+    ctx.echo(json.dumps({"id": ctx.id, "action": "accept"}, separators=(",", ":")))
+    node = node_hex()
+    # Ne jamais enqueuer un DM envoyé PAR le NODE lui-même (boucle de réponses)
+    if len(node) != 64 or ctx.pubkey == node or node not in ctx.tags("p"):
+        return True
+    os.makedirs(QUEUE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=QUEUE_DIR, prefix=f"{ctx.id}_", suffix=".json.tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(ctx.line + "\n")
+    os.replace(tmp, os.path.join(QUEUE_DIR, f"{ctx.id}.json"))
+    return True
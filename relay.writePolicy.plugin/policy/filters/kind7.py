@@ -0,0 +1,76 @@
+"""
+Kind 7 — réactions NIP-25 / crowdfunding (verdict de filter/7.sh).
+
+Le verdict (autorisation, auto-like, tag e ou project-id) est calculé ici ;
+7.sh, exécuté en arrière-plan une fois l'événement accepté, dépose les
+paiements ZEN (relais roaming, contributions et votes compris) dans la file
+de policy/payments.py.
+"""
+
+from .. import crowdfunding
+from .base import FilterContext, StagedLog, logger, register
+
+log = logger("nostr_likes.log")
+
+# Motifs du `case` de 7.sh : "+[0-9]"* est entre guillemets, donc littéral
+LIKE_CONTENTS = ("", "+", "👍", "❤️", "♥️", "♥")
+LIKE_PREFIX = "+[0-9]"
+DISLIKE_CONTENTS = ("-", "👎", "💔")
+
+
+def is_like(content: str) -> bool:
+    return content in LIKE_CONTENTS or content.startswith(LIKE_PREFIX)
+
+
+def has_bien_wallet(project_id: str, reacted_author: str) -> bool:
+    """Un portefeuille Bien est trouvé (project-id, sinon auteur réagi)."""
+    wallet = crowdfunding.get_bien_wallet_info(project_id) if project_id else None
+    if wallet and wallet["g1pub"]:
+        return True
+    bien_project = crowdfunding.is_crowdfunding_bien(reacted_author) if reacted_author else ""
+    wallet = crowdfunding.get_bien_wallet_info(bien_project) if bien_project else None
+    return bool(wallet and wallet["g1pub"])
+
+
+@register(7)
+def reaction(ctx: FilterContext) -> bool:
+    # Même cache de 5 min que 7.sh : les Biens doivent être autorisés avant le contrôle
+    crowdfunding.sync_biens_to_amis(log)
+    staged = StagedLog(log)
+
+    if not ctx.authorize(log=staged).authorized:
+        staged.flush()
+        return False
+
+    reacted_event_id, reacted_author = ctx.tag("e"), ctx.tag("p")
+    if reacted_author and ctx.pubkey == reacted_author:
+        staged(f"REJECTED: Self-like detected - source {ctx.pubkey[:8]}... "
+               f"cannot like their own event {reacted_event_id[:8]}...")
+        staged.flush()
+        return False
+
+    # Lignes REACTION écrites par 7.sh avant la validation (les likes, eux,
+    # déclenchent les paiements : ils ne sont journalisés que par le script différé)
+    if ctx.content in DISLIKE_CONTENTS:
+        staged(f"REACTION: DISLIKE from {ctx.pubkey[:8]}... to event {reacted_event_id[:8]}...")
+    elif not is_like(ctx.content):
+        staged(f"REACTION: CUSTOM ({ctx.content}) from {ctx.pubkey[:8]}... to event {reacted_event_id[:8]}...")
+
+    # NIP-25 exige un tag e ; une contribution crowdfunding peut utiliser project-id
+    if not reacted_event_id:
+        project_id = ctx.first_tag("project-id")
+        is_crowdfunding = ctx.has_tag("t", "crowdfunding")
+        if is_crowdfunding and is_like(ctx.content):
+            # 7.sh repasse en like standard si aucun portefeuille Bien n'est trouvé
+            is_crowdfunding = has_bien_wallet(project_id, reacted_author)
+        if not is_crowdfunding:
+            staged("REJECTED: Missing required 'e' tag (reacted event ID)")
+            staged.flush()
+            return False
+        if not project_id:
+            staged("REJECTED: Crowdfunding requires either 'e' tag or 'project-id' tag")
+            staged.flush()
+            return False
+
+    ctx.defer()
+    return True
@@ -0,0 +1,46 @@
+"""Kind 9735 — reçus de zap (port de filter/9735.sh)."""
+
+from ..auth import log_authorization
+from .base import FilterContext, logger, register
+
+log = logger("nostr_zaps.9735.log")
+
+
+@register(9735)
+def zap_receipt(ctx: FilterContext) -> bool:
+    recipient = ctx.tag("p")
+    # Zappeur et destinataire résolus ensemble
+    auths = ctx.authorize_many(ctx.pubkey, recipient)
+    zapper = auths[ctx.pubkey]
+    log_authorization(log, ctx.pubkey, zapper)
+    if not zapper.authorized:
+        return False
+
+    if not recipient:
+        log("REJECTED: Zap missing required 'p' tag (recipient pubkey)")
+        return False
+    if not ctx.tag("bolt11"):
+        log("REJECTED: Zap missing required 'bolt11' tag (Lightning invoice)")
+        return False
+    if not ctx.tag("description"):
+        log("REJECTED: Zap missing required 'description' tag (Zap request)")
+        return False
+
+    member = auths[recipient]
+    log_authorization(log, recipient, member)
+    if member.authorized:
+        log(f"ZAP: {ctx.pubkey[:8]}... zapped {recipient[:8]}... "
+            f"(UPlanet member: {member.email} from {member.source})")
+    else:
+        log(f"ZAP: {ctx.pubkey[:8]}... zapped external user {recipient[:8]}...")
+
+    zapped_event_id, amount = ctx.tag("e"), ctx.tag("amount")
+    if zapped_event_id:
+        log(f"ZAP: Event being zapped: {zapped_event_id[:8]}...")
+    if amount:
+        log(f"ZAP: Amount: {amount} millisatoshis")
+
+    log(f"ACCEPTED: Zap from {ctx.pubkey[:8]}... to {recipient[:8]}... "
+        f"(Email: {zapper.email}, Source: {zapper.source})")
+    ctx.echo(f">>> (9735) ZAP: {ctx.pubkey[:8]}... → {recipient[:8]}... ({amount or 'unknown'} msat)")
+    return True
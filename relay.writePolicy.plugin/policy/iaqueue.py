@@ -0,0 +1,423 @@
+"""
+File de travaux de UPlanet_IA_Responder.sh (messages #BRO / #BOT de filter/1.sh).
+
+1.sh décidait avec `pgrep` si le répondeur tournait, écrivait sinon un
+fichier par pubkey dans ~/.zen/tmp/uplanet_queue (compté par `ls | wc -l`),
+tuait les répondeurs bloqués via `ps`/`date` + `kill -9`, n'exécutait qu'un
+travail à la fois et perdait les messages au-delà de MAX_QUEUE_SIZE.
+
+Les travaux sont maintenant dans ~/.zen/tmp/ia_queue.sqlite :
+
+- mise en file atomique (`python3 -m policy.iaqueue enqueue …`), clé
+  primaire = event id (un filtre relancé ne répond pas deux fois) ; un
+  nouveau message d'une pubkey remplace son travail encore en attente
+  (comme l'ancien fichier par pubkey) ;
+- priorités : #BRO/#BOT (0) avant #secret (1) avant #plantnet (2), puis
+  ordre d'arrivée ;
+- contre-pression : au-delà de IA_QUEUE_MAX travaux en attente, le moins
+  prioritaire (le plus récent à priorité égale) est abandonné — le nouveau
+  s'il n'est pas plus prioritaire ;
+- un répartiteur unique (verrou ia_queue.lock, lancé par `enqueue` et arrêté
+  quand la file est vide) exécute IA_WORKERS répondeurs en parallèle, chacun
+  dans son groupe de processus : au bout de IA_TIMEOUT secondes le groupe
+  reçoit SIGTERM puis SIGKILL, sans balayage `pgrep` ;
+- un travail resté « running » après un arrêt brutal n'est pas relancé (la
+  réponse a pu partir) : il passe en « interrupted ».
+
+Les arguments du répondeur contiennent le message (y compris #secret) : ils
+sont effacés dès qu'un travail quitte pending / running ; la base est en
+secure_delete et le WAL est vidé (checkpoint TRUNCATE) à la fin de chaque
+passage du répartiteur. Seules les métadonnées (statut, durées) restent
+IA_QUEUE_RETENTION secondes pour les stats.
+
+Profondeur de file, attente et durée d'exécution sont exportées dans
+~/.zen/tmp/policy/ia_queue.prom.
+
+Usage en ligne de commande :
+    python3 -m policy.iaqueue enqueue --event ID --pubkey HEX [--class bro|secret|plantnet] -- ARGS...
+    python3 -m policy.iaqueue work
+    python3 -m policy.iaqueue stats
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from . import config, logs
+from .metrics import Metrics
+
+IA_QUEUE_DB = os.path.join(config.TMP_DIR, "ia_queue.sqlite")
+IA_QUEUE_LOCK = IA_QUEUE_DB[:-len(".sqlite")] + ".lock"
+IA_QUEUE_METRICS_FILE = os.path.join(config.POLICY_DIR, "ia_queue.prom")
+IA_LOG = os.path.join(config.TMP_DIR, "IA.log")
+KIND1_LOG = os.path.join(config.TMP_DIR, "nostr_kind1_messages.log")
+RESPONDER = os.path.join(config.ZEN_DIR, "Astroport.ONE", "IA", "UPlanet_IA_Responder.sh")
+
+IA_WORKERS = int(os.environ.get("NIP101_IA_WORKERS", "2"))
+IA_TIMEOUT = float(os.environ.get("NIP101_IA_TIMEOUT", "300"))
+IA_QUEUE_MAX = int(os.environ.get("NIP101_IA_QUEUE_MAX", "20"))
+# Délai entre SIGTERM et SIGKILL d'un répondeur hors délai
+IA_KILL_GRACE = 5.0
+# Un worker inactif recherche un travail à cet intervalle tant qu'un autre tourne
+IA_POLL_INTERVAL = 0.5
+# Les travaux terminés (sans leur message) sont gardés une semaine (stats, métriques)
+IA_QUEUE_RETENTION = float(os.environ.get("NIP101_IA_QUEUE_RETENTION", str(7 * 86400)))
+
+PRIORITIES = {"bro": 0, "secret": 1, "plantnet": 2}
+CLASSES = {v: k for k, v in PRIORITIES.items()}
+
+PENDING, RUNNING, DONE, FAILED, TIMEOUT = "pending", "running", "done", "failed", "timeout"
+SUPERSEDED, DROPPED, INTERRUPTED = "superseded", "dropped", "interrupted"
+QUEUED, REPLACED, DUPLICATE, FULL = "queued", "replaced", "duplicate", "full"
+
+# Arguments d'un travail terminé : le message n'est pas conservé
+NO_ARGS = "[]"
+
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+RUN_BUCKETS = (1.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 180.0, 300.0, 600.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    event_id    TEXT PRIMARY KEY,
+    pubkey      TEXT NOT NULL,
+    priority    INTEGER NOT NULL,
+    args        TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    started_at  REAL,
+    finished_at REAL,
+    exit_code   INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, enqueued_at);
+CREATE INDEX IF NOT EXISTS jobs_pubkey ON jobs (pubkey, status);
+"""
+
+log = logs.logger(KIND1_LOG)
+
+
+class Job(NamedTuple):
+    event_id: str
+    pubkey: str
+    priority: int
+    args: List[str]
+    enqueued_at: float
+
+
+class IAQueue:
+    """Travaux du répondeur IA ; `work` est exécuté par un seul processus à la fois."""
+
+    def __init__(self, path: str = IA_QUEUE_DB, lock_path: str = IA_QUEUE_LOCK, workers: int = IA_WORKERS,
+                 timeout: float = IA_TIMEOUT, max_pending: int = IA_QUEUE_MAX, command: str = RESPONDER,
+                 log: Callable[[str], None] = log):
+        self.path = path
+        self.lock_path = lock_path
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_pending = max(1, max_pending)
+        self.command = command
+        self.log = log
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Partagée par les threads du répartiteur, sous self._db_lock
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Messages effacés réellement écrasés dans le fichier
+        self.conn.execute("PRAGMA secure_delete=ON")
+        self.conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # ---------------------------------------------------------------- enqueue
+
+    def enqueue(self, job: Job) -> str:
+        """QUEUED, REPLACED (travail en attente de la même pubkey remplacé),
+        DUPLICATE (event déjà connu) ou FULL (abandonné, file pleine)."""
+        result = QUEUED
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.conn.execute("SELECT 1 FROM jobs WHERE event_id = ?", (job.event_id,)).fetchone():
+                self.conn.execute("COMMIT")
+                return DUPLICATE
+            if self.conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, args = ? WHERE pubkey = ? AND status = ?",
+                    (SUPERSEDED, job.enqueued_at, NO_ARGS, job.pubkey, PENDING)).rowcount:
+                result = REPLACED
+            status = PENDING
+            depth = self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (PENDING,)).fetchone()[0]
+            if depth >= self.max_pending:
+                worst = self.conn.execute(
+                    "SELECT event_id, priority FROM jobs WHERE status = ? "
+                    "ORDER BY priority DESC, enqueued_at DESC LIMIT 1", (PENDING,)).fetchone()
+                if worst[1] > job.priority:
+                    self.conn.execute("UPDATE jobs SET status = ?, finished_at = ?, args = ? WHERE event_id = ?",
+                                      (DROPPED, job.enqueued_at, NO_ARGS, worst[0]))
+                    self.log(f"IA_QUEUE: queue full, dropped lower priority job {worst[0][:8]}...")
+                else:
+                    status, result = DROPPED, FULL
+            self.conn.execute(
+                "INSERT INTO jobs (event_id, pubkey, priority, args, enqueued_at, status, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.event_id, job.pubkey, job.priority, json.dumps(job.args) if status == PENDING else NO_ARGS,
+                 job.enqueued_at, status, job.enqueued_at if status == DROPPED else None))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def pending(self) -> int:
+        with self._db_lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def worker_running(self) -> bool:
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return False
+
+    def spawn_worker(self) -> None:
+        """Lance `work` en arrière-plan (détaché) s'il ne tourne pas déjà."""
+        if self.worker_running():
+            return
+        env = dict(os.environ)
+        env["PYTHONPATH"] = config.PLUGIN_DIR + (":" + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+        subprocess.Popen([sys.executable, "-m", "policy.iaqueue", "work"], cwd=config.PLUGIN_DIR, env=env,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+
+    # ------------------------------------------------------------------- work
+
+    def work(self) -> int:
+        """Exécute les travaux jusqu'à ce que la file soit vide. Retourne le
+        nombre de travaux exécutés, 0 si un autre répartiteur tourne."""
+        executed = 0
+        while True:
+            with open(self.lock_path, "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return executed
+                try:
+                    self._recover()
+                    executed += self._drain()
+                    self._prune()
+                    self.write_metrics()
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            # Un enqueue arrivé pendant la libération du verrou n'a pas relancé de répartiteur
+            if not self.pending():
+                return executed
+
+    def _recover(self) -> None:
+        with self._db_lock:
+            stale = self.conn.execute("UPDATE jobs SET status = ?, finished_at = ?, args = ? WHERE status = ?",
+                                      (INTERRUPTED, time.time(), NO_ARGS, RUNNING)).rowcount
+        if stale:
+            self.log(f"IA_QUEUE: ⚠️ {stale} job(s) interrupted by a previous stop — not restarted")
+
+    def _drain(self) -> int:
+        """IA_WORKERS threads ; un thread sans travail attend tant qu'un autre
+        tourne (un enqueue peut arriver entre-temps), puis s'arrête."""
+        state = {"active": 0, "done": 0}
+        cond = threading.Condition()
+
+        def worker() -> None:
+            while True:
+                job = self._claim()
+                if job is None:
+                    with cond:
+                        if not state["active"]:
+                            cond.notify_all()
+                            return
+                        cond.wait(IA_POLL_INTERVAL)
+                    continue
+                with cond:
+                    state["active"] += 1
+                try:
+                    self._execute(job)
+                finally:
+                    with cond:
+                        state["active"] -= 1
+                        state["done"] += 1
+                        cond.notify_all()
+
+        threads = [threading.Thread(target=worker, name=f"ia-worker-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return state["done"]
+
+    def _claim(self) -> Optional[Job]:
+        with self._db_lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT event_id, pubkey, priority, args, enqueued_at FROM jobs WHERE status = ? "
+                    "ORDER BY priority, enqueued_at LIMIT 1", (PENDING,)).fetchone()
+                if row is not None:
+                    self.conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE event_id = ?",
+                                      (RUNNING, time.time(), row[0]))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Job(row[0], row[1], row[2], json.loads(row[3]), row[4])
+
+    def _finish(self, job: Job, status: str, exit_code: int) -> None:
+        with self._db_lock:
+            self.conn.execute("UPDATE jobs SET status = ?, exit_code = ?, finished_at = ?, args = ? "
+                              "WHERE event_id = ?", (status, exit_code, time.time(), NO_ARGS, job.event_id))
+
+    def _execute(self, job: Job) -> None:
+        label = CLASSES.get(job.priority, str(job.priority))
+        self.log(f"IA_QUEUE: processing {label} job {job.event_id[:8]}... for {job.pubkey[:8]}... "
+                 f"(waited {time.time() - job.enqueued_at:.1f}s)")
+        code = self._run([self.command] + job.args)
+        status = DONE if code == 0 else TIMEOUT if code == 124 else FAILED
+        self._finish(job, status, code)
+        if status != DONE:
+            self.log(f"IA_QUEUE: job {job.event_id[:8]}... {status} (exit code: {code})")
+
+    def _run(self, command: List[str]) -> int:
+        """Répondeur dans son propre groupe de processus, tué en entier après self.timeout."""
+        with logs.writer().stream(IA_LOG) as out:
+            try:
+                proc = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT,
+                                        start_new_session=True)
+            except OSError:
+                return 127
+            try:
+                return proc.wait(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                for sig, grace in ((signal.SIGTERM, IA_KILL_GRACE), (signal.SIGKILL, None)):
+                    try:
+                        os.killpg(proc.pid, sig)
+                    except OSError:
+                        break
+                    try:
+                        proc.wait(timeout=grace)
+                        break
+                    except subprocess.TimeoutExpired:
+                        continue
+                proc.wait()
+                return 124
+
+    def _prune(self, now: Optional[float] = None) -> None:
+        cutoff = (time.time() if now is None else now) - IA_QUEUE_RETENTION
+        with self._db_lock:
+            self.conn.execute("DELETE FROM jobs WHERE status NOT IN (?, ?) AND finished_at < ?",
+                              (PENDING, RUNNING, cutoff))
+            # Lignes terminées écrites avant l'effacement des arguments
+            self.conn.execute("UPDATE jobs SET args = ? WHERE status NOT IN (?, ?) AND args != ?",
+                              (NO_ARGS, PENDING, RUNNING, NO_ARGS))
+            # Les anciennes versions des lignes restent dans le WAL jusqu'au checkpoint
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    # ---------------------------------------------------------------- metrics
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            by_status = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+            depth = {CLASSES.get(p, str(p)): n for p, n in self.conn.execute(
+                "SELECT priority, COUNT(*) FROM jobs WHERE status = ? GROUP BY priority", (PENDING,))}
+            wait = self.conn.execute(
+                "SELECT AVG(started_at - enqueued_at), MAX(started_at - enqueued_at) FROM jobs "
+                "WHERE started_at IS NOT NULL").fetchone()
+            oldest = self.conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = ?",
+                                       (PENDING,)).fetchone()[0]
+        return {
+            "jobs": by_status,
+            "depth": depth,
+            "avg_wait_seconds": round(wait[0] or 0, 3),
+            "max_wait_seconds": round(wait[1] or 0, 3),
+            "oldest_pending_seconds": round(time.time() - oldest, 3) if oldest else 0,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+        }
+
+    def metrics(self) -> Metrics:
+        metrics = Metrics(prefix="nip101_ia_queue")
+        metrics.describe("depth", "Pending IA responder jobs by class")
+        metrics.describe("running", "IA responder jobs currently running")
+        metrics.describe("wait_seconds", "Delay between enqueue and start, per job", WAIT_BUCKETS)
+        metrics.describe("run_seconds", "IA responder run time, per job", RUN_BUCKETS)
+        metrics.describe("jobs_total", "IA responder jobs by class and final status")
+        with self._db_lock:
+            rows = self.conn.execute(
+                "SELECT priority, status, enqueued_at, started_at, finished_at FROM jobs").fetchall()
+        for cls in PRIORITIES:
+            metrics.set("depth", 0, **{"class": cls})
+        metrics.set("running", 0)
+        for priority, status, enqueued_at, started_at, finished_at in rows:
+            cls = CLASSES.get(priority, str(priority))
+            if status == PENDING:
+                metrics.inc("depth", 1, **{"class": cls})
+                continue
+            if status == RUNNING:
+                metrics.inc("running", 1)
+                continue
+            metrics.inc("jobs_total", 1, status=status, **{"class": cls})
+            if started_at is not None:
+                metrics.observe("wait_seconds", started_at - enqueued_at, **{"class": cls})
+                if finished_at is not None:
+                    metrics.observe("run_seconds", finished_at - started_at, status=status, **{"class": cls})
+        return metrics
+
+    def write_metrics(self, path: str = IA_QUEUE_METRICS_FILE) -> None:
+        try:
+            self.metrics().write(path)
+        except OSError as e:
+            self.log(f"IA_QUEUE: metrics export failed: {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python3 -m policy.iaqueue",
+                                     description="Job queue for UPlanet_IA_Responder.sh")
+    sub = parser.add_subparsers(dest="command")
+    enqueue = sub.add_parser("enqueue")
+    enqueue.add_argument("--event", required=True)
+    enqueue.add_argument("--pubkey", required=True)
+    enqueue.add_argument("--class", dest="cls", choices=sorted(PRIORITIES, key=PRIORITIES.get), default="bro")
+    enqueue.add_argument("args", nargs=argparse.REMAINDER, help="UPlanet_IA_Responder.sh arguments (after --)")
+    sub.add_parser("work")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        parser.print_usage(sys.stderr)
+        return 2
+    queue = IAQueue()
+    try:
+        if args.command == "work":
+            print(f"{queue.work()} jobs executed")
+            return 0
+        if args.command == "stats":
+            print(json.dumps(queue.stats(), indent=2))
+            return 0
+        responder_args = args.args[1:] if args.args[:1] == ["--"] else args.args
+        print(queue.enqueue(Job(args.event, args.pubkey, PRIORITIES[args.cls], responder_args, time.time())))
+        queue.spawn_worker()
+        return 0
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Index en mémoire pubkey → identité (email, source, répertoire MULTIPASS).
+
+Regroupe les recherches que filter/common.sh faisait par grep sur chaque appel :
+
+    local       ~/.zen/game/nostr/<email>/HEX                (get_key_email)
+    swarm       ~/.zen/tmp/swarm/*/TW/<email>/HEX            (search_swarm_for_pubkey)
+                ~/.zen/tmp/<IPFSNODEID>/TW/<email>/HEX
+    atom4love_certified  ~/.zen/strfry/atom4love_certified.txt  (pubkey:created_at)
+    amisOfAmis  ~/.zen/strfry/amisOfAmis.txt + swarm/*/amisOfAmis.txt
+    swarm_node  ~/.zen/tmp/<IPFSNODEID>/HEX + swarm/*/HEX     (check_swarm_node_hex)
+    captain     ~/.zen/tmp/swarm/*/HEX_CAPTAIN
+
+Le rafraîchissement est incrémental (polling des mtime) : un répertoire n'est
+relu que si son mtime a changé, un fichier n'est reparsé que si son mtime ou
+sa taille ont changé, et seules ses clés sont retirées / ajoutées à l'index.
+
+Les filtres qui écrivent une source (amisOfAmis.txt, atom4love_certified.txt,
+index des certificats, répertoire MULTIPASS roaming) touchent
+IDENTITY_SIGNAL_FILE (signal_change, signal_identity_change dans common.sh) :
+le moteur relit ses index après un tel filtre au lieu d'attendre l'intervalle.
+
+L'index peut être exporté en TSV trié (pubkey, source, email, répertoire) pour
+les filtres shell lancés par le moteur (variable NIP101_IDENTITY_INDEX).
+"""
+
+import fnmatch
+import os
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from . import config
+
+# Ordre de priorité = ordre de check_authorization() puis de check_swarm_node_hex()
+SOURCES = ("local", "swarm", "atom4love_certified", "amisOfAmis", "swarm_node", "captain")
+SOURCE_RANK = {source: rank for rank, source in enumerate(SOURCES)}
+
+
+def signal_change(path: str = config.IDENTITY_SIGNAL_FILE) -> None:
+    """Signale au moteur qu'une source d'identité vient d'être modifiée."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a"):
+        os.utime(path)
+
+
+def signal_mtime(path: str = config.IDENTITY_SIGNAL_FILE) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class Identity(NamedTuple):
+    pubkey: str
+    source: str
+    email: str
+    directory: str
+
+
+class _Source:
+    """Un motif de fichiers (glob à profondeur fixe) alimentant une source de l'index."""
+
+    def __init__(self, source: str, pattern: str, email_from_dir: bool, separator: Optional[str] = None):
+        self.source = source
+        self.pattern = pattern
+        self.email_from_dir = email_from_dir
+        self.separator = separator
+
+    def key(self, line: str) -> str:
+        return line.split(self.separator, 1)[0] if self.separator else line
+
+    def identity(self, pubkey: str, path: str) -> Identity:
+        directory = os.path.dirname(path)
+        if self.source == "amisOfAmis":
+            return Identity(pubkey, self.source, "amisOfAmis", "")
+        if self.source == "atom4love_certified":
+            return Identity(pubkey, self.source, "atom4love", "")
+        email = os.path.basename(directory) if self.email_from_dir else ""
+        return Identity(pubkey, self.source, email, directory)
+
+
+def default_sources(node_id: str = "") -> List[_Source]:
+    sources = [
+        _Source("local", os.path.join(config.KEY_DIR, "*", "HEX"), True),
+        _Source("swarm", os.path.join(config.SWARM_DIR, "*", "TW", "*", "HEX"), True),
+    ]
+    if node_id:
+        sources.append(_Source("swarm", os.path.join(config.TMP_DIR, node_id, "TW", "*", "HEX"), True))
+    sources += [
+        _Source("atom4love_certified", config.ATOM4LOVE_CERTIFIED_FILE, False, separator=":"),
+        _Source("amisOfAmis", config.AMIS_OF_AMIS_FILE, False),
+        _Source("amisOfAmis", os.path.join(config.SWARM_DIR, "*", "amisOfAmis.txt"), False),
+    ]
+    if node_id:
+        sources.append(_Source("swarm_node", os.path.join(config.TMP_DIR, node_id, "HEX"), False))
+    sources += [
+        _Source("swarm_node", os.path.join(config.SWARM_DIR, "*", "HEX"), False),
+        _Source("captain", os.path.join(config.SWARM_DIR, "*", "HEX_CAPTAIN"), False),
+    ]
+    return sources
+
+
+class IdentityIndex:
+    """Index des identités connues, rafraîchi au plus une fois par `interval` secondes."""
+
+    def __init__(self, sources: Optional[List[_Source]] = None,
+                 interval: float = config.REFRESH_INTERVAL, node_id: Optional[str] = None):
+        if sources is None:
+            sources = default_sources(config.load_ipfs_node_id() if node_id is None else node_id)
+        self.sources = sources
+        self.interval = interval
+        # path -> (signature, clés, _Source)
+        self._files: Dict[str, Tuple[Tuple[int, int], Set[str], _Source]] = {}
+        # pubkey -> {(source, path): Identity}
+        self._by_key: Dict[str, Dict[Tuple[str, str], Identity]] = {}
+        # dir -> (mtime_ns, noms)
+        self._listings: Dict[str, Tuple[int, List[str]]] = {}
+        self._checked_at = 0.0
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.files_parsed = 0
+        self.refresh_seconds_total = 0.0
+        self.last_refresh_seconds = 0.0
+
+    # ---------------------------------------------------------------- discovery
+
+    def _listdir(self, path: str) -> List[str]:
+        """listdir mis en cache tant que le mtime du répertoire ne change pas."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._listings.pop(path, None)
+            return []
+        cached = self._listings.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            names = sorted(os.listdir(path))
+        except OSError:
+            names = []
+        self._listings[path] = (mtime, names)
+        return names
+
+    def _expand(self, pattern: str) -> List[str]:
+        parts = pattern.strip(os.sep).split(os.sep)
+        paths = [os.sep]
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            matched = []
+            for base in paths:
+                if "*" in part or "?" in part or "[" in part:
+                    candidates = [os.path.join(base, n) for n in self._listdir(base)
+                                  if fnmatch.fnmatchcase(n, part) and not n.startswith(".")]
+                else:
+                    candidates = [os.path.join(base, part)]
+                matched.extend(c for c in candidates if last or os.path.isdir(c))
+            paths = matched
+        return paths
+
+    # ------------------------------------------------------------------ refresh
+
+    def _drop(self, path: str) -> None:
+        _, keys, source = self._files.pop(path)
+        for key in keys:
+            entries = self._by_key.get(key)
+            if entries is not None:
+                entries.pop((source.source, path), None)
+                if not entries:
+                    del self._by_key[key]
+
+    def _load(self, path: str, signature: Tuple[int, int], source: _Source) -> None:
+        keys: Set[str] = set()
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    key = source.key(line.strip())
+                    if key and not key.startswith("#"):
+                        keys.add(key)
+        except OSError:
+            return
+        self.files_parsed += 1
+        for key in keys:
+            self._by_key.setdefault(key, {})[(source.source, path)] = source.identity(key, path)
+        self._files[path] = (signature, keys, source)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Applique les changements de fichiers. Retourne True si l'index a changé."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.interval:
+            return False
+        self._checked_at = now
+        started = time.perf_counter()
+
+        seen: Set[str] = set()
+        changed = False
+        for source in self.sources:
+            for path in self._expand(source.pattern):
+                if path in seen:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                signature = (st.st_mtime_ns, st.st_size)
+                known = self._files.get(path)
+                if known and known[0] == signature:
+                    continue
+                if known:
+                    self._drop(path)
+                self._load(path, signature, source)
+                changed = True
+        for path in [p for p in self._files if p not in seen]:
+            self._drop(path)
+            changed = True
+
+        self.last_refresh_seconds = time.perf_counter() - started
+        self.refresh_seconds_total += self.last_refresh_seconds
+        self.refreshes += 1
+        if changed:
+            self.version += 1
+        return changed
+
+    def mark_stale(self) -> None:
+        """Force une vérification des fichiers au prochain accès (source modifiée)."""
+        self._checked_at = 0.0
+
+    # ------------------------------------------------------------------ queries
+
+    def identities(self, pubkey: str) -> List[Identity]:
+        """Toutes les appartenances de `pubkey`, par priorité de source puis chemin."""
+        self.refresh()
+        entries = self._by_key.get(pubkey)
+        if not entries:
+            self.misses += 1
+            return []
+        self.hits += 1
+        return [entries[k] for k in sorted(entries, key=lambda k: (SOURCE_RANK[k[0]], k[1]))]
+
+    def lookup(self, pubkey: str, source: Optional[str] = None) -> Optional[Identity]:
+        """Meilleure identité de `pubkey` (ou la première pour `source`), None si inconnue."""
+        for identity in self.identities(pubkey):
+            if source is None or identity.source == source:
+                return identity
+        return None
+
+    def has(self, pubkey: str, *sources: str) -> bool:
+        return any(i.source in sources for i in self.identities(pubkey))
+
+    def get_key_email(self, pubkey: str) -> str:
+        identity = self.lookup(pubkey, "local")
+        return identity.email if identity else ""
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "keys": len(self._by_key),
+            "files": len(self._files),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "files_parsed": self.files_parsed,
+            "refresh_seconds_total": round(self.refresh_seconds_total, 6),
+            "last_refresh_seconds": round(self.last_refresh_seconds, 6),
+        }
+
+    # ------------------------------------------------------------------- export
+
+    def export(self, path: str) -> None:
+        """Écrit l'index trié en TSV (pubkey, source, email, répertoire), atomiquement."""
+        rows = []
+        for pubkey, entries in self._by_key.items():
+            for (source, file_path), identity in entries.items():
+                rows.append((pubkey, SOURCE_RANK[source], file_path, identity))
+        rows.sort()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for _, _, _, i in rows:
+                f.write(f"{i.pubkey}\t{i.source}\t{i.email}\t{i.directory}\n")
+        os.replace(tmp, path)
@@ -0,0 +1,266 @@
+"""
+File de travaux durable pour les effets de bord des filtres.
+
+Le verdict accept / reject est rendu à strfry dès que l'autorisation et la
+validation sont faites ; le reste (paiements ZEN, réponses IA, stats vidéo,
+synchronisation des projets…) est déposé ici et exécuté par un pool borné
+de threads.
+
+Chaque travail est un fichier JSON :
+
+    ~/.zen/tmp/policy/jobs/pending/<échéance ms>-<id>.json   en attente
+    ~/.zen/tmp/policy/jobs/running/<même nom>               en cours
+    ~/.zen/tmp/policy/jobs/failed/<même nom>                abandonné
+
+Sémantique « au moins une fois » : un travail n'est supprimé qu'après
+succès ; ceux restés dans running/ (arrêt brutal) sont remis en attente au
+démarrage. Un échec est retenté avec un délai exponentiel jusqu'à
+JOB_MAX_ATTEMPTS, puis déplacé dans failed/.
+
+Deux travaux d'une même voie (`lane`) ne s'exécutent jamais en même temps.
+Le moteur donne à chaque filtre shell différé sa voie ("filter/1.sh",
+"filter/7.sh"…) : deux événements du même kind ne modifient jamais en même
+temps les fichiers propres au script (lastevent, warning, données de projet),
+tandis que les autres kinds avancent sur les autres workers. Les fichiers
+communs à plusieurs scripts (amisOfAmis.txt) sont écrits sous flock
+(add_to_amis_of_amis).
+
+La file est bornée (JOB_MAX_PENDING travaux en attente, retentatives
+comprises) : au-delà, submit() abandonne le travail et retourne None
+(compteur `dropped`). La boucle de verdict n'attend jamais un travail.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import config
+
+JobHandler = Callable[[dict], bool]
+
+PENDING, RUNNING, FAILED = "pending", "running", "failed"
+
+
+class WorkQueue:
+    """Travaux persistés sur disque, exécutés par `workers` threads."""
+
+    def __init__(self, directory: str = config.JOBS_DIR, workers: int = config.JOB_WORKERS,
+                 max_attempts: int = config.JOB_MAX_ATTEMPTS, retry_delay: float = config.JOB_RETRY_DELAY,
+                 max_pending: int = config.JOB_MAX_PENDING, log: Optional[Callable[[str], None]] = None):
+        self.directory = directory
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.log = log or (lambda message: None)
+        self._handlers: Dict[str, JobHandler] = {}
+        # (échéance, ordre, nom du fichier, voie)
+        self._heap: List[Tuple[float, int, str, str]] = []
+        self._busy_lanes: Set[str] = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._running = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.started = 0
+        self.completed = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        for state in (PENDING, RUNNING, FAILED):
+            os.makedirs(self._dir(state), exist_ok=True)
+
+    def _dir(self, state: str) -> str:
+        return os.path.join(self.directory, state)
+
+    def register(self, job_type: str, handler: JobHandler) -> None:
+        """`handler(job)` retourne True si le travail est terminé, False pour le retenter."""
+        self._handlers[job_type] = handler
+
+    # ------------------------------------------------------------------ submit
+
+    def _write(self, state: str, name: str, job: dict) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self._dir(state), prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp, os.path.join(self._dir(state), name))
+
+    def _push(self, due: float, name: str, lane: str) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._seq), name, lane))
+            self._cond.notify()
+
+    def submit(self, job_type: str, args: dict, delay: float = 0.0, lane: str = "") -> Optional[str]:
+        """Dépose un travail (écrit sur disque avant de rendre la main).
+        None si la file est pleine : le travail est abandonné."""
+        with self._cond:
+            if len(self._heap) >= self.max_pending:
+                self.dropped += 1
+                return None
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex, "type": job_type, "args": args, "lane": lane,
+            "attempts": 0, "submitted_at": now, "error": "",
+        }
+        due = now + delay
+        name = f"{int(due * 1000):013d}-{job['id']}.json"
+        self._write(PENDING, name, job)
+        self.submitted += 1
+        self._push(due, name, lane)
+        return job["id"]
+
+    # ----------------------------------------------------------------- workers
+
+    def start(self) -> None:
+        """Remet en attente les travaux interrompus puis lance les workers."""
+        for name in os.listdir(self._dir(RUNNING)):
+            if name.endswith(".json"):
+                os.replace(os.path.join(self._dir(RUNNING), name), os.path.join(self._dir(PENDING), name))
+                self.log(f"Job {name} interrupted by a restart, requeued")
+        for name in os.listdir(self._dir(PENDING)):
+            if name.endswith(".json"):
+                try:
+                    due = int(name.split("-", 1)[0]) / 1000
+                except ValueError:
+                    due = 0.0
+                self._push(due, name, self._lane_of(name))
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"policy-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _lane_of(self, name: str) -> str:
+        try:
+            with open(os.path.join(self._dir(PENDING), name), encoding="utf-8") as f:
+                return json.load(f).get("lane", "")
+        except (OSError, ValueError, AttributeError):
+            return ""
+
+    def _next(self) -> Optional[Tuple[str, str]]:
+        """Premier travail dû dont la voie est libre : (nom, voie)."""
+        with self._cond:
+            while not self._stopping:
+                now = time.time()
+                blocked = []
+                chosen = None
+                while self._heap and self._heap[0][0] <= now:
+                    entry = heapq.heappop(self._heap)
+                    if entry[3] and entry[3] in self._busy_lanes:
+                        blocked.append(entry)
+                        continue
+                    chosen = entry
+                    break
+                next_due = self._heap[0][0] if self._heap else None
+                for entry in blocked:
+                    heapq.heappush(self._heap, entry)
+                if chosen is not None:
+                    self._running += 1
+                    if chosen[3]:
+                        self._busy_lanes.add(chosen[3])
+                    return chosen[2], chosen[3]
+                # Réveil à la prochaine échéance ou quand une voie se libère
+                self._cond.wait(None if next_due is None else max(0.0, next_due - now))
+            return None
+
+    def _worker(self) -> None:
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            name, lane = entry
+            try:
+                self._run(name)
+            except Exception as e:  # un travail ne doit jamais tuer le worker
+                self.log(f"Job {name} crashed the worker: {e!r}")
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._busy_lanes.discard(lane)
+                    self._cond.notify_all()
+
+    def _count(self, counter: str) -> None:
+        with self._cond:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _run(self, name: str) -> None:
+        pending = os.path.join(self._dir(PENDING), name)
+        running = os.path.join(self._dir(RUNNING), name)
+        try:
+            os.replace(pending, running)
+        except FileNotFoundError:
+            return
+        with open(running, encoding="utf-8") as f:
+            job = json.load(f)
+        if job["attempts"] == 0:
+            waited = max(0.0, time.time() - job["submitted_at"])
+            with self._cond:
+                self.started += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+        handler = self._handlers.get(job["type"])
+        try:
+            done = handler is not None and handler(job)
+            error = "" if handler else f"no handler for job type {job['type']}"
+        except Exception as e:
+            done, error = False, repr(e)
+        if done:
+            os.unlink(running)
+            self._count("completed")
+            return
+
+        job["attempts"] += 1
+        job["error"] = error or "handler reported failure"
+        if job["attempts"] >= self.max_attempts:
+            self._write(FAILED, name, job)
+            os.unlink(running)
+            self._count("failures")
+            self.log(f"Job {job['type']} {job['id']} failed after {job['attempts']} attempts: {job['error']}")
+            return
+        due = time.time() + self.retry_delay * 2 ** (job["attempts"] - 1)
+        retry_name = f"{int(due * 1000):013d}-{job['id']}.json"
+        self._write(PENDING, retry_name, job)
+        os.unlink(running)
+        self._count("retries")
+        self._push(due, retry_name, job.get("lane", ""))
+
+    def drain(self, timeout: float) -> bool:
+        """Attend que les travaux dus soient terminés (au plus `timeout` s)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._running or (self._heap and self._heap[0][0] <= time.time()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.1))
+        return True
+
+    def stop(self) -> None:
+        """Arrête les workers ; les travaux non terminés restent sur disque."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": len(self._heap),
+            "running": self._running,
+            "failed_total": len(os.listdir(self._dir(FAILED))),
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "retries": self.retries,
+            "failures": self.failures,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.started, 6) if self.started else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
@@ -0,0 +1,431 @@
+"""
+Registre transactionnel du crowdfunding (contributions, votes ASSETS, totaux).
+
+Remplace les réécritures jq + mktemp + mv de project.json par
+record_crowdfunding_contribution, record_assets_vote et check_vote_threshold
+(filter/common.sh) : une base SQLite en mode WAL
+(~/.zen/game/crowdfunding/ledger.sqlite) où chaque opération est une
+transaction `BEGIN IMMEDIATE` — deux likes simultanés ne perdent plus de
+contribution.
+
+- contribution : ajout d'une ligne, idempotent sur l'event id (un filtre
+  relancé par la file de travaux ne compte pas deux fois) ;
+- vote : un votant par projet (clé primaire), totaux et approbation
+  (seuil ZEN + quorum lus dans project.json) mis à jour dans la même
+  transaction.
+
+project.json reste la vue lue par les autres outils. Il est réexporté hors
+transaction (le verrou d'écriture SQLite n'attend jamais une écriture de
+fichier) : chaque opération incrémente `version` du projet, un changement de
+statut (approbation, Kind 30904) est exporté aussitôt, les contributions et
+votes au plus une fois par LEDGER_EXPORT_INTERVAL secondes — le reste est
+exporté à la fin du lot de paiements, par la maintenance du moteur
+(export_due) ou par `export`. Seuls les champs tenus par le registre
+(contributions, totals.zen_convertible_collected, vote.voters,
+vote.voters_count, vote.votes_zen_total, vote.vote_events, vote.vote_status /
+approved_at une fois approuvé) et les changements de statut en attente
+(`overrides`) sont remplacés, le reste du fichier est conservé. Au premier
+passage d'un projet, son historique est importé depuis project.json.
+
+Usage en ligne de commande (codes de retour des fonctions shell) :
+    python3 -m policy.ledger contribute PROJECT HEX AMOUNT [CURRENCY] [EVENT_ID]
+    python3 -m policy.ledger vote PROJECT HEX AMOUNT [EVENT_ID]
+    python3 -m policy.ledger threshold PROJECT
+    python3 -m policy.ledger status PROJECT STATUS [EVENT_ID]
+    python3 -m policy.ledger export [PROJECT]
+"""
+
+import fcntl
+import json
+import math
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from .crowdfunding import CROWDFUNDING_DIR, projects
+
+LEDGER_FILE = os.path.join(CROWDFUNDING_DIR, "ledger.sqlite")
+# Réexport de project.json après une contribution ou un vote, au plus une fois par intervalle (s)
+LEDGER_EXPORT_INTERVAL = float(os.environ.get("NIP101_LEDGER_EXPORT_INTERVAL", "30"))
+
+# Codes de retour de record_assets_vote (filter/common.sh)
+VOTE_RECORDED, VOTE_ERROR, VOTE_INACTIVE, VOTE_DUPLICATE = 0, 1, 2, 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    project_id      TEXT PRIMARY KEY,
+    zen_collected   REAL NOT NULL DEFAULT 0,
+    votes_zen_total REAL NOT NULL DEFAULT 0,
+    voters_count    INTEGER NOT NULL DEFAULT 0,
+    vote_status     TEXT,
+    approved_at     TEXT,
+    version          INTEGER NOT NULL DEFAULT 0,
+    exported_version INTEGER NOT NULL DEFAULT 0,
+    exported_at      REAL NOT NULL DEFAULT 0,
+    overrides        TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS contributions (
+    seq             INTEGER PRIMARY KEY,
+    project_id      TEXT NOT NULL,
+    contributor_hex TEXT NOT NULL,
+    amount          REAL NOT NULL,
+    currency        TEXT NOT NULL,
+    timestamp       TEXT NOT NULL,
+    event_id        TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS contributions_project ON contributions (project_id, seq);
+CREATE UNIQUE INDEX IF NOT EXISTS contributions_event
+    ON contributions (project_id, event_id) WHERE event_id != '';
+CREATE TABLE IF NOT EXISTS votes (
+    project_id TEXT NOT NULL,
+    voter_hex  TEXT NOT NULL,
+    amount     REAL NOT NULL,
+    event_id   TEXT NOT NULL DEFAULT '',
+    seq        INTEGER NOT NULL,
+    PRIMARY KEY (project_id, voter_hex)
+);
+"""
+
+# Colonnes ajoutées aux registres créés avant l'export hors transaction
+EXPORT_COLUMNS = (
+    ("version", "INTEGER NOT NULL DEFAULT 0"),
+    ("exported_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("exported_at", "REAL NOT NULL DEFAULT 0"),
+    ("overrides", "TEXT NOT NULL DEFAULT '{}'"),
+)
+
+
+def utc_now() -> str:
+    """Même format que `date -u +%Y-%m-%dT%H:%M:%SZ`."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _number(value: float):
+    """1.0 → 1 pour garder le rendu de `jq --argjson`."""
+    return int(value) if float(value).is_integer() else value
+
+
+def parse_amount(text: str) -> float:
+    """Montant ZEN passé par le shell (ValueError si non numérique, comme `--argjson`)."""
+    amount = float(text)
+    if not math.isfinite(amount):
+        raise ValueError(f"invalid amount: {text}")
+    return amount
+
+
+def _float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class Ledger:
+    """Connexion au registre ; chaque méthode publique est une transaction."""
+
+    def __init__(self, path: str = LEDGER_FILE, base_dir: str = CROWDFUNDING_DIR):
+        self.path = path
+        self.base_dir = base_dir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(projects)")}
+        for name, definition in EXPORT_COLUMNS:
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE projects ADD COLUMN {name} {definition}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # ----------------------------------------------------------- project.json
+
+    def project_file(self, project_id: str) -> str:
+        return os.path.join(self.base_dir, project_id, "project.json")
+
+    def _load(self, project_id: str) -> Optional[dict]:
+        try:
+            with open(self.project_file(project_id), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def _import(self, project_id: str, data: dict) -> None:
+        """Première écriture sur un projet : reprend l'historique de project.json."""
+        if self.conn.execute("SELECT 1 FROM projects WHERE project_id = ?", (project_id,)).fetchone():
+            return
+        vote = data.get("vote") if isinstance(data.get("vote"), dict) else {}
+        totals = data.get("totals") if isinstance(data.get("totals"), dict) else {}
+        for c in data.get("contributions") or []:
+            if isinstance(c, dict):
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO contributions (project_id, contributor_hex, amount, currency, "
+                    "timestamp, event_id) VALUES (?, ?, ?, ?, ?, ?)",
+                    (project_id, str(c.get("contributor_hex") or ""), _float(c.get("amount")),
+                     str(c.get("currency") or "ZEN"), str(c.get("timestamp") or ""), str(c.get("event_id") or "")))
+        amounts = {str(e.get("hex")): e for e in vote.get("vote_events") or [] if isinstance(e, dict)}
+        for seq, voter in enumerate(vote.get("voters") or []):
+            event = amounts.get(str(voter), {})
+            self.conn.execute(
+                "INSERT OR IGNORE INTO votes (project_id, voter_hex, amount, event_id, seq) VALUES (?, ?, ?, ?, ?)",
+                (project_id, str(voter), _float(event.get("amount")), str(event.get("event_id") or ""), seq))
+        voters = self.conn.execute("SELECT COUNT(*) FROM votes WHERE project_id = ?", (project_id,)).fetchone()[0]
+        approved = vote.get("vote_status") == "approved"
+        self.conn.execute(
+            "INSERT INTO projects (project_id, zen_collected, votes_zen_total, voters_count, vote_status, "
+            "approved_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (project_id, _float(totals.get("zen_convertible_collected")), _float(vote.get("votes_zen_total")),
+             voters, "approved" if approved else None, vote.get("approved_at") if approved else None))
+
+    @contextmanager
+    def _export_locked(self) -> Iterator[None]:
+        """Un export de project.json à la fois (instantané, écriture, marquage)."""
+        with open(self.path + ".export.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def export(self, project_id: str) -> bool:
+        """Réécrit project.json (remplacement atomique) avec les champs du registre,
+        hors transaction d'écriture. False si le projet n'existe pas."""
+        if not os.path.isfile(self.project_file(project_id)):
+            return False
+        with self._export_locked():
+            data = self._load(project_id)
+            if data is None:
+                return False
+            if not self.conn.execute("SELECT 1 FROM projects WHERE project_id = ?", (project_id,)).fetchone():
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._import(project_id, data)
+                    self.conn.execute("COMMIT")
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            self.conn.execute("BEGIN")  # instantané cohérent, en lecture seule
+            try:
+                zen_collected, votes_total, voters_count, vote_status, approved_at, version, overrides = \
+                    self.conn.execute(
+                        "SELECT zen_collected, votes_zen_total, voters_count, vote_status, approved_at, version, "
+                        "overrides FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+                contributions = self.conn.execute(
+                    "SELECT contributor_hex, amount, currency, timestamp, event_id FROM contributions "
+                    "WHERE project_id = ? ORDER BY seq", (project_id,)).fetchall()
+                events = self.conn.execute(
+                    "SELECT voter_hex, amount, event_id FROM votes WHERE project_id = ? ORDER BY seq",
+                    (project_id,)).fetchall()
+            finally:
+                self.conn.execute("COMMIT")
+            data["contributions"] = [
+                {"contributor_hex": hex_, "amount": _number(amount), "currency": currency,
+                 "timestamp": ts, "event_id": event_id}
+                for hex_, amount, currency, ts, event_id in contributions]
+            totals = data["totals"] if isinstance(data.get("totals"), dict) else {}
+            totals["zen_convertible_collected"] = _number(zen_collected)
+            data["totals"] = totals
+            vote = data["vote"] if isinstance(data.get("vote"), dict) else {}
+            if events or "voters" in vote:
+                vote["voters"] = [hex_ for hex_, _, _ in events]
+                vote["voters_count"] = voters_count
+                vote["votes_zen_total"] = _number(votes_total)
+                vote["vote_events"] = [{"hex": hex_, "amount": _number(amount), "event_id": event_id}
+                                       for hex_, amount, event_id in events]
+            if vote_status:
+                vote["vote_status"] = vote_status
+                vote["approved_at"] = approved_at
+            if vote:
+                data["vote"] = vote
+            applied = json.loads(overrides or "{}")
+            data.update(applied)
+            path = self.project_file(project_id)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".project.")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                    f.write("\n")
+                os.replace(tmp, path)
+            except OSError:
+                os.unlink(tmp)
+                raise
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Un statut posé depuis l'instantané reste en attente du prochain export
+                current = json.loads(self.conn.execute("SELECT overrides FROM projects WHERE project_id = ?",
+                                                       (project_id,)).fetchone()[0] or "{}")
+                remaining = {k: v for k, v in current.items() if applied.get(k, object()) != v}
+                self.conn.execute(
+                    "UPDATE projects SET exported_version = MAX(exported_version, ?), exported_at = ?, "
+                    "overrides = ? WHERE project_id = ?", (version, time.time(), json.dumps(remaining), project_id))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def export_due(self, project_id: Optional[str] = None, interval: float = LEDGER_EXPORT_INTERVAL) -> int:
+        """Exporte les projets modifiés depuis leur dernier export, si celui-ci a plus de
+        `interval` secondes. Retourne le nombre de project.json réécrits."""
+        query = "SELECT project_id FROM projects WHERE version > exported_version AND exported_at <= ?"
+        params: tuple = (time.time() - interval,)
+        if project_id is not None:
+            query += " AND project_id = ?"
+            params += (project_id,)
+        return sum(self.export(p) for (p,) in self.conn.execute(query, params).fetchall())
+
+    def _transaction(self, project_id: str):
+        """BEGIN IMMEDIATE + project.json chargé et importé ; None si le projet n'existe pas."""
+        if not os.path.isfile(self.project_file(project_id)):
+            return None
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            data = self._load(project_id)  # configuration du vote, historique au premier passage
+            if data is not None:
+                self._import(project_id, data)
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if data is None:
+            self.conn.execute("ROLLBACK")
+        return data
+
+    def _commit(self, project_id: str, overrides: Optional[dict] = None) -> None:
+        """Marque le projet à réexporter et valide ; export hors transaction
+        (tout de suite pour un changement de statut)."""
+        try:
+            if overrides:
+                pending = json.loads(self.conn.execute("SELECT overrides FROM projects WHERE project_id = ?",
+                                                       (project_id,)).fetchone()[0] or "{}")
+                pending.update(overrides)
+                self.conn.execute("UPDATE projects SET overrides = ? WHERE project_id = ?",
+                                  (json.dumps(pending), project_id))
+            self.conn.execute("UPDATE projects SET version = version + 1 WHERE project_id = ?", (project_id,))
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        if overrides:
+            self.export(project_id)
+        else:
+            self.export_due(project_id)
+
+    # --------------------------------------------------------------- opérations
+
+    def contribute(self, project_id: str, contributor_hex: str, amount: float,
+                   currency: str = "ZEN", event_id: str = "") -> bool:
+        """record_crowdfunding_contribution : False si le projet n'existe pas."""
+        data = self._transaction(project_id)
+        if data is None:
+            return False
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO contributions (project_id, contributor_hex, amount, currency, timestamp, "
+            "event_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (project_id, contributor_hex, amount, currency, utc_now(), event_id))
+        if not cursor.rowcount:  # event déjà enregistré (filtre rejoué)
+            self.conn.execute("ROLLBACK")
+            return True
+        self.conn.execute("UPDATE projects SET zen_collected = zen_collected + ? WHERE project_id = ?",
+                          (amount, project_id))
+        self._commit(project_id)
+        return True
+
+    def _approve_if_reached(self, project_id: str, data: dict) -> Optional[dict]:
+        """Approuve le vote si seuil et quorum sont atteints ; retourne les champs à exporter."""
+        vote = data.get("vote") if isinstance(data.get("vote"), dict) else {}
+        threshold = _float(vote.get("vote_threshold"), 100)
+        quorum = _float(vote.get("vote_quorum"), 10)
+        updated = self.conn.execute(
+            "UPDATE projects SET vote_status = 'approved', approved_at = ? WHERE project_id = ? "
+            "AND votes_zen_total >= ? AND voters_count >= ? AND vote_status IS NULL",
+            (utc_now(), project_id, threshold, quorum))
+        return {"status": "funded"} if updated.rowcount else None
+
+    def vote(self, project_id: str, voter_hex: str, amount: float, event_id: str = "") -> int:
+        """record_assets_vote : VOTE_RECORDED, VOTE_ERROR, VOTE_INACTIVE ou VOTE_DUPLICATE."""
+        data = self._transaction(project_id)
+        if data is None:
+            return VOTE_ERROR
+        vote = data.get("vote") if isinstance(data.get("vote"), dict) else {}
+        if vote.get("assets_vote_active") is not True:
+            self.conn.execute("ROLLBACK")
+            return VOTE_INACTIVE
+        seq = self.conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM votes WHERE project_id = ?",
+                                (project_id,)).fetchone()[0]
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO votes (project_id, voter_hex, amount, event_id, seq) VALUES (?, ?, ?, ?, ?)",
+            (project_id, voter_hex, amount, event_id, seq))
+        if not cursor.rowcount:
+            self.conn.execute("ROLLBACK")
+            return VOTE_DUPLICATE
+        self.conn.execute(
+            "UPDATE projects SET votes_zen_total = votes_zen_total + ?, voters_count = voters_count + 1 "
+            "WHERE project_id = ?", (amount, project_id))
+        self._commit(project_id, self._approve_if_reached(project_id, data))
+        return VOTE_RECORDED
+
+    def threshold_reached(self, project_id: str) -> bool:
+        """check_vote_threshold : True si le vote est approuvé (réévalué avec la config actuelle)."""
+        data = self._transaction(project_id)
+        if data is None:
+            return False
+        overrides = self._approve_if_reached(project_id, data)
+        if overrides is None:
+            self.conn.execute("ROLLBACK")
+        else:
+            self._commit(project_id, overrides)
+        status = self.conn.execute("SELECT vote_status FROM projects WHERE project_id = ?",
+                                   (project_id,)).fetchone()
+        return bool(status) and status[0] == "approved"
+
+    def set_status(self, project_id: str, status: str, nostr_event: str = "") -> bool:
+        """Statut de campagne synchronisé depuis un Kind 30904 (filter/30904.sh)."""
+        data = self._transaction(project_id)
+        if data is None:
+            return False
+        self._commit(project_id, {"status": status, "last_nostr_event": nostr_event, "last_sync": utc_now()})
+        return True
+
+    def totals(self, project_id: str) -> Dict[str, float]:
+        row = self.conn.execute(
+            "SELECT zen_collected, votes_zen_total, voters_count FROM projects WHERE project_id = ?",
+            (project_id,)).fetchone()
+        if row is None:
+            return {}
+        return {"zen_convertible_collected": row[0], "votes_zen_total": row[1], "voters_count": row[2]}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    command, params = (args[0], args[1:]) if args else ("", [])
+    try:
+        if command == "contribute" and 3 <= len(params) <= 5:
+            amount = parse_amount(params[2])
+            ledger = Ledger()
+            return 0 if ledger.contribute(params[0], params[1], amount, *params[3:]) else 1
+        if command == "vote" and 3 <= len(params) <= 4:
+            amount = parse_amount(params[2])
+            return Ledger().vote(params[0], params[1], amount, *params[3:])
+        if command == "threshold" and len(params) == 1:
+            return 0 if Ledger().threshold_reached(params[0]) else 1
+        if command == "status" and 2 <= len(params) <= 3:
+            return 0 if Ledger().set_status(*params) else 1
+        if command == "export" and len(params) <= 1:
+            ledger = Ledger()
+            return 0 if all([ledger.export(p) for p in (params or projects(ledger.base_dir))]) else 1
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"ledger: {e}", file=sys.stderr)
+        return 1
+    print(__doc__.split("Usage en ligne de commande (codes de retour des fonctions shell) :")[1],
+          file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
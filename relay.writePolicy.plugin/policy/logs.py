@@ -0,0 +1,248 @@
+"""
+Journalisation tamponnée partagée par le moteur et les filtres Python.
+
+Les lignes sont mises en file en mémoire (aucun fork de `date`, aucune
+réouverture de fichier par ligne) et écrites par lots par un thread
+d'écriture qui garde les fichiers ouverts. Format inchangé :
+
+    AAAA-MM-JJ HH:MM:SS - message
+
+Chaque fichier est un sous-système (strfry, nostr_likes, nostr_zaps.9735…)
+avec son niveau : NIP101_LOG_LEVEL (défaut INFO) et
+NIP101_LOG_LEVELS="strfry=WARNING,nostr_likes=DEBUG". Rotation par taille
+(NIP101_LOG_MAX_BYTES, NIP101_LOG_BACKUPS) : <fichier>.1, .2… Les scripts
+shell qui écrivent dans les mêmes fichiers les rouvrent à chaque ligne et
+suivent donc la rotation.
+
+Le moteur, les travaux différés et les répartiteurs (paiements, file IA)
+ont chacun leur LogWriter sur les mêmes fichiers : avant chaque lot, un
+fichier dont l'inode a changé (tourné par un autre processus) est rouvert,
+comme logging.handlers.WatchedFileHandler, et la rotation se fait sous flock
+du fichier courant, après avoir vérifié qu'un autre processus ne l'a pas
+déjà tourné.
+"""
+
+import atexit
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import config
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+
+# (chemin, horodatage ou None pour une ligne brute, texte)
+_Record = Tuple[str, Optional[float], str]
+
+
+def subsystem_of(path: str) -> str:
+    """nostr_zaps.9735.log → nostr_zaps.9735"""
+    name = os.path.basename(path)
+    return name[:-4] if name.endswith(".log") else name
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.strip().partition("=")
+        if name and level.upper() in LEVELS:
+            levels[name] = LEVELS[level.upper()]
+    return levels
+
+
+class LogWriter:
+    """File de lignes de log + thread d'écriture par lots."""
+
+    def __init__(self, max_bytes: int = config.LOG_MAX_BYTES, backups: int = config.LOG_BACKUPS,
+                 flush_interval: float = config.LOG_FLUSH_INTERVAL,
+                 default_level: int = LEVELS.get(config.LOG_LEVEL.upper(), INFO),
+                 levels: Optional[Dict[str, int]] = None):
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.default_level = default_level
+        self.levels = parse_levels(config.LOG_LEVELS) if levels is None else levels
+        self._queue: List[_Record] = []
+        self._cond = threading.Condition()
+        self._files: Dict[str, IO[str]] = {}
+        self._written = 0
+        self._flushed = 0
+        self._stopping = False
+        self._stamp_second = -1
+        self._stamp = ""
+        self.records = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="policy-log-writer", daemon=True)
+        self._thread.start()
+
+    # ---------------------------------------------------------------- producers
+
+    def enabled(self, path: str, level: int = INFO) -> bool:
+        return level >= self.levels.get(subsystem_of(path), self.default_level)
+
+    def write(self, path: str, message: str, level: int = INFO) -> None:
+        """Ajoute une ligne horodatée (filtrée par le niveau du sous-système)."""
+        if not self.enabled(path, level):
+            self.dropped += 1
+            return
+        self._put((path, time.time(), message))
+
+    def raw(self, path: str, text: str) -> None:
+        """Ligne brute sans horodatage (stdout d'un filtre)."""
+        self._put((path, None, text))
+
+    def _put(self, record: _Record) -> None:
+        with self._cond:
+            self._queue.append(record)
+            self._written += 1
+            self.records += 1
+            if len(self._queue) == 1:
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Attend que toutes les lignes déjà mises en file soient écrites."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._written
+            self._cond.notify_all()
+            while self._flushed < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._thread.is_alive():
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    @contextmanager
+    def stream(self, path: str) -> Iterator[IO[str]]:
+        """Fichier ouvert en ajout pour la sortie d'un sous-processus, après
+        écriture des lignes en attente (l'ordre des logs est conservé)."""
+        self.flush()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            yield f
+
+    def close(self) -> None:
+        self.flush()
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    # ------------------------------------------------------------------- writer
+
+    def _timestamp(self, when: float) -> str:
+        second = int(when)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        return self._stamp
+
+    @staticmethod
+    def _is_current(path: str, f: IO[str]) -> bool:
+        """True si `f` est toujours le fichier présent à `path`."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        opened = os.fstat(f.fileno())
+        return (st.st_dev, st.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def _file(self, path: str) -> IO[str]:
+        f = self._files.get(path)
+        if f is not None and not self._is_current(path, f):
+            f.close()  # tourné ou supprimé par un autre processus
+            f = None
+        if f is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = self._files[path] = open(path, "a", encoding="utf-8")
+        return f
+
+    def _rotate(self, path: str) -> None:
+        """Rotation de `path` si le fichier ouvert dépasse max_bytes, par un seul processus."""
+        f = self._files.pop(path)
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # Un autre processus a pu tourner le fichier en attendant le verrou
+            if not self._is_current(path, f) or os.fstat(f.fileno()).st_size < self.max_bytes:
+                return
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{path}.{i}"):
+                    os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+            if self.backups > 0:
+                os.replace(path, f"{path}.1")
+            else:
+                os.truncate(path, 0)
+            self.rotations += 1
+        finally:
+            f.close()
+
+    def _write_batch(self, batch: List[_Record]) -> None:
+        by_path: Dict[str, List[str]] = {}
+        for path, when, text in batch:
+            line = text if when is None else f"{self._timestamp(when)} - {text}"
+            by_path.setdefault(path, []).append(line + "\n")
+        for path, lines in by_path.items():
+            try:
+                f = self._file(path)
+                f.write("".join(lines))
+                f.flush()
+                if self.max_bytes and os.fstat(f.fileno()).st_size >= self.max_bytes:
+                    self._rotate(path)
+            except OSError:
+                self.errors += 1
+                self._files.pop(path, None)
+        self.batches += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._queue and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+                batch, self._queue = self._queue, []
+                stopping = self._stopping
+            if batch:
+                self._write_batch(batch)
+            with self._cond:
+                self._flushed += len(batch)
+                self._cond.notify_all()
+            if stopping and not batch:
+                return
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "records": self.records,
+            "dropped_by_level": self.dropped,
+            "pending": len(self._queue),
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
+
+
+_writer: Optional[LogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def writer() -> LogWriter:
+    """LogWriter du processus (créé au premier usage, vidé à la sortie)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def logger(path: str, level: int = INFO) -> Callable[[str], None]:
+    """Fonction de log vers `path` au niveau `level`."""
+    return lambda message: writer().write(path, message, level)
@@ -0,0 +1,159 @@
+"""
+Métriques du chemin critique : durées par étape et verdicts par type
+d'utilisateur et kind, exportées au format texte Prometheus
+(~/.zen/tmp/policy/metrics.prom, lisible par le textfile collector de
+node_exporter).
+
+Les histogrammes ont des bornes fixes et un `observe()` en O(log n) sans
+allocation : assez bon marché pour rester actifs en production. Un verrou
+protège les mises à jour venant des workers de la file de travaux.
+"""
+
+import bisect
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Bornes en secondes (100 µs → 10 s)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Borne supérieure du bucket contenant le quantile `q` (None au-delà de la dernière)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+
+class Metrics:
+    """Registre des histogrammes (par étape), compteurs et jauges (par labels)."""
+
+    def __init__(self, prefix: str = "nip101_policy"):
+        self.prefix = prefix
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str, buckets: Optional[Sequence[float]] = None) -> None:
+        self._help[name] = text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Jauge (profondeur de file…) : dernière valeur connue."""
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        return self._histograms.get(name, {}).get(_labels(labels)) or Histogram()
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    # -------------------------------------------------------------------- export
+
+    def render(self) -> str:
+        """Exposition texte Prometheus (format 0.0.4)."""
+        with self._lock:
+            return self._render()
+
+    def _render(self) -> str:
+        lines: List[str] = []
+        for name in sorted(self._histograms):
+            full = f"{self.prefix}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} histogram")
+            for labels, h in sorted(self._histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(h.bounds, h.counts):
+                    cumulative += count
+                    le = 'le="%g"' % bound
+                    lines.append(f"{full}_bucket{_format_labels(labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{full}_bucket{_format_labels(labels, le)} {h.count}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {h.total:.6f}")
+                lines.append(f"{full}_count{_format_labels(labels)} {h.count}")
+        for kind, registry in (("counter", self._counters), ("gauge", self._gauges)):
+            for name in sorted(registry):
+                full = f"{self.prefix}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {kind}")
+                for labels, value in sorted(registry[name].items()):
+                    lines.append(f"{full}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, dict]:
+        """Résumé par étape pour stats.json : nombre, moyenne, p50 / p99 approchés."""
+        out: Dict[str, dict] = {}
+        with self._lock:
+            items = [(name, labels, h) for name, series in self._histograms.items()
+                     for labels, h in series.items()]
+        for name, labels, h in items:
+            key = name + "".join(f",{k}={v}" for k, v in labels)
+            out[key] = {
+                "count": h.count,
+                "avg_seconds": round(h.total / h.count, 6) if h.count else 0.0,
+                "p50_le": h.quantile(0.5),
+                "p99_le": h.quantile(0.99),
+            }
+        return out
+
+    def write(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".metrics.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
@@ -0,0 +1,489 @@
+"""
+File de sortie des paiements ẐEN des réactions kind 7 (filter/7.sh).
+
+Chaque like payant, contribution crowdfunding ou vote ASSETS lançait son
+propre PAYforSURE.sh (ou, en roaming, un `python3 -c` puis un DM
+nostr_node_intercom.py) : un post populaire produisait une rafale de
+micro-virements indépendants. 7.sh dépose maintenant le paiement ici
+(`python3 -m policy.payments enqueue …`) et un répartiteur unique les envoie
+regroupés :
+
+- une ligne d'audit par réaction (~/.zen/game/zen_payments.sqlite, table
+  payments), clé primaire = event id : un filtre relancé ne paie pas deux fois ;
+- les paiements en attente d'un même groupe (méthode, source, destination,
+  catégorie LIKE / CF / VOTE, projet, émetteur et email) sont envoyés
+  ensemble quand le plus ancien a attendu PAYMENT_WINDOW secondes : un seul
+  PAYforSURE.sh du total, ou un seul DM zen_like vers la home station (même
+  payload, montant total, liste `event_ids`). L'émetteur fait partie du
+  groupe : la home station débite l'email du payload, et le commentaire
+  du virement (UPLANET:G1:EMAIL:…) nomme le payeur ;
+- après un virement réussi, contributions et votes sont inscrits au registre
+  (policy/ledger.py), réaction par réaction ;
+- un paiement resté « sending » après un arrêt brutal n'est jamais renvoyé
+  (il a pu partir) : il passe en « unknown » et est journalisé.
+
+Le répartiteur est lancé par `enqueue` s'il ne tourne pas (verrou
+zen_payments.lock) et s'arrête quand la file est vide. Les métriques
+(latence mise en file → envoi, taille des lots) sont exportées dans
+~/.zen/tmp/policy/payments.prom.
+
+Usage en ligne de commande :
+    python3 -m policy.payments enqueue --event ID --sender HEX --dest G1PUB --zen N
+        --comment TEXT (--wallet DUNIKEY | --home NODE_HEX) [--email EMAIL]
+        [--project PROJECT [--vote]] [--reacted-event ID] [--reacted-author HEX]
+    python3 -m policy.payments dispatch [--now]
+    python3 -m policy.payments stats
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+from decimal import ROUND_DOWN, Decimal
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from . import config, logs
+from .metrics import Metrics
+
+PAYMENTS_DB = os.path.join(config.ZEN_DIR, "game", "zen_payments.sqlite")
+PAYMENTS_LOCK = PAYMENTS_DB[:-len(".sqlite")] + ".lock"
+PAYMENTS_METRICS_FILE = os.path.join(config.POLICY_DIR, "payments.prom")
+LIKES_LOG = os.path.join(config.TMP_DIR, "nostr_likes.log")
+
+PAYFORSURE = os.path.join(config.ZEN_DIR, "Astroport.ONE", "tools", "PAYforSURE.sh")
+INTERCOM = os.path.join(config.ZEN_DIR, "Astroport.ONE", "tools", "nostr_node_intercom.py")
+SECRET_FILE = os.path.join(config.ZEN_DIR, "game", "secret.nostr")
+ROAMING_RELAYS = "wss://relay.copylaradio.com"
+
+# Fenêtre de regroupement (s) et durée maximale d'un envoi (s)
+PAYMENT_WINDOW = float(os.environ.get("NIP101_PAYMENT_WINDOW", "10"))
+PAYMENT_TIMEOUT = float(os.environ.get("NIP101_PAYMENT_TIMEOUT", "300"))
+
+TRANSFER, ROAMING = "transfer", "roaming"
+PENDING, SENDING, SENT, FAILED, UNKNOWN = "pending", "sending", "sent", "failed", "unknown"
+
+LATENCY_BUCKETS = (1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+BATCH_SIZE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payments (
+    event_id       TEXT PRIMARY KEY,
+    enqueued_at    REAL NOT NULL,
+    method         TEXT NOT NULL,
+    source         TEXT NOT NULL,
+    dest           TEXT NOT NULL,
+    category       TEXT NOT NULL,
+    project_id     TEXT NOT NULL DEFAULT '',
+    zen            REAL NOT NULL,
+    comment        TEXT NOT NULL,
+    email          TEXT NOT NULL DEFAULT '',
+    sender         TEXT NOT NULL DEFAULT '',
+    reacted_event  TEXT NOT NULL DEFAULT '',
+    reacted_author TEXT NOT NULL DEFAULT '',
+    status         TEXT NOT NULL DEFAULT 'pending',
+    batch_id       INTEGER,
+    sent_at        REAL
+);
+CREATE INDEX IF NOT EXISTS payments_status ON payments (status, enqueued_at);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id    INTEGER PRIMARY KEY,
+    method      TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    dest        TEXT NOT NULL,
+    category    TEXT NOT NULL,
+    project_id  TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    zen         REAL NOT NULL,
+    comment     TEXT NOT NULL,
+    started_at  REAL NOT NULL,
+    finished_at REAL,
+    status      TEXT NOT NULL,
+    exit_code   INTEGER
+);
+"""
+
+log = logs.logger(LIKES_LOG)
+
+
+def _number(value: float):
+    """1.0 → 1 (montants ẐEN entiers dans les commentaires et les logs)."""
+    return int(value) if float(value).is_integer() else value
+
+
+def g1_amount(zen: float) -> str:
+    """Conversion ẐEN → Ğ1 de 7.sh (`scale=2; ZEN * 0.1`, zéro initial ajouté)."""
+    amount = Decimal(str(_number(zen))) * Decimal("0.1")
+    if amount.as_tuple().exponent < -2:
+        amount = amount.quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+    return format(amount, "f")
+
+
+def read_nsec(path: str = SECRET_FILE) -> str:
+    """NSEC de ~/.zen/game/secret.nostr ("NSEC=…; NPUB=…; HEX=…")."""
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            match = re.search(r"NSEC=([^;\s]+)", f.read())
+    except OSError:
+        return ""
+    return match.group(1).strip("\"'") if match else ""
+
+
+class Payment(NamedTuple):
+    event_id: str
+    enqueued_at: float
+    method: str
+    source: str
+    dest: str
+    category: str
+    project_id: str
+    zen: float
+    comment: str
+    email: str
+    sender: str
+    reacted_event: str
+    reacted_author: str
+
+
+COLUMNS = ", ".join(Payment._fields)
+GroupKey = Tuple[str, str, str, str, str, str, str]
+
+
+def group_key(payment: Payment) -> GroupKey:
+    """Paiements envoyés ensemble : même trajet, même catégorie, même payeur."""
+    return (payment.method, payment.source, payment.dest, payment.category, payment.project_id,
+            payment.sender, payment.email)
+
+
+def batch_comment(payments: Sequence[Payment], total: float) -> str:
+    """Commentaire du virement groupé, dérivé de celui de la première réaction.
+
+    LIKE : UPLANET:G1:EMAIL:LIKE:<total>Z:<premier event>+<autres>
+    CF / VOTE : CF:PROJET:ZEN|VOTE:<total>:<pubkey>"""
+    first = payments[0].comment
+    if len(payments) == 1:
+        return first
+    parts = first.split(":")
+    if payments[0].category == "LIKE" and len(parts) >= 6:
+        parts[4] = f"{_number(total)}Z"
+        parts[5] = f"{parts[5]}+{len(payments) - 1}"
+    elif len(parts) >= 4:
+        parts[3] = str(_number(total))
+    return ":".join(parts)
+
+
+class PaymentOutbox:
+    """File de sortie persistante ; `dispatch` est exécuté par un seul processus à la fois."""
+
+    def __init__(self, path: str = PAYMENTS_DB, lock_path: str = PAYMENTS_LOCK,
+                 window: float = PAYMENT_WINDOW, timeout: float = PAYMENT_TIMEOUT,
+                 log: Callable[[str], None] = log):
+        self.path = path
+        self.lock_path = lock_path
+        self.window = window
+        self.timeout = timeout
+        self.log = log
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # ---------------------------------------------------------------- enqueue
+
+    def enqueue(self, payment: Payment) -> bool:
+        """Ajoute un paiement ; False si cet event id est déjà connu."""
+        cursor = self.conn.execute(
+            f"INSERT OR IGNORE INTO payments ({COLUMNS}) VALUES ({', '.join('?' * len(Payment._fields))})",
+            payment)
+        return cursor.rowcount == 1
+
+    def pending(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM payments WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def dispatcher_running(self) -> bool:
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return False
+
+    def spawn_dispatcher(self) -> None:
+        """Lance `dispatch` en arrière-plan (détaché) s'il ne tourne pas déjà."""
+        if self.dispatcher_running():
+            return
+        env = dict(os.environ)
+        env["PYTHONPATH"] = config.PLUGIN_DIR + (":" + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+        subprocess.Popen([sys.executable, "-m", "policy.payments", "dispatch"], cwd=config.PLUGIN_DIR, env=env,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+
+    # --------------------------------------------------------------- dispatch
+
+    def dispatch(self, now: bool = False) -> int:
+        """Envoie les lots échus jusqu'à ce que la file soit vide (tout de suite
+        avec `now`). Retourne le nombre de lots, 0 si un autre répartiteur tourne."""
+        batches = 0
+        while True:
+            with open(self.lock_path, "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return batches
+                try:
+                    self._recover()
+                    batches += self._drain(now)
+                    self.write_metrics()
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            # Un enqueue arrivé pendant la libération du verrou n'a pas relancé de répartiteur
+            if not self.pending():
+                return batches
+
+    def _recover(self) -> None:
+        stale = self.conn.execute("SELECT event_id, zen, dest FROM payments WHERE status = ?", (SENDING,)).fetchall()
+        for event_id, zen, dest in stale:
+            self.log(f"PAYMENT: ⚠️ {_number(zen)}Ẑ to {dest[:8]}... (event {event_id[:8]}...) "
+                     f"interrupted during sending — not resent, check manually")
+        if stale:
+            self.conn.execute("UPDATE payments SET status = ? WHERE status = ?", (UNKNOWN, SENDING))
+            self.conn.execute("UPDATE batches SET status = ? WHERE status = ?", (UNKNOWN, SENDING))
+
+    def _drain(self, now: bool) -> int:
+        batches = 0
+        while True:
+            pending = [Payment(*row) for row in self.conn.execute(
+                f"SELECT {COLUMNS} FROM payments WHERE status = ? ORDER BY enqueued_at", (PENDING,))]
+            if not pending:
+                return batches
+            groups: Dict[GroupKey, List[Payment]] = {}
+            for payment in pending:
+                groups.setdefault(group_key(payment), []).append(payment)
+            current = time.time()
+            due = [g for g in groups.values() if now or current - g[0].enqueued_at >= self.window]
+            if not due:
+                oldest = min(g[0].enqueued_at for g in groups.values())
+                time.sleep(max(0.1, oldest + self.window - current))
+                continue
+            for group in due:
+                self._send(group)
+                batches += 1
+
+    def _claim(self, group: List[Payment], total: float, comment: str) -> int:
+        method, source, dest, category, project_id = group_key(group[0])[:5]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            batch_id = self.conn.execute(
+                "INSERT INTO batches (method, source, dest, category, project_id, size, zen, comment, "
+                "started_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (method, source, dest, category, project_id, len(group), total, comment, time.time(),
+                 SENDING)).lastrowid
+            self.conn.executemany(
+                "UPDATE payments SET status = ?, batch_id = ? WHERE event_id = ? AND status = ?",
+                [(SENDING, batch_id, p.event_id, PENDING) for p in group])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return batch_id
+
+    def _finish(self, batch_id: int, status: str, exit_code: int) -> None:
+        finished = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("UPDATE batches SET status = ?, exit_code = ?, finished_at = ? WHERE batch_id = ?",
+                              (status, exit_code, finished, batch_id))
+            self.conn.execute("UPDATE payments SET status = ?, sent_at = ? WHERE batch_id = ?",
+                              (status, finished, batch_id))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _send(self, group: List[Payment]) -> None:
+        total = sum(p.zen for p in group)
+        comment = batch_comment(group, total)
+        batch_id = self._claim(group, total, comment)
+        first = group[0]
+        label = f"{len(group)} reaction{'s' if len(group) > 1 else ''}"
+        if first.method == ROAMING:
+            code = self._relay(group, total, comment)
+            status = SENT if code == 0 else FAILED
+            self._finish(batch_id, status, code)
+            if code == 0:
+                self.log(f"ROAMING: ✈️ zen_like relayé → {first.source[:12]}... pour {first.email} "
+                         f"({_number(total)}Ẑ, {label})")
+            else:
+                self.log(f"ROAMING: ⚠️ zen_like relay FAILED pour {first.email} ({label})")
+            return
+        amount = g1_amount(total)
+        prefix = "CROWDFUNDING" if first.project_id else "PAYMENT"
+        target = f"Bien {first.project_id}" if first.project_id else first.dest
+        self.log(f"{prefix}: Sending {_number(total)}Ẑ ({amount} G1) to {target} ({label})")
+        code = self._run([PAYFORSURE, first.source, amount, first.dest, comment])
+        self._finish(batch_id, SENT if code == 0 else FAILED, code)
+        if code != 0:
+            self.log(f"{prefix}: ❌ Payment failed (exit code: {code})")
+            return
+        self.log(f"{prefix}: ✅ Successfully sent {_number(total)}Ẑ to {target}")
+        if first.project_id:
+            self._record_crowdfunding(group)
+
+    def _run(self, command: List[str]) -> int:
+        with logs.writer().stream(LIKES_LOG) as out:
+            try:
+                return subprocess.run(command, stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT,
+                                      timeout=self.timeout).returncode
+            except subprocess.TimeoutExpired:
+                return 124
+            except OSError:
+                return 127
+
+    def _relay(self, group: List[Payment], total: float, comment: str) -> int:
+        """Un DM zen_like vers la home station pour tout le lot (payload de 7.sh)."""
+        nsec = read_nsec()
+        if not nsec:
+            self.log("ROAMING: ⚠️ secret.nostr absent — impossible de relayer")
+            return 1
+        first = group[0]
+        payload = {
+            "email": first.email,
+            "sender_pubkey": first.sender,
+            "event_id": first.event_id,
+            "reacted_event_id": first.reacted_event,
+            "reacted_author_pubkey": first.reacted_author,
+            "zen_amount": float(total),
+            "comment": comment,
+            "g1pub_dest": first.dest,
+            "is_crowdfunding": bool(first.project_id),
+            "project_id": first.project_id,
+            "bien_g1pub": first.dest if first.project_id else "",
+            "event_ids": [p.event_id for p in group],
+            "count": len(group),
+        }
+        return self._run([sys.executable, INTERCOM, "send", "--nsec", nsec, "--to", first.source,
+                          "--channel", "zen_like", "--payload", json.dumps(payload), "--relays", ROAMING_RELAYS])
+
+    def _record_crowdfunding(self, group: List[Payment]) -> None:
+        """Contributions (et votes) du lot, comme après PAYforSURE.sh dans 7.sh."""
+        from .ledger import Ledger
+
+        ledger = Ledger()
+        try:
+            for p in group:
+                ledger.contribute(p.project_id, p.sender, p.zen, "ZEN", p.event_id)
+                if p.category == "VOTE":
+                    self.log(f"VOTE: Recording vote from {p.sender[:8]}... for project {p.project_id}")
+                    ledger.vote(p.project_id, p.sender, p.zen, p.event_id)
+            if group[0].category == "VOTE" and ledger.threshold_reached(group[0].project_id):
+                self.log(f"VOTE: 🎉 Vote threshold reached for project {group[0].project_id} - APPROVED!")
+            ledger.export_due(group[0].project_id, interval=0)  # un export par lot
+        finally:
+            ledger.close()
+
+    # ---------------------------------------------------------------- metrics
+
+    def stats(self) -> dict:
+        by_status = dict(self.conn.execute("SELECT status, COUNT(*) FROM payments GROUP BY status"))
+        row = self.conn.execute(
+            "SELECT COUNT(*), AVG(size), MAX(size), AVG(finished_at - started_at) FROM batches "
+            "WHERE finished_at IS NOT NULL").fetchone()
+        latency = self.conn.execute(
+            "SELECT AVG(sent_at - enqueued_at), MAX(sent_at - enqueued_at) FROM payments "
+            "WHERE sent_at IS NOT NULL").fetchone()
+        return {
+            "payments": by_status,
+            "batches": row[0],
+            "avg_batch_size": round(row[1] or 0, 2),
+            "max_batch_size": row[2] or 0,
+            "avg_send_seconds": round(row[3] or 0, 3),
+            "avg_latency_seconds": round(latency[0] or 0, 3),
+            "max_latency_seconds": round(latency[1] or 0, 3),
+        }
+
+    def metrics(self) -> Metrics:
+        metrics = Metrics(prefix="nip101_payments")
+        metrics.describe("latency_seconds", "Delay between enqueue and end of sending, per payment",
+                         LATENCY_BUCKETS)
+        metrics.describe("batch_size", "Reactions coalesced per transfer or roaming DM", BATCH_SIZE_BUCKETS)
+        metrics.describe("payments_total", "Payments by method and status")
+        metrics.describe("zen_total", "ZEN amount by method and status")
+        for method, status, latency in self.conn.execute(
+                "SELECT method, status, sent_at - enqueued_at FROM payments WHERE sent_at IS NOT NULL"):
+            metrics.observe("latency_seconds", latency, method=method, status=status)
+        for method, size in self.conn.execute("SELECT method, size FROM batches WHERE finished_at IS NOT NULL"):
+            metrics.observe("batch_size", size, method=method)
+        for method, status, count, zen in self.conn.execute(
+                "SELECT method, status, COUNT(*), SUM(zen) FROM payments GROUP BY method, status"):
+            metrics.inc("payments_total", count, method=method, status=status)
+            metrics.inc("zen_total", zen, method=method, status=status)
+        return metrics
+
+    def write_metrics(self, path: str = PAYMENTS_METRICS_FILE) -> None:
+        try:
+            self.metrics().write(path)
+        except OSError as e:
+            self.log(f"PAYMENT: metrics export failed: {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python3 -m policy.payments",
+                                     description="Coalesced ZEN payment outbox for kind 7 reactions")
+    sub = parser.add_subparsers(dest="command")
+    enqueue = sub.add_parser("enqueue")
+    enqueue.add_argument("--event", required=True)
+    enqueue.add_argument("--sender", required=True)
+    enqueue.add_argument("--dest", required=True)
+    enqueue.add_argument("--zen", required=True)
+    enqueue.add_argument("--comment", required=True)
+    source = enqueue.add_mutually_exclusive_group(required=True)
+    source.add_argument("--wallet")
+    source.add_argument("--home")
+    enqueue.add_argument("--email", default="")
+    enqueue.add_argument("--project", default="")
+    enqueue.add_argument("--vote", action="store_true")
+    enqueue.add_argument("--reacted-event", default="")
+    enqueue.add_argument("--reacted-author", default="")
+    dispatch = sub.add_parser("dispatch")
+    dispatch.add_argument("--now", action="store_true", help="send pending batches without waiting")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        parser.print_usage(sys.stderr)
+        return 2
+    outbox = PaymentOutbox()
+    try:
+        if args.command == "dispatch":
+            print(f"{outbox.dispatch(now=args.now)} batches sent")
+            return 0
+        if args.command == "stats":
+            print(json.dumps(outbox.stats(), indent=2))
+            return 0
+        try:
+            zen = float(args.zen)
+        except ValueError:
+            print(f"invalid amount: {args.zen}", file=sys.stderr)
+            return 1
+        category = ("VOTE" if args.vote else "CF") if args.project else "LIKE"
+        payment = Payment(args.event, time.time(), ROAMING if args.home else TRANSFER, args.home or args.wallet,
+                          args.dest, category, args.project, zen, args.comment, args.email, args.sender,
+                          args.reacted_event, args.reacted_author)
+        print("queued" if outbox.enqueue(payment) else "duplicate")
+        outbox.spawn_dispatcher()
+        return 0
+    finally:
+        outbox.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,485 @@
+"""
+Passerelle de requêtes vers le relais strfry local (NIP-01 REQ sur websocket).
+
+check_atom4love_cert et resolve_email_from_kind0 (filter/common.sh),
+certs.scan_events (reconstruction de l'index, reprise de policy/expiry.py) et
+backfill_constellation.sh lançaient chacun `./strfry scan` : un processus qui
+ouvre la base LMDB à chaque requête, et un parcours complet pour
+`--count '{}'`. Les requêtes passent désormais par des connexions websocket
+gardées ouvertes vers NIP101_RELAY_URL (ws://127.0.0.1:7777), au plus
+RELAY_POOL_SIZE en parallèle :
+
+    query(*filters)              événements (pagination par `until` si le
+                                 filtre n'a pas de limit : maxFilterLimit,
+                                 voir RelayPool.query)
+    latest(author, kind, d=None) dernier événement remplaçable (limit 1)
+    count(filter=None)           NIP-45 COUNT, sinon `strfry scan --count`
+
+Si le relais ne répond pas, `strfry scan` reste le repli. Client websocket
+minimal (RFC 6455, sans extension) : pas de dépendance hors bibliothèque
+standard, comme le reste du moteur.
+
+Les scripts shell passent par `serve`, un processus qui écoute sur
+127.0.0.1:NIP101_RELAY_GATEWAY_PORT (une requête JSON par ligne) et s'arrête
+après RELAY_GATEWAY_IDLE secondes sans requête ; relay_query() dans
+filter/common.sh garde sa connexion TCP ouverte (/dev/tcp, sans fork) et le
+relance s'il ne tourne pas. Protocole :
+
+    {"op": "query", "filters": [...]}            → un événement JSON par ligne
+    {"op": "latest", "author": HEX, "kind": K, "d": D}
+    {"op": "count", "filter": {...}}
+    puis ["END", N] (N événements ou le nombre compté), ou ["ERROR", "…"]
+
+Usage en ligne de commande :
+    python3 -m policy.relayquery query FILTER_JSON [FILTER_JSON...]
+    python3 -m policy.relayquery latest PUBKEY KIND [D]
+    python3 -m policy.relayquery count [FILTER_JSON]
+    python3 -m policy.relayquery serve [--detach]
+"""
+
+import base64
+import hashlib
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import ssl
+import struct
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from . import config
+
+RELAY_URL = os.environ.get("NIP101_RELAY_URL", "ws://127.0.0.1:7777")
+RELAY_POOL_SIZE = int(os.environ.get("NIP101_RELAY_POOL_SIZE", "4"))
+RELAY_TIMEOUT = float(os.environ.get("NIP101_RELAY_TIMEOUT", "10"))
+# Après un échec de connexion, repli direct sur `strfry scan` pendant ce délai (s)
+RELAY_RETRY_DELAY = float(os.environ.get("NIP101_RELAY_RETRY_DELAY", "30"))
+RELAY_GATEWAY_PORT = int(os.environ.get("NIP101_RELAY_GATEWAY_PORT", "7778"))
+RELAY_GATEWAY_IDLE = float(os.environ.get("NIP101_RELAY_GATEWAY_IDLE", "600"))
+SCAN_TIMEOUT = 300
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+OP_CONT, OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x8, 0x9, 0xA
+
+
+class RelayError(Exception):
+    """Relais injoignable ou connexion perdue."""
+
+
+class RelayRefused(RelayError):
+    """Requête refusée par le relais (NOTICE ou CLOSED)."""
+
+
+class RelayConnection:
+    """Une connexion websocket au relais ; une requête à la fois."""
+
+    def __init__(self, url: str = RELAY_URL, timeout: float = RELAY_TIMEOUT):
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        host, port = parts.hostname or "127.0.0.1", parts.port or (443 if secure else 80)
+        try:
+            sock = socket.create_connection((host, port), timeout=timeout)
+            if secure:
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+            self.sock = sock
+            self._reader = sock.makefile("rb")
+            self._handshake(host, port, parts.path or "/")
+        except OSError as e:
+            raise RelayError(f"{url}: {e}") from e
+        self._sub_ids = itertools.count(1)
+
+    def _handshake(self, host: str, port: int, path: str) -> None:
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                           f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                           "Sec-WebSocket-Version: 13\r\n\r\n").encode())
+        status = self._reader.readline()
+        headers = {}
+        for line in iter(self._reader.readline, b"\r\n"):
+            if not line:
+                raise RelayError("connection closed during handshake")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        if b" 101 " not in status or headers.get("sec-websocket-accept") != accept:
+            raise RelayError(f"websocket handshake refused: {status.decode('latin-1').strip()}")
+
+    def close(self) -> None:
+        try:
+            self._send_frame(OP_CLOSE, b"")
+        except OSError:
+            pass
+        self._reader.close()
+        self.sock.close()
+
+    # ----------------------------------------------------------------- frames
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        n = len(payload)
+        if n < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | n)
+        elif n < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, n)
+        mask = os.urandom(4)
+        masked = (int.from_bytes(payload, "big") ^ int.from_bytes((mask * (n // 4 + 1))[:n], "big")).to_bytes(n, "big")
+        self.sock.sendall(header + mask + masked)
+
+    def _read(self, n: int) -> bytes:
+        data = self._reader.read(n)
+        if len(data) < n:
+            raise RelayError("connection closed by relay")
+        return data
+
+    def send(self, message: list) -> None:
+        try:
+            self._send_frame(OP_TEXT, json.dumps(message, separators=(",", ":")).encode())
+        except OSError as e:
+            raise RelayError(str(e)) from e
+
+    def recv(self) -> list:
+        """Prochain message texte du relais (décodé) ; répond aux PING."""
+        chunks: List[bytes] = []
+        try:
+            while True:
+                b1, b2 = self._read(2)
+                n = b2 & 0x7F
+                if n == 126:
+                    n = struct.unpack("!H", self._read(2))[0]
+                elif n == 127:
+                    n = struct.unpack("!Q", self._read(8))[0]
+                payload = self._read(n)
+                opcode = b1 & 0x0F
+                if opcode == OP_PING:
+                    self._send_frame(OP_PONG, payload)
+                elif opcode == OP_CLOSE:
+                    raise RelayError("connection closed by relay")
+                elif opcode in (OP_TEXT, OP_CONT):
+                    chunks.append(payload)
+                    if b1 & 0x80:
+                        return json.loads(b"".join(chunks))
+        except (OSError, ValueError) as e:
+            raise RelayError(str(e)) from e
+
+    # --------------------------------------------------------------- requests
+
+    def _answers(self, sub_id: str) -> Iterator[list]:
+        """Messages destinés à `sub_id` (les restes d'anciennes souscriptions sont ignorés)."""
+        while True:
+            message = self.recv()
+            if not isinstance(message, list) or not message:
+                continue
+            if message[0] == "NOTICE":
+                raise RelayRefused(f"NOTICE: {message[1:]}")
+            if len(message) > 1 and message[1] == sub_id:
+                if message[0] == "CLOSED":
+                    raise RelayRefused(f"CLOSED: {message[2:]}")
+                yield message
+
+    def req(self, filters: List[dict]) -> List[dict]:
+        """Événements stockés correspondant à `filters` (jusqu'à EOSE)."""
+        sub_id = f"q{next(self._sub_ids)}"
+        self.send(["REQ", sub_id, *filters])
+        events = []
+        for message in self._answers(sub_id):
+            if message[0] == "EOSE":
+                break
+            if message[0] == "EVENT" and len(message) > 2:
+                events.append(message[2])
+        self.send(["CLOSE", sub_id])
+        return events
+
+    def count(self, flt: dict) -> int:
+        """NIP-45 COUNT ; RelayRefused si le relais ne le gère pas."""
+        sub_id = f"c{next(self._sub_ids)}"
+        self.send(["COUNT", sub_id, flt])
+        for message in self._answers(sub_id):
+            if message[0] == "COUNT" and len(message) > 2:
+                return int(message[2].get("count", 0))
+        return 0
+
+
+class RelayPool:
+    """Connexions réutilisées vers le relais, au plus `size` utilisées à la fois."""
+
+    def __init__(self, url: str = RELAY_URL, size: int = RELAY_POOL_SIZE, timeout: float = RELAY_TIMEOUT,
+                 retry_delay: float = RELAY_RETRY_DELAY):
+        self.url = url
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: "queue.LifoQueue[RelayConnection]" = queue.LifoQueue()
+        self._down_until = 0.0
+        self.count_supported = True
+        self.counters = {"requests": 0, "connects": 0, "errors": 0, "fallbacks": 0}
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    @contextmanager
+    def connection(self) -> Iterator[RelayConnection]:
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                try:
+                    conn = RelayConnection(self.url, self.timeout)
+                except RelayError:
+                    self._down_until = time.monotonic() + self.retry_delay
+                    raise
+                self.counters["connects"] += 1
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+
+    def _call(self, method: str, *args):
+        """Appel sur une connexion du pool ; une connexion au repos périmée
+        (relais redémarré) est remplacée une fois."""
+        self.counters["requests"] += 1
+        for attempt in (1, 2):
+            reused = not self._idle.empty()
+            try:
+                with self.connection() as conn:
+                    return getattr(conn, method)(*args)
+            except RelayError as e:
+                self.counters["errors"] += 1
+                if attempt == 2 or not reused or isinstance(e, RelayRefused):
+                    raise
+
+    def req(self, filters: List[dict]) -> List[dict]:
+        return self._call("req", filters)
+
+    def query(self, *filters: dict) -> List[dict]:
+        """Comme `strfry scan` : les filtres sans `limit` sont paginés par `until`
+        (le relais tronque chaque réponse à maxFilterLimit).
+
+        `until` reste sur la seconde la plus ancienne de la page tant qu'elle
+        apporte des événements nouveaux, puis passe à la seconde précédente ;
+        seule une page vide arrête la pagination. Limite de REQ : si plus de
+        maxFilterLimit événements partagent une même seconde, le relais renvoie
+        toujours les mêmes et le surplus de cette seconde n'est pas lu (le
+        parcours continue avec les secondes plus anciennes)."""
+        events: Dict[str, dict] = {}
+        for flt in filters:
+            if "limit" in flt:
+                events.update((e.get("id"), e) for e in self.req([flt]))
+                continue
+            page_filter = dict(flt)
+            while True:
+                page = self.req([page_filter])
+                if not page:
+                    break
+                new = [e for e in page if e.get("id") not in events]
+                events.update((e.get("id"), e) for e in new)
+                oldest = min(e.get("created_at", 0) for e in page)
+                page_filter["until"] = oldest if new else oldest - 1
+                if page_filter["until"] < flt.get("since", 0):
+                    break
+        return sorted(events.values(), key=lambda e: e.get("created_at", 0), reverse=True)
+
+    def count(self, flt: dict) -> int:
+        if not self.count_supported:
+            raise RelayError("COUNT not supported by relay")
+        try:
+            return self._call("count", flt)
+        except RelayRefused:
+            self.count_supported = False
+            raise
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+# ------------------------------------------------------------ repli strfry scan
+
+def _strfry(*args: str) -> Optional[str]:
+    if not os.access(os.path.join(config.STRFRY_DIR, "strfry"), os.X_OK):
+        return None
+    try:
+        return subprocess.run(["./strfry", "scan", *args], cwd=config.STRFRY_DIR, stdin=subprocess.DEVNULL,
+                              capture_output=True, text=True, timeout=SCAN_TIMEOUT).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def scan(flt: dict) -> List[dict]:
+    """Événements de la base strfry locale correspondant à `flt` (un `strfry scan`)."""
+    events = []
+    for line in (_strfry(json.dumps(flt)) or "").splitlines():
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict):
+            events.append(event)
+    return events
+
+
+def scan_count(flt: dict) -> int:
+    out = (_strfry("--count", json.dumps(flt)) or "").split()
+    return int(out[-1]) if out and out[-1].isdigit() else 0
+
+
+# ----------------------------------------------------------------- client API
+
+_default_pool: Optional[RelayPool] = None
+_pool_lock = threading.Lock()
+
+
+def default_pool() -> RelayPool:
+    global _default_pool
+    with _pool_lock:
+        if _default_pool is None:
+            _default_pool = RelayPool()
+        return _default_pool
+
+
+def query(*filters: dict) -> List[dict]:
+    """Événements correspondant à `filters`, du plus récent au plus ancien."""
+    pool = default_pool()
+    if pool.available:
+        try:
+            return pool.query(*filters)
+        except RelayError:
+            pass
+    pool.counters["fallbacks"] += 1
+    events = {e.get("id"): e for flt in filters for e in scan(flt)}
+    return sorted(events.values(), key=lambda e: e.get("created_at", 0), reverse=True)
+
+
+def latest(author: str, kind: int, d: Optional[str] = None) -> Optional[dict]:
+    """Dernière version de l'événement remplaçable (`kind`, `author`[, d])."""
+    flt = {"authors": [author], "kinds": [int(kind)], "limit": 1}
+    if d is not None:
+        flt["#d"] = [d]
+    events = query(flt)
+    return events[0] if events else None
+
+
+def count(flt: Optional[dict] = None) -> int:
+    """Nombre d'événements correspondant à `flt` (toute la base par défaut)."""
+    flt = flt or {}
+    pool = default_pool()
+    if pool.available and pool.count_supported:
+        try:
+            return pool.count(flt)
+        except RelayError:
+            pass
+    pool.counters["fallbacks"] += 1
+    return scan_count(flt)
+
+
+# -------------------------------------------------------------- passerelle TCP
+
+def _answer(request: dict) -> Iterator[str]:
+    op = request.get("op")
+    if op == "query":
+        events = query(*(request.get("filters") or [{}]))
+    elif op == "latest":
+        event = latest(request["author"], request["kind"], request.get("d"))
+        events = [event] if event else []
+    elif op == "count":
+        yield json.dumps(["END", count(request.get("filter"))])
+        return
+    else:
+        raise ValueError(f"unknown op: {op}")
+    for event in events:
+        yield json.dumps(event, separators=(",", ":"), ensure_ascii=False)
+    yield json.dumps(["END", len(events)])
+
+
+class _GatewayHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            self.server.last_request = time.monotonic()
+            try:
+                lines = list(_answer(json.loads(line)))
+            except (ValueError, KeyError, TypeError) as e:
+                lines = [json.dumps(["ERROR", str(e)])]
+            try:
+                self.wfile.write(("\n".join(lines) + "\n").encode())
+                self.wfile.flush()
+            except OSError:
+                return
+
+
+class Gateway(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = RELAY_GATEWAY_PORT, idle: float = RELAY_GATEWAY_IDLE):
+        super().__init__(("127.0.0.1", port), _GatewayHandler)
+        self.idle = idle
+        self.last_request = time.monotonic()
+
+    def service_actions(self) -> None:
+        if self.idle and time.monotonic() - self.last_request > self.idle:
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+
+def serve(port: int = RELAY_GATEWAY_PORT, idle: float = RELAY_GATEWAY_IDLE) -> int:
+    """Sert la passerelle jusqu'à `idle` secondes sans requête ; 1 si le port est déjà pris."""
+    try:
+        server = Gateway(port, idle)
+    except OSError:
+        return 1
+    try:
+        server.serve_forever(poll_interval=1)
+    finally:
+        server.server_close()
+        default_pool().close()
+    return 0
+
+
+def spawn_gateway() -> None:
+    """Lance `serve` en arrière-plan, détaché (sans effet si le port est pris)."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = config.PLUGIN_DIR + (":" + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    subprocess.Popen([sys.executable, "-m", "policy.relayquery", "serve"], cwd=config.PLUGIN_DIR, env=env,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    try:
+        if args[:1] == ["query"] and len(args) > 1:
+            events = query(*(json.loads(a) for a in args[1:]))
+        elif args[:1] == ["latest"] and len(args) in (3, 4):
+            event = latest(args[1], int(args[2]), args[3] if len(args) == 4 else None)
+            events = [event] if event else []
+        elif args[:1] == ["count"] and len(args) <= 2:
+            print(count(json.loads(args[1]) if len(args) == 2 else {}))
+            return 0
+        elif args == ["serve"]:
+            return serve()
+        elif args == ["serve", "--detach"]:
+            spawn_gateway()
+            return 0
+        else:
+            print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+            return 2
+    except ValueError as e:
+        print(f"invalid argument: {e}", file=sys.stderr)
+        return 2
+    for event in events:
+        print(json.dumps(event, separators=(",", ":"), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Cache des clés publiques UMAP (cellule de 0.01°) dérivées par keygen.
+
+La clé NOSTR d'une UMAP est fixe pour un UPLANETNAME et une cellule :
+`keygen -t nostr "${UPLANETNAME}LAT" "${UPLANETNAME}LON"` puis
+`nostr2hex.py NPUB`. filter/1.sh (UMAP 0.00,0.00 des visiteurs) et
+filter/21.sh / 22.sh (suivi UMAP des vidéos géolocalisées) relançaient ces
+deux outils à chaque événement. Les résultats sont gardés dans
+~/.zen/strfry/umap_keys.tsv, une ligne par cellule :
+
+    NAMESPACE  LAT  LON  HEX  NPUB
+
+NAMESPACE = 16 premiers caractères du sha256 d'UPLANETNAME (le secret de
+l'essaim n'est pas écrit sur disque) : changer d'UPlanet ne mélange pas les
+clés. Le fichier n'est qu'ajouté (sous flock) et relu incrémentalement ; une
+résolution est une recherche dans un dictionnaire, keygen n'est lancé que
+pour une cellule inconnue. Les NSEC ne sont jamais mis en cache.
+
+`umap_key LAT LON` (filter/common.sh) lit la même table avec un seul grep.
+
+Usage en ligne de commande :
+    python3 -m policy.umapkeys get LAT LON
+    python3 -m policy.umapkeys precompute LAT_MIN LON_MIN LAT_MAX LON_MAX [WORKERS]
+    python3 -m policy.umapkeys stats
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import config
+
+UMAP_KEYS_FILE = os.path.join(config.STRFRY_DIR, "umap_keys.tsv")
+TOOLS_DIR = os.path.join(config.ZEN_DIR, "Astroport.ONE", "tools")
+KEYGEN = os.path.join(TOOLS_DIR, "keygen")
+NOSTR2HEX = os.path.join(TOOLS_DIR, "nostr2hex.py")
+SWARM_KEY_FILE = os.path.join(config.HOME, ".ipfs", "swarm.key")
+DEFAULT_UPLANETNAME = "0" * 64
+
+KEYGEN_TIMEOUT = 30
+# Coordonnée acceptée par 21.sh avant arrondi (sinon 0.00)
+COORDINATE_REGEX = re.compile(r"^-?[0-9]+\.?[0-9]*$")
+# Nombre de cellules écrites par ajout lors d'un précalcul
+PRECOMPUTE_CHUNK = 100
+
+Cell = Tuple[str, str]
+
+
+class UmapKey(NamedTuple):
+    namespace: str
+    lat: str
+    lon: str
+    hex: str
+    npub: str
+
+    def row(self) -> str:
+        return "\t".join(self) + "\n"
+
+
+def uplanet_name() -> str:
+    """UPLANETNAME de l'environnement, sinon dernière ligne de ~/.ipfs/swarm.key (comme common.sh)."""
+    name = os.environ.get("UPLANETNAME", "")
+    if name:
+        return name
+    try:
+        with open(SWARM_KEY_FILE, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        lines = []
+    return (lines[-1] if lines else "") or DEFAULT_UPLANETNAME
+
+
+def namespace(name: str) -> str:
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+
+
+def cell(lat, lon) -> Optional[Cell]:
+    """Cellule 0.01° ("%.2f", arrondi de printf) ; None si une coordonnée n'est pas numérique."""
+    lat, lon = str(lat).strip(), str(lon).strip()
+    if not (COORDINATE_REGEX.match(lat) and COORDINATE_REGEX.match(lon)):
+        return None
+    return f"{float(lat):.2f}", f"{float(lon):.2f}"
+
+
+class UmapKeyCache:
+    """Table (namespace, lat, lon) → clé UMAP, suivie en fin de fichier."""
+
+    def __init__(self, path: str = UMAP_KEYS_FILE, name: Optional[str] = None,
+                 interval: float = config.REFRESH_INTERVAL):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.name = uplanet_name() if name is None else name
+        self.namespace = namespace(self.name)
+        self.interval = interval
+        self._keys: Dict[Tuple[str, str, str], UmapKey] = {}
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.derived = 0
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ----------------------------------------------------------------- lecture
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.interval:
+            return
+        self._checked_at = now
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._keys, self._file_id, self._offset = {}, None, 0
+            return
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self._file_id or st.st_size < self._offset:
+            self._keys, self._file_id, self._offset = {}, file_id, 0
+        if st.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            fields = line.split("\t")
+            if len(fields) == 5 and fields[3]:
+                key = UmapKey(*fields)
+                self._keys[(key.namespace, key.lat, key.lon)] = key
+        self._offset += end
+
+    def get(self, lat, lon) -> Optional[UmapKey]:
+        """Clé déjà connue de la cellule (aucun processus lancé)."""
+        c = cell(lat, lon)
+        if c is None:
+            return None
+        self.refresh()
+        key = self._keys.get((self.namespace,) + c)
+        if key is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key
+
+    def __len__(self) -> int:
+        self.refresh()
+        return sum(1 for ns, _, _ in self._keys if ns == self.namespace)
+
+    # -------------------------------------------------------------- dérivation
+
+    def _run(self, command: List[str]) -> str:
+        try:
+            result = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, timeout=KEYGEN_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            return ""
+        lines = result.stdout.decode("utf-8", errors="replace").strip().splitlines()
+        return lines[-1].strip() if result.returncode == 0 and lines else ""
+
+    def derive(self, c: Cell) -> Optional[UmapKey]:
+        """keygen + nostr2hex.py pour une cellule (NPUB → HEX de la clé publique)."""
+        lat, lon = c
+        npub = self._run([KEYGEN, "-t", "nostr", f"{self.name}{lat}", f"{self.name}{lon}"])
+        if not npub:
+            return None
+        hex_key = self._run([NOSTR2HEX, npub])
+        if not re.fullmatch(r"[0-9a-f]{64}", hex_key):
+            return None
+        self.derived += 1
+        return UmapKey(self.namespace, lat, lon, hex_key, npub)
+
+    def _append(self, keys: List[UmapKey]) -> None:
+        with self._locked():
+            self.refresh(force=True)
+            rows = [k.row() for k in keys if (k.namespace, k.lat, k.lon) not in self._keys]
+            if rows:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(rows))
+            self.refresh(force=True)
+
+    def resolve(self, lat, lon) -> Optional[UmapKey]:
+        """Clé de la cellule, dérivée puis enregistrée si elle est inconnue."""
+        key = self.get(lat, lon)
+        if key is not None:
+            return key
+        c = cell(lat, lon)
+        if c is None:
+            return None
+        key = self.derive(c)
+        if key is not None:
+            self._append([key])
+        return key
+
+    def precompute(self, lat_min, lon_min, lat_max, lon_max, workers: int = 4) -> int:
+        """Dérive toutes les cellules inconnues du rectangle ; retourne le nombre ajouté."""
+        lat_lo, lat_hi = sorted((round(float(lat_min) * 100), round(float(lat_max) * 100)))
+        lon_lo, lon_hi = sorted((round(float(lon_min) * 100), round(float(lon_max) * 100)))
+        self.refresh(force=True)
+        cells = [(f"{i / 100:.2f}", f"{j / 100:.2f}")
+                 for i in range(lat_lo, lat_hi + 1) for j in range(lon_lo, lon_hi + 1)]
+        missing = [c for c in cells if (self.namespace,) + c not in self._keys]
+        added = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for start in range(0, len(missing), PRECOMPUTE_CHUNK):
+                keys = [k for k in pool.map(self.derive, missing[start:start + PRECOMPUTE_CHUNK]) if k]
+                self._append(keys)
+                added += len(keys)
+        return added
+
+    def stats(self) -> Dict[str, int]:
+        return {"cells": len(self), "hits": self.hits, "misses": self.misses, "derived": self.derived}
+
+
+_default_cache: Optional[UmapKeyCache] = None
+
+
+def default_cache() -> UmapKeyCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = UmapKeyCache()
+    return _default_cache
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    cache = default_cache()
+    if args[:1] == ["get"] and len(args) == 3:
+        key = cache.resolve(args[1], args[2])
+        if key is None:
+            return 1
+        print(key.row(), end="")
+        return 0
+    if args[:1] == ["precompute"] and len(args) in (5, 6):
+        try:
+            workers = int(args[5]) if len(args) == 6 else 4
+            added = cache.precompute(*args[1:5], workers=workers)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        print(f"{added} UMAP keys derived ({len(cache)} cached)")
+        return 0
+    if args == ["stats"]:
+        print(cache.stats())
+        return 0
+    print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Cache des verdicts de classification par pubkey.
+
+Un client bavard (réactions, likes…) publie des centaines d'événements par
+minute : le verdict nobody / player / uplanet et la source d'autorisation
+sont mémorisés avec une durée de vie, plus courte pour "nobody" (cache
+négatif) afin qu'un nouveau MULTIPASS soit reconnu rapidement.
+
+Le cache est entièrement vidé dès que la génération des sources change
+(version de l'IdentityIndex : HEX ajouté, amisOfAmis.txt modifié par
+add_to_amis_of_amis, atom4love_certified.txt…).
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+
+from . import config
+
+
+class Verdict(NamedTuple):
+    user_type: str  # nobody, player ou uplanet (classify_user)
+    source: str     # SOURCE de check_authorization ("" si non résolue sans effet de bord)
+    email: str      # EMAIL de check_authorization
+
+
+class VerdictCache:
+    """Cache LRU pubkey → Verdict avec TTL positif / négatif."""
+
+    def __init__(self, ttl: float = config.VERDICT_TTL,
+                 negative_ttl: float = config.VERDICT_NEGATIVE_TTL,
+                 max_entries: int = config.VERDICT_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Verdict]]" = OrderedDict()
+        self._generation: Optional[Hashable] = None
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def sync(self, generation: Hashable) -> bool:
+        """Vide le cache si les sources ont changé. Retourne True si invalidé."""
+        if generation == self._generation:
+            return False
+        if self._entries:
+            self.invalidations += 1
+            self._entries.clear()
+        self._generation = generation
+        return True
+
+    def get(self, pubkey: str) -> Optional[Verdict]:
+        entry = self._entries.get(pubkey)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, verdict = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[pubkey]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(pubkey)
+        self.hits += 1
+        return verdict
+
+    def put(self, pubkey: str, verdict: Verdict) -> None:
+        ttl = self.negative_ttl if verdict.user_type == "nobody" else self.ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[pubkey] = (time.monotonic() + ttl, verdict)
+        self._entries.move_to_end(pubkey)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, pubkey: Optional[str] = None) -> None:
+        """Oublie le verdict de `pubkey` (ou tous les verdicts)."""
+        if pubkey is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(pubkey, None)
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,386 @@
+"""
+Compteurs des vidéos NIP-71 (kinds 21 et 22) de filter/21.sh et filter/22.sh.
+
+Les filtres ne réécrivent plus nostr_video_stats.json /
+nostr_long_video_stats.json avec jq + mktemp + mv à chaque vidéo (coût
+proportionnel au nombre d'auteurs de `by_user`, et deux vidéos simultanées
+perdaient un incrément) : `video_stats_add` (filter/common.sh) ajoute une
+ligne TSV à un journal de deltas (~/.zen/tmp/nostr_video_stats.delta) par un
+simple `printf >>`, sans processus ni verrou :
+
+    KIND  PUBKEY  DURATION  MIME_TYPE  HAS_LOCATION(0/1)  FLAG(0/1)
+
+FLAG vaut webcam_videos pour le kind 21 et extended_content pour le kind 22.
+
+`flush` (au plus une fois par VIDEO_STATS_INTERVAL secondes, déclenché par la
+maintenance du moteur ou par les filtres) replie les lignes complètes dans une
+base SQLite (~/.zen/tmp/nostr_video_stats.sqlite) : compteurs par kind, par
+auteur et par type MIME, avec la position lue dans le journal dans la même
+transaction (chaque ligne est comptée une fois, même après un arrêt brutal).
+Le journal est renommé en .delta.old au-delà de VIDEO_STATS_ROTATE_BYTES puis
+supprimé au passage suivant. Les fichiers JSON restent la vue lue par les
+autres outils : ils sont réécrits au même format à chaque flush qui a appliqué
+des lignes. Au premier passage, leur contenu est importé dans la base.
+
+Usage en ligne de commande :
+    python3 -m policy.videostats flush
+    python3 -m policy.videostats summary [KIND]
+    python3 -m policy.videostats user PUBKEY [KIND]
+    python3 -m policy.videostats type MIME_TYPE [KIND]
+"""
+
+import fcntl
+import json
+import math
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import config
+
+DELTA_FILE = os.path.join(config.TMP_DIR, "nostr_video_stats.delta")
+# Date (epoch) du dernier flush, lue par video_stats_add sans processus
+STAMP_FILE = os.path.join(config.TMP_DIR, "nostr_video_stats.flushed")
+DB_FILE = os.path.join(config.TMP_DIR, "nostr_video_stats.sqlite")
+
+VIDEO_STATS_INTERVAL = float(os.environ.get("NIP101_VIDEO_STATS_INTERVAL", "60"))
+VIDEO_STATS_ROTATE_BYTES = int(os.environ.get("NIP101_VIDEO_STATS_ROTATE_BYTES", str(1024 * 1024)))
+
+
+class StatsFile(NamedTuple):
+    path: str
+    total_key: str
+    flag_key: str
+
+
+# Format des fichiers JSON historiques de filter/21.sh et filter/22.sh
+STATS_FILES: Dict[int, StatsFile] = {
+    21: StatsFile(os.path.join(config.TMP_DIR, "nostr_video_stats.json"), "total_videos", "webcam_videos"),
+    22: StatsFile(os.path.join(config.TMP_DIR, "nostr_long_video_stats.json"), "total_long_videos",
+                  "extended_content"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS totals (
+    kind          INTEGER PRIMARY KEY,
+    videos        INTEGER NOT NULL DEFAULT 0,
+    duration      REAL NOT NULL DEFAULT 0,
+    with_location INTEGER NOT NULL DEFAULT 0,
+    flagged       INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS by_user (
+    kind   INTEGER NOT NULL,
+    pubkey TEXT NOT NULL,
+    videos INTEGER NOT NULL,
+    PRIMARY KEY (kind, pubkey)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS by_type (
+    kind      INTEGER NOT NULL,
+    mime_type TEXT NOT NULL,
+    videos    INTEGER NOT NULL,
+    PRIMARY KEY (kind, mime_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS delta_offsets (
+    inode  INTEGER PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+"""
+
+
+def _number(value: float):
+    """1.0 → 1 pour garder le rendu de jq."""
+    return int(value) if float(value).is_integer() else value
+
+
+def _int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _duration(text: str) -> float:
+    try:
+        value = float(text)
+    except ValueError:
+        return 0.0
+    return value if math.isfinite(value) else 0.0
+
+
+class Batch:
+    """Incréments lus dans le journal, agrégés avant l'écriture en base."""
+
+    def __init__(self):
+        self.lines = 0
+        self.totals: Dict[int, List[float]] = {}
+        self.users: Counter = Counter()
+        self.types: Counter = Counter()
+
+    def add(self, line: str) -> bool:
+        fields = line.split("\t")
+        if len(fields) != 6 or not fields[0].isdigit() or int(fields[0]) not in STATS_FILES:
+            return False
+        kind = int(fields[0])
+        pubkey, duration, mime_type, has_location, flag = fields[1:]
+        total = self.totals.setdefault(kind, [0, 0.0, 0, 0])
+        total[0] += 1
+        total[1] += _duration(duration)
+        total[2] += has_location == "1"
+        total[3] += flag == "1"
+        self.users[(kind, pubkey)] += 1
+        self.types[(kind, mime_type)] += 1
+        self.lines += 1
+        return True
+
+
+class VideoStats:
+    """Base des compteurs ; `flush` applique le journal de deltas et exporte les JSON."""
+
+    def __init__(self, db_file: str = DB_FILE, delta_file: str = DELTA_FILE,
+                 stats_files: Optional[Dict[int, StatsFile]] = None, stamp_file: str = STAMP_FILE,
+                 interval: float = VIDEO_STATS_INTERVAL, rotate_bytes: int = VIDEO_STATS_ROTATE_BYTES):
+        self.db_file = db_file
+        self.delta_file = delta_file
+        self.old_file = delta_file + ".old"
+        self.lock_file = delta_file + ".lock"
+        self.stats_files = STATS_FILES if stats_files is None else stats_files
+        self.stamp_file = stamp_file
+        self.interval = interval
+        self.rotate_bytes = rotate_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._flushed_at = 0.0
+        self.flushes = 0
+        self.applied = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        with open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ----------------------------------------------------------------- import
+
+    def _import(self, kind: int) -> None:
+        """Premier passage d'un kind : reprend le fichier JSON existant."""
+        if self.conn.execute("SELECT 1 FROM totals WHERE kind = ?", (kind,)).fetchone():
+            return
+        spec = self.stats_files[kind]
+        try:
+            with open(spec.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        self.conn.execute(
+            "INSERT INTO totals (kind, videos, duration, with_location, flagged) VALUES (?, ?, ?, ?, ?)",
+            (kind, _int(data.get(spec.total_key)), _duration(str(data.get("total_duration", 0))),
+             _int(data.get("with_location")), _int(data.get(spec.flag_key))))
+        for table, column, key in (("by_user", "pubkey", "by_user"), ("by_type", "mime_type", "by_type")):
+            counts = data.get(key) if isinstance(data.get(key), dict) else {}
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (kind, {column}, videos) VALUES (?, ?, ?)",
+                [(kind, name, _int(count)) for name, count in counts.items()])
+
+    # ------------------------------------------------------------------ flush
+
+    def _read_delta(self, path: str, batch: Batch) -> Optional[Tuple[int, int, int]]:
+        """Lit les lignes complètes après la position enregistrée : (inode, nouvelle position, taille)."""
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            row = self.conn.execute("SELECT offset FROM delta_offsets WHERE inode = ?", (st.st_ino,)).fetchone()
+            offset = row[0] if row else 0
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            batch.add(line)
+        return st.st_ino, offset + end, st.st_size
+
+    def _apply(self, batch: Batch) -> None:
+        for kind, (videos, duration, with_location, flagged) in batch.totals.items():
+            self.conn.execute(
+                "UPDATE totals SET videos = videos + ?, duration = duration + ?, "
+                "with_location = with_location + ?, flagged = flagged + ? WHERE kind = ?",
+                (videos, duration, with_location, flagged, kind))
+        for table, column, counts in (("by_user", "pubkey", batch.users), ("by_type", "mime_type", batch.types)):
+            self.conn.executemany(
+                f"INSERT INTO {table} (kind, {column}, videos) VALUES (?, ?, ?) "
+                f"ON CONFLICT (kind, {column}) DO UPDATE SET videos = videos + excluded.videos",
+                [(kind, name, count) for (kind, name), count in counts.items()])
+
+    def flush(self, export: bool = False) -> int:
+        """Applique le journal de deltas ; réécrit les JSON si des lignes ont été
+        appliquées (ou si `export`). Retourne le nombre de lignes appliquées."""
+        self._flushed_at = time.monotonic()
+        with self._locked():
+            self._write_stamp()
+            batch = Batch()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for kind in self.stats_files:
+                    self._import(kind)
+                positions = [(path, self._read_delta(path, batch)) for path in (self.old_file, self.delta_file)]
+                self._apply(batch)
+                for _, pos in positions:
+                    if pos is not None:
+                        self.conn.execute("INSERT OR REPLACE INTO delta_offsets (inode, offset) VALUES (?, ?)",
+                                          pos[:2])
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._rotate(dict(positions))
+            if batch.lines or export:
+                self.export()
+        self.flushes += 1
+        self.applied += batch.lines
+        return batch.lines
+
+    def _rotate(self, positions: Dict[str, Optional[Tuple[int, int, int]]]) -> None:
+        """Supprime .delta.old une fois lu en entier ; renomme un journal trop gros.
+
+        Un `printf >>` ouvert juste avant le renommage écrit dans .delta.old :
+        il est relu au flush suivant avant la suppression."""
+        old = positions.get(self.old_file)
+        if old is not None:
+            inode, offset, size = old
+            if offset >= size:
+                try:
+                    os.unlink(self.old_file)
+                except OSError:
+                    return
+                self.conn.execute("DELETE FROM delta_offsets WHERE inode = ?", (inode,))
+            return
+        current = positions.get(self.delta_file)
+        if current is not None and current[2] >= self.rotate_bytes:
+            os.replace(self.delta_file, self.old_file)
+
+    def maybe_flush(self, force: bool = False) -> int:
+        """Flush au plus une fois par `interval` (maintenance du moteur)."""
+        if not force and time.monotonic() - self._flushed_at < self.interval:
+            return 0
+        if not (os.path.exists(self.delta_file) or os.path.exists(self.old_file)):
+            self._flushed_at = time.monotonic()
+            return 0
+        return self.flush()
+
+    def _write_stamp(self) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.stamp_file), prefix=".video_stats.")
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{int(time.time())}\n")
+        os.replace(tmp, self.stamp_file)
+
+    # ----------------------------------------------------------------- export
+
+    def document(self, kind: int) -> dict:
+        """Contenu du fichier JSON du kind, au format de filter/21.sh / 22.sh."""
+        spec = self.stats_files[kind]
+        row = self.conn.execute(
+            "SELECT videos, duration, with_location, flagged FROM totals WHERE kind = ?", (kind,)).fetchone()
+        videos, duration, with_location, flagged = row or (0, 0, 0, 0)
+        return {
+            spec.total_key: videos,
+            "total_duration": _number(duration),
+            "by_user": dict(self.conn.execute(
+                "SELECT pubkey, videos FROM by_user WHERE kind = ? ORDER BY pubkey", (kind,))),
+            "by_type": dict(self.conn.execute(
+                "SELECT mime_type, videos FROM by_type WHERE kind = ? ORDER BY mime_type", (kind,))),
+            "with_location": with_location,
+            spec.flag_key: flagged,
+        }
+
+    def export(self) -> None:
+        for kind, spec in self.stats_files.items():
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(spec.path), prefix=".video_stats.")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self.document(kind), f, indent=2, ensure_ascii=False)
+                    f.write("\n")
+                os.replace(tmp, spec.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                raise
+
+    # ---------------------------------------------------------------- requêtes
+
+    def summary(self, kind: int) -> dict:
+        spec = self.stats_files[kind]
+        row = self.conn.execute(
+            "SELECT videos, duration, with_location, flagged FROM totals WHERE kind = ?", (kind,)).fetchone()
+        videos, duration, with_location, flagged = row or (0, 0, 0, 0)
+        users = self.conn.execute("SELECT COUNT(*) FROM by_user WHERE kind = ?", (kind,)).fetchone()[0]
+        return {spec.total_key: videos, "total_duration": _number(duration), "users": users,
+                "with_location": with_location, spec.flag_key: flagged}
+
+    def user_count(self, kind: int, pubkey: str) -> int:
+        row = self.conn.execute("SELECT videos FROM by_user WHERE kind = ? AND pubkey = ?",
+                                (kind, pubkey)).fetchone()
+        return row[0] if row else 0
+
+    def type_count(self, kind: int, mime_type: str) -> int:
+        row = self.conn.execute("SELECT videos FROM by_type WHERE kind = ? AND mime_type = ?",
+                                (kind, mime_type)).fetchone()
+        return row[0] if row else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    stats = VideoStats()
+    try:
+        if args == ["flush"]:
+            print(f"{stats.flush()} video events applied")
+            return 0
+        command, rest = (args[0], args[1:]) if args else ("", [])
+        kinds = list(stats.stats_files)
+        if rest and rest[-1] in ("21", "22") and (command == "summary" or len(rest) == 2):
+            kinds = [int(rest.pop())]
+        # Les requêtes lisent la base après avoir appliqué les deltas en attente
+        if command == "summary" and not rest:
+            stats.flush()
+            print(json.dumps({str(k): stats.summary(k) for k in kinds}))
+            return 0
+        if command in ("user", "type") and len(rest) == 1:
+            stats.flush()
+            count = stats.user_count if command == "user" else stats.type_count
+            print(sum(count(k, rest[0]) for k in kinds))
+            return 0
+    finally:
+        stats.close()
+    print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
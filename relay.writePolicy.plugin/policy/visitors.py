@@ -0,0 +1,252 @@
+"""
+Limite de messages des visiteurs (pubkeys « nobody ») de filter/1.sh.
+
+Remplace le fichier compteur par pubkey (~/.zen/strfry/pubkey_counts/<hex>),
+le fichier d'avertissement (~/.zen/strfry/warning_messages/<hex>) et leur
+balayage toutes les 48 h : une table SQLite (~/.zen/strfry/visitors.sqlite),
+une ligne par visiteur, lue et écrite par clé primaire.
+
+Chaque ligne garde les horodatages des derniers messages dans une fenêtre
+glissante de VISITOR_WINDOW secondes (48 h, comme l'ancien balayage) : au
+plus MESSAGE_LIMIT valeurs. Tant que le nombre de messages de la fenêtre ne
+dépasse pas MESSAGE_LIMIT, 1.sh envoie l'avertissement (« N message(s)
+left ») ; au-delà, la clé est ajoutée à blacklist.txt (policy/blacklist.py)
+et sa ligne supprimée — même escalade qu'avant. Une ligne sans message depuis
+VISITOR_WINDOW expire d'elle-même (purge par l'index expires_at, au plus une
+fois par VISITOR_PURGE_INTERVAL). Les anciens fichiers compteurs sont importés
+au premier passage puis supprimés.
+
+blacklist.txt n'est pas relu à chaque message : 1.sh passe --not-blacklisted
+(le moteur et all_but_blacklist.sh rejettent les clés blacklistées avant tout
+filtre) ; sans verdict, seul un visiteur inconnu de la table est vérifié — un
+visiteur déjà compté n'était pas blacklisté, et l'est ici au dépassement.
+
+Usage en ligne de commande :
+    python3 -m policy.visitors hit PUBKEY [--not-blacklisted]
+                                              → "warn|block|blacklisted COUNT REMAINING"
+    python3 -m policy.visitors get PUBKEY
+    python3 -m policy.visitors purge
+    python3 -m policy.visitors stats
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from . import config
+from .blacklist import BlacklistStore
+
+VISITORS_DB = os.path.join(config.STRFRY_DIR, "visitors.sqlite")
+# Anciens compteurs de filter/1.sh (lastevent y reste : anti-doublon #BRO)
+COUNT_DIR = os.path.join(config.STRFRY_DIR, "pubkey_counts")
+LEGACY_KEEP = ("lastevent",)
+
+MESSAGE_LIMIT = int(os.environ.get("NIP101_VISITOR_MESSAGE_LIMIT", "3"))
+VISITOR_WINDOW = float(os.environ.get("NIP101_VISITOR_WINDOW", "172800"))
+VISITOR_PURGE_INTERVAL = float(os.environ.get("NIP101_VISITOR_PURGE_INTERVAL", "3600"))
+
+WARN, BLOCK, BLACKLISTED = "warn", "block", "blacklisted"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS visitors (
+    pubkey     TEXT PRIMARY KEY,
+    hits       TEXT NOT NULL,
+    warned_at  REAL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS visitors_expiry ON visitors (expires_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class Hit(NamedTuple):
+    action: str
+    count: int
+    remaining: int
+
+
+class VisitorStore:
+    """Fenêtre glissante de messages par visiteur ; chaque `hit` est une transaction."""
+
+    def __init__(self, path: str = VISITORS_DB, limit: int = MESSAGE_LIMIT, window: float = VISITOR_WINDOW,
+                 purge_interval: float = VISITOR_PURGE_INTERVAL, blacklist: Optional[BlacklistStore] = None,
+                 legacy_dir: str = COUNT_DIR):
+        self.path = path
+        self.limit = limit
+        self.window = window
+        self.purge_interval = purge_interval
+        self._blacklist = blacklist
+        self.legacy_dir = legacy_dir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._import_legacy()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @property
+    def blacklist(self) -> BlacklistStore:
+        """blacklist.txt chargé à la première consultation seulement."""
+        if self._blacklist is None:
+            self._blacklist = BlacklistStore()
+        return self._blacklist
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _import_legacy(self) -> None:
+        """Reprend une fois les fichiers compteurs de pubkey_counts/ (date du fichier
+        pour chaque message compté), puis les supprime."""
+        if self._meta("legacy_imported"):
+            return
+        try:
+            names = [n for n in os.listdir(self.legacy_dir) if n not in LEGACY_KEEP]
+        except OSError:
+            names = []
+        imported = []
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._meta("legacy_imported"):
+                for name in names:
+                    path = os.path.join(self.legacy_dir, name)
+                    try:
+                        with open(path, encoding="utf-8") as f:
+                            count = int(f.read().strip() or 0)
+                        mtime = os.stat(path).st_mtime
+                    except (OSError, ValueError):
+                        continue
+                    if count > 0:
+                        hits = " ".join(f"{mtime:.3f}" for _ in range(min(count, self.limit)))
+                        self.conn.execute(
+                            "INSERT OR IGNORE INTO visitors (pubkey, hits, warned_at, expires_at) VALUES (?, ?, ?, ?)",
+                            (name, hits, mtime, mtime + self.window))
+                    imported.append(path)
+                self._set_meta("legacy_imported", str(int(time.time())))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        for path in imported:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    # -------------------------------------------------------------------- hits
+
+    def _window(self, hits: str, now: float) -> List[float]:
+        cutoff = now - self.window
+        return [t for t in (float(v) for v in hits.split()) if t > cutoff]
+
+    def hit(self, pubkey: str, now: Optional[float] = None, blacklisted: Optional[bool] = None) -> Hit:
+        """Compte un message du visiteur : WARN (avertir, `remaining` messages
+        restants), BLOCK (limite dépassée : blacklisté) ou BLACKLISTED (déjà).
+        `blacklisted` : verdict déjà connu de l'appelant ; None → vérifié si le
+        visiteur est nouveau."""
+        if blacklisted is None:
+            known = self.conn.execute("SELECT 1 FROM visitors WHERE pubkey = ?", (pubkey,)).fetchone()
+            blacklisted = known is None and pubkey in self.blacklist
+        if blacklisted:
+            return Hit(BLACKLISTED, 0, 0)
+        now = time.time() if now is None else now
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT hits FROM visitors WHERE pubkey = ?", (pubkey,)).fetchone()
+            hits = self._window(row[0], now) if row else []
+            hits.append(now)
+            count = len(hits)
+            if count <= self.limit:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO visitors (pubkey, hits, warned_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (pubkey, " ".join(f"{t:.3f}" for t in hits), now, now + self.window))
+            else:
+                self.conn.execute("DELETE FROM visitors WHERE pubkey = ?", (pubkey,))
+            self._maybe_purge(now)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        if count > self.limit:
+            self.blacklist.add(pubkey)
+            return Hit(BLOCK, count, self.limit - count)
+        return Hit(WARN, count, self.limit - count)
+
+    def get(self, pubkey: str, now: Optional[float] = None) -> Optional[Dict[str, float]]:
+        now = time.time() if now is None else now
+        row = self.conn.execute("SELECT hits, warned_at, expires_at FROM visitors WHERE pubkey = ?",
+                                (pubkey,)).fetchone()
+        if row is None or row[2] <= now:
+            return None
+        return {"count": len(self._window(row[0], now)), "warned_at": row[1], "expires_at": row[2]}
+
+    # ------------------------------------------------------------------ expiry
+
+    def _maybe_purge(self, now: float) -> None:
+        last = float(self._meta("purged_at") or 0)
+        if now - last >= self.purge_interval:
+            self._purge(now)
+
+    def _purge(self, now: float) -> int:
+        removed = self.conn.execute("DELETE FROM visitors WHERE expires_at <= ?", (now,)).rowcount
+        self._set_meta("purged_at", str(now))
+        return removed
+
+    def purge(self, now: Optional[float] = None) -> int:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = self._purge(time.time() if now is None else now)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self) -> Dict[str, float]:
+        now = time.time()
+        visitors, warned = self.conn.execute(
+            "SELECT COUNT(*), COUNT(warned_at) FROM visitors WHERE expires_at > ?", (now,)).fetchone()
+        return {"visitors": visitors, "warned": warned, "limit": self.limit, "window_seconds": self.window,
+                "purged_at": float(self._meta("purged_at") or 0)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    checked = args[:1] == ["hit"] and args[2:] == ["--not-blacklisted"]
+    if checked:
+        args = args[:2]
+    if not args or (args[0] in ("hit", "get") and len(args) != 2) or args[0] not in ("hit", "get", "purge", "stats"):
+        print(__doc__.split("Usage en ligne de commande :")[1], file=sys.stderr)
+        return 2
+    store = VisitorStore()
+    try:
+        if args[0] == "hit":
+            print(" ".join(str(v) for v in store.hit(args[1], blacklisted=False if checked else None)))
+        elif args[0] == "get":
+            state = store.get(args[1])
+            if state is None:
+                return 1
+            print(json.dumps(state))
+        elif args[0] == "purge":
+            print(f"{store.purge()} expired visitors removed")
+        else:
+            print(json.dumps(store.stats(), indent=2))
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
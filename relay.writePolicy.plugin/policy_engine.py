@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Point d'entrée du plugin writePolicy strfry (moteur persistant).
+
+Lit les événements JSON sur stdin et répond {"id": ..., "action": ...} sur
+stdout, comme all_but_blacklist.sh, mais depuis un seul processus.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from policy.engine import main
+
+if __name__ == "__main__":
+    main()
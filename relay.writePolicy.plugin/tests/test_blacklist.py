@@ -0,0 +1,64 @@
+"""Blacklist journalisée (policy/blacklist.py)."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.blacklist import BlacklistStore  # noqa: E402
+
+
+class Removal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "blacklist.txt")
+        with open(self.path, "w") as f:
+            f.write("aaa\nbbb\nccc\n")
+        self.store = BlacklistStore(self.path, interval=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def lines(self, path):
+        with open(path) as f:
+            return f.read().split()
+
+    def test_remove_is_one_journal_append(self):
+        self.assertTrue(self.store.remove("bbb"))
+        self.assertEqual(self.lines(self.path), ["aaa", "bbb", "ccc"])
+        self.assertEqual(len(self.lines(self.store.journal_path)), 3)
+        self.assertNotIn("bbb", self.store)
+        self.assertNotIn("bbb", BlacklistStore(self.path, interval=0))
+
+    def test_compact_applies_journal(self):
+        self.store.remove("bbb")
+        self.store.add("ddd")
+        self.assertTrue(self.store.compact())
+        self.assertEqual(self.lines(self.path), ["aaa", "ccc", "ddd"])
+        self.assertEqual(self.lines(self.store.journal_path), [])
+
+    def test_final_line_without_newline(self):
+        with open(self.path, "a") as f:
+            f.write("eee")
+        store = BlacklistStore(self.path, interval=0)
+        self.assertIn("eee", store)
+        self.assertTrue(store.remove("eee"))
+        self.assertNotIn("eee", BlacklistStore(self.path, interval=0))
+
+    def test_reload_keeps_pending_since(self):
+        with open(self.store.journal_path, "w") as f:
+            f.write("-aaa 0 0\n")
+        self.store.reload()
+        pending = self.store._pending_since
+        with open(self.store.journal_path, "a") as f:
+            f.write("-ccc 0 0\n")
+        self.store.reload()
+        self.assertEqual(self.store._pending_since, pending)
+        self.assertEqual(self.store.keys(), ["bbb"])
+
+
+if __name__ == "__main__":
+    unittest.main()
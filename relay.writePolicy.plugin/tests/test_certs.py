@@ -0,0 +1,69 @@
+"""Index des certificats ATOM4LOVE (policy/certs.py)."""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.certs import DEFAULT_APP_ID, Cert, CertIndex, app_proof  # noqa: E402
+
+PUBKEY = "a" * 64
+
+
+def cert_event(pubkey=PUBKEY, created_at=1700000000, phase=3.0, omega=7.0, a5l=1):
+    return {"id": "e" * 64, "pubkey": pubkey, "kind": 30078, "created_at": created_at,
+            "tags": [["d", "atom4love"], ["a4l_proof", app_proof(pubkey, DEFAULT_APP_ID)]],
+            "content": json.dumps({"personal_phase": phase, "omega_bio": omega, "a5l_amplitude": a5l})}
+
+
+class ImportedCertificates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "atom4love_certs.idx")
+        self.batch = os.path.join(self.tmp.name, "import.ndjson")
+        self.index = CertIndex(self.path, apps_path=os.path.join(self.tmp.name, "missing.json"), interval=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_batch(self, *events):
+        with open(self.batch, "w") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+
+    def test_imported_cert_is_indexed(self):
+        open(self.path, "w").close()
+        other = dict(cert_event("b" * 64), kind=1, content="atom4love")
+        self.write_batch(cert_event(), other)
+        self.assertFalse(self.index.is_certified(PUBKEY))
+        self.assertEqual(self.index.index_file(self.batch), 1)
+        self.assertTrue(self.index.is_certified(PUBKEY))
+        self.assertFalse(self.index.is_certified("b" * 64))
+
+    def test_invalid_a5l_not_indexed(self):
+        open(self.path, "w").close()
+        injected = "0.5\n" + "\t".join(("c" * 64, "1700000001", "3.0", "7.0", "", "x"))
+        self.write_batch(cert_event(a5l=injected), cert_event("b" * 64, a5l=2),
+                         cert_event("d" * 64, phase=9.0), cert_event("f" * 64, a5l="0.25"))
+        self.assertEqual(self.index.index_file(self.batch), 1)
+        with open(self.path) as f:
+            rows = [line.split("\t") for line in f]
+        self.assertEqual([(row[0], row[4]) for row in rows], [("f" * 64, "0.25")])
+
+    def test_row_strips_separators(self):
+        cert = Cert(1700000000, 3.0, 7.0, "", "pro\tof\n")
+        self.assertEqual(cert.row("a\tb").count("\t"), 5)
+        self.assertEqual(cert.row("a\tb").count("\n"), 1)
+
+    def test_no_index_left_to_rebuild(self):
+        self.write_batch(cert_event())
+        self.assertEqual(self.index.index_file(self.batch), 0)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Compteurs d'événements (policy/eventcounts.py)."""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.eventcounts import EventCounts  # noqa: E402
+
+
+class StoredEstimate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.counts = EventCounts(os.path.join(self.tmp.name, "event_counts.sqlite"),
+                                  os.path.join(self.tmp.name, "event_counts.total"))
+
+    def tearDown(self):
+        self.counts.close()
+        self.tmp.cleanup()
+
+    def total_file(self):
+        with open(self.counts.total_file) as f:
+            return f.read().split()
+
+    def test_unknown_before_calibration(self):
+        self.counts.add(1, "player", "accept")
+        self.counts.flush()
+        self.assertIsNone(self.counts.stored())
+        self.assertEqual(self.total_file(), ["-", "1", "0", "0"])
+
+    def test_only_row_adding_kinds_counted(self):
+        self.counts.calibrate(100)
+        for kind in (1, 7, 0, 3, 10002, 22242, 30078):
+            self.counts.add(kind, "player", "accept")
+        self.counts.add(1, "nobody", "reject")
+        self.counts.flush()
+        self.assertEqual(self.counts.stored(), 102)
+        self.assertEqual(self.total_file(), ["102", "7", "1", "0"])
+
+    def test_import_counted_and_calibration_resets(self):
+        self.counts.calibrate(10)
+        batch = os.path.join(self.tmp.name, "import.ndjson")
+        with open(batch, "w") as f:
+            for kind in (1, 1, 22242, 30023):
+                f.write(json.dumps({"kind": kind}) + "\n")
+        self.assertEqual(self.counts.import_file(batch), 4)
+        self.assertEqual(self.counts.stored(), 12)
+        self.assertEqual(self.counts.calibrate(50), 50)
+        self.counts.add(1, "player", "accept")
+        self.counts.flush()
+        self.assertEqual(self.counts.stored(), 51)
+        self.assertEqual(self.counts.summary()["totals"]["import"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
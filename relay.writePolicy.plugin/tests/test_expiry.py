@@ -0,0 +1,73 @@
+"""Suppression planifiée des réponses aux visiteurs (policy/expiry.py)."""
+
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy import expiry  # noqa: E402
+from policy.expiry import ExpiryQueue  # noqa: E402
+
+
+class Sweep(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmp.name, "kind1.log")
+        self.kind1_log, expiry.KIND1_LOG = expiry.KIND1_LOG, self.log
+        self.next_file = os.path.join(self.tmp.name, "expiry.next")
+        self.queue = ExpiryQueue(os.path.join(self.tmp.name, "expiry.sqlite"),
+                                 os.path.join(self.tmp.name, "expiry.lock"), self.next_file,
+                                 batch=2, retry_delay=100, strfry_dir=self.tmp.name)
+        self.queue._set_meta("visitor_replies_imported", "1")  # pas de relais ici
+        self.strfry(0)
+
+    def tearDown(self):
+        self.queue.close()
+        expiry.KIND1_LOG = self.kind1_log
+        self.tmp.cleanup()
+
+    def strfry(self, code):
+        """Faux ./strfry : note ses arguments et sort avec `code`."""
+        path = os.path.join(self.tmp.name, "strfry")
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\necho "$@" >> calls\nexit {code}\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    def next_due(self):
+        with open(self.next_file) as f:
+            return int(f.read())
+
+    def calls(self):
+        with open(os.path.join(self.tmp.name, "calls")) as f:
+            return f.read().splitlines()
+
+    def test_next_file_tracks_earliest_due(self):
+        self.assertTrue(self.queue.add("a" * 64, 2000))
+        self.assertTrue(self.queue.add("b" * 64, 1000))
+        self.assertFalse(self.queue.add("b" * 64, 500))
+        self.assertEqual(self.next_due(), 1000)
+
+    def test_sweep_deletes_due_events_in_batches(self):
+        for n, due in enumerate((1000, 1001, 1002, 5000)):
+            self.queue.add(str(n) * 64, due)
+        self.assertEqual(self.queue.sweep(now=1500), 3)
+        self.assertEqual(len(self.calls()), 2)  # lots de 2
+        self.assertEqual(self.next_due(), 5000)
+        self.assertEqual(self.queue.stats(now=1500)["deleted_total"], 3)
+
+    def test_failed_delete_is_retried_later(self):
+        self.strfry(1)
+        self.queue.add("a" * 64, 1000)
+        self.assertEqual(self.queue.sweep(now=1500), 0)
+        self.assertEqual(self.next_due(), 1600)
+        self.strfry(0)
+        self.assertEqual(self.queue.sweep(now=1600), 1)
+        self.assertFalse(os.path.exists(self.next_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
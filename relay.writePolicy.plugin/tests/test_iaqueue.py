@@ -0,0 +1,84 @@
+"""File du répondeur IA (policy/iaqueue.py)."""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy import iaqueue  # noqa: E402
+from policy.iaqueue import DONE, DUPLICATE, FAILED, FULL, INTERRUPTED, IAQueue, Job  # noqa: E402
+
+
+class Queue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "ia_queue.sqlite")
+        self.queue = self.open()
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def open(self, command="true", max_pending=20):
+        return IAQueue(self.db, self.db + ".lock", workers=1, timeout=5, max_pending=max_pending,
+                       command=command, log=lambda line: None)
+
+    def job(self, n, pubkey=None, priority=0, message="hello"):
+        return Job(f"{n:064x}", pubkey or f"{n:064x}", priority, ["--message", message], time.time() + n / 1000)
+
+    def rows(self):
+        return {row[0][-1]: row[1:] for row in self.queue.conn.execute(
+            "SELECT event_id, status, args, exit_code FROM jobs")}
+
+    def test_finished_jobs_keep_no_message(self):
+        self.queue.enqueue(self.job(1, message="#secret my code"))
+        self.assertEqual(self.queue.work(), 1)
+        status, args, code = self.rows()["1"]
+        self.assertEqual((status, code), (DONE, 0))
+        self.assertEqual(json.loads(args), [])
+        for name in os.listdir(self.tmp.name):
+            with open(os.path.join(self.tmp.name, name), "rb") as f:
+                self.assertNotIn(b"my code", f.read(), name)
+
+    def test_failed_job_not_retried(self):
+        self.queue.close()
+        self.queue = self.open(command="false")
+        self.queue.enqueue(self.job(1))
+        self.assertEqual(self.queue.work(), 1)
+        self.assertEqual(self.rows()["1"][0], FAILED)
+        self.assertEqual(self.queue.enqueue(self.job(1)), DUPLICATE)
+        self.assertEqual(self.queue.work(), 0)
+
+    def test_interrupted_job_not_restarted(self):
+        self.queue.enqueue(self.job(1))
+        self.queue._claim()  # arrêt brutal pendant l'exécution
+        self.assertEqual(self.queue.work(), 0)
+        status, args, _ = self.rows()["1"]
+        self.assertEqual(status, INTERRUPTED)
+        self.assertEqual(json.loads(args), [])
+
+    def test_full_queue_keeps_higher_priority(self):
+        self.queue.close()
+        self.queue = self.open(max_pending=2)
+        self.queue.enqueue(self.job(1, priority=2))
+        self.queue.enqueue(self.job(2, priority=0))
+        self.assertEqual(self.queue.enqueue(self.job(3, priority=2)), FULL)
+        self.queue.enqueue(self.job(4, priority=1))
+        self.assertEqual(self.queue.pending(), 2)
+        self.assertEqual(self.rows()["1"][:2], ("dropped", "[]"))
+
+    def test_prune_after_retention(self):
+        self.queue.enqueue(self.job(1))
+        self.queue.enqueue(self.job(2))
+        self.queue.work()
+        self.queue._prune(now=time.time() + iaqueue.IA_QUEUE_RETENTION + 1)
+        self.assertEqual(self.rows(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""File des effets de bord (policy/jobs.py)."""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.jobs import WorkQueue  # noqa: E402
+
+
+class Lanes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.lock = threading.Lock()
+        self.active = {}
+        self.overlaps = []
+        self.done = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def queue(self, **kwargs):
+        q = WorkQueue(self.tmp.name, workers=4, log=lambda line: None, **kwargs)
+        q.register("sleep", self.sleep)
+        return q
+
+    def sleep(self, job):
+        lane = job["lane"]
+        with self.lock:
+            if self.active.get(lane):
+                self.overlaps.append(lane)
+            self.active[lane] = self.active.get(lane, 0) + 1
+        time.sleep(0.05)
+        with self.lock:
+            self.active[lane] -= 1
+            self.done.append(job["args"]["n"])
+        return True
+
+    def test_same_lane_never_concurrent(self):
+        q = self.queue()
+        for n in range(6):
+            q.submit("sleep", {"n": n}, lane="filter")
+        q.start()
+        self.assertTrue(q.drain(5))
+        q.stop()
+        self.assertEqual(self.overlaps, [])
+        self.assertEqual(sorted(self.done), list(range(6)))
+
+    def test_other_lanes_run_concurrently(self):
+        q = self.queue()
+        for n in range(4):
+            q.submit("sleep", {"n": n}, lane=f"filter/{n % 2}.sh")
+        started = time.monotonic()
+        q.start()
+        self.assertTrue(q.drain(5))
+        q.stop()
+        self.assertEqual(self.overlaps, [])
+        # 2 voies x 2 travaux de 0.05 s : ~0.1 s en parallèle, 0.2 s en série
+        self.assertLess(time.monotonic() - started, 0.15)
+
+    def test_full_queue_drops_without_blocking(self):
+        q = self.queue(max_pending=2)
+        self.assertIsNotNone(q.submit("sleep", {"n": 0}, lane="filter/1.sh"))
+        self.assertIsNotNone(q.submit("sleep", {"n": 1}, lane="filter/1.sh"))
+        self.assertIsNone(q.submit("sleep", {"n": 2}, lane="filter/1.sh"))
+        q.start()
+        self.assertTrue(q.drain(5))
+        q.stop()
+        self.assertEqual(sorted(self.done), [0, 1])
+        self.assertEqual(q.stats()["dropped"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Registre du crowdfunding (policy/ledger.py)."""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.ledger import (Ledger, VOTE_DUPLICATE, VOTE_ERROR, VOTE_INACTIVE,  # noqa: E402
+                           VOTE_RECORDED)
+
+
+class Registry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        self.ledger = Ledger(os.path.join(self.base, "ledger.sqlite"), self.base)
+        self.project("p1", {"status": "crowdfunding", "title": "Jardin",
+                            "vote": {"assets_vote_active": True, "vote_threshold": 10, "vote_quorum": 2}})
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def project(self, project_id, data):
+        os.makedirs(os.path.join(self.base, project_id), exist_ok=True)
+        with open(self.ledger.project_file(project_id), "w") as f:
+            json.dump(data, f)
+
+    def read(self, project_id="p1"):
+        with open(self.ledger.project_file(project_id)) as f:
+            return json.load(f)
+
+    def test_contribution_idempotent_on_event(self):
+        self.assertTrue(self.ledger.contribute("p1", "aa", 5, "ZEN", "e1"))
+        self.assertTrue(self.ledger.contribute("p1", "aa", 5, "ZEN", "e1"))
+        self.assertTrue(self.ledger.contribute("p1", "bb", 2.5, "ZEN", "e2"))
+        self.assertFalse(self.ledger.contribute("missing", "aa", 5, "ZEN", "e3"))
+        self.assertEqual(self.ledger.totals("p1")["zen_convertible_collected"], 7.5)
+
+    def test_vote_duplicate_and_inactive(self):
+        self.assertEqual(self.ledger.vote("p1", "aa", 3, "e1"), VOTE_RECORDED)
+        self.assertEqual(self.ledger.vote("p1", "aa", 3, "e2"), VOTE_DUPLICATE)
+        self.assertEqual(self.ledger.vote("missing", "aa", 3), VOTE_ERROR)
+        self.project("p2", {"vote": {"assets_vote_active": False}})
+        self.assertEqual(self.ledger.vote("p2", "aa", 3), VOTE_INACTIVE)
+        self.assertEqual(self.ledger.totals("p1")["voters_count"], 1)
+
+    def test_threshold_needs_amount_and_quorum(self):
+        self.ledger.vote("p1", "aa", 20, "e1")
+        self.assertFalse(self.ledger.threshold_reached("p1"))  # quorum de 2 votants
+        self.ledger.vote("p1", "bb", 1, "e2")
+        self.assertTrue(self.ledger.threshold_reached("p1"))
+        data = self.read()
+        self.assertEqual(data["status"], "funded")  # exporté aussitôt
+        self.assertEqual(data["vote"]["vote_status"], "approved")
+        self.assertEqual(data["vote"]["voters"], ["aa", "bb"])
+        self.assertEqual(data["title"], "Jardin")
+
+    def test_export_is_throttled_then_complete(self):
+        self.ledger.contribute("p1", "aa", 5, "ZEN", "e1")  # premier export
+        self.ledger.contribute("p1", "bb", 2, "ZEN", "e2")  # dans l'intervalle : en attente
+        self.assertEqual(len(self.read()["contributions"]), 1)
+        self.assertEqual(self.ledger.export_due(interval=0), 1)
+        data = self.read()
+        self.assertEqual([c["event_id"] for c in data["contributions"]], ["e1", "e2"])
+        self.assertEqual(data["totals"]["zen_convertible_collected"], 7)
+        self.assertEqual(self.ledger.export_due(interval=0), 0)  # rien de neuf
+
+    def test_export_holds_no_write_lock(self):
+        self.ledger.contribute("p1", "aa", 5, "ZEN", "e1")
+        other = sqlite3.connect(self.ledger.path, timeout=0, isolation_level=None)
+        original = json.dump
+
+        def dump(data, f, **kwargs):  # écriture du fichier : la base reste libre
+            other.execute("BEGIN IMMEDIATE")
+            other.execute("ROLLBACK")
+            original(data, f, **kwargs)
+
+        json.dump = dump
+        try:
+            self.assertTrue(self.ledger.export("p1"))
+        finally:
+            json.dump = original
+            other.close()
+
+    def test_status_override_survives_reimport(self):
+        self.assertTrue(self.ledger.set_status("p1", "completed", "ev"))
+        data = self.read()
+        self.assertEqual((data["status"], data["last_nostr_event"]), ("completed", "ev"))
+        self.ledger.contribute("p1", "aa", 1, "ZEN", "e1")
+        self.ledger.export("p1")
+        self.assertEqual(self.read()["status"], "completed")
+
+
+if __name__ == "__main__":
+    unittest.main()
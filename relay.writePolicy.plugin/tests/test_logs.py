@@ -0,0 +1,51 @@
+"""Rotation des logs partagés entre processus (policy/logs.py)."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.logs import LogWriter  # noqa: E402
+
+
+class SharedRotation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "strfry.log")
+        # Deux LogWriter = deux processus (descripteurs distincts sur le même fichier)
+        self.engine = LogWriter(max_bytes=300, backups=5, flush_interval=0.01, levels={})
+        self.worker = LogWriter(max_bytes=300, backups=5, flush_interval=0.01, levels={})
+
+    def tearDown(self):
+        self.engine.close()
+        self.worker.close()
+        self.tmp.cleanup()
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_other_process_follows_rotation(self):
+        self.worker.raw(self.path, "worker before")
+        self.worker.flush()
+        self.engine.raw(self.path, "x" * 400)
+        self.engine.flush()
+        self.assertEqual(self.engine.rotations, 1)
+        self.worker.raw(self.path, "worker after")
+        self.worker.flush()
+        self.assertEqual(self.read(self.path), "worker after\n")
+        self.assertNotIn("worker after", self.read(self.path + ".1"))
+
+    def test_single_rotation_per_file(self):
+        for writer in (self.engine, self.worker):
+            writer.raw(self.path, "y" * 200)
+            writer.flush()
+        self.assertEqual(self.engine.rotations + self.worker.rotations, 1)
+        self.assertFalse(os.path.exists(self.path + ".2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
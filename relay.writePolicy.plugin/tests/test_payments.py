@@ -0,0 +1,72 @@
+"""Regroupement des paiements ẐEN (policy/payments.py)."""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy import payments  # noqa: E402
+from policy.payments import ROAMING, TRANSFER, Payment, PaymentOutbox  # noqa: E402
+
+
+def payment(event_id, method, source, sender, email, zen=1.0, dest="G1DEST"):
+    comment = f"UPLANET:G1:{email}:LIKE:{int(zen)}Z:{event_id}"
+    return Payment(event_id, time.time(), method, source, dest, "LIKE", "", zen, comment, email, sender,
+                   "reacted", "author")
+
+
+class MultiSenderGrouping(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "zen_payments.sqlite")
+        self.outbox = PaymentOutbox(path, path + ".lock", window=0, log=lambda line: None)
+        self.commands = []
+        self.outbox._run = lambda command: self.commands.append(command) or 0
+
+    def tearDown(self):
+        self.outbox.close()
+        self.tmp.cleanup()
+
+    def dispatch(self, *queued):
+        for p in queued:
+            self.assertTrue(self.outbox.enqueue(p))
+        with mock.patch.object(payments, "read_nsec", return_value="nsec1test"):
+            self.outbox.dispatch(now=True)
+
+    def test_roaming_one_dm_per_sender(self):
+        self.dispatch(payment("ev0", ROAMING, "homenode", "alicehex", "alice@x"),
+                      payment("ev1", ROAMING, "homenode", "bobhex", "bob@x"),
+                      payment("ev2", ROAMING, "homenode", "alicehex", "alice@x"))
+        sent = [json.loads(c[c.index("--payload") + 1]) for c in self.commands]
+        by_email = {p["email"]: p for p in sent}
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(by_email["alice@x"]["sender_pubkey"], "alicehex")
+        self.assertEqual(by_email["alice@x"]["zen_amount"], 2.0)
+        self.assertEqual(by_email["alice@x"]["event_ids"], ["ev0", "ev2"])
+        self.assertEqual(by_email["bob@x"]["sender_pubkey"], "bobhex")
+        self.assertEqual(by_email["bob@x"]["zen_amount"], 1.0)
+        self.assertEqual(by_email["bob@x"]["event_ids"], ["ev1"])
+
+    def test_transfer_from_shared_wallet_one_batch_per_sender(self):
+        self.dispatch(payment("ev0", TRANSFER, "captain.dunikey", "alicehex", "alice@x"),
+                      payment("ev1", TRANSFER, "captain.dunikey", "bobhex", "bob@x"))
+        comments = sorted(c[4] for c in self.commands)
+        self.assertEqual(len(self.commands), 2)
+        self.assertEqual(comments, ["UPLANET:G1:alice@x:LIKE:1Z:ev0", "UPLANET:G1:bob@x:LIKE:1Z:ev1"])
+
+    def test_same_sender_coalesced(self):
+        self.dispatch(payment("ev0", TRANSFER, "captain.dunikey", "alicehex", "alice@x"),
+                      payment("ev1", TRANSFER, "captain.dunikey", "alicehex", "alice@x", zen=2.0))
+        self.assertEqual(len(self.commands), 1)
+        self.assertEqual(self.commands[0][2], payments.g1_amount(3.0))
+        self.assertEqual(self.commands[0][4], "UPLANET:G1:alice@x:LIKE:3Z:ev0+1")
+
+
+if __name__ == "__main__":
+    unittest.main()
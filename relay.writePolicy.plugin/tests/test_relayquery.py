@@ -0,0 +1,54 @@
+"""Pagination des requêtes au relais local (policy/relayquery.py)."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.relayquery import RelayPool  # noqa: E402
+
+
+class CappedPool(RelayPool):
+    """Relais simulé : réponses triées du plus récent au plus ancien, tronquées à `cap`."""
+
+    def __init__(self, events, cap=3):
+        super().__init__()
+        self.events = events
+        self.cap = cap
+        self.reqs = 0
+
+    def req(self, filters):
+        self.reqs += 1
+        flt = filters[0]
+        matching = [e for e in self.events
+                    if flt.get("since", 0) <= e["created_at"] <= flt.get("until", float("inf"))]
+        matching.sort(key=lambda e: (-e["created_at"], e["id"]))
+        return matching[:self.cap]
+
+
+def event(n, created_at):
+    return {"id": f"{n:064x}", "created_at": created_at}
+
+
+class Pagination(unittest.TestCase):
+
+    def test_all_pages_read(self):
+        events = [event(n, 1000 + n) for n in range(10)]
+        self.assertEqual(len(CappedPool(events).query({})), 10)
+
+    def test_boundary_second_shared_by_several_pages(self):
+        # 5 événements à 1005 (cap 3) : la page bloquée passe à 1004 au lieu de s'arrêter
+        events = [event(n, 1005) for n in range(5)] + [event(10 + n, 1000 + n) for n in range(5)]
+        ids = {e["id"] for e in CappedPool(events).query({})}
+        self.assertEqual(ids & {e["id"] for e in events[5:]}, {e["id"] for e in events[5:]})
+
+    def test_since_stops_pagination(self):
+        events = [event(n, 1000 + n) for n in range(10)]
+        pool = CappedPool(events)
+        self.assertEqual(len(pool.query({"since": 1008})), 2)
+        self.assertLessEqual(pool.reqs, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
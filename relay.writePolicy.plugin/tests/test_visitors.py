@@ -0,0 +1,65 @@
+"""Limite de messages des visiteurs (policy/visitors.py)."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy.blacklist import BlacklistStore  # noqa: E402
+from policy.visitors import BLACKLISTED, BLOCK, WARN, Hit, VisitorStore  # noqa: E402
+
+A, B = "a" * 64, "b" * 64
+
+
+class CountingBlacklist(BlacklistStore):
+    """Compte les consultations de blacklist.txt."""
+
+    lookups = 0
+
+    def __contains__(self, pubkey):
+        self.lookups += 1
+        return super().__contains__(pubkey)
+
+
+class Visitors(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.blacklist = CountingBlacklist(os.path.join(self.tmp.name, "blacklist.txt"), interval=0)
+        self.store = VisitorStore(os.path.join(self.tmp.name, "visitors.sqlite"), limit=3, window=100,
+                                  blacklist=self.blacklist, legacy_dir=os.path.join(self.tmp.name, "none"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_limit_per_window_then_blacklisted(self):
+        self.assertEqual(self.store.hit(A, now=1000), Hit(WARN, 1, 2))
+        self.assertEqual(self.store.hit(A, now=1010), Hit(WARN, 2, 1))
+        self.assertEqual(self.store.hit(A, now=1020), Hit(WARN, 3, 0))
+        self.assertEqual(self.store.hit(A, now=1030), Hit(BLOCK, 4, -1))
+        self.assertIn(A, self.blacklist)
+        self.assertIsNone(self.store.get(A, now=1030))
+        self.assertEqual(self.store.hit(A, now=1040), Hit(BLACKLISTED, 0, 0))
+
+    def test_old_messages_leave_the_window(self):
+        self.store.hit(A, now=1000)
+        self.store.hit(A, now=1010)
+        self.store.hit(A, now=1020)
+        self.assertEqual(self.store.hit(A, now=1105), Hit(WARN, 3, 0))  # 1000 est sorti
+        self.assertEqual(self.store.hit(B, now=1105), Hit(WARN, 1, 2))  # compteur par clé
+        self.assertEqual(self.store.purge(now=1300), 2)
+
+    def test_blacklist_checked_only_for_new_visitors(self):
+        self.store.hit(A, now=1000)
+        self.store.hit(A, now=1010)
+        self.assertEqual(self.blacklist.lookups, 1)
+        self.store.hit(B, now=1010, blacklisted=False)
+        self.assertEqual(self.blacklist.lookups, 1)
+        self.assertEqual(self.store.hit(B, now=1020, blacklisted=True), Hit(BLACKLISTED, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,9 +9,10 @@ source ~/.zen/Astroport.ONE/tools/my.sh
 REPORT_LOG="$HOME/.zen/strfry/constellation-backfill.log"
 
 # Load KEY="value" lines into shell variables — allowlist strict pour éviter d'écraser PATH/IFS
-_ALLOWED_STATS="SYNC_START_TIME|SYNC_END_TIME|TOTAL_EVENTS|IMPORTED_EVENTS|TOTAL_PEERS|\
+_ALLOWED_STATS="SYNC_START_TIME|SYNC_END_TIME|TOTAL_EVENTS|IMPORTED_EVENTS|SKIPPED_EVENTS|TOTAL_PEERS|\
 SUCCESS_PEERS|HEX_PUBKEYS|PROFILES_FOUND|PROFILES_MISSING|SOCIAL_EVENTS|PRIVATE_EVENTS|\
-MEDIA_EVENTS|COOP_EVENTS|STATION_EVENTS|CONTENT_EVENTS|FAILURES"
+MEDIA_EVENTS|COOP_EVENTS|STATION_EVENTS|CONTENT_EVENTS|FAILURES|RELAY_STORED|RELAY_ACCEPTED|\
+RELAY_REJECTED"
 
 _load_stats() {
     local _line
@@ -33,7 +34,7 @@ extract_sync_stats() {
     local log_file="$1"
     [[ ! -f "$log_file" ]] && echo "Log not found: $log_file" >&2 && return 1
 
-    local start_time end_time sync_stats sync_hex sync_profiles sync_peers sync_import
+    local start_time end_time sync_stats sync_hex sync_profiles sync_peers sync_import sync_dedup sync_relay
 
     start_time=$(grep "Starting Astroport constellation backfill" "$log_file" | head -1 \
                  | sed 's/.*\[\([0-9-]* [0-9:]*\)\].*/\1/')
@@ -44,6 +45,9 @@ extract_sync_stats() {
     sync_profiles=$(grep "SYNC_PROFILES:" "$log_file" | tail -1 | sed 's/.*SYNC_PROFILES: //')
     sync_peers=$(grep "SYNC_PEERS:"  "$log_file" | tail -1 | sed 's/.*SYNC_PEERS: //')
     sync_import=$(grep "SYNC_IMPORT:" "$log_file" | tail -1 | sed 's/.*SYNC_IMPORT: //')
+    sync_dedup=$(grep "SYNC_DEDUP_TOTAL:" "$log_file" | tail -1 | sed 's/.*SYNC_DEDUP_TOTAL: //')
+    # Compteurs du writePolicy (policy/eventcounts.py), sans parcours de la base
+    sync_relay=$(grep "SYNC_RELAY:" "$log_file" | tail -1 | sed 's/.*SYNC_RELAY: //')
 
     # ── Group events by functional role ───────────────────────────────────
     # Social identity (kind 0,1,3,6,7) — MULTIPASS + réseau social
@@ -89,6 +93,7 @@ SYNC_START_TIME="$start_time"
 SYNC_END_TIME="$end_time"
 TOTAL_EVENTS="$(_val "$sync_stats" events)"
 IMPORTED_EVENTS="$(_val "$sync_import" events)"
+SKIPPED_EVENTS="$(_val "$sync_dedup" skipped)"
 TOTAL_PEERS="$(_val "$sync_peers" total)"
 SUCCESS_PEERS="$(_val "$sync_peers" success)"
 HEX_PUBKEYS="$(_val "$sync_hex" count)"
@@ -101,6 +106,9 @@ COOP_EVENTS="$coop"
 STATION_EVENTS="${station:-0}"
 CONTENT_EVENTS="$content"
 FAILURES="$failures"
+RELAY_STORED="$(_val "$sync_relay" stored)"
+RELAY_ACCEPTED="$(_val "$sync_relay" accepted)"
+RELAY_REJECTED="$(_val "$sync_relay" rejected)"
 EOF
 }
 
@@ -148,6 +156,9 @@ generate_html_report() {
         <tr><td>HEX pubkeys suivis</td><td>${HEX_PUBKEYS:-0}</td></tr>
         <tr><td>Profils trouvés / manquants</td><td>${PROFILES_FOUND:-0} / ${PROFILES_MISSING:-0}</td></tr>
         <tr><td>Events collectés → importés</td><td>${TOTAL_EVENTS:-0} → ${IMPORTED_EVENTS:-0}</td></tr>
+        <tr><td>Doublons ignorés avant import</td><td>${SKIPPED_EVENTS:-0}</td></tr>
+        <tr><td>Events stockés sur le relais</td><td>${RELAY_STORED:-0}</td></tr>
+        <tr><td>Verdicts writePolicy acceptés / rejetés</td><td>${RELAY_ACCEPTED:-0} / ${RELAY_REJECTED:-0}</td></tr>
 
         <tr><th colspan="2">Events par catégorie</th></tr>
         <tr><td>Social (kind 0,1,3,6,7 — MULTIPASS)</td><td>${SOCIAL_EVENTS:-0}</td></tr>
@@ -192,8 +203,9 @@ send_sync_report() {
     local nostr_content="${status_icon} Constellation Sync — $(date '+%Y-%m-%d %H:%M')
 
 📡 Peers ${SUCCESS_PEERS:-0}/${TOTAL_PEERS:-0}   🔑 ${HEX_PUBKEYS:-0} pubkeys
-📥 ${TOTAL_EVENTS:-0} collectés → ${IMPORTED_EVENTS:-0} importés
+📥 ${TOTAL_EVENTS:-0} collectés → ${IMPORTED_EVENTS:-0} importés (${SKIPPED_EVENTS:-0} doublons ignorés)
 👤 Profils: ${PROFILES_FOUND:-0} ✓  ${PROFILES_MISSING:-0} manquants
+🗄️ Relais: ${RELAY_STORED:-0} events (writePolicy ${RELAY_ACCEPTED:-0} ✓ ${RELAY_REJECTED:-0} ✗)
 
 📊 Social   (0,1,3,6,7) : ${SOCIAL_EVENTS:-0}
 🔒 DMs      (kind 4)    : ${PRIVATE_EVENTS:-0}